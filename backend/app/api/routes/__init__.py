@@ -20,6 +20,7 @@ from .simulation import router as simulation_router
 from .geo_velocity import router as geo_velocity_router
 from .device_fingerprint import router as device_fingerprint_router
 from .feedback import router as feedback_router
+from .jobs import router as jobs_router
 
 router = APIRouter()
 
@@ -42,3 +43,4 @@ router.include_router(simulation_router)  # Fraud Simulation Lab (has own prefix
 router.include_router(geo_velocity_router)  # Geo-Velocity Tracker (has own prefix)
 router.include_router(device_fingerprint_router)  # Device Fingerprint Analyzer (has own prefix)
 router.include_router(feedback_router)  # ML Feedback & Retraining (has own prefix)
+router.include_router(jobs_router)  # Background batch jobs (has own prefix)
@@ -5,17 +5,25 @@ from typing import Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 
+from ...core.responses import FastJSONResponse
 from ...db.database import get_db
 from ...db.models import Prediction
 from ...models.schemas import ModelInfo, StatsResponse, UserResponse
 from ...models.ml_model import fraud_model
 from ...services.fraud_detector import FraudDetectorService
+from ...services.aggregation import bucket_label
+from ...services.pagination import InvalidCursor, estimated_count, keyset_page
+from ...services.prediction_service import LISTING_FIELDS, prediction_columns, serialize_prediction_rows
+from ...services.rollups import hourly_buckets, rollup_summary
 from ...services.auth_service import get_current_user
 
 router = APIRouter()
 
+# Sortable listing columns; all non-null, as keyset pagination requires
+FILTER_SORT_FIELDS = ("created_at", "id", "time", "amount", "fraud_probability", "risk_score", "prediction_time_ms")
+
 
 @router.get(
     "/stats",
@@ -100,37 +108,16 @@ async def get_time_series(
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
 
-    # Query predictions in date range
-    predictions = (
-        db.query(Prediction)
-        .filter(
-            Prediction.user_id == int(current_user.id),
-            Prediction.created_at >= start_date
-        )
-        .order_by(Prediction.created_at)
-        .all()
-    )
-
-    # Aggregate by period
+    # Merge hourly rollups into the requested period
     data = {}
-    for p in predictions:
-        if period == "hour":
-            key = p.created_at.strftime("%Y-%m-%d %H:00")
-        elif period == "week":
-            key = p.created_at.strftime("%Y-W%W")
-        elif period == "month":
-            key = p.created_at.strftime("%Y-%m")
-        else:  # day
-            key = p.created_at.strftime("%Y-%m-%d")
-
+    for bucket in hourly_buckets(db, int(current_user.id), start=start_date):
+        key = bucket_label(bucket["bucket_start"], period)
         if key not in data:
             data[key] = {"date": key, "fraud": 0, "legitimate": 0, "total": 0}
 
-        data[key]["total"] += 1
-        if p.is_fraud:
-            data[key]["fraud"] += 1
-        else:
-            data[key]["legitimate"] += 1
+        data[key]["total"] += bucket["total"]
+        data[key]["fraud"] += bucket["fraud_count"]
+        data[key]["legitimate"] += bucket["total"] - bucket["fraud_count"]
 
     # Convert to list and calculate rates
     result = []
@@ -144,6 +131,7 @@ async def get_time_series(
 
 @router.get(
     "/predictions/filter",
+    response_model=dict,
     summary="Filter predictions",
     description="Get filtered prediction history with advanced filtering options."
 )
@@ -158,12 +146,16 @@ async def filter_predictions(
     confidence: Optional[str] = None,
     batch_id: Optional[str] = None,
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page"),
     sort_by: str = Query("created_at", description="Sort field"),
     sort_order: str = Query("desc", description="Sort order: asc or desc"),
+    total: Optional[str] = Query(
+        None, pattern="^(exact|estimate)$",
+        description="Also count the matches: exact (COUNT) or estimate (cheap, approximate)"
+    ),
     current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
-) -> dict:
+) -> FastJSONResponse:
     """
     Get filtered predictions with advanced options.
 
@@ -174,62 +166,61 @@ async def filter_predictions(
     - Risk score range
     - Confidence level
     - Batch ID
+
+    Pages by cursor: pass next_cursor or prev_cursor back as `cursor`
+    with the same filters and sort.
     """
-    query = db.query(Prediction).filter(Prediction.user_id == int(current_user.id))
+    criteria = [Prediction.user_id == int(current_user.id)]
 
     # Apply filters
     if start_date:
-        query = query.filter(Prediction.created_at >= start_date)
+        criteria.append(Prediction.created_at >= start_date)
     if end_date:
-        query = query.filter(Prediction.created_at <= end_date)
+        criteria.append(Prediction.created_at <= end_date)
     if is_fraud is not None:
-        query = query.filter(Prediction.is_fraud == is_fraud)
+        criteria.append(Prediction.is_fraud == is_fraud)
     if min_amount is not None:
-        query = query.filter(Prediction.amount >= min_amount)
+        criteria.append(Prediction.amount >= min_amount)
     if max_amount is not None:
-        query = query.filter(Prediction.amount <= max_amount)
+        criteria.append(Prediction.amount <= max_amount)
     if min_risk is not None:
-        query = query.filter(Prediction.risk_score >= min_risk)
+        criteria.append(Prediction.risk_score >= min_risk)
     if max_risk is not None:
-        query = query.filter(Prediction.risk_score <= max_risk)
+        criteria.append(Prediction.risk_score <= max_risk)
     if confidence:
-        query = query.filter(Prediction.confidence == confidence)
+        criteria.append(Prediction.confidence == confidence)
     if batch_id:
-        query = query.filter(Prediction.batch_id == batch_id)
+        criteria.append(Prediction.batch_id == batch_id)
 
-    # Count total before pagination
-    total = query.count()
+    # Sorting, on a non-null column with id as the tie-breaker
+    if sort_by not in FILTER_SORT_FIELDS:
+        sort_by = "created_at"
+    descending = sort_order != "asc"
 
-    # Sorting
-    sort_column = getattr(Prediction, sort_by, Prediction.created_at)
-    if sort_order == "asc":
-        query = query.order_by(sort_column.asc())
-    else:
-        query = query.order_by(sort_column.desc())
-
-    # Pagination
-    predictions = query.offset(offset).limit(limit).all()
+    # Keyset pagination, selecting only the returned columns
+    statement = select(*prediction_columns(LISTING_FIELDS)).where(*criteria)
+    try:
+        page = keyset_page(
+            db, statement, getattr(Prediction, sort_by), Prediction.id, limit,
+            cursor=cursor, descending=descending
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return {
-        "total": total,
+    content = {
         "limit": limit,
-        "offset": offset,
-        "predictions": [
-            {
-                "id": p.id,
-                "time": p.time,
-                "amount": p.amount,
-                "is_fraud": p.is_fraud,
-                "fraud_probability": p.fraud_probability,
-                "confidence": p.confidence,
-                "risk_score": p.risk_score,
-                "prediction_time_ms": p.prediction_time_ms,
-                "batch_id": p.batch_id,
-                "created_at": p.created_at.isoformat() if p.created_at else None
-            }
-            for p in predictions
-        ]
+        "sort_by": sort_by,
+        "sort_order": "desc" if descending else "asc",
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor,
+        "predictions": serialize_prediction_rows(page.rows, LISTING_FIELDS)
     }
+    if total == "exact":
+        content["total"] = db.execute(select(func.count()).select_from(Prediction).where(*criteria)).scalar()
+    elif total == "estimate":
+        content["total"] = estimated_count(db, statement)
+        content["total_estimated"] = True
+    return FastJSONResponse(content)
 
 
 @router.get(
@@ -253,17 +244,9 @@ async def get_analytics_summary(
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
 
-    # Get predictions in range
-    predictions = (
-        db.query(Prediction)
-        .filter(
-            Prediction.user_id == int(current_user.id),
-            Prediction.created_at >= start_date
-        )
-        .all()
-    )
+    stats = rollup_summary(db, int(current_user.id), start=start_date)
 
-    if not predictions:
+    if stats["total"] == 0:
         return {
             "period_days": days,
             "total_predictions": 0,
@@ -277,34 +260,14 @@ async def get_analytics_summary(
             "trend": "stable"
         }
 
-    total = len(predictions)
-    fraud = [p for p in predictions if p.is_fraud]
-    legitimate = [p for p in predictions if not p.is_fraud]
-
-    # Calculate averages
-    avg_amount = sum(p.amount for p in predictions) / total
-    avg_fraud_amount = sum(p.amount for p in fraud) / len(fraud) if fraud else 0
-    avg_legitimate_amount = sum(p.amount for p in legitimate) / len(legitimate) if legitimate else 0
-
-    # Risk distribution
-    risk_dist = {"low": 0, "medium": 0, "high": 0, "critical": 0}
-    for p in predictions:
-        if p.risk_score < 25:
-            risk_dist["low"] += 1
-        elif p.risk_score < 50:
-            risk_dist["medium"] += 1
-        elif p.risk_score < 75:
-            risk_dist["high"] += 1
-        else:
-            risk_dist["critical"] += 1
-
     # Calculate trend (compare first half vs second half)
     mid_date = start_date + timedelta(days=days // 2)
-    first_half = [p for p in predictions if p.created_at < mid_date]
-    second_half = [p for p in predictions if p.created_at >= mid_date]
+    second_half = rollup_summary(db, int(current_user.id), start=mid_date)
+    first_total = stats["total"] - second_half["total"]
+    first_fraud = stats["fraud_count"] - second_half["fraud_count"]
 
-    first_fraud_rate = len([p for p in first_half if p.is_fraud]) / len(first_half) if first_half else 0
-    second_fraud_rate = len([p for p in second_half if p.is_fraud]) / len(second_half) if second_half else 0
+    first_fraud_rate = first_fraud / first_total if first_total else 0
+    second_fraud_rate = second_half["fraud_rate"]
 
     if second_fraud_rate > first_fraud_rate * 1.1:
         trend = "increasing"
@@ -315,14 +278,14 @@ async def get_analytics_summary(
 
     return {
         "period_days": days,
-        "total_predictions": total,
-        "fraud_count": len(fraud),
-        "legitimate_count": len(legitimate),
-        "fraud_rate": len(fraud) / total,
-        "avg_amount": round(avg_amount, 2),
-        "avg_fraud_amount": round(avg_fraud_amount, 2),
-        "avg_legitimate_amount": round(avg_legitimate_amount, 2),
-        "risk_distribution": risk_dist,
+        "total_predictions": stats["total"],
+        "fraud_count": stats["fraud_count"],
+        "legitimate_count": stats["legitimate_count"],
+        "fraud_rate": stats["fraud_rate"],
+        "avg_amount": round(stats["avg_amount"], 2),
+        "avg_fraud_amount": round(stats["avg_fraud_amount"], 2),
+        "avg_legitimate_amount": round(stats["avg_legitimate_amount"], 2),
+        "risk_distribution": stats["risk_distribution"],
         "trend": trend
     }
 
@@ -363,8 +326,7 @@ async def get_shap_explanation(
 
     # Otherwise, try to calculate them
     try:
-        import json
-        features_dict = json.loads(prediction.features_json)
+        features_dict = prediction.pca_features()
 
         # Try to get SHAP values from the model
         shap_values = FraudDetectorService.get_shap_values_for_prediction(
@@ -410,40 +372,12 @@ async def compare_periods(
     """
 
     def get_period_stats(start: datetime, end: datetime) -> dict:
-        predictions = (
-            db.query(Prediction)
-            .filter(
-                Prediction.user_id == int(current_user.id),
-                Prediction.created_at >= start,
-                Prediction.created_at <= end
-            )
-            .all()
+        stats = rollup_summary(db, int(current_user.id), start=start, end=end)
+        keys = (
+            "total", "fraud_count", "legitimate_count", "fraud_rate",
+            "avg_amount", "total_amount", "avg_risk_score", "high_risk_count"
         )
-
-        total = len(predictions)
-        if total == 0:
-            return {
-                "total": 0,
-                "fraud_count": 0,
-                "legitimate_count": 0,
-                "fraud_rate": 0,
-                "avg_amount": 0,
-                "total_amount": 0,
-                "avg_risk_score": 0,
-                "high_risk_count": 0
-            }
-
-        fraud = [p for p in predictions if p.is_fraud]
-        return {
-            "total": total,
-            "fraud_count": len(fraud),
-            "legitimate_count": total - len(fraud),
-            "fraud_rate": len(fraud) / total,
-            "avg_amount": sum(p.amount for p in predictions) / total,
-            "total_amount": sum(p.amount for p in predictions),
-            "avg_risk_score": sum(p.risk_score for p in predictions) / total,
-            "high_risk_count": sum(1 for p in predictions if p.risk_score >= 70)
-        }
+        return {key: stats[key] for key in keys}
 
     period1_stats = get_period_stats(period1_start, period1_end)
     period2_stats = get_period_stats(period2_start, period2_end)
@@ -478,6 +412,7 @@ async def compare_periods(
 
 @router.get(
     "/heatmap",
+    response_model=dict,
     summary="Get fraud heatmap data",
     description="Get fraud distribution by hour and day of week for heatmap visualization."
 )
@@ -485,22 +420,13 @@ async def get_heatmap_data(
     days: int = Query(30, ge=7, le=365),
     current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
-) -> dict:
+) -> FastJSONResponse:
     """
     Get heatmap data showing fraud distribution by hour and day of week.
     """
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
 
-    predictions = (
-        db.query(Prediction)
-        .filter(
-            Prediction.user_id == int(current_user.id),
-            Prediction.created_at >= start_date
-        )
-        .all()
-    )
-
     # Initialize heatmap data
     heatmap = {}
     for day in range(7):  # 0=Monday, 6=Sunday
@@ -508,15 +434,11 @@ async def get_heatmap_data(
             key = f"{day}_{hour}"
             heatmap[key] = {"total": 0, "fraud": 0}
 
-    # Aggregate predictions
-    for p in predictions:
-        if p.created_at:
-            day = p.created_at.weekday()
-            hour = p.created_at.hour
-            key = f"{day}_{hour}"
-            heatmap[key]["total"] += 1
-            if p.is_fraud:
-                heatmap[key]["fraud"] += 1
+    # Aggregate hourly rollups
+    for bucket in hourly_buckets(db, int(current_user.id), start=start_date):
+        key = f"{bucket['bucket_start'].weekday()}_{bucket['bucket_start'].hour}"
+        heatmap[key]["total"] += bucket["total"]
+        heatmap[key]["fraud"] += bucket["fraud_count"]
 
     # Convert to list format for frontend
     result = []
@@ -535,8 +457,8 @@ async def get_heatmap_data(
                 "fraud_rate": fraud_rate
             })
 
-    return {
+    return FastJSONResponse({
         "data": result,
         "period_days": days,
         "max_fraud_rate": max(r["fraud_rate"] for r in result) if result else 0
-    }
+    })
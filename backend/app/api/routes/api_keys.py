@@ -10,7 +10,7 @@ import hashlib
 from datetime import datetime, timedelta
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
@@ -23,14 +23,22 @@ router = APIRouter(prefix="/api-keys", tags=["API Keys"])
 
 
 # In-memory storage for API keys (in production, use database)
-# Structure: {key_hash: {user_id, name, created_at, last_used, scopes, is_active}}
+# Structure: {key_hash: {user_id, name, created_at, last_used, scopes, is_active, memoize_predictions}}
 api_keys_store = {}
 
+# Header integrations send their API key in
+API_KEY_HEADER = "X-API-Key"
+
 
 class APIKeyCreate(BaseModel):
     name: str
     scopes: List[str] = ["read"]  # read, write, admin
     expires_in_days: Optional[int] = 365
+    memoize_predictions: bool = True  # False: always score fresh, never reuse a memoized result
+
+
+class APIKeyUpdate(BaseModel):
+    memoize_predictions: Optional[bool] = None
 
 
 class APIKeyResponse(BaseModel):
@@ -42,6 +50,7 @@ class APIKeyResponse(BaseModel):
     last_used: Optional[str]
     expires_at: Optional[str]
     is_active: bool
+    memoize_predictions: bool = True
 
 
 class APIKeyCreateResponse(BaseModel):
@@ -81,6 +90,15 @@ def verify_api_key(key: str) -> Optional[dict]:
     return None
 
 
+def memoization_allowed(request: Request) -> bool:
+    """Whether the request's API key (if any) accepts memoized prediction results"""
+    key = request.headers.get(API_KEY_HEADER)
+    if not key:
+        return True
+    key_data = verify_api_key(key)
+    return key_data is None or key_data.get("memoize_predictions", True)
+
+
 @router.post(
     "",
     response_model=APIKeyCreateResponse,
@@ -140,7 +158,8 @@ async def create_api_key(
         "created_at": datetime.utcnow().isoformat(),
         "last_used": None,
         "expires_at": expires_at,
-        "is_active": True
+        "is_active": True,
+        "memoize_predictions": key_data.memoize_predictions
     }
 
     return APIKeyCreateResponse(
@@ -172,7 +191,8 @@ async def list_api_keys(
             created_at=k["created_at"],
             last_used=k["last_used"],
             expires_at=k["expires_at"],
-            is_active=k["is_active"]
+            is_active=k["is_active"],
+            memoize_predictions=k.get("memoize_predictions", True)
         )
         for k in api_keys_store.values()
         if k["user_id"] == int(current_user.id)
@@ -199,6 +219,42 @@ async def revoke_api_key(
     raise HTTPException(status_code=404, detail="API key not found")
 
 
+@router.patch(
+    "/{key_id}",
+    response_model=APIKeyResponse,
+    summary="Update API key settings",
+    description="Change settings of an API key, such as whether it accepts memoized predictions."
+)
+async def update_api_key(
+    key_id: str,
+    update: APIKeyUpdate,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Update an API key's settings.
+
+    - **memoize_predictions**: false makes every prediction sent with this
+      key score fresh, for clients that must not receive a reused result
+    """
+    for key_data in api_keys_store.values():
+        if key_data["id"] == key_id and key_data["user_id"] == int(current_user.id):
+            if update.memoize_predictions is not None:
+                key_data["memoize_predictions"] = update.memoize_predictions
+            return APIKeyResponse(
+                id=key_data["id"],
+                name=key_data["name"],
+                prefix=key_data["prefix"],
+                scopes=key_data["scopes"],
+                created_at=key_data["created_at"],
+                last_used=key_data["last_used"],
+                expires_at=key_data["expires_at"],
+                is_active=key_data["is_active"],
+                memoize_predictions=key_data.get("memoize_predictions", True)
+            )
+
+    raise HTTPException(status_code=404, detail="API key not found")
+
+
 @router.post(
     "/{key_id}/rotate",
     response_model=APIKeyCreateResponse,
@@ -242,7 +298,8 @@ async def rotate_api_key(
         "created_at": datetime.utcnow().isoformat(),
         "last_used": None,
         "expires_at": old_key_data["expires_at"],
-        "is_active": True
+        "is_active": True,
+        "memoize_predictions": old_key_data.get("memoize_predictions", True)
     }
 
     return APIKeyCreateResponse(
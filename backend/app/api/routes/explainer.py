@@ -1,6 +1,7 @@
 """AI Fraud Explainer API - Generates natural language explanations for fraud predictions"""
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import Optional
 from pydantic import BaseModel
@@ -542,9 +543,14 @@ async def explain_prediction(
 
     # Get prediction data
     if request.prediction_id:
-        prediction = db.query(Prediction).filter(
-            Prediction.id == request.prediction_id,
-            Prediction.user_id == current_user.id
+        prediction = db.execute(
+            select(
+                Prediction.amount, Prediction.risk_score, Prediction.fraud_probability,
+                Prediction.is_fraud, Prediction.shap_values, Prediction.time.label("time_feature")
+            ).where(
+                Prediction.id == request.prediction_id,
+                Prediction.user_id == current_user.id
+            )
         ).first()
 
         if not prediction:
@@ -653,9 +659,11 @@ async def get_quick_explanation(
 ):
     """Get a quick one-liner explanation for a prediction"""
 
-    prediction = db.query(Prediction).filter(
-        Prediction.id == prediction_id,
-        Prediction.user_id == current_user.id
+    prediction = db.execute(
+        select(Prediction.amount, Prediction.risk_score, Prediction.is_fraud).where(
+            Prediction.id == prediction_id,
+            Prediction.user_id == current_user.id
+        )
     ).first()
 
     if not prediction:
@@ -10,8 +10,9 @@ import math
 import random
 
 from ...db.database import get_db
-from ...db.models import Prediction, User
+from ...db.models import User
 from ...services.auth_service import get_current_user
+from ...services.rollups import hourly_buckets
 
 router = APIRouter(prefix="/forecast", tags=["Risk Forecast"])
 
@@ -122,13 +123,10 @@ def get_historical_patterns(db: Session, user_id: int, days: int = 90) -> dict:
 
     cutoff_date = datetime.utcnow() - timedelta(days=days)
 
-    # Get predictions from the last N days
-    predictions = db.query(Prediction).filter(
-        Prediction.user_id == user_id,
-        Prediction.created_at >= cutoff_date
-    ).all()
+    # Get hourly rollups from the last N days
+    buckets = hourly_buckets(db, user_id, start=cutoff_date)
 
-    if not predictions:
+    if not buckets:
         return {
             "hourly_fraud_rate": {h: 0.02 for h in range(24)},
             "daily_fraud_rate": {d: 0.02 for d in range(7)},
@@ -139,22 +137,20 @@ def get_historical_patterns(db: Session, user_id: int, days: int = 90) -> dict:
         }
 
     # Analyze by hour
-    hourly_stats = {h: {"total": 0, "fraud": 0, "amounts": []} for h in range(24)}
+    hourly_stats = {h: {"total": 0, "fraud": 0, "amount": 0.0} for h in range(24)}
     daily_stats = {d: {"total": 0, "fraud": 0} for d in range(7)}
 
-    for pred in predictions:
-        hour = pred.created_at.hour
-        day = pred.created_at.weekday()
+    for bucket in buckets:
+        hour = bucket["bucket_start"].hour
+        day = bucket["bucket_start"].weekday()
 
-        hourly_stats[hour]["total"] += 1
-        daily_stats[day]["total"] += 1
+        hourly_stats[hour]["total"] += bucket["total"]
+        daily_stats[day]["total"] += bucket["total"]
 
-        if pred.is_fraud:
-            hourly_stats[hour]["fraud"] += 1
-            daily_stats[day]["fraud"] += 1
+        hourly_stats[hour]["fraud"] += bucket["fraud_count"]
+        daily_stats[day]["fraud"] += bucket["fraud_count"]
 
-        if pred.amount:
-            hourly_stats[hour]["amounts"].append(pred.amount)
+        hourly_stats[hour]["amount"] += bucket["amount_sum"]
 
     # Calculate rates
     hourly_fraud_rate = {}
@@ -165,7 +161,7 @@ def get_historical_patterns(db: Session, user_id: int, days: int = 90) -> dict:
         if hourly_stats[h]["total"] > 0:
             hourly_fraud_rate[h] = hourly_stats[h]["fraud"] / hourly_stats[h]["total"]
             avg_transactions_per_hour[h] = hourly_stats[h]["total"] / days
-            avg_amount_by_hour[h] = sum(hourly_stats[h]["amounts"]) / len(hourly_stats[h]["amounts"]) if hourly_stats[h]["amounts"] else 150.0
+            avg_amount_by_hour[h] = hourly_stats[h]["amount"] / hourly_stats[h]["total"] if hourly_stats[h]["amount"] else 150.0
         else:
             hourly_fraud_rate[h] = 0.02  # Default baseline
             avg_transactions_per_hour[h] = 5
@@ -178,8 +174,9 @@ def get_historical_patterns(db: Session, user_id: int, days: int = 90) -> dict:
         else:
             daily_fraud_rate[d] = 0.02
 
-    total_fraud = sum(1 for p in predictions if p.is_fraud)
-    overall_fraud_rate = total_fraud / len(predictions) if predictions else 0.02
+    total_predictions = sum(bucket["total"] for bucket in buckets)
+    total_fraud = sum(bucket["fraud_count"] for bucket in buckets)
+    overall_fraud_rate = total_fraud / total_predictions if total_predictions else 0.02
 
     return {
         "hourly_fraud_rate": hourly_fraud_rate,
@@ -187,7 +184,7 @@ def get_historical_patterns(db: Session, user_id: int, days: int = 90) -> dict:
         "avg_transactions_per_hour": avg_transactions_per_hour,
         "avg_amount_by_hour": avg_amount_by_hour,
         "overall_fraud_rate": overall_fraud_rate,
-        "total_predictions": len(predictions)
+        "total_predictions": total_predictions
     }
 
 
@@ -8,167 +8,76 @@ Author: Zhmuryk Andrii
 Copyright (c) 2024 - All Rights Reserved
 """
 
-import json
-import hashlib
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from collections import defaultdict
+from typing import List, Dict, Optional, Tuple
 
+import numpy as np
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
 
+from ...core.executors import db_executor, inference_executor
+from ...core.responses import FastJSONResponse
 from ...db.database import get_db
 from ...db.models import Prediction
 from ...models.schemas import UserResponse
 from ...services.auth_service import get_current_user
+from ...services.fraud_clusters import fraud_cluster_store
+from ...services.fraud_graph import (
+    GraphNodes, SimilarityGraph, build_similarity_graph, load_graph_nodes, pair_connections, score_pairs
+)
+from ...services.prediction_service import get_feature_matrix
+from ...services.similarity_index import similarity_index, transaction_vectors
 
 router = APIRouter(prefix="/fraud-network", tags=["Fraud Network"])
 
 
-def calculate_similarity(pred1: Prediction, pred2: Prediction) -> Dict:
-    """
-    Calculate similarity between two predictions based on multiple factors.
-    Returns similarity score and connection type.
-    """
-    connections = []
-    total_score = 0
-
-    # 1. Amount similarity (within 10% range)
-    if pred1.amount > 0 and pred2.amount > 0:
-        amount_diff = abs(pred1.amount - pred2.amount) / max(pred1.amount, pred2.amount)
-        if amount_diff < 0.1:
-            connections.append({
-                "type": "similar_amount",
-                "strength": 1 - amount_diff,
-                "detail": f"${pred1.amount:.2f} ↔ ${pred2.amount:.2f}"
-            })
-            total_score += (1 - amount_diff) * 0.3
-
-    # 2. Time proximity (within 1 hour)
-    if pred1.created_at and pred2.created_at:
-        time_diff = abs((pred1.created_at - pred2.created_at).total_seconds())
-        if time_diff < 3600:  # 1 hour
-            time_strength = 1 - (time_diff / 3600)
-            connections.append({
-                "type": "time_proximity",
-                "strength": time_strength,
-                "detail": f"{int(time_diff / 60)} min apart"
-            })
-            total_score += time_strength * 0.25
-
-    # 3. Risk score similarity
-    if pred1.risk_score and pred2.risk_score:
-        risk_diff = abs(pred1.risk_score - pred2.risk_score) / 100
-        if risk_diff < 0.15:
-            risk_strength = 1 - risk_diff
-            connections.append({
-                "type": "similar_risk",
-                "strength": risk_strength,
-                "detail": f"Risk: {pred1.risk_score} ↔ {pred2.risk_score}"
-            })
-            total_score += risk_strength * 0.2
-
-    # 4. Same batch (strong connection)
-    if pred1.batch_id and pred2.batch_id and pred1.batch_id == pred2.batch_id:
-        connections.append({
-            "type": "same_batch",
-            "strength": 1.0,
-            "detail": f"Batch: {pred1.batch_id[:8]}"
-        })
-        total_score += 0.5
-
-    # 5. Feature pattern similarity (using V features)
-    if pred1.features_json and pred2.features_json:
-        try:
-            f1 = json.loads(pred1.features_json)
-            f2 = json.loads(pred2.features_json)
-
-            # Compare key V features (V1, V2, V3, V14, V17 - most important)
-            key_features = ['v1', 'v2', 'v3', 'v14', 'v17']
-            feature_similarity = 0
-            count = 0
-
-            for feat in key_features:
-                if feat in f1 and feat in f2:
-                    diff = abs(f1[feat] - f2[feat])
-                    if diff < 1.0:  # Within 1 standard deviation
-                        feature_similarity += 1 - diff
-                        count += 1
-
-            if count > 0:
-                avg_similarity = feature_similarity / count
-                if avg_similarity > 0.5:
-                    connections.append({
-                        "type": "feature_pattern",
-                        "strength": avg_similarity,
-                        "detail": f"Pattern match: {avg_similarity:.1%}"
-                    })
-                    total_score += avg_similarity * 0.25
-        except:
-            pass
-
-    return {
-        "score": min(total_score, 1.0),
-        "connections": connections
-    }
+def fraud_graph_criteria(user_id: int, days: int, min_risk: int, include_legitimate: bool) -> List:
+    """Filter selecting the predictions of a user's fraud graph"""
+    criteria = [
+        Prediction.user_id == user_id,
+        Prediction.created_at >= datetime.utcnow() - timedelta(days=days),
+        Prediction.risk_score >= min_risk,
+    ]
+    if not include_legitimate:
+        criteria.append(Prediction.is_fraud == True)
+    return criteria
 
 
-def detect_fraud_clusters(predictions: List[Prediction], threshold: float = 0.3) -> List[Dict]:
+def load_node_neighbourhood(
+    db: Session, prediction_id: int, user_id: int
+) -> Optional[Tuple[Prediction, GraphNodes]]:
     """
-    Detect clusters of related fraud predictions using similarity analysis.
+    A user's prediction, with graph nodes of it followed by up to 50 of
+    the user's other predictions from the 24 hours either side
     """
-    if len(predictions) < 2:
-        return []
+    prediction = db.query(Prediction).filter(
+        Prediction.id == prediction_id,
+        Prediction.user_id == user_id
+    ).first()
+    if not prediction:
+        return None
 
-    # Build adjacency list
-    edges = []
-    for i, pred1 in enumerate(predictions):
-        for j, pred2 in enumerate(predictions[i+1:], i+1):
-            similarity = calculate_similarity(pred1, pred2)
-            if similarity["score"] >= threshold:
-                edges.append({
-                    "source": pred1.id,
-                    "target": pred2.id,
-                    "weight": similarity["score"],
-                    "connections": similarity["connections"]
-                })
-
-    # Find connected components (clusters)
-    if not edges:
-        return []
-
-    # Union-Find for clustering
-    parent = {p.id: p.id for p in predictions}
-
-    def find(x):
-        if parent[x] != x:
-            parent[x] = find(parent[x])
-        return parent[x]
-
-    def union(x, y):
-        px, py = find(x), find(y)
-        if px != py:
-            parent[px] = py
-
-    for edge in edges:
-        union(edge["source"], edge["target"])
-
-    # Group by cluster
-    clusters = defaultdict(list)
-    for pred in predictions:
-        clusters[find(pred.id)].append(pred.id)
+    target = load_graph_nodes(db, [Prediction.id == prediction_id], [])
+    related = load_graph_nodes(db, [
+        Prediction.user_id == user_id,
+        Prediction.id != prediction_id,
+        Prediction.created_at >= prediction.created_at - timedelta(hours=24),
+        Prediction.created_at <= prediction.created_at + timedelta(hours=24)
+    ], [Prediction.id], 50)
+    return prediction, GraphNodes(target.rows + related.rows, np.vstack([target.features, related.features]))
 
-    # Filter clusters with more than 1 member
-    return [
-        {"cluster_id": k, "members": v, "size": len(v)}
-        for k, v in clusters.items()
-        if len(v) > 1
-    ]
+
+async def build_fraud_graph(db: Session, criteria: List, max_nodes: int, threshold: float) -> SimilarityGraph:
+    """Load the newest matching predictions and build their similarity graph off the event loop"""
+    nodes = await db_executor.run(
+        load_graph_nodes, db, criteria, [Prediction.created_at.desc()], max_nodes
+    )
+    return await inference_executor.run(build_similarity_graph, nodes, threshold)
 
 
 @router.get(
     "/graph",
+    response_model=dict,
     summary="Get fraud network graph data",
     description="Returns nodes and edges for visualizing fraud connections."
 )
@@ -177,35 +86,26 @@ async def get_fraud_network_graph(
     min_risk: int = Query(30, ge=0, le=100, description="Minimum risk score to include"),
     include_legitimate: bool = Query(False, description="Include legitimate transactions"),
     similarity_threshold: float = Query(0.25, ge=0.1, le=0.9, description="Connection threshold"),
+    max_nodes: int = Query(1000, ge=2, le=50000, description="Newest transactions to include"),
+    max_edges: int = Query(20000, ge=1, le=200000, description="Strongest connections to return"),
     current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
-) -> Dict:
+) -> FastJSONResponse:
     """
     Generate fraud network graph data for visualization.
 
     Returns:
     - nodes: Transaction nodes with attributes
-    - edges: Connections between similar transactions
+    - edges: Connections between similar transactions (the strongest
+      max_edges; statistics count all of them)
     - clusters: Detected fraud rings/groups
     - statistics: Network analysis stats
     """
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
-
-    # Query predictions
-    query = db.query(Prediction).filter(
-        Prediction.user_id == int(current_user.id),
-        Prediction.created_at >= start_date,
-        Prediction.risk_score >= min_risk
-    )
-
-    if not include_legitimate:
-        query = query.filter(Prediction.is_fraud == True)
-
-    predictions = query.order_by(Prediction.created_at.desc()).limit(200).all()
+    criteria = fraud_graph_criteria(int(current_user.id), days, min_risk, include_legitimate)
+    graph = await build_fraud_graph(db, criteria, max_nodes, similarity_threshold)
 
-    if not predictions:
-        return {
+    if not len(graph.nodes):
+        return FastJSONResponse({
             "nodes": [],
             "edges": [],
             "clusters": [],
@@ -215,11 +115,11 @@ async def get_fraud_network_graph(
                 "clusters_found": 0,
                 "density": 0
             }
-        }
+        })
 
     # Build nodes
     nodes = []
-    for pred in predictions:
+    for pred in graph.nodes.rows:
         node = {
             "id": str(pred.id),
             "label": f"TX-{pred.id}",
@@ -237,65 +137,58 @@ async def get_fraud_network_graph(
         nodes.append(node)
 
     # Build edges
+    node_ids = [node["id"] for node in nodes]
+    scores = graph.edges["score"]
     edges = []
-    edge_id = 0
-    for i, pred1 in enumerate(predictions):
-        for pred2 in predictions[i+1:]:
-            similarity = calculate_similarity(pred1, pred2)
-            if similarity["score"] >= similarity_threshold:
-                edge = {
-                    "id": f"e{edge_id}",
-                    "source": str(pred1.id),
-                    "target": str(pred2.id),
-                    "weight": similarity["score"],
-                    "connections": similarity["connections"],
-                    # Edge styling
-                    "width": 1 + (similarity["score"] * 4),
-                    "color": get_edge_color(similarity["score"]),
-                    "label": f"{similarity['score']:.0%}"
-                }
-                edges.append(edge)
-                edge_id += 1
+    for edge_id, edge in enumerate(graph.top_edges(max_edges)):
+        score = float(scores[edge])
+        edges.append({
+            "id": f"e{edge_id}",
+            "source": node_ids[graph.source[edge]],
+            "target": node_ids[graph.target[edge]],
+            "weight": score,
+            "connections": graph.connections(edge),
+            # Edge styling
+            "width": 1 + (score * 4),
+            "color": get_edge_color(score),
+            "label": f"{score:.0%}"
+        })
 
-    # Detect clusters
-    clusters = detect_fraud_clusters(predictions, similarity_threshold)
+    # Clusters are the connected components of the same edges
+    clusters = graph.clusters()
 
     # Calculate statistics
     n_nodes = len(nodes)
-    n_edges = len(edges)
-    max_edges = n_nodes * (n_nodes - 1) / 2 if n_nodes > 1 else 1
-    density = n_edges / max_edges if max_edges > 0 else 0
+    n_edges = graph.edge_count
+    max_possible_edges = n_nodes * (n_nodes - 1) / 2 if n_nodes > 1 else 1
+    density = n_edges / max_possible_edges if max_possible_edges > 0 else 0
 
     # Find most connected nodes
-    connection_count = defaultdict(int)
-    for edge in edges:
-        connection_count[edge["source"]] += 1
-        connection_count[edge["target"]] += 1
-
-    top_connected = sorted(
-        connection_count.items(),
-        key=lambda x: x[1],
-        reverse=True
-    )[:5]
+    degrees = graph.degrees()
+    top_connected = [
+        position for position in np.argsort(-degrees, kind="stable")[:5] if degrees[position]
+    ]
 
-    return {
+    return FastJSONResponse({
         "nodes": nodes,
         "edges": edges,
         "clusters": clusters,
         "statistics": {
             "total_nodes": n_nodes,
             "total_edges": n_edges,
+            "edges_returned": len(edges),
+            "exact": graph.exact,
             "clusters_found": len(clusters),
             "density": round(density, 4),
             "avg_connections": round(n_edges * 2 / n_nodes, 2) if n_nodes > 0 else 0,
             "top_connected": [
-                {"node_id": node_id, "connections": count}
-                for node_id, count in top_connected
+                {"node_id": node_ids[position], "connections": int(degrees[position])}
+                for position in top_connected
             ],
             "period_days": days,
             "min_risk_filter": min_risk
         }
-    }
+    })
 
 
 @router.get(
@@ -314,38 +207,29 @@ async def get_node_details(
     - All connected nodes
     - Connection explanations
     """
-    prediction = db.query(Prediction).filter(
-        Prediction.id == prediction_id,
-        Prediction.user_id == int(current_user.id)
-    ).first()
-
-    if not prediction:
+    loaded = await db_executor.run(load_node_neighbourhood, db, prediction_id, int(current_user.id))
+    if loaded is None:
         raise HTTPException(status_code=404, detail="Prediction not found")
+    prediction, nodes = loaded
 
-    # Find connected predictions (same time window)
-    time_window_start = prediction.created_at - timedelta(hours=24)
-    time_window_end = prediction.created_at + timedelta(hours=24)
-
-    related = db.query(Prediction).filter(
-        Prediction.user_id == int(current_user.id),
-        Prediction.id != prediction_id,
-        Prediction.created_at >= time_window_start,
-        Prediction.created_at <= time_window_end
-    ).limit(50).all()
+    # Score the prediction against each related one in one pass
+    related = np.arange(1, len(nodes))
+    scores = score_pairs(nodes, np.zeros_like(related), related)
 
     connections = []
-    for rel in related:
-        similarity = calculate_similarity(prediction, rel)
-        if similarity["score"] > 0.2:
-            connections.append({
-                "node_id": rel.id,
-                "amount": rel.amount,
-                "risk_score": rel.risk_score,
-                "is_fraud": rel.is_fraud,
-                "similarity_score": similarity["score"],
-                "connection_types": similarity["connections"],
-                "created_at": rel.created_at.isoformat() if rel.created_at else None
-            })
+    for k in np.flatnonzero(scores["score"] > 0.2):
+        rel = nodes.rows[related[k]]
+        connections.append({
+            "node_id": rel.id,
+            "amount": rel.amount,
+            "risk_score": rel.risk_score,
+            "is_fraud": rel.is_fraud,
+            "similarity_score": float(scores["score"][k]),
+            "connection_types": pair_connections(
+                nodes.rows[0], rel, {name: values[k] for name, values in scores.items()}
+            ),
+            "created_at": rel.created_at.isoformat() if rel.created_at else None
+        })
 
     # Sort by similarity
     connections.sort(key=lambda x: x["similarity_score"], reverse=True)
@@ -367,6 +251,60 @@ async def get_node_details(
     }
 
 
+@router.get(
+    "/similar/{prediction_id}",
+    summary="Get similar transactions",
+    description="Nearest transactions by V1-V28 and amount, from the approximate nearest-neighbour index."
+)
+async def get_similar_transactions(
+    prediction_id: int,
+    k: int = Query(10, ge=1, le=100, description="Neighbours to return"),
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> Dict:
+    """
+    Find the user's transactions that look most like this one.
+
+    The index picks up predictions saved since the last query before
+    searching.
+    """
+    user_id = int(current_user.id)
+    ids, features = await db_executor.run(
+        get_feature_matrix, db, Prediction.id == prediction_id, Prediction.user_id == user_id
+    )
+    if not len(ids):
+        raise HTTPException(status_code=404, detail="Prediction not found")
+
+    await db_executor.run(similarity_index.refresh, db)
+    neighbours = await inference_executor.run(
+        similarity_index.search, transaction_vectors(features)[0], k, user_id, prediction_id
+    )
+
+    rows = {
+        row.id: row
+        for row in db.query(
+            Prediction.id, Prediction.amount, Prediction.risk_score, Prediction.is_fraud, Prediction.created_at
+        ).filter(Prediction.id.in_([neighbour_id for neighbour_id, _ in neighbours])).all()
+    }
+
+    return {
+        "prediction_id": prediction_id,
+        "neighbours": [
+            {
+                "node_id": neighbour_id,
+                "distance": round(distance, 4),
+                "amount": rows[neighbour_id].amount,
+                "risk_score": rows[neighbour_id].risk_score,
+                "is_fraud": rows[neighbour_id].is_fraud,
+                "created_at": rows[neighbour_id].created_at.isoformat() if rows[neighbour_id].created_at else None
+            }
+            for neighbour_id, distance in neighbours
+            if neighbour_id in rows
+        ],
+        "index": similarity_index.get_stats()
+    }
+
+
 @router.get(
     "/clusters",
     summary="Get fraud clusters",
@@ -379,47 +317,38 @@ async def get_fraud_clusters(
     db: Session = Depends(get_db)
 ) -> Dict:
     """
-    Detect and return fraud clusters (potential fraud rings).
-    """
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
-
-    predictions = db.query(Prediction).filter(
-        Prediction.user_id == int(current_user.id),
-        Prediction.created_at >= start_date,
-        Prediction.is_fraud == True
-    ).order_by(Prediction.created_at.desc()).limit(100).all()
+    Return fraud clusters (potential fraud rings) with members in the period.
 
-    clusters = detect_fraud_clusters(predictions, threshold=0.3)
+    Fraud predictions saved since the last lookup are linked into their
+    rings first; existing rings are only looked up.
+    """
+    clusters = await db_executor.run(
+        fraud_cluster_store.user_clusters,
+        db, int(current_user.id), datetime.utcnow() - timedelta(days=days), min_cluster_size
+    )
 
     # Enrich cluster data
     enriched_clusters = []
     for cluster in clusters:
-        if cluster["size"] >= min_cluster_size:
-            members = []
-            total_amount = 0
-            avg_risk = 0
-
-            for pred_id in cluster["members"]:
-                pred = next((p for p in predictions if p.id == pred_id), None)
-                if pred:
-                    members.append({
-                        "id": pred.id,
-                        "amount": pred.amount,
-                        "risk_score": pred.risk_score,
-                        "created_at": pred.created_at.isoformat() if pred.created_at else None
-                    })
-                    total_amount += pred.amount
-                    avg_risk += pred.risk_score
-
-            enriched_clusters.append({
-                "cluster_id": cluster["cluster_id"],
-                "size": cluster["size"],
-                "members": members,
-                "total_amount": round(total_amount, 2),
-                "avg_risk_score": round(avg_risk / cluster["size"], 1) if cluster["size"] > 0 else 0,
-                "threat_level": "critical" if avg_risk / cluster["size"] > 75 else "high" if avg_risk / cluster["size"] > 50 else "medium"
-            })
+        members = cluster["members"]
+        avg_risk = sum(pred.risk_score for pred in members) / cluster["size"]
+
+        enriched_clusters.append({
+            "cluster_id": cluster["cluster_id"],
+            "size": cluster["size"],
+            "members": [
+                {
+                    "id": pred.id,
+                    "amount": pred.amount,
+                    "risk_score": pred.risk_score,
+                    "created_at": pred.created_at.isoformat() if pred.created_at else None
+                }
+                for pred in members
+            ],
+            "total_amount": round(sum(pred.amount for pred in members), 2),
+            "avg_risk_score": round(avg_risk, 1),
+            "threat_level": "critical" if avg_risk > 75 else "high" if avg_risk > 50 else "medium"
+        })
 
     # Sort by threat level
     enriched_clusters.sort(key=lambda x: x["avg_risk_score"], reverse=True)
@@ -449,7 +378,9 @@ async def get_fraud_timeline(
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
 
-    predictions = db.query(Prediction).filter(
+    predictions = db.query(
+        Prediction.id, Prediction.amount, Prediction.risk_score, Prediction.is_fraud, Prediction.created_at
+    ).filter(
         Prediction.user_id == int(current_user.id),
         Prediction.created_at >= start_date
     ).order_by(Prediction.created_at).all()
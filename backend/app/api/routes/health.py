@@ -15,7 +15,13 @@ from ...models.schemas import HealthResponse
 from ...models.ml_model import fraud_model
 from ...core.config import settings
 from ...core.rate_limit import get_rate_limit_status
+from ...core.executors import EXECUTORS
 from ...db.database import engine
+from ...services.cache_service import cache
+from ...services.micro_batcher import micro_batcher
+from ...services.prediction_memo import prediction_memo
+from ...services.prediction_sink import prediction_sink
+from ...services.report_cache import report_cache
 
 router = APIRouter()
 
@@ -139,7 +145,9 @@ async def detailed_health_check() -> Dict[str, Any]:
             "ml_model": {
                 "status": "healthy" if fraud_model.is_loaded else "unhealthy",
                 "loaded": fraud_model.is_loaded,
-                "type": fraud_model.model_info.get("model_type", "unknown") if fraud_model.is_loaded else None
+                "type": fraud_model.model_info.get("model_type", "unknown") if fraud_model.is_loaded else None,
+                "inference_backend": fraud_model.inference_backend if fraud_model.is_loaded else None,
+                "prediction_memo": prediction_memo.get_stats()
             },
             "database": db_status,
             "redis": redis_status
@@ -261,6 +269,131 @@ async def get_prometheus_metrics():
     metrics.append(f"# TYPE fraud_detection_model_loaded gauge")
     metrics.append(f'fraud_detection_model_loaded {1 if fraud_model.is_loaded else 0}')
 
+    # Inference micro-batching
+    batching = micro_batcher.get_stats()
+    metrics.append(f"# HELP fraud_detection_inference_queue_depth Predictions waiting to be batched")
+    metrics.append(f"# TYPE fraud_detection_inference_queue_depth gauge")
+    metrics.append(f'fraud_detection_inference_queue_depth {batching["queue_depth"]}')
+
+    metrics.append(f"# HELP fraud_detection_inference_batch_size Rows scored per model call")
+    metrics.append(f"# TYPE fraud_detection_inference_batch_size histogram")
+    for bucket, count in batching["batch_size_buckets"].items():
+        metrics.append(f'fraud_detection_inference_batch_size_bucket{{le="{bucket}"}} {count}')
+    metrics.append(f'fraud_detection_inference_batch_size_bucket{{le="+Inf"}} {batching["batches"]}')
+    metrics.append(f'fraud_detection_inference_batch_size_sum {batching["batch_size_sum"]}')
+    metrics.append(f'fraud_detection_inference_batch_size_count {batching["batches"]}')
+
+    metrics.append(f"# HELP fraud_detection_inference_batch_wait_ms Wait added by micro-batching in ms")
+    metrics.append(f"# TYPE fraud_detection_inference_batch_wait_ms summary")
+    metrics.append(f'fraud_detection_inference_batch_wait_ms_sum {batching["wait_ms_sum"]}')
+    metrics.append(f'fraud_detection_inference_batch_wait_ms_count {batching["rows"]}')
+
+    # Prediction memoization
+    memo = prediction_memo.get_stats()
+    metrics.append(f"# HELP fraud_detection_prediction_memo_lookups_total Memo lookups by result (local_hit, redis_hit, miss, bypass)")
+    metrics.append(f"# TYPE fraud_detection_prediction_memo_lookups_total counter")
+    for result, count in memo["lookups"].items():
+        metrics.append(f'fraud_detection_prediction_memo_lookups_total{{result="{result}"}} {count}')
+
+    metrics.append(f"# HELP fraud_detection_prediction_memo_entries Memoized feature vectors in this process")
+    metrics.append(f"# TYPE fraud_detection_prediction_memo_entries gauge")
+    metrics.append(f'fraud_detection_prediction_memo_entries {memo["entries"]}')
+
+    # Write-behind prediction sink
+    sink = prediction_sink.get_stats()
+    metrics.append(f"# HELP fraud_detection_prediction_sink_queue_size Predictions waiting to be written")
+    metrics.append(f"# TYPE fraud_detection_prediction_sink_queue_size gauge")
+    metrics.append(f'fraud_detection_prediction_sink_queue_size {sink["queue_size"]}')
+
+    metrics.append(f"# HELP fraud_detection_prediction_sink_flush_ms Bulk insert latency per flush in ms")
+    metrics.append(f"# TYPE fraud_detection_prediction_sink_flush_ms summary")
+    metrics.append(f'fraud_detection_prediction_sink_flush_ms_sum {sink["flush_ms_sum"]}')
+    metrics.append(f'fraud_detection_prediction_sink_flush_ms_count {sink["flushes"]}')
+
+    metrics.append(f"# HELP fraud_detection_prediction_sink_rows_written_total Predictions written by the sink")
+    metrics.append(f"# TYPE fraud_detection_prediction_sink_rows_written_total counter")
+    metrics.append(f'fraud_detection_prediction_sink_rows_written_total {sink["rows_written"]}')
+
+    metrics.append(f"# HELP fraud_detection_prediction_sink_dropped_rows_total Predictions dropped after failed flushes")
+    metrics.append(f"# TYPE fraud_detection_prediction_sink_dropped_rows_total counter")
+    metrics.append(f'fraud_detection_prediction_sink_dropped_rows_total {sink["dropped_rows"]}')
+
+    # Executor pools
+    executor_stats = [(executor.name, executor.get_stats()) for executor in EXECUTORS]
+    metrics.append(f"# HELP fraud_detection_executor_queued Tasks waiting for an executor thread")
+    metrics.append(f"# TYPE fraud_detection_executor_queued gauge")
+    for name, stats in executor_stats:
+        metrics.append(f'fraud_detection_executor_queued{{pool="{name}"}} {stats["queued"]}')
+
+    metrics.append(f"# HELP fraud_detection_executor_running Tasks running on executor threads")
+    metrics.append(f"# TYPE fraud_detection_executor_running gauge")
+    for name, stats in executor_stats:
+        metrics.append(f'fraud_detection_executor_running{{pool="{name}"}} {stats["running"]}')
+
+    metrics.append(f"# HELP fraud_detection_executor_rejected_total Tasks rejected with 503 because the queue was full")
+    metrics.append(f"# TYPE fraud_detection_executor_rejected_total counter")
+    for name, stats in executor_stats:
+        metrics.append(f'fraud_detection_executor_rejected_total{{pool="{name}"}} {stats["rejected"]}')
+
+    # Rendered report cache
+    reports = report_cache.get_stats()
+    metrics.append(f"# HELP fraud_detection_report_cache_requests_total Report downloads by cache result")
+    metrics.append(f"# TYPE fraud_detection_report_cache_requests_total counter")
+    metrics.append(f'fraud_detection_report_cache_requests_total{{result="hit"}} {reports["hits"]}')
+    metrics.append(f'fraud_detection_report_cache_requests_total{{result="miss"}} {reports["misses"]}')
+
+    metrics.append(f"# HELP fraud_detection_report_renders_total Reports rendered into the cache")
+    metrics.append(f"# TYPE fraud_detection_report_renders_total counter")
+    metrics.append(f'fraud_detection_report_renders_total {reports["renders"]}')
+
+    metrics.append(f"# HELP fraud_detection_report_cache_evictions_total Cached reports evicted to stay under the size cap")
+    metrics.append(f"# TYPE fraud_detection_report_cache_evictions_total counter")
+    metrics.append(f'fraud_detection_report_cache_evictions_total {reports["evictions"]}')
+
+    metrics.append(f"# HELP fraud_detection_report_cache_bytes Size of the cached reports")
+    metrics.append(f"# TYPE fraud_detection_report_cache_bytes gauge")
+    metrics.append(f'fraud_detection_report_cache_bytes {reports["size_bytes"]}')
+
+    # Two-tier data cache
+    cache_stats = cache.get_stats()
+    metrics.append(f"# HELP fraud_detection_cache_requests_total Cache lookups by tier, key prefix and result")
+    metrics.append(f"# TYPE fraud_detection_cache_requests_total counter")
+    for prefix, tiers in cache_stats["prefixes"].items():
+        for tier, results in tiers.items():
+            for result in ("hit", "miss"):
+                if result in results:
+                    metrics.append(
+                        f'fraud_detection_cache_requests_total{{tier="{tier}",prefix="{prefix}",result="{result}"}} '
+                        f'{results[result]}'
+                    )
+
+    metrics.append(f"# HELP fraud_detection_cache_evictions_total Entries evicted from the in-process tier by key prefix")
+    metrics.append(f"# TYPE fraud_detection_cache_evictions_total counter")
+    for prefix, tiers in cache_stats["prefixes"].items():
+        if "eviction" in tiers.get("local", {}):
+            metrics.append(
+                f'fraud_detection_cache_evictions_total{{tier="local",prefix="{prefix}"}} {tiers["local"]["eviction"]}'
+            )
+
+    metrics.append(f"# HELP fraud_detection_cache_computations_total get_or_set results computed, coalesced onto a running computation or served stale")
+    metrics.append(f"# TYPE fraud_detection_cache_computations_total counter")
+    for prefix, tiers in cache_stats["prefixes"].items():
+        for result, count in tiers.get("compute", {}).items():
+            metrics.append(f'fraud_detection_cache_computations_total{{prefix="{prefix}",result="{result}"}} {count}')
+
+    metrics.append(f"# HELP fraud_detection_cache_local_entries Entries in the in-process tier")
+    metrics.append(f"# TYPE fraud_detection_cache_local_entries gauge")
+    metrics.append(f'fraud_detection_cache_local_entries {cache_stats["local"]["entries"]}')
+
+    metrics.append(f"# HELP fraud_detection_cache_local_bytes Encoded size of the in-process tier")
+    metrics.append(f"# TYPE fraud_detection_cache_local_bytes gauge")
+    metrics.append(f'fraud_detection_cache_local_bytes {cache_stats["local"]["size_bytes"]}')
+
+    if cache_stats["redis"].get("connected"):
+        metrics.append(f"# HELP fraud_detection_cache_redis_evicted_keys_total Keys Redis evicted under memory pressure")
+        metrics.append(f"# TYPE fraud_detection_cache_redis_evicted_keys_total counter")
+        metrics.append(f'fraud_detection_cache_redis_evicted_keys_total {cache_stats["redis"]["evicted_keys"]}')
+
     # Join with newlines
     return "\n".join(metrics) + "\n"
 
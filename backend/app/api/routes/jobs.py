@@ -0,0 +1,128 @@
+"""
+Batch Job Routes - Background CSV scoring with progress tracking
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.responses import FastJSONResponse
+from ...db.database import get_db
+from ...db.models import AuditAction, BatchJobStatus
+from ...models.ml_model import fraud_model
+from ...models.schemas import UserResponse
+from ...services.audit_service import log_action
+from ...services.auth_service import get_current_user
+from ...services.batch_jobs import batch_job_manager
+from ...services.pagination import InvalidCursor
+
+router = APIRouter(prefix="/jobs", tags=["Batch Jobs"])
+
+
+@router.post("", status_code=status.HTTP_202_ACCEPTED)
+async def submit_batch_job(
+    request: Request,
+    file: UploadFile = File(...),
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> dict:
+    """
+    Submit a CSV file for background batch prediction.
+
+    CSV format is the same as /predict/upload-csv, with no row limit.
+    Returns immediately with a job id; poll GET /jobs/{job_id} for progress
+    or listen for the `batch_complete` WebSocket message / webhook event.
+    """
+    if not fraud_model.is_loaded:
+        raise HTTPException(
+            status_code=503,
+            detail="Model not loaded. Please ensure the model files exist.",
+        )
+
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="File must be a CSV")
+
+    try:
+        job = await run_in_threadpool(
+            batch_job_manager.create_job,
+            db, int(current_user.id), file.filename, file.file, settings.max_stream_upload_size
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    log_action(
+        db, AuditAction.BATCH_PREDICTION,
+        user_id=int(current_user.id),
+        resource_type="batch_job",
+        resource_id=job.id,
+        details={"filename": file.filename, "estimated_rows": job.total_rows},
+        ip_address=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent", "")[:255]
+    )
+
+    batch_job_manager.enqueue(job.id, db.get_bind())
+    return batch_job_manager.job_to_dict(job)
+
+
+@router.get("", response_model=List[dict])
+async def list_batch_jobs(
+    limit: int = 20,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor / X-Prev-Cursor of a previous page"),
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> FastJSONResponse:
+    """List the current user's batch jobs, most recent first."""
+    try:
+        page = batch_job_manager.get_user_jobs(db, int(current_user.id), limit=min(max(limit, 1), 100), cursor=cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse([batch_job_manager.job_to_dict(job) for job in page.rows], headers=page.headers())
+
+
+@router.get("/{job_id}")
+async def get_batch_job(
+    job_id: str,
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> dict:
+    """Get status, progress and throughput of a batch job."""
+    job = batch_job_manager.get_job(db, job_id, int(current_user.id))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return batch_job_manager.job_to_dict(job)
+
+
+@router.get("/{job_id}/result")
+async def download_batch_job_result(
+    job_id: str,
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Download the predictions CSV of a completed batch job."""
+    job = batch_job_manager.get_job(db, job_id, int(current_user.id))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != BatchJobStatus.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status.value}")
+    if not job.result_path or not Path(job.result_path).exists():
+        raise HTTPException(status_code=404, detail="Result file no longer available")
+
+    return FileResponse(
+        job.result_path,
+        media_type="text/csv",
+        filename=f"predictions_{job.id[:8]}.csv",
+        headers={
+            "X-Batch-ID": job.id,
+            "X-Total-Rows": str(job.rows_processed),
+            "X-Fraud-Count": str(job.fraud_count),
+            "X-Legitimate-Count": str(job.rows_processed - job.fraud_count)
+        }
+    )
@@ -2,10 +2,12 @@
 
 import uuid
 import io
-from typing import Dict, List
+import logging
+from typing import Dict, List, Optional
 
 import pandas as pd
-from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
@@ -20,12 +22,26 @@ from ...models.ml_model import fraud_model
 from ...services.fraud_detector import FraudDetectorService
 from ...services.data_processor import DataProcessor
 from ...services.auth_service import get_current_user
-from ...services.prediction_service import save_prediction, get_user_predictions, get_user_prediction_stats, save_batch_predictions
+from ...services.prediction_service import (
+    HISTORY_FIELDS,
+    get_user_predictions,
+    get_user_prediction_stats,
+    prediction_record,
+    save_batch_predictions,
+    save_prediction,
+    serialize_prediction_rows,
+)
+from ...services.pagination import InvalidCursor
+from ...services.prediction_sink import prediction_sink
+from ...services.csv_stream import CsvScoringStream, spool_upload
 from ...db.database import get_db
 from ...db.models import AuditAction
 from ...services.audit_service import log_action
 from ...core.rate_limit import limiter
 from ...core.config import settings
+from ...core.responses import FastJSONResponse
+from ...core.executors import inference_executor, db_executor
+from .api_keys import memoization_allowed
 
 router = APIRouter()
 
@@ -58,12 +74,19 @@ async def predict_fraud(
         )
 
     try:
-        result = FraudDetectorService.predict_single(transaction)
+        result = await FraudDetectorService.predict_single_async(transaction, memoization_allowed(request))
 
-        # Save prediction to database
-        save_prediction(db, int(current_user.id), transaction, result)
+        # Save prediction to database, off the request path when write-behind is on
+        if settings.prediction_write_behind_enabled:
+            await prediction_sink.submit(
+                prediction_record(int(current_user.id), transaction, result), db.get_bind()
+            )
+        else:
+            await db_executor.run(save_prediction, db, int(current_user.id), transaction, result)
 
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         import logging
@@ -81,7 +104,7 @@ async def predict_fraud_batch(
     request: Request,
     batch: BatchPredictionInput,
     current_user: UserResponse = Depends(get_current_user)
-) -> BatchPredictionResponse:
+) -> FastJSONResponse:
     """
     Predict fraud for multiple transactions at once.
 
@@ -95,38 +118,46 @@ async def predict_fraud_batch(
         )
 
     try:
-        return FraudDetectorService.predict_batch(batch.transactions)
+        result = await inference_executor.run(
+            FraudDetectorService.predict_batch, batch.transactions, memoization_allowed(request)
+        )
+        # Already a validated BatchPredictionResponse; skip re-validating it
+        return FastJSONResponse(result)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Batch prediction error: {str(e)}")
 
 
 @router.get(
     "/history",
+    response_model=List[dict],
     summary="Get prediction history",
-    description="Get the authenticated user's prediction history.",
+    description=(
+        "Get the authenticated user's prediction history, newest first. Pass the "
+        "X-Next-Cursor / X-Prev-Cursor response header as `cursor` to page."
+    ),
 )
 async def get_history(
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page"),
+    include_total: bool = Query(False, description="Return the user's prediction count in X-Total-Count"),
     current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
-) -> List[dict]:
-    """Get the user's prediction history from database."""
-    predictions = get_user_predictions(db, int(current_user.id), limit=limit)
-
-    return [
-        {
-            "id": p.id,
-            "time": p.time,
-            "amount": p.amount,
-            "is_fraud": p.is_fraud,
-            "fraud_probability": p.fraud_probability,
-            "confidence": p.confidence,
-            "risk_score": p.risk_score,
-            "prediction_time_ms": p.prediction_time_ms,
-            "created_at": p.created_at.isoformat()
-        }
-        for p in predictions
-    ]
+) -> FastJSONResponse:
+    """Get a page of the user's prediction history from database."""
+    # Include predictions still waiting in the write-behind queue
+    await prediction_sink.flush()
+    try:
+        page = get_user_predictions(db, int(current_user.id), limit=limit, cursor=cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = page.headers()
+    if include_total:
+        # Exact, from the hourly rollups rather than a COUNT over the rows
+        headers["X-Total-Count"] = str(get_user_prediction_stats(db, int(current_user.id))["total_predictions"])
+    return FastJSONResponse(serialize_prediction_rows(page.rows, HISTORY_FIELDS), headers=headers)
 
 
 @router.get(
@@ -139,6 +170,7 @@ async def get_stats(
     db: Session = Depends(get_db)
 ) -> dict:
     """Get the user's prediction statistics."""
+    await prediction_sink.flush()
     return get_user_prediction_stats(db, int(current_user.id))
 
 
@@ -179,9 +211,10 @@ async def upload_csv_predictions(
     Upload a CSV file with transactions for batch prediction.
 
     CSV format should have columns: time, amount, v1, v2, ... v28
-    Maximum file size: 10MB
-    Maximum rows: 10000
+    Maximum file size: 100MB
+    Maximum rows: 100000
 
+    The file is scored column-wise in one batch call and bulk-inserted.
     Returns a CSV file with predictions added.
     """
     if not fraud_model.is_loaded:
@@ -197,7 +230,7 @@ async def upload_csv_predictions(
     # Read file content
     content = await file.read()
 
-    # Check file size (10MB limit)
+    # Check file size
     if len(content) > settings.max_upload_size:
         raise HTTPException(
             status_code=400,
@@ -206,65 +239,40 @@ async def upload_csv_predictions(
 
     try:
         # Parse CSV
-        df = pd.read_csv(io.BytesIO(content))
+        df = await inference_executor.run(pd.read_csv, io.BytesIO(content))
 
         # Check row limit
-        if len(df) > 10000:
-            raise HTTPException(status_code=400, detail="Maximum 10000 rows allowed")
-
-        # Validate columns
-        required_cols = ['time', 'amount'] + [f'v{i}' for i in range(1, 29)]
-        missing_cols = [col for col in required_cols if col.lower() not in [c.lower() for c in df.columns]]
-
-        if missing_cols:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing columns: {', '.join(missing_cols)}"
-            )
+        if len(df) > settings.csv_max_rows:
+            raise HTTPException(status_code=400, detail=f"Maximum {settings.csv_max_rows} rows allowed")
+        if len(df) == 0:
+            raise HTTPException(status_code=400, detail="CSV file has no rows")
 
-        # Normalize column names to lowercase
-        df.columns = df.columns.str.lower()
+        # Validate columns and values, then score every row in one vectorized call
+        try:
+            df = await inference_executor.run(FraudDetectorService.score_dataframe, df)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
         # Generate batch ID
         batch_id = str(uuid.uuid4())
 
-        # Process each row
-        predictions = []
-        for _, row in df.iterrows():
-            transaction = TransactionInput(
-                time=float(row['time']),
-                amount=float(row['amount']),
-                **{f'v{i}': float(row[f'v{i}']) for i in range(1, 29)}
-            )
-
-            result = FraudDetectorService.predict_single(transaction)
-            predictions.append({
-                'is_fraud': result.is_fraud,
-                'fraud_probability': result.fraud_probability,
-                'confidence': result.confidence,
-                'risk_score': result.risk_score
-            })
-
-        # Add predictions to dataframe
-        df['is_fraud'] = [p['is_fraud'] for p in predictions]
-        df['fraud_probability'] = [p['fraud_probability'] for p in predictions]
-        df['confidence'] = [p['confidence'] for p in predictions]
-        df['risk_score'] = [p['risk_score'] for p in predictions]
-
         # Save batch predictions to database
-        save_batch_predictions(db, int(current_user.id), df, batch_id)
+        await db_executor.run(save_batch_predictions, db, int(current_user.id), df, batch_id)
+
+        fraud_count = int(df["is_fraud"].sum())
 
         # Log the action
         client_ip = request.client.host if request.client else None
         user_agent = request.headers.get("user-agent", "")[:255]
-        log_action(
+        await db_executor.run(
+            log_action,
             db, AuditAction.BATCH_PREDICTION,
             user_id=int(current_user.id),
             resource_type="batch",
             resource_id=batch_id,
             details={
                 "rows": len(df),
-                "fraud_count": sum(1 for p in predictions if p['is_fraud']),
+                "fraud_count": fraud_count,
                 "filename": file.filename
             },
             ip_address=client_ip,
@@ -272,15 +280,10 @@ async def upload_csv_predictions(
         )
 
         # Generate result CSV
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-
-        # Count fraud
-        fraud_count = sum(1 for p in predictions if p['is_fraud'])
+        output = (await inference_executor.run(df.to_csv, index=False)).encode()
 
         return StreamingResponse(
-            io.BytesIO(output.getvalue().encode()),
+            io.BytesIO(output),
             media_type="text/csv",
             headers={
                 "Content-Disposition": f"attachment; filename=predictions_{batch_id[:8]}.csv",
@@ -302,3 +305,93 @@ async def upload_csv_predictions(
         import logging
         logging.error(f"CSV upload error: {str(e)}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+
+
+@router.post(
+    "/upload-csv/stream",
+    summary="Stream CSV batch prediction",
+    description="Score a large CSV file in chunks and stream the predictions back.",
+)
+async def upload_csv_predictions_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload a CSV file of any number of rows for chunked batch prediction.
+
+    CSV format is the same as /upload-csv. The file is parsed, scored and
+    saved in chunks of `csv_stream_chunk_rows` rows (one transaction per
+    chunk) and result rows are streamed back as each chunk completes, so
+    memory stays bounded regardless of file size.
+
+    Errors in the first chunk return 400. An error in a later chunk ends
+    the stream early; chunks already sent are saved under the batch id.
+    Totals are recorded in the audit log once the stream finishes.
+    """
+    if not fraud_model.is_loaded:
+        raise HTTPException(
+            status_code=503,
+            detail="Model not loaded. Please ensure the model files exist.",
+        )
+
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="File must be a CSV")
+
+    try:
+        source = await run_in_threadpool(
+            spool_upload, file.file, settings.max_stream_upload_size
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        stream = await inference_executor.run(
+            CsvScoringStream, source, settings.csv_stream_chunk_rows
+        )
+    except Exception as e:
+        source.close()
+        if isinstance(e, HTTPException):
+            raise
+        if isinstance(e, pd.errors.EmptyDataError):
+            raise HTTPException(status_code=400, detail="CSV file is empty")
+        if isinstance(e, pd.errors.ParserError):
+            raise HTTPException(status_code=400, detail=f"Invalid CSV format: {str(e)}")
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=str(e))
+        logging.error(f"CSV stream error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+
+    batch_id = str(uuid.uuid4())
+    user_id = int(current_user.id)
+    client_ip = request.client.host if request.client else None
+    user_agent = request.headers.get("user-agent", "")[:255]
+
+    def log_completion(stream_db: Session, completed: CsvScoringStream) -> None:
+        log_action(
+            stream_db, AuditAction.BATCH_PREDICTION,
+            user_id=user_id,
+            resource_type="batch",
+            resource_id=batch_id,
+            details={
+                "rows": completed.rows_processed,
+                "fraud_count": completed.fraud_count,
+                "filename": file.filename,
+                "streamed": True
+            },
+            ip_address=client_ip,
+            user_agent=user_agent
+        )
+
+    # The request session is closed before the body is sent; the stream gets its own
+    stream_db = Session(bind=db.get_bind())
+
+    return StreamingResponse(
+        stream.iter_csv(stream_db, user_id, batch_id, on_complete=log_completion),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f"attachment; filename=predictions_{batch_id[:8]}.csv",
+            "X-Batch-ID": batch_id,
+        }
+    )
@@ -5,6 +5,7 @@ Author: Zhmuryk Andrii
 Copyright (c) 2024 - All Rights Reserved
 """
 
+import functools
 import io
 from datetime import datetime, timedelta
 from typing import Optional, Literal
@@ -12,155 +13,29 @@ from typing import Optional, Literal
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 
+from ...core.config import settings
+from ...core.executors import db_executor
 from ...db.database import get_db
 from ...db.models import Prediction
 from ...models.schemas import UserResponse
 from ...services.auth_service import get_current_user
+from ...services.prediction_service import prediction_columns
+from ...services.report_cache import data_watermark, iter_file, report_cache
+from ...services.report_export import excel_export, iter_csv_export
+from ...services.rollups import hourly_buckets
 
 router = APIRouter(prefix="/reports", tags=["Reports"])
 
+# Prediction fields the PDF reports read
+REPORT_FIELDS = (
+    "id", "amount", "is_fraud", "fraud_probability", "confidence",
+    "risk_score", "prediction_time_ms", "batch_id", "created_at",
+)
 
-def generate_excel_report(
-    predictions: list,
-    user: UserResponse,
-    title: str,
-    include_summary: bool = True
-) -> bytes:
-    """Generate an Excel report with predictions data"""
-    try:
-        import pandas as pd
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils.dataframe import dataframe_to_rows
-        from openpyxl.chart import PieChart, Reference, BarChart
-
-        wb = Workbook()
-
-        # Summary Sheet
-        if include_summary and predictions:
-            ws_summary = wb.active
-            ws_summary.title = "Summary"
-
-            # Title
-            ws_summary['A1'] = title
-            ws_summary['A1'].font = Font(size=18, bold=True, color="2563EB")
-            ws_summary.merge_cells('A1:D1')
-
-            ws_summary['A3'] = f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
-            ws_summary['A4'] = f"User: {user.username}"
-            ws_summary['A5'] = f"Total Predictions: {len(predictions)}"
-
-            # Calculate stats
-            total = len(predictions)
-            fraud_count = sum(1 for p in predictions if p.get('is_fraud'))
-            legitimate_count = total - fraud_count
-            avg_amount = sum(p.get('amount', 0) for p in predictions) / total if total > 0 else 0
-
-            # Risk distribution
-            risk_low = sum(1 for p in predictions if p.get('risk_score', 0) < 25)
-            risk_medium = sum(1 for p in predictions if 25 <= p.get('risk_score', 0) < 50)
-            risk_high = sum(1 for p in predictions if 50 <= p.get('risk_score', 0) < 75)
-            risk_critical = sum(1 for p in predictions if p.get('risk_score', 0) >= 75)
-
-            # Summary table
-            summary_header = ['Metric', 'Value']
-            summary_data = [
-                ['Total Predictions', total],
-                ['Fraud Detected', fraud_count],
-                ['Legitimate', legitimate_count],
-                ['Fraud Rate', f"{fraud_count / total * 100:.2f}%" if total > 0 else "0%"],
-                ['Average Amount', f"${avg_amount:.2f}"],
-                ['', ''],
-                ['Risk Distribution', ''],
-                ['Low (0-24)', risk_low],
-                ['Medium (25-49)', risk_medium],
-                ['High (50-74)', risk_high],
-                ['Critical (75-100)', risk_critical],
-            ]
-
-            # Header styling
-            header_fill = PatternFill(start_color="2563EB", end_color="2563EB", fill_type="solid")
-            header_font = Font(color="FFFFFF", bold=True)
-            thin_border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-
-            # Write summary table
-            for col, header in enumerate(summary_header, 1):
-                cell = ws_summary.cell(row=7, column=col, value=header)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.border = thin_border
-                cell.alignment = Alignment(horizontal='center')
-
-            for row_idx, row_data in enumerate(summary_data, 8):
-                for col_idx, value in enumerate(row_data, 1):
-                    cell = ws_summary.cell(row=row_idx, column=col_idx, value=value)
-                    cell.border = thin_border
-                    if row_data[0] == 'Risk Distribution' or row_data[0] == '':
-                        cell.font = Font(bold=True)
-
-            # Column widths
-            ws_summary.column_dimensions['A'].width = 25
-            ws_summary.column_dimensions['B'].width = 20
-
-        # Data Sheet
-        ws_data = wb.create_sheet("Predictions Data")
-
-        # Headers
-        headers = ['Date', 'Amount', 'Is Fraud', 'Fraud Probability', 'Risk Score', 'Confidence']
-        header_fill = PatternFill(start_color="374151", end_color="374151", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True)
-
-        for col, header in enumerate(headers, 1):
-            cell = ws_data.cell(row=1, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-
-        # Data rows
-        fraud_fill = PatternFill(start_color="FEE2E2", end_color="FEE2E2", fill_type="solid")
-
-        for row_idx, pred in enumerate(predictions, 2):
-            ws_data.cell(row=row_idx, column=1, value=pred.get('created_at', '')[:19] if pred.get('created_at') else '')
-            ws_data.cell(row=row_idx, column=2, value=pred.get('amount', 0))
-            ws_data.cell(row=row_idx, column=3, value='Yes' if pred.get('is_fraud') else 'No')
-            ws_data.cell(row=row_idx, column=4, value=f"{pred.get('fraud_probability', 0) * 100:.2f}%")
-            ws_data.cell(row=row_idx, column=5, value=pred.get('risk_score', 0))
-            ws_data.cell(row=row_idx, column=6, value=pred.get('confidence', ''))
-
-            # Highlight fraud rows
-            if pred.get('is_fraud'):
-                for col in range(1, 7):
-                    ws_data.cell(row=row_idx, column=col).fill = fraud_fill
-
-        # Column widths
-        ws_data.column_dimensions['A'].width = 20
-        ws_data.column_dimensions['B'].width = 12
-        ws_data.column_dimensions['C'].width = 10
-        ws_data.column_dimensions['D'].width = 18
-        ws_data.column_dimensions['E'].width = 12
-        ws_data.column_dimensions['F'].width = 12
-
-        # Freeze header row
-        ws_data.freeze_panes = 'A2'
-
-        # Save to buffer
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        return buffer.getvalue()
-
-    except ImportError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Excel generation requires openpyxl. Error: {str(e)}"
-        )
+# model_info fields shown in the model performance report
+MODEL_REPORT_FIELDS = ("model_type", "version", "accuracy", "precision", "recall", "f1_score", "roc_auc")
 
 
 def generate_pdf_report(
@@ -307,30 +182,64 @@ def generate_pdf_report(
         return b"PDF generation requires reportlab. Please install it with: pip install reportlab"
 
 
-@router.get(
-    "/fraud-summary",
-    summary="Generate fraud summary report",
-    description="Generate a PDF report with fraud detection summary."
-)
-async def generate_fraud_summary_report(
-    days: int = Query(30, ge=1, le=365),
-    current_user: UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Generate a PDF fraud summary report"""
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
+async def cached_pdf_response(
+    db: Session,
+    user: UserResponse,
+    report_type: str,
+    params: dict,
+    criteria: list,
+    render,
+    filename_prefix: str
+) -> StreamingResponse:
+    """
+    Stream a PDF report from the report cache, rendering it on a miss
+
+    The cache key includes the watermark of the predictions matching
+    `criteria`, so a cached report is reused until they change.
+
+    Args:
+        db: Request session, used for the watermark query only
+        user: Report owner
+        report_type: Report name in the cache key
+        params: Query parameters that change the report's content
+        criteria: Filter on the predictions the report reads
+        render: Callable taking a session and returning the PDF bytes
+        filename_prefix: Download file name prefix
+    """
+    watermark = await db_executor.run(data_watermark, db, *criteria)
+    key = report_cache.make_key(int(user.id), report_type, params, watermark)
+
+    def render_report() -> bytes:
+        # Other requests may share this render after the request session closes
+        render_db = Session(bind=db.get_bind())
+        try:
+            return render(render_db)
+        finally:
+            render_db.close()
+
+    report = await report_cache.get_or_render(key, render_report)
+
+    filename = f"{filename_prefix}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
+    return StreamingResponse(
+        iter_file(report),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        }
+    )
 
+
+def render_fraud_summary_report(db: Session, user: UserResponse, days: int, start_date: datetime) -> bytes:
+    """Render the fraud summary PDF"""
     # Get predictions
-    predictions = (
-        db.query(Prediction)
-        .filter(
-            Prediction.user_id == int(current_user.id),
+    predictions = db.execute(
+        select(*prediction_columns(REPORT_FIELDS))
+        .where(
+            Prediction.user_id == int(user.id),
             Prediction.created_at >= start_date
         )
         .order_by(Prediction.created_at.desc())
-        .all()
-    )
+    ).all()
 
     # Calculate summary
     total = len(predictions)
@@ -398,37 +307,38 @@ async def generate_fraud_summary_report(
         for p in predictions
     ]
 
-    # Generate PDF
-    pdf_content = generate_pdf_report(
+    return generate_pdf_report(
         title="Fraud Detection Report",
         summary=summary,
         predictions=pred_list,
-        user=current_user,
+        user=user,
         period_days=days
     )
 
-    filename = f"fraud_report_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
-
-    return StreamingResponse(
-        io.BytesIO(pdf_content),
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
-    )
-
 
 @router.get(
-    "/trend-analysis",
-    summary="Generate trend analysis report",
-    description="Generate a PDF report with fraud trend analysis over time."
+    "/fraud-summary",
+    summary="Generate fraud summary report",
+    description="Generate a PDF report with fraud detection summary."
 )
-async def generate_trend_analysis_report(
-    days: int = Query(30, ge=7, le=365),
+async def generate_fraud_summary_report(
+    days: int = Query(30, ge=1, le=365),
     current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Generate a PDF trend analysis report"""
+    """Generate a PDF fraud summary report"""
+    start_date = datetime.utcnow() - timedelta(days=days)
+
+    return await cached_pdf_response(
+        db, current_user, "fraud_summary", {"days": days},
+        criteria=[Prediction.user_id == int(current_user.id), Prediction.created_at >= start_date],
+        render=functools.partial(render_fraud_summary_report, user=current_user, days=days, start_date=start_date),
+        filename_prefix="fraud_report"
+    )
+
+
+def render_trend_analysis_report(db: Session, user: UserResponse, start_date: datetime, end_date: datetime) -> bytes:
+    """Render the trend analysis PDF"""
     from reportlab.lib import colors
     from reportlab.lib.pagesizes import A4
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -436,44 +346,35 @@ async def generate_trend_analysis_report(
     from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
     from reportlab.lib.enums import TA_CENTER
 
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
-
-    predictions = (
-        db.query(Prediction)
-        .filter(
-            Prediction.user_id == int(current_user.id),
-            Prediction.created_at >= start_date
-        )
-        .order_by(Prediction.created_at)
-        .all()
-    )
+    buckets = hourly_buckets(db, int(user.id), start=start_date)
 
     # Group by day
     daily_stats = {}
-    for p in predictions:
-        day = p.created_at.strftime('%Y-%m-%d')
+    for bucket in buckets:
+        day = bucket['bucket_start'].strftime('%Y-%m-%d')
         if day not in daily_stats:
             daily_stats[day] = {'total': 0, 'fraud': 0, 'amount': 0}
-        daily_stats[day]['total'] += 1
-        daily_stats[day]['fraud'] += 1 if p.is_fraud else 0
-        daily_stats[day]['amount'] += p.amount
+        daily_stats[day]['total'] += bucket['total']
+        daily_stats[day]['fraud'] += bucket['fraud_count']
+        daily_stats[day]['amount'] += bucket['amount_sum']
+
+    # Calculate weekly trends (an hour crossing a week boundary counts
+    # toward the week it starts in)
+    weekly_totals = {}
+    for bucket in buckets:
+        week = max(0, (bucket['bucket_start'] - start_date) // timedelta(days=7))
+        totals = weekly_totals.setdefault(week, {'total': 0, 'fraud': 0})
+        totals['total'] += bucket['total']
+        totals['fraud'] += bucket['fraud_count']
 
-    # Calculate weekly trends
     weekly_trends = []
-    week_start = start_date
-    while week_start < end_date:
-        week_end = week_start + timedelta(days=7)
-        week_preds = [p for p in predictions if week_start <= p.created_at < week_end]
-        if week_preds:
-            fraud_count = sum(1 for p in week_preds if p.is_fraud)
-            weekly_trends.append({
-                'week': week_start.strftime('%Y-%m-%d'),
-                'total': len(week_preds),
-                'fraud': fraud_count,
-                'rate': fraud_count / len(week_preds) * 100
-            })
-        week_start = week_end
+    for week, totals in sorted(weekly_totals.items()):
+        weekly_trends.append({
+            'week': (start_date + timedelta(days=7 * week)).strftime('%Y-%m-%d'),
+            'total': totals['total'],
+            'fraud': totals['fraud'],
+            'rate': totals['fraud'] / totals['total'] * 100
+        })
 
     # Generate PDF
     buffer = io.BytesIO()
@@ -486,7 +387,7 @@ async def generate_trend_analysis_report(
     story.append(Spacer(1, 12))
 
     story.append(Paragraph(f"<b>Generated:</b> {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}", styles['Normal']))
-    story.append(Paragraph(f"<b>User:</b> {current_user.username}", styles['Normal']))
+    story.append(Paragraph(f"<b>User:</b> {user.username}", styles['Normal']))
     story.append(Paragraph(f"<b>Period:</b> {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}", styles['Normal']))
     story.append(Spacer(1, 20))
 
@@ -561,24 +462,35 @@ async def generate_trend_analysis_report(
     story.append(Paragraph("Generated by Fraud Detection ML System | (c) 2024 Zhmuryk Andrii", footer_style))
 
     doc.build(story)
-    buffer.seek(0)
-
-    filename = f"trend_analysis_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return StreamingResponse(buffer, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={filename}"})
+    return buffer.getvalue()
 
 
 @router.get(
-    "/high-risk",
-    summary="Generate high risk transactions report",
-    description="Generate a PDF report listing all high-risk transactions."
+    "/trend-analysis",
+    summary="Generate trend analysis report",
+    description="Generate a PDF report with fraud trend analysis over time."
 )
-async def generate_high_risk_report(
-    days: int = Query(30, ge=1, le=365),
-    threshold: int = Query(50, ge=0, le=100),
+async def generate_trend_analysis_report(
+    days: int = Query(30, ge=7, le=365),
     current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Generate a PDF report of high-risk transactions"""
+    """Generate a PDF trend analysis report"""
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
+
+    return await cached_pdf_response(
+        db, current_user, "trend_analysis", {"days": days},
+        criteria=[Prediction.user_id == int(current_user.id), Prediction.created_at >= start_date],
+        render=functools.partial(
+            render_trend_analysis_report, user=current_user, start_date=start_date, end_date=end_date
+        ),
+        filename_prefix="trend_analysis"
+    )
+
+
+def render_high_risk_report(db: Session, user: UserResponse, days: int, threshold: int, start_date: datetime) -> bytes:
+    """Render the high-risk transactions PDF"""
     from reportlab.lib import colors
     from reportlab.lib.pagesizes import A4
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -586,20 +498,16 @@ async def generate_high_risk_report(
     from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
     from reportlab.lib.enums import TA_CENTER
 
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
-
-    predictions = (
-        db.query(Prediction)
-        .filter(
-            Prediction.user_id == int(current_user.id),
+    predictions = db.execute(
+        select(*prediction_columns(REPORT_FIELDS))
+        .where(
+            Prediction.user_id == int(user.id),
             Prediction.created_at >= start_date,
             Prediction.risk_score >= threshold
         )
         .order_by(Prediction.risk_score.desc())
         .limit(100)
-        .all()
-    )
+    ).all()
 
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
@@ -611,7 +519,7 @@ async def generate_high_risk_report(
     story.append(Spacer(1, 12))
 
     story.append(Paragraph(f"<b>Generated:</b> {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}", styles['Normal']))
-    story.append(Paragraph(f"<b>User:</b> {current_user.username}", styles['Normal']))
+    story.append(Paragraph(f"<b>User:</b> {user.username}", styles['Normal']))
     story.append(Paragraph(f"<b>Period:</b> Last {days} days", styles['Normal']))
     story.append(Paragraph(f"<b>Risk Threshold:</b> {threshold}+", styles['Normal']))
     story.append(Paragraph(f"<b>Total High-Risk Found:</b> {len(predictions)}", styles['Normal']))
@@ -682,22 +590,35 @@ async def generate_high_risk_report(
     story.append(Paragraph("Generated by Fraud Detection ML System | (c) 2024 Zhmuryk Andrii", footer_style))
 
     doc.build(story)
-    buffer.seek(0)
-
-    filename = f"high_risk_transactions_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return StreamingResponse(buffer, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={filename}"})
+    return buffer.getvalue()
 
 
 @router.get(
-    "/model-performance",
-    summary="Generate model performance report",
-    description="Generate a PDF report with model performance metrics."
+    "/high-risk",
+    summary="Generate high risk transactions report",
+    description="Generate a PDF report listing all high-risk transactions."
 )
-async def generate_model_performance_report(
+async def generate_high_risk_report(
+    days: int = Query(30, ge=1, le=365),
+    threshold: int = Query(50, ge=0, le=100),
     current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Generate a PDF model performance report"""
+    """Generate a PDF report of high-risk transactions"""
+    start_date = datetime.utcnow() - timedelta(days=days)
+
+    return await cached_pdf_response(
+        db, current_user, "high_risk", {"days": days, "threshold": threshold},
+        criteria=[Prediction.user_id == int(current_user.id), Prediction.created_at >= start_date],
+        render=functools.partial(
+            render_high_risk_report, user=current_user, days=days, threshold=threshold, start_date=start_date
+        ),
+        filename_prefix="high_risk_transactions"
+    )
+
+
+def render_model_performance_report(db: Session, user: UserResponse) -> bytes:
+    """Render the model performance PDF"""
     from reportlab.lib import colors
     from reportlab.lib.pagesizes import A4
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -708,7 +629,9 @@ async def generate_model_performance_report(
 
     model_info = fraud_model.model_info if fraud_model.is_loaded else {}
 
-    all_predictions = db.query(Prediction).filter(Prediction.user_id == int(current_user.id)).all()
+    all_predictions = db.execute(
+        select(*prediction_columns(REPORT_FIELDS)).where(Prediction.user_id == int(user.id))
+    ).all()
 
     total = len(all_predictions)
     fraud_predictions = sum(1 for p in all_predictions if p.is_fraud)
@@ -727,7 +650,7 @@ async def generate_model_performance_report(
     story.append(Spacer(1, 12))
 
     story.append(Paragraph(f"<b>Generated:</b> {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}", styles['Normal']))
-    story.append(Paragraph(f"<b>User:</b> {current_user.username}", styles['Normal']))
+    story.append(Paragraph(f"<b>User:</b> {user.username}", styles['Normal']))
     story.append(Spacer(1, 20))
 
     story.append(Paragraph("<b>Model Information</b>", styles['Heading2']))
@@ -831,10 +754,33 @@ async def generate_model_performance_report(
     story.append(Paragraph("Generated by Fraud Detection ML System | (c) 2024 Zhmuryk Andrii", footer_style))
 
     doc.build(story)
-    buffer.seek(0)
+    return buffer.getvalue()
 
-    filename = f"model_performance_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return StreamingResponse(buffer, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@router.get(
+    "/model-performance",
+    summary="Generate model performance report",
+    description="Generate a PDF report with model performance metrics."
+)
+async def generate_model_performance_report(
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Generate a PDF model performance report"""
+    from ...models.ml_model import fraud_model
+
+    model_info = fraud_model.model_info if fraud_model.is_loaded else {}
+
+    return await cached_pdf_response(
+        db, current_user, "model_performance",
+        {
+            "model_loaded": fraud_model.is_loaded,
+            **{field: model_info.get(field) for field in MODEL_REPORT_FIELDS}
+        },
+        criteria=[Prediction.user_id == int(current_user.id)],
+        render=functools.partial(render_model_performance_report, user=current_user),
+        filename_prefix="model_performance"
+    )
 
 
 @router.get(
@@ -848,15 +794,14 @@ async def generate_batch_report(
     db: Session = Depends(get_db)
 ):
     """Generate a PDF report for a batch prediction"""
-    predictions = (
-        db.query(Prediction)
-        .filter(
+    predictions = db.execute(
+        select(*prediction_columns(REPORT_FIELDS))
+        .where(
             Prediction.user_id == int(current_user.id),
             Prediction.batch_id == batch_id
         )
         .order_by(Prediction.id)
-        .all()
-    )
+    ).all()
 
     if not predictions:
         raise HTTPException(status_code=404, detail="Batch not found")
@@ -909,8 +854,47 @@ async def generate_batch_report(
     )
 
 
+
+
 # Excel Export Endpoints
 
+EXCEL_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def stream_excel_export(
+    db: Session,
+    criteria: list,
+    order_by: list,
+    title: str,
+    user: UserResponse,
+    filename: str
+) -> StreamingResponse:
+    """Stream an Excel export built in constant memory"""
+    # The request session is closed before the body is sent; the export gets its own
+    export_db = Session(bind=db.get_bind())
+    try:
+        stream = excel_export(
+            export_db, criteria, order_by,
+            title=title,
+            username=user.username,
+            chunk_rows=settings.export_chunk_rows
+        )
+    except ImportError as e:
+        export_db.close()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Excel generation requires xlsxwriter. Error: {str(e)}"
+        )
+
+    return StreamingResponse(
+        stream,
+        media_type=EXCEL_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        }
+    )
+
+
 @router.get(
     "/export/excel",
     summary="Export predictions to Excel",
@@ -922,45 +906,18 @@ async def export_predictions_excel(
     db: Session = Depends(get_db)
 ):
     """Export predictions to Excel format"""
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
+    start_date = datetime.utcnow() - timedelta(days=days)
 
-    predictions = (
-        db.query(Prediction)
-        .filter(
+    return stream_excel_export(
+        db,
+        criteria=[
             Prediction.user_id == int(current_user.id),
             Prediction.created_at >= start_date
-        )
-        .order_by(Prediction.created_at.desc())
-        .all()
-    )
-
-    pred_list = [
-        {
-            "created_at": p.created_at.isoformat() if p.created_at else None,
-            "amount": p.amount,
-            "is_fraud": p.is_fraud,
-            "fraud_probability": p.fraud_probability,
-            "risk_score": p.risk_score,
-            "confidence": p.confidence
-        }
-        for p in predictions
-    ]
-
-    excel_content = generate_excel_report(
-        predictions=pred_list,
+        ],
+        order_by=[Prediction.created_at.desc()],
+        title=f"Fraud Detection Report - Last {days} Days",
         user=current_user,
-        title=f"Fraud Detection Report - Last {days} Days"
-    )
-
-    filename = f"predictions_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    return StreamingResponse(
-        io.BytesIO(excel_content),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
+        filename=f"predictions_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
     )
 
 
@@ -975,46 +932,19 @@ async def export_fraud_predictions_excel(
     db: Session = Depends(get_db)
 ):
     """Export only fraud predictions to Excel format"""
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
+    start_date = datetime.utcnow() - timedelta(days=days)
 
-    predictions = (
-        db.query(Prediction)
-        .filter(
+    return stream_excel_export(
+        db,
+        criteria=[
             Prediction.user_id == int(current_user.id),
             Prediction.created_at >= start_date,
             Prediction.is_fraud == True
-        )
-        .order_by(Prediction.created_at.desc())
-        .all()
-    )
-
-    pred_list = [
-        {
-            "created_at": p.created_at.isoformat() if p.created_at else None,
-            "amount": p.amount,
-            "is_fraud": p.is_fraud,
-            "fraud_probability": p.fraud_probability,
-            "risk_score": p.risk_score,
-            "confidence": p.confidence
-        }
-        for p in predictions
-    ]
-
-    excel_content = generate_excel_report(
-        predictions=pred_list,
+        ],
+        order_by=[Prediction.created_at.desc()],
+        title=f"Fraud Transactions - Last {days} Days",
         user=current_user,
-        title=f"Fraud Transactions - Last {days} Days"
-    )
-
-    filename = f"fraud_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    return StreamingResponse(
-        io.BytesIO(excel_content),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
+        filename=f"fraud_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
     )
 
 
@@ -1030,46 +960,19 @@ async def export_high_risk_excel(
     db: Session = Depends(get_db)
 ):
     """Export high-risk predictions to Excel format"""
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
+    start_date = datetime.utcnow() - timedelta(days=days)
 
-    predictions = (
-        db.query(Prediction)
-        .filter(
+    return stream_excel_export(
+        db,
+        criteria=[
             Prediction.user_id == int(current_user.id),
             Prediction.created_at >= start_date,
             Prediction.risk_score >= threshold
-        )
-        .order_by(Prediction.risk_score.desc())
-        .all()
-    )
-
-    pred_list = [
-        {
-            "created_at": p.created_at.isoformat() if p.created_at else None,
-            "amount": p.amount,
-            "is_fraud": p.is_fraud,
-            "fraud_probability": p.fraud_probability,
-            "risk_score": p.risk_score,
-            "confidence": p.confidence
-        }
-        for p in predictions
-    ]
-
-    excel_content = generate_excel_report(
-        predictions=pred_list,
+        ],
+        order_by=[Prediction.risk_score.desc()],
+        title=f"High Risk Transactions (>={threshold}) - Last {days} Days",
         user=current_user,
-        title=f"High Risk Transactions (>={threshold}) - Last {days} Days"
-    )
-
-    filename = f"high_risk_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    return StreamingResponse(
-        io.BytesIO(excel_content),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
+        filename=f"high_risk_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
     )
 
 
@@ -1083,44 +986,30 @@ async def export_predictions_csv(
     current_user: UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Export predictions to CSV format"""
-    import pandas as pd
-
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
-
-    predictions = (
-        db.query(Prediction)
-        .filter(
+    """
+    Export predictions to CSV format
+
+    Rows are read from a server-side cursor and sent as they are
+    encoded, so the download starts at once and memory stays flat.
+    """
+    start_date = datetime.utcnow() - timedelta(days=days)
+
+    # The request session is closed before the body is sent; the export gets its own
+    export_db = Session(bind=db.get_bind())
+    stream = iter_csv_export(
+        export_db,
+        criteria=[
             Prediction.user_id == int(current_user.id),
             Prediction.created_at >= start_date
-        )
-        .order_by(Prediction.created_at.desc())
-        .all()
+        ],
+        order_by=[Prediction.created_at.desc()],
+        chunk_rows=settings.export_chunk_rows
     )
 
-    data = [
-        {
-            "date": p.created_at.isoformat() if p.created_at else None,
-            "amount": p.amount,
-            "is_fraud": p.is_fraud,
-            "fraud_probability": p.fraud_probability,
-            "risk_score": p.risk_score,
-            "confidence": p.confidence,
-            "prediction_time_ms": p.prediction_time_ms
-        }
-        for p in predictions
-    ]
-
-    df = pd.DataFrame(data)
-    output = io.StringIO()
-    df.to_csv(output, index=False)
-    output.seek(0)
-
     filename = f"predictions_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
 
     return StreamingResponse(
-        io.BytesIO(output.getvalue().encode()),
+        stream,
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename={filename}"
@@ -14,6 +14,8 @@ import uuid
 import math
 import numpy as np
 
+from ...core.responses import FastJSONResponse
+
 router = APIRouter(prefix="/simulation", tags=["Simulation Lab"])
 
 
@@ -765,7 +767,7 @@ async def get_scenario(scenario_id: str):
 
 
 @router.post("/start", response_model=SimulationResult)
-async def start_simulation(config: SimulationConfig):
+async def start_simulation(config: SimulationConfig) -> FastJSONResponse:
     """Start a new fraud simulation"""
     if config.scenario_id not in FRAUD_SCENARIOS:
         raise HTTPException(status_code=404, detail="Scenario not found")
@@ -803,15 +805,16 @@ async def start_simulation(config: SimulationConfig):
     )
 
     active_simulations[simulation_id] = result
-    return result
+    # Serialized straight from the model; FastAPI would re-validate every transaction
+    return FastJSONResponse(result)
 
 
 @router.get("/active/{simulation_id}", response_model=SimulationResult)
-async def get_simulation(simulation_id: str):
+async def get_simulation(simulation_id: str) -> FastJSONResponse:
     """Get an active simulation by ID"""
     if simulation_id not in active_simulations:
         raise HTTPException(status_code=404, detail="Simulation not found")
-    return active_simulations[simulation_id]
+    return FastJSONResponse(active_simulations[simulation_id])
 
 
 @router.post("/submit", response_model=AnalystEvaluation)
@@ -971,7 +974,7 @@ async def get_leaderboard(scenario_id: Optional[str] = None, limit: int = 10):
 
 
 @router.post("/custom-scenario", response_model=SimulationResult)
-async def create_custom_simulation(request: CustomScenarioRequest):
+async def create_custom_simulation(request: CustomScenarioRequest) -> FastJSONResponse:
     """Create a simulation with custom fraud patterns"""
     # Create custom scenario
     custom_scenario = FraudScenario(
@@ -1026,7 +1029,7 @@ async def create_custom_simulation(request: CustomScenarioRequest):
     )
 
     active_simulations[simulation_id] = result
-    return result
+    return FastJSONResponse(result)
 
 
 @router.get("/hints/{simulation_id}/{transaction_id}")
@@ -1,7 +1,7 @@
 """Application configuration using Pydantic Settings"""
 
 from functools import lru_cache
-from typing import List
+from typing import Dict, List
 
 from pydantic_settings import BaseSettings
 
@@ -26,6 +26,34 @@ class Settings(BaseSettings):
     # ML Model paths
     model_path: str = "models/fraud_detector.pkl"
     scaler_path: str = "models/scaler.pkl"
+    inference_backend: str = "sklearn"  # "sklearn" or "compiled" (flattened tree arrays)
+
+    # Inference micro-batching (single /predict requests)
+    inference_batching_enabled: bool = True
+    inference_batch_max_size: int = 64
+    inference_batch_max_wait_ms: float = 2.0
+
+    # Memoized scores of repeated feature vectors, per model version
+    prediction_memo_enabled: bool = False
+    prediction_memo_max_entries: int = 100000
+    prediction_memo_ttl: float = 3600.0
+    prediction_memo_decimals: int = 6  # features are rounded to this many places before hashing
+    prediction_memo_redis_enabled: bool = False  # share single-prediction entries through Redis
+
+    # Bounded executors for blocking work in async routes (503 when full)
+    inference_executor_workers: int = 4
+    inference_executor_max_pending: int = 64
+    db_executor_workers: int = 8
+    db_executor_max_pending: int = 256
+    report_executor_workers: int = 2
+    report_executor_max_pending: int = 16
+
+    # Write-behind persistence of single predictions
+    prediction_write_behind_enabled: bool = True
+    prediction_sink_max_batch_rows: int = 500
+    prediction_sink_flush_interval_ms: float = 50.0
+    prediction_sink_max_queue_size: int = 10000
+    prediction_sink_put_timeout_ms: float = 1000.0  # wait for queue space before 503
 
     # Logging
     log_level: str = "INFO"
@@ -52,13 +80,38 @@ class Settings(BaseSettings):
     redis_url: str = "redis://localhost:6379"
     redis_enabled: bool = False
 
+    # In-process cache tier, in front of Redis or standing in for it
+    cache_local_max_entries: int = 10000
+    cache_local_max_mb: int = 64
+    cache_local_ttl: float = 30.0  # max seconds a Redis value is served locally
+    cache_namespace_quotas: str = ""  # per key prefix entry caps, e.g. "prediction=5000,user=2000"
+
     # 2FA Settings
     totp_issuer: str = "FraudDetectionML"
 
     # File Upload Settings
-    max_upload_size_mb: int = 10
+    max_upload_size_mb: int = 100
+    csv_max_rows: int = 100000
+    csv_stream_chunk_rows: int = 50000  # rows per chunk for /predict/upload-csv/stream
+    max_stream_upload_size_mb: int = 4096
     allowed_extensions: str = "csv,xlsx"
 
+    # Report exports
+    export_chunk_rows: int = 5000  # rows fetched per server-side cursor round trip
+    report_cache_dir: str = "report_cache"  # rendered PDF reports
+    report_cache_max_mb: int = 512  # least recently used reports are evicted beyond this
+
+    # Fraud network similarity index (approximate nearest neighbours)
+    similarity_index_dir: str = "similarity_index"
+    similarity_index_nprobe: int = 8  # lists scanned per query; more is slower and more exact
+    fraud_cluster_checkpoint: str = "fraud_clusters.npz"  # incrementally maintained fraud rings
+
+    # Background batch jobs
+    batch_job_dir: str = "batch_jobs"  # spooled uploads and result files
+    batch_job_workers: int = 2  # scoring processes; 0 scores in a thread
+    batch_job_max_concurrent: int = 2
+    batch_job_retention_hours: float = 168.0  # uploads and results older than this are deleted
+
     @property
     def cors_origins_list(self) -> List[str]:
         """Parse CORS origins from comma-separated string"""
@@ -69,11 +122,26 @@ class Settings(BaseSettings):
         """Parse allowed extensions from comma-separated string"""
         return [ext.strip() for ext in self.allowed_extensions.split(",")]
 
+    @property
+    def cache_namespace_quotas_map(self) -> Dict[str, int]:
+        """Parse per-prefix cache quotas from comma-separated prefix=entries pairs"""
+        quotas = {}
+        for item in self.cache_namespace_quotas.split(","):
+            if item.strip():
+                prefix, entries = item.split("=")
+                quotas[prefix.strip()] = int(entries)
+        return quotas
+
     @property
     def max_upload_size(self) -> int:
         """Get max upload size in bytes"""
         return self.max_upload_size_mb * 1024 * 1024
 
+    @property
+    def max_stream_upload_size(self) -> int:
+        """Get max streamed upload size in bytes"""
+        return self.max_stream_upload_size_mb * 1024 * 1024
+
     class Config:
         env_file = ".env"
         case_sensitive = False
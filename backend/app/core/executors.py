@@ -0,0 +1,164 @@
+"""
+Bounded executors for blocking work in async routes
+
+Model inference, pandas work and synchronous SQLAlchemy calls block the
+event loop when called directly from `async def` routes. Routes dispatch
+them into one of the dedicated thread pools instead:
+
+- `inference_executor` for CPU-bound scoring (the tree traversal in
+  scikit-learn releases the GIL, so threads run it in parallel)
+- `db_executor` for blocking database I/O
+- `report_executor` for PDF rendering, which holds a thread for seconds
+  and must not starve short database calls
+
+Each pool caps the number of running plus queued tasks. Once the cap is
+reached further work is rejected with 503 instead of queueing without
+bound, so overload shows up as fast failures rather than latency growth.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ExecutorOverloaded(HTTPException):
+    """Raised when an executor's queue is full; served as 503"""
+
+    def __init__(self, name: str, retry_after: int = 1):
+        super().__init__(
+            status_code=503,
+            detail=f"Server busy ({name} queue full). Please retry shortly.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a limit on in-flight tasks.
+
+    `max_pending` counts tasks that are running or waiting for a thread.
+    A task stays counted until its thread finishes, even if the awaiting
+    request was cancelled.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._stats = {"completed": 0, "rejected": 0}
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        """Create the thread pool on first use (and again after shutdown)"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=f"{self.name}-executor"
+            )
+        return self._pool
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run a blocking callable in the pool and await its result
+
+        Raises:
+            ExecutorOverloaded: If max_pending tasks are already in flight
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise ExecutorOverloaded(self.name)
+            self._pending += 1
+
+        try:
+            future = self._get_pool().submit(self._call, functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _call(self, fn: Callable[[], T]) -> T:
+        """Track running tasks around the call in the worker thread"""
+        with self._lock:
+            self._running += 1
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._stats["completed"] += 1
+
+    @property
+    def queue_depth(self) -> int:
+        """Tasks waiting for a free thread"""
+        with self._lock:
+            return max(0, self._pending - self._running)
+
+    def get_stats(self) -> Dict:
+        """Get pool utilization and rejection counts"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "running": self._running,
+                "queued": max(0, self._pending - self._running),
+                "completed": self._stats["completed"],
+                "rejected": self._stats["rejected"],
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the pool; it is recreated on the next run()"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+# Global executor instances
+inference_executor = BoundedExecutor(
+    "inference",
+    max_workers=settings.inference_executor_workers,
+    max_pending=settings.inference_executor_max_pending,
+)
+db_executor = BoundedExecutor(
+    "db",
+    max_workers=settings.db_executor_workers,
+    max_pending=settings.db_executor_max_pending,
+)
+
+report_executor = BoundedExecutor(
+    "report",
+    max_workers=settings.report_executor_workers,
+    max_pending=settings.report_executor_max_pending,
+)
+
+EXECUTORS = (inference_executor, db_executor, report_executor)
+
+
+def shutdown_executors() -> None:
+    """Wait for in-flight work and stop all executors"""
+    for executor in EXECUTORS:
+        executor.shutdown(wait=True)
@@ -0,0 +1,91 @@
+"""
+JSON response encoding
+
+FastJSONResponse is the application's default response class. It encodes
+with orjson when installed, which serializes dicts, datetimes, UUIDs,
+enums, dataclasses and NumPy arrays/scalars natively, and falls back to
+the standard library encoder otherwise.
+
+Routes with large payloads return a FastJSONResponse themselves. FastAPI
+then skips its response_model re-validation and jsonable_encoder pass,
+which for built-in models and plain dicts only repeat work already done.
+Pydantic models are encoded by pydantic's own serializer.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import dataclasses
+import json
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+from uuid import UUID
+
+import numpy as np
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.warning("orjson not installed. Responses use the standard library JSON encoder.")
+
+if ORJSON_AVAILABLE:
+    # Non-string keys are stringified like json.dumps does
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    """Values neither encoder handles natively"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if ORJSON_AVAILABLE:
+        raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+    # Standard library fallback only
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, UUID):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content to compact UTF-8 JSON"""
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode("utf-8")
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson (or json), accepting models and NumPy values"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -62,4 +62,6 @@ def init_db():
     """Initialize the database (create tables)"""
     # Import models to register them with Base.metadata
     from . import models  # noqa: F401
+    from .migrations import upgrade_schema
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
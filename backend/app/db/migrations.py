@@ -0,0 +1,158 @@
+"""
+Database Migrations - In-place schema upgrades
+
+`init_db` only creates missing tables, so columns added to existing
+tables are applied here. Schema changes run at startup; data backfills
+can take a while on large tables and run from the command line:
+
+    python -m app.db.migrations
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import json
+import logging
+from typing import List
+
+from sqlalchemy import bindparam, inspect, text, update
+from sqlalchemy.engine import Engine
+
+from .models import Prediction
+
+logger = logging.getLogger(__name__)
+
+PCA_COLUMNS = [f"v{i}" for i in range(1, 29)]
+
+# Rows read and updated per backfill transaction
+BACKFILL_BATCH_SIZE = 5000
+
+
+def add_prediction_feature_columns(engine: Engine) -> List[str]:
+    """
+    Add the typed V1-V28 columns to an existing predictions table
+
+    Returns:
+        Names of the columns that were added
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(Prediction.__tablename__):
+        return []
+
+    existing = {column["name"] for column in inspector.get_columns(Prediction.__tablename__)}
+    missing = [col for col in PCA_COLUMNS if col not in existing]
+    if not missing:
+        return []
+
+    float_type = Prediction.__table__.c.v1.type.compile(dialect=engine.dialect)
+    with engine.begin() as conn:
+        for col in missing:
+            conn.execute(text(f"ALTER TABLE {Prediction.__tablename__} ADD COLUMN {col} {float_type}"))
+
+    logger.info(f"Added {len(missing)} feature columns to {Prediction.__tablename__}")
+    return missing
+
+
+def add_prediction_indexes(engine: Engine) -> List[str]:
+    """
+    Create the composite indexes declared on Prediction that are missing
+
+    On PostgreSQL the indexes are built CONCURRENTLY so inserts into a
+    large predictions table are not blocked while they build.
+
+    Returns:
+        Names of the indexes that were created
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(Prediction.__tablename__):
+        return []
+
+    existing = {index["name"] for index in inspector.get_indexes(Prediction.__tablename__)}
+    missing = [index for index in Prediction.__table__.indexes if index.name not in existing]
+    if not missing:
+        return []
+
+    if engine.dialect.name == "postgresql":
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for index in missing:
+                columns = ", ".join(column.name for column in index.columns)
+                conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} "
+                    f"ON {Prediction.__tablename__} ({columns})"
+                ))
+    else:
+        with engine.begin() as conn:
+            for index in missing:
+                index.create(conn)
+
+    names = [index.name for index in missing]
+    logger.info(f"Created indexes on {Prediction.__tablename__}: {', '.join(names)}")
+    return names
+
+
+def backfill_prediction_features(engine: Engine, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    Copy V1-V28 from features_json into the typed columns
+
+    Processes rows whose typed columns are still NULL in id order, one
+    transaction per batch, so it can be interrupted and resumed.
+
+    Returns:
+        Number of rows backfilled
+    """
+    table = Prediction.__table__
+    # SET clause comes from the v1..v28 keys of the parameter dicts
+    statement = update(table).where(table.c.id == bindparam("row_id"))
+
+    total = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    f"SELECT id, features_json FROM {table.name} "
+                    "WHERE v1 IS NULL AND id > :last_id ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": batch_size},
+            ).all()
+            if not rows:
+                break
+
+            # One json.loads call for the whole batch
+            decoded = json.loads("[" + ",".join(row.features_json for row in rows) + "]")
+            params = [
+                {"row_id": row.id, **{col: features[col] for col in PCA_COLUMNS}}
+                for row, features in zip(rows, decoded)
+            ]
+            conn.execute(statement, params)
+
+        total += len(rows)
+        last_id = rows[-1].id
+        logger.info(f"Backfilled feature columns for {total} predictions")
+
+    return total
+
+
+def upgrade_schema(engine: Engine) -> None:
+    """Apply in-place schema changes (run at startup after create_all)"""
+    from ..services.rollups import backfill_rollups_if_empty
+
+    add_prediction_feature_columns(engine)
+    add_prediction_indexes(engine)
+    # Dashboards read rollups only, so they must exist before serving
+    backfill_rollups_if_empty(engine)
+
+
+def main():
+    """Upgrade the schema and backfill feature columns"""
+    from .database import engine
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    upgrade_schema(engine)
+    count = backfill_prediction_features(engine)
+    print(f"Backfilled {count} predictions")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,12 @@ Author: Zhmuryk Andrii
 Copyright (c) 2024 - All Rights Reserved
 """
 
+import json
 from datetime import datetime
 from enum import Enum as PyEnum
+from typing import Dict
 
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String, Text, Enum, Table
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text, Enum, Table
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -41,6 +43,14 @@ class AuditAction(str, PyEnum):
     DISABLE_2FA = "disable_2fa"
 
 
+class BatchJobStatus(str, PyEnum):
+    """Lifecycle states of a background batch job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 # ============== Association Tables ==============
 
 team_members = Table(
@@ -127,9 +137,39 @@ class Prediction(Base):
     time = Column(Float, nullable=False)
     amount = Column(Float, nullable=False)
 
-    # PCA features stored as JSON string
+    # PCA features stored as JSON string (legacy format, still written)
     features_json = Column(Text, nullable=False)
 
+    # PCA features V1-V28 as typed columns; NULL on rows not yet backfilled
+    v1 = Column(Float, nullable=True)
+    v2 = Column(Float, nullable=True)
+    v3 = Column(Float, nullable=True)
+    v4 = Column(Float, nullable=True)
+    v5 = Column(Float, nullable=True)
+    v6 = Column(Float, nullable=True)
+    v7 = Column(Float, nullable=True)
+    v8 = Column(Float, nullable=True)
+    v9 = Column(Float, nullable=True)
+    v10 = Column(Float, nullable=True)
+    v11 = Column(Float, nullable=True)
+    v12 = Column(Float, nullable=True)
+    v13 = Column(Float, nullable=True)
+    v14 = Column(Float, nullable=True)
+    v15 = Column(Float, nullable=True)
+    v16 = Column(Float, nullable=True)
+    v17 = Column(Float, nullable=True)
+    v18 = Column(Float, nullable=True)
+    v19 = Column(Float, nullable=True)
+    v20 = Column(Float, nullable=True)
+    v21 = Column(Float, nullable=True)
+    v22 = Column(Float, nullable=True)
+    v23 = Column(Float, nullable=True)
+    v24 = Column(Float, nullable=True)
+    v25 = Column(Float, nullable=True)
+    v26 = Column(Float, nullable=True)
+    v27 = Column(Float, nullable=True)
+    v28 = Column(Float, nullable=True)
+
     # Prediction results
     is_fraud = Column(Boolean, nullable=False)
     fraud_probability = Column(Float, nullable=False)
@@ -147,10 +187,52 @@ class Prediction(Base):
     # Relationship to user
     user = relationship("User", back_populates="predictions")
 
+    # Per-user time-range queries (history, analytics, reports, forecast);
+    # is_fraud is included so fraud counts per time bucket are index-only scans
+    __table_args__ = (
+        Index("ix_predictions_user_id_created_at_is_fraud", "user_id", "created_at", "is_fraud"),
+        Index("ix_predictions_user_id_is_fraud_created_at", "user_id", "is_fraud", "created_at"),
+    )
+
+    def pca_features(self) -> Dict[str, float]:
+        """V1-V28 by name, from the typed columns or the legacy JSON"""
+        if self.v1 is None:
+            return json.loads(self.features_json)
+        return {f"v{i}": getattr(self, f"v{i}") for i in range(1, 29)}
+
     def __repr__(self):
         return f"<Prediction(id={self.id}, is_fraud={self.is_fraud}, probability={self.fraud_probability})>"
 
 
+class PredictionRollup(Base):
+    """Per-user hourly prediction aggregates, updated as predictions are written"""
+
+    __tablename__ = "prediction_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # created_at truncated to the hour
+
+    # Counters
+    total = Column(Integer, nullable=False, default=0)
+    fraud_count = Column(Integer, nullable=False, default=0)
+    high_risk_count = Column(Integer, nullable=False, default=0)
+
+    # Sums for averages
+    amount_sum = Column(Float, nullable=False, default=0.0)
+    fraud_amount_sum = Column(Float, nullable=False, default=0.0)
+    risk_score_sum = Column(Float, nullable=False, default=0.0)
+    prediction_time_ms_sum = Column(Float, nullable=False, default=0.0)
+
+    # Risk score histogram
+    risk_low = Column(Integer, nullable=False, default=0)
+    risk_medium = Column(Integer, nullable=False, default=0)
+    risk_high = Column(Integer, nullable=False, default=0)
+    risk_critical = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<PredictionRollup(user_id={self.user_id}, bucket='{self.bucket_start}', total={self.total})>"
+
+
 class AuditLog(Base):
     """Audit log for tracking user actions"""
 
@@ -257,3 +339,54 @@ class ModelVersion(Base):
 
     def __repr__(self):
         return f"<ModelVersion(version='{self.version}', type='{self.model_type}', active={self.is_active})>"
+
+
+class BatchJob(Base):
+    """Background batch scoring job"""
+
+    __tablename__ = "batch_jobs"
+
+    id = Column(String(36), primary_key=True)  # UUID, also the batch_id of its predictions
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String(255), nullable=True)
+    status = Column(Enum(BatchJobStatus), default=BatchJobStatus.QUEUED, nullable=False)
+
+    # Progress
+    total_rows = Column(Integer, nullable=True)  # Estimated from line count at submit
+    rows_processed = Column(Integer, default=0)
+    fraud_count = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+
+    # Files on local disk
+    source_path = Column(String(500), nullable=False)
+    result_path = Column(String(500), nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    # Job listing pages seek on (created_at, id) per user
+    __table_args__ = (
+        Index("ix_batch_jobs_user_id_created_at", "user_id", "created_at"),
+    )
+
+    @property
+    def progress_percent(self) -> float:
+        """Share of rows processed, 100 once completed"""
+        if self.status == BatchJobStatus.COMPLETED:
+            return 100.0
+        if not self.total_rows:
+            return 0.0
+        return round(min(100.0, (self.rows_processed or 0) / self.total_rows * 100), 1)
+
+    @property
+    def rows_per_second(self) -> float:
+        """Scoring throughput since the job started"""
+        if self.started_at is None:
+            return 0.0
+        elapsed = ((self.completed_at or datetime.utcnow()) - self.started_at).total_seconds()
+        return round((self.rows_processed or 0) / elapsed, 1) if elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return f"<BatchJob(id='{self.id}', status='{self.status}', rows={self.rows_processed})>"
@@ -22,11 +22,19 @@ from slowapi.errors import RateLimitExceeded
 
 from .api import router
 from .core.config import settings
+from .core.responses import FastJSONResponse
+from .core.executors import shutdown_executors
 from .core.rate_limit import limiter, RateLimitHeaderMiddleware, rate_limit_exceeded_handler, get_rate_limit_status
 from .core.logging_config import setup_logging, RequestLogger
 from .core.security_headers import SecurityHeadersMiddleware
 from .models.ml_model import fraud_model
-from .db.database import init_db
+from .db.database import init_db, SessionLocal
+from .services.batch_jobs import batch_job_manager
+from .services.cache_service import cache
+from .services.fraud_clusters import fraud_cluster_store
+from .services.similarity_index import similarity_index
+from .services.micro_batcher import micro_batcher
+from .services.prediction_sink import prediction_sink
 
 # Configure structured logging
 setup_logging(
@@ -49,6 +57,17 @@ async def lifespan(app: FastAPI):
     init_db()
     logger.info("Database initialized successfully")
 
+    # Jobs queued or running when the last process stopped can't resume,
+    # and files of old jobs are past their retention
+    db = SessionLocal()
+    try:
+        interrupted = batch_job_manager.recover(db)
+        if interrupted:
+            logger.warning(f"Marked {interrupted} interrupted batch jobs as failed")
+    finally:
+        db.close()
+    batch_job_manager.sweep()
+
     # Get the backend directory path
     backend_dir = Path(__file__).parent.parent
 
@@ -60,6 +79,8 @@ async def lifespan(app: FastAPI):
         success = fraud_model.load(str(model_path), str(scaler_path))
         if success:
             logger.info("ML model loaded successfully")
+            if settings.inference_backend == "compiled":
+                fraud_model.enable_compiled_backend()
         else:
             logger.warning("Failed to load ML model")
     else:
@@ -75,6 +96,27 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down Fraud Detection API...")
 
+    # Score any predictions still waiting in the micro-batcher
+    await micro_batcher.stop()
+
+    # Write predictions still buffered in the write-behind sink
+    await prediction_sink.stop()
+
+    # Stop background batch jobs and their worker processes
+    await batch_job_manager.shutdown()
+
+    # Let in-flight inference and DB work finish
+    shutdown_executors()
+
+    # Stop listening for cache invalidations
+    cache.close()
+
+    # Persist the nearest-neighbour index and fraud clusters so a restart doesn't rebuild them
+    if len(similarity_index):
+        similarity_index.save()
+    if fraud_cluster_store.pending_checkpoint:
+        fraud_cluster_store.save()
+
 
 # Create FastAPI application
 app = FastAPI(
@@ -107,6 +149,7 @@ Copyright (c) 2024 - All Rights Reserved
     version=settings.app_version,
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
     lifespan=lifespan,
 )
 
@@ -132,7 +175,8 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=[
         "X-Batch-ID", "X-Total-Rows", "X-Fraud-Count", "X-Legitimate-Count", "Content-Disposition",
-        "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After"
+        "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After",
+        "X-Next-Cursor", "X-Prev-Cursor", "X-Total-Count"
     ],
 )
 
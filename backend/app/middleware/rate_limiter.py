@@ -1,21 +1,73 @@
 """Advanced rate limiting middleware with Redis support"""
 
+import math
 import time
 import logging
-from typing import Optional, Callable
-from collections import defaultdict, deque
+from typing import Dict, List, Optional, Callable
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
 logger = logging.getLogger(__name__)
 
+# Timing wheel of idle-key expiry: slots, and slots the longest state
+# lifetime spans (the rest is headroom so schedules never wrap)
+WHEEL_SLOTS = 64
+WHEEL_SPAN_SLOTS = 32
+
+# Wheel entries examined per request; exceeds the rate keys can be created
+EXPIRE_PER_CALL = 4
+
+
+class _Slot:
+    """Rate limit state of one identifier: a current and previous bucket count per window"""
+
+    __slots__ = (
+        "last", "burst", "burst_prev", "minute", "minute_prev", "hour", "hour_prev"
+    )
+
+    def __init__(self, now: float):
+        self.last = now
+        self.burst = self.burst_prev = 0
+        self.minute = self.minute_prev = 0
+        self.hour = self.hour_prev = 0
+
+
+def _roll(current: int, previous: int, last: float, now: float, window: float) -> tuple:
+    """Counts of a window's buckets at `now`, given the counts at `last`"""
+    elapsed = int(now // window) - int(last // window)
+    if elapsed == 0:
+        return current, previous
+    if elapsed == 1:
+        return 0, current
+    return 0, 0
+
+
+def _retry_at(current: int, previous: int, now: float, window: float, limit: int) -> float:
+    """Earliest time the sliding estimate drops below `limit` without new requests"""
+    bucket_start = now - now % window
+    if limit <= 0:
+        return bucket_start + window
+    if current < limit:
+        # The previous bucket's weight has to fall far enough
+        return bucket_start + window * (1.0 - (limit - current) / previous)
+    # Only once this bucket is the previous one, then decays
+    return bucket_start + window * (2.0 - limit / current)
+
 
 class InMemoryRateLimiter:
     """
-    In-memory rate limiter using sliding window algorithm
+    In-memory rate limiter using sliding window counters
+
+    Each identifier has a fixed-size slot with two bucket counts per
+    window (1 s burst, minute, hour). The request rate over the last
+    window is estimated as the current bucket's count plus the previous
+    bucket's count weighted by how much of it the window still covers.
+    Checks cost O(1) time and memory whatever the limits.
 
-    Tracks requests per IP address with configurable limits
+    Idle identifiers expire through a timing wheel. Each check examines at
+    most EXPIRE_PER_CALL scheduled entries, so expiry never pauses
+    requests.
     """
 
     def __init__(
@@ -28,41 +80,52 @@ class InMemoryRateLimiter:
         self.requests_per_hour = requests_per_hour
         self.burst_size = burst_size
 
-        # Store request timestamps per IP
-        self.minute_windows = defaultdict(lambda: deque(maxlen=requests_per_minute * 2))
-        self.hour_windows = defaultdict(lambda: deque(maxlen=requests_per_hour * 2))
-
-        # Cleanup interval
-        self.last_cleanup = time.time()
-        self.cleanup_interval = 300  # 5 minutes
-
-    def _cleanup_old_entries(self):
-        """Remove old entries to prevent memory leaks"""
-        current_time = time.time()
-
-        if current_time - self.last_cleanup < self.cleanup_interval:
-            return
-
-        cutoff_time = current_time - 3600  # 1 hour ago
-
-        # Clean up minute windows
-        for ip in list(self.minute_windows.keys()):
-            window = self.minute_windows[ip]
-            while window and window[0] < cutoff_time:
-                window.popleft()
-            if not window:
-                del self.minute_windows[ip]
-
-        # Clean up hour windows
-        for ip in list(self.hour_windows.keys()):
-            window = self.hour_windows[ip]
-            while window and window[0] < cutoff_time:
-                window.popleft()
-            if not window:
-                del self.hour_windows[ip]
-
-        self.last_cleanup = current_time
-        logger.info(f"Rate limiter cleanup completed. Active IPs: {len(self.minute_windows)}")
+        self.slots: Dict[str, _Slot] = {}
+
+        # A slot is all zeros two hours after its last check
+        self.state_ttl = 2 * 3600.0
+        self.tick_seconds = self.state_ttl / WHEEL_SPAN_SLOTS
+        self._wheel: List[List[str]] = [[] for _ in range(WHEEL_SLOTS)]
+        self._wheel_tick: Optional[int] = None  # next tick to process
+        self._expire_at = 0.0  # when that tick is due
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _schedule(self, identifier: str, at: float) -> None:
+        """Queue an identifier for an expiry check at time `at`"""
+        tick = max(int(at // self.tick_seconds), self._wheel_tick)
+        self._wheel[tick % WHEEL_SLOTS].append(identifier)
+
+    def _expire(self, now: float) -> None:
+        """Examine a few due wheel entries, dropping identifiers idle for state_ttl"""
+        now_tick = int(now // self.tick_seconds)
+        if self._wheel_tick is None:
+            self._wheel_tick = now_tick
+        # After a long idle period every slot is due; don't walk the gap tick by tick
+        self._wheel_tick = max(self._wheel_tick, now_tick - WHEEL_SLOTS)
+
+        budget = EXPIRE_PER_CALL
+        while budget and self._wheel_tick < now_tick:
+            due = self._wheel[self._wheel_tick % WHEEL_SLOTS]
+            if not due:
+                self._wheel_tick += 1
+                continue
+            identifier = due.pop()
+            budget -= 1
+            slot = self.slots.get(identifier)
+            if slot is None:
+                continue
+            expires_at = slot.last + self.state_ttl
+            if expires_at <= now:
+                del self.slots[identifier]
+                self.expired += 1
+            else:
+                # Seen since it was scheduled; check again when it can next expire
+                self._schedule(identifier, expires_at)
+
+        self._expire_at = (self._wheel_tick + 1) * self.tick_seconds
 
     def is_allowed(self, identifier: str) -> tuple[bool, Optional[dict]]:
         """
@@ -75,66 +138,71 @@ class InMemoryRateLimiter:
             Tuple of (is_allowed, rate_limit_info)
         """
         current_time = time.time()
-        self._cleanup_old_entries()
-
-        minute_window = self.minute_windows[identifier]
-        hour_window = self.hour_windows[identifier]
-
-        # Remove requests outside the windows
-        minute_cutoff = current_time - 60
-        hour_cutoff = current_time - 3600
-
-        while minute_window and minute_window[0] < minute_cutoff:
-            minute_window.popleft()
-
-        while hour_window and hour_window[0] < hour_cutoff:
-            hour_window.popleft()
-
-        # Check limits
-        minute_count = len(minute_window)
-        hour_count = len(hour_window)
+        if current_time >= self._expire_at:
+            self._expire(current_time)
+
+        slot = self.slots.get(identifier)
+        if slot is None:
+            slot = self.slots[identifier] = _Slot(current_time)
+            self._schedule(identifier, current_time + self.state_ttl)
+
+        # Move each window's buckets forward to now; a longer window's
+        # bucket only turns over with a new bucket of the shorter one
+        last = slot.last
+        slot.last = current_time
+        if int(current_time) != int(last):
+            slot.burst, slot.burst_prev = _roll(slot.burst, slot.burst_prev, last, current_time, 1.0)
+            if current_time // 60.0 != last // 60.0:
+                slot.minute, slot.minute_prev = _roll(slot.minute, slot.minute_prev, last, current_time, 60.0)
+                if current_time // 3600.0 != last // 3600.0:
+                    slot.hour, slot.hour_prev = _roll(slot.hour, slot.hour_prev, last, current_time, 3600.0)
+
+        # Each estimate weights the previous bucket by the share of it the
+        # sliding window still covers
 
         # Check for burst
-        recent_requests = sum(1 for t in minute_window if current_time - t < 1)
-        if recent_requests >= self.burst_size:
+        if slot.burst_prev * (1.0 - current_time % 1.0) + slot.burst >= self.burst_size:
             return False, {
                 "limit": self.burst_size,
                 "remaining": 0,
-                "reset": int(current_time + 1),
+                "reset": math.ceil(_retry_at(slot.burst, slot.burst_prev, current_time, 1.0, self.burst_size)),
                 "reason": "burst_limit_exceeded"
             }
 
         # Check minute limit
+        minute_count = slot.minute_prev * (1.0 - current_time % 60.0 / 60.0) + slot.minute
         if minute_count >= self.requests_per_minute:
-            oldest = minute_window[0]
-            reset_time = int(oldest + 60)
             return False, {
                 "limit": self.requests_per_minute,
                 "remaining": 0,
-                "reset": reset_time,
+                "reset": math.ceil(
+                    _retry_at(slot.minute, slot.minute_prev, current_time, 60.0, self.requests_per_minute)
+                ),
                 "reason": "minute_limit_exceeded"
             }
 
         # Check hour limit
+        hour_count = slot.hour_prev * (1.0 - current_time % 3600.0 / 3600.0) + slot.hour
         if hour_count >= self.requests_per_hour:
-            oldest = hour_window[0]
-            reset_time = int(oldest + 3600)
             return False, {
                 "limit": self.requests_per_hour,
                 "remaining": 0,
-                "reset": reset_time,
+                "reset": math.ceil(
+                    _retry_at(slot.hour, slot.hour_prev, current_time, 3600.0, self.requests_per_hour)
+                ),
                 "reason": "hour_limit_exceeded"
             }
 
         # Request is allowed
-        minute_window.append(current_time)
-        hour_window.append(current_time)
+        slot.burst += 1
+        slot.minute += 1
+        slot.hour += 1
 
         return True, {
             "limit_minute": self.requests_per_minute,
-            "remaining_minute": self.requests_per_minute - minute_count - 1,
+            "remaining_minute": max(0, self.requests_per_minute - math.ceil(minute_count) - 1),
             "limit_hour": self.requests_per_hour,
-            "remaining_hour": self.requests_per_hour - hour_count - 1,
+            "remaining_hour": max(0, self.requests_per_hour - math.ceil(hour_count) - 1),
             "reset_minute": int(current_time + 60),
             "reset_hour": int(current_time + 3600)
         }
@@ -148,7 +216,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
     - Per-IP rate limiting
     - Different limits for authenticated vs anonymous users
     - Configurable burst protection
-    - Automatic cleanup
+    - Constant-time checks, idle clients expire incrementally
     """
 
     def __init__(
@@ -0,0 +1,322 @@
+"""
+Compiled tree-ensemble inference backend
+
+Flattens trained scikit-learn tree ensembles into NumPy node arrays
+(feature index, threshold, left/right child, leaf value) and scores all
+trees with one vectorized traversal. The StandardScaler is folded into
+the split thresholds, so raw features are compared directly.
+
+Threshold folding is exact: scikit-learn compares the float32 cast of the
+scaled value against a float64 threshold, and that comparison is monotone
+in the raw value. For every split we search the float64 line for the
+largest raw value that still goes left, which makes the compiled output
+bit-for-bit identical to `predict_proba` (for forests scored with
+n_jobs=1, where scikit-learn sums trees in estimator order).
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence
+
+import numpy as np
+from scipy.special import expit
+from sklearn.dummy import DummyClassifier
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier, VotingClassifier
+from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+TREE_LEAF = -1
+
+_INT64_MIN = np.iinfo(np.int64).min
+_FLOAT64_MAX = np.finfo(np.float64).max
+
+
+def _float_to_key(values: np.ndarray) -> np.ndarray:
+    """Map float64 values to int64 keys with the same ordering"""
+    bits = values.view(np.int64)
+    return np.where(bits >= 0, bits, _INT64_MIN - bits)
+
+
+def _key_to_float(keys: np.ndarray) -> np.ndarray:
+    """Inverse of _float_to_key"""
+    bits = np.where(keys >= 0, keys, _INT64_MIN - keys)
+    return bits.view(np.float64)
+
+
+def _goes_left(
+    keys: np.ndarray, mean: np.ndarray, scale: np.ndarray, thresholds: np.ndarray
+) -> np.ndarray:
+    """Branch test of the scaled path for raw values given as keys"""
+    raw = _key_to_float(keys)
+    with np.errstate(over="ignore", invalid="ignore"):
+        return ((raw - mean) / scale).astype(np.float32) <= thresholds
+
+
+def fold_scaler_thresholds(
+    features: np.ndarray,
+    thresholds: np.ndarray,
+    scaler: Optional[StandardScaler],
+) -> np.ndarray:
+    """
+    Fold a StandardScaler into tree split thresholds
+
+    For each split returns the largest raw float64 value `x` for which
+    `float32((x - mean) / scale) <= threshold`, so that
+    `x_raw <= folded` takes exactly the same branch as the scaled path.
+
+    Args:
+        features: Feature index of each split
+        thresholds: Split thresholds in scaled space
+        scaler: Fitted StandardScaler, or None for unscaled models
+
+    Returns:
+        Thresholds in raw feature space
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    n_splits = len(thresholds)
+
+    # Without a scaler the trees still compare the float32 cast of the input
+    mean = np.zeros(n_splits)
+    scale = np.ones(n_splits)
+    if scaler is not None:
+        if getattr(scaler, "mean_", None) is not None:
+            mean = scaler.mean_[features]
+        if getattr(scaler, "scale_", None) is not None:
+            scale = scaler.scale_[features]
+
+    lo = np.full(n_splits, _float_to_key(np.array([-_FLOAT64_MAX]))[0])
+    hi = np.full(n_splits, _float_to_key(np.array([_FLOAT64_MAX]))[0])
+
+    none_left = ~_goes_left(lo, mean, scale, thresholds)
+    all_left = _goes_left(hi, mean, scale, thresholds)
+
+    # Binary search over the ordered float64 keys; invariant: lo goes left, hi does not
+    searched = ~(none_left | all_left)
+    active = searched.copy()
+    while active.any():
+        a_lo, a_hi = lo[active], hi[active]
+        mid = (a_lo >> 1) + (a_hi >> 1) + (a_lo & a_hi & 1)
+        left = _goes_left(mid, mean[active], scale[active], thresholds[active])
+        lo[active] = np.where(left, mid, a_lo)
+        hi[active] = np.where(left, a_hi, mid)
+        active &= lo + 1 < hi
+
+    folded = np.empty(n_splits, dtype=np.float64)
+    folded[none_left] = -np.inf
+    folded[all_left] = np.inf
+    folded[searched] = _key_to_float(lo[searched])
+    return folded
+
+
+class CompiledTrees:
+    """All trees of an ensemble flattened into shared node arrays"""
+
+    def __init__(self, trees: Sequence, scaler: Optional[StandardScaler]):
+        """
+        Args:
+            trees: Fitted sklearn `Tree` objects (estimator.tree_)
+            scaler: StandardScaler applied before the trees, if any
+        """
+        features, thresholds, lefts, rights, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for tree in trees:
+            n_nodes = tree.node_count
+            node_ids = np.arange(offset, offset + n_nodes)
+            is_leaf = tree.children_left == TREE_LEAF
+
+            # Leaves point to themselves so the traversal can run a fixed depth
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            roots.append(offset)
+
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n_nodes
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+
+        # Interleaved (right, left) children so the next node is children[2 * node + go_left]
+        self.children = np.empty(2 * len(self.left), dtype=np.intp)
+        self.children[0::2] = self.right
+        self.children[1::2] = self.left
+
+        # Only split nodes need folding; leaves never branch
+        self.threshold = np.concatenate(thresholds)
+        splits = self.left != np.arange(len(self.left))
+        self.threshold[splits] = fold_scaler_thresholds(
+            self.feature[splits], self.threshold[splits], scaler
+        )
+        self.roots = np.array(roots, dtype=np.intp)
+        self.max_depth = max_depth
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        Find the leaf reached in every tree
+
+        Args:
+            X: Raw float64 features of shape (n_samples, n_features)
+
+        Returns:
+            Flat leaf node indices of shape (n_samples, n_trees)
+        """
+        n_samples, n_features = X.shape
+        values = np.ascontiguousarray(X).ravel()
+        row_offset = (np.arange(n_samples) * n_features)[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (n_samples, self.n_trees))
+
+        for _ in range(self.max_depth):
+            x = np.take(values, row_offset + np.take(self.feature, nodes))
+            go_left = x <= np.take(self.threshold, nodes)
+            nodes = np.take(self.children, 2 * nodes + go_left)
+
+        return nodes
+
+
+class CompiledModel(ABC):
+    """Base class for compiled fraud models"""
+
+    @abstractmethod
+    def predict_fraud_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Probability of fraud (class 1) for raw, unscaled features
+
+        Args:
+            X: numpy array of shape (n_samples, n_features)
+
+        Returns:
+            Array of shape (n_samples,)
+        """
+
+
+class CompiledForest(CompiledModel):
+    """Compiled RandomForestClassifier"""
+
+    def __init__(self, forest: RandomForestClassifier, scaler: Optional[StandardScaler]):
+        if forest.n_outputs_ != 1 or forest.n_classes_ != 2:
+            raise ValueError("Only binary single-output forests can be compiled")
+
+        self.trees = CompiledTrees([e.tree_ for e in forest.estimators_], scaler)
+        self.leaf_value = np.concatenate(
+            [self._leaf_proba(e.tree_) for e in forest.estimators_]
+        )
+
+    @staticmethod
+    def _leaf_proba(tree) -> np.ndarray:
+        """Class-1 probability stored at each node"""
+        value = tree.value[:, 0, :]
+        totals = value.sum(axis=1)
+        if np.allclose(totals, 1.0):
+            # scikit-learn >= 1.4 stores class fractions directly
+            return value[:, 1].copy()
+
+        # Older releases store weighted counts and normalize at predict time
+        totals[totals == 0.0] = 1.0
+        return value[:, 1] / totals
+
+    def predict_fraud_proba(self, X: np.ndarray) -> np.ndarray:
+        leaves = self.leaf_value[self.trees.apply(X)]
+
+        # Accumulate in estimator order, as RandomForestClassifier does
+        proba = np.zeros(X.shape[0], dtype=np.float64)
+        for t in range(self.trees.n_trees):
+            proba += leaves[:, t]
+        proba /= self.trees.n_trees
+        return proba
+
+
+class CompiledGradientBoosting(CompiledModel):
+    """Compiled binary GradientBoostingClassifier (log-loss)"""
+
+    def __init__(self, gb: GradientBoostingClassifier, scaler: Optional[StandardScaler]):
+        if gb.n_classes_ != 2 or gb.loss not in ("log_loss", "deviance"):
+            raise ValueError("Only binary log-loss gradient boosting can be compiled")
+        if not (gb.init_ == "zero" or isinstance(gb.init_, DummyClassifier)):
+            raise ValueError("Only constant init estimators can be compiled")
+
+        stages = gb.estimators_[:, 0]
+        self.trees = CompiledTrees([e.tree_ for e in stages], scaler)
+        self.leaf_value = np.concatenate([e.tree_.value[:, 0, 0] for e in stages])
+        self.learning_rate = gb.learning_rate
+
+        # The prior-based init prediction is the same for every row
+        probe = np.zeros((1, gb.n_features_in_), dtype=np.float32)
+        self.init_raw = float(gb._raw_predict_init(probe)[0, 0])
+
+    def predict_fraud_proba(self, X: np.ndarray) -> np.ndarray:
+        leaves = self.leaf_value[self.trees.apply(X)]
+
+        raw = np.full(X.shape[0], self.init_raw, dtype=np.float64)
+        for t in range(self.trees.n_trees):
+            raw += self.learning_rate * leaves[:, t]
+        return expit(raw)
+
+
+class CompiledVoting(CompiledModel):
+    """Soft-voting ensemble with its tree members compiled"""
+
+    def __init__(self, voting: VotingClassifier, scaler: Optional[StandardScaler]):
+        if voting.voting != "soft":
+            raise ValueError("Only soft-voting ensembles can be compiled")
+
+        self.scaler = scaler
+        self.weights = voting._weights_not_none
+        self.members: List = []
+        for estimator in voting.estimators_:
+            try:
+                self.members.append(compile_model(estimator, scaler))
+            except ValueError:
+                # Non-tree members (e.g. the MLP) keep the sklearn path
+                self.members.append(estimator)
+
+        if not any(isinstance(m, CompiledModel) for m in self.members):
+            raise ValueError("Ensemble has no tree members to compile")
+
+    def predict_fraud_proba(self, X: np.ndarray) -> np.ndarray:
+        X_scaled = None
+        probas = []
+        for member in self.members:
+            if isinstance(member, CompiledModel):
+                probas.append(member.predict_fraud_proba(X))
+            else:
+                if X_scaled is None:
+                    X_scaled = self.scaler.transform(X) if self.scaler is not None else X
+                probas.append(member.predict_proba(X_scaled)[:, 1])
+        return np.average(np.asarray(probas), axis=0, weights=self.weights)
+
+
+def compile_model(model, scaler: Optional[StandardScaler] = None) -> CompiledModel:
+    """
+    Compile a fitted model for fast inference
+
+    Args:
+        model: RandomForestClassifier, GradientBoostingClassifier or
+            soft VotingClassifier containing them
+        scaler: StandardScaler applied to features before the model
+
+    Returns:
+        Compiled model exposing predict_fraud_proba(X_raw)
+
+    Raises:
+        ValueError: If the model type is not supported
+    """
+    if isinstance(model, RandomForestClassifier):
+        return CompiledForest(model, scaler)
+    if isinstance(model, GradientBoostingClassifier):
+        return CompiledGradientBoosting(model, scaler)
+    if isinstance(model, VotingClassifier):
+        return CompiledVoting(model, scaler)
+    raise ValueError(f"Cannot compile model of type {type(model).__name__}")
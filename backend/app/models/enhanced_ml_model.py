@@ -2,7 +2,7 @@
 
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, Optional, Tuple, Any
 from enum import Enum
 import json
 
@@ -14,6 +14,8 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import classification_report, confusion_matrix
 from datetime import datetime
 
+from .compiled_trees import CompiledModel, compile_model
+
 logger = logging.getLogger(__name__)
 
 
@@ -51,15 +53,23 @@ class EnhancedFraudDetectionModel:
         "high_amount_flag",  # 1 if amount > threshold
     ]
 
+    # Default fraud probability cut-off (matches the estimators' predict)
+    DEFAULT_DECISION_THRESHOLD = 0.5
+
+    # Above this many rows sklearn's Cython traversal beats the NumPy one
+    COMPILED_MAX_ROWS = 256
+
     def __init__(self, model_type: ModelType = ModelType.ENSEMBLE):
         self.model_type = model_type
         self.model: Optional[Any] = None
         self.scaler: Optional[StandardScaler] = None
+        self.compiled_model: Optional[CompiledModel] = None
         self.is_loaded: bool = False
         self.model_info: Dict = {
             "version": "2.0",
             "created_at": datetime.now().isoformat(),
             "model_type": model_type.value,
+            "decision_threshold": self.DEFAULT_DECISION_THRESHOLD,
             "training_history": [],
             "performance_metrics": {},
         }
@@ -193,6 +203,7 @@ class EnhancedFraudDetectionModel:
         # Create and train model
         self.model = self._create_model()
         self.model.fit(X_train_scaled, y_train)
+        self.compiled_model = None
 
         self.is_loaded = True
 
@@ -238,6 +249,7 @@ class EnhancedFraudDetectionModel:
 
             self.model = joblib.load(model_file)
             self.scaler = joblib.load(scaler_file)
+            self.compiled_model = None
             self.is_loaded = True
 
             # Load model info if available
@@ -282,6 +294,52 @@ class EnhancedFraudDetectionModel:
             logger.error(f"Error saving model: {e}")
             return False
 
+    @property
+    def decision_threshold(self) -> float:
+        """Fraud probability above which a transaction is labelled fraud"""
+        return float(
+            self.model_info.get("decision_threshold", self.DEFAULT_DECISION_THRESHOLD)
+        )
+
+    def set_decision_threshold(self, threshold: float) -> None:
+        """Change the decision threshold (persisted by save())"""
+        if not 0.0 <= threshold <= 1.0:
+            raise ValueError("Decision threshold must be between 0 and 1")
+
+        self.model_info["decision_threshold"] = float(threshold)
+
+    def enable_compiled_backend(self) -> bool:
+        """
+        Compile the tree members (RF / GradientBoosting) into flat node arrays
+
+        The neural network member of an ensemble keeps the sklearn path.
+        """
+        if not self.is_loaded:
+            raise RuntimeError("Model not loaded. Call load() or train() first.")
+
+        try:
+            self.compiled_model = compile_model(self.model, self.scaler)
+        except ValueError as e:
+            logger.warning(f"Compiled inference backend unavailable: {e}")
+            return False
+
+        logger.info("Compiled inference backend enabled for enhanced model")
+        return True
+
+    def _fraud_probabilities(self, features: np.ndarray) -> np.ndarray:
+        """Engineer, scale and score features in a single model pass"""
+        features_eng = self._engineer_features(features)
+
+        if (
+            self.compiled_model is not None
+            and len(features_eng) <= self.COMPILED_MAX_ROWS
+            and np.isfinite(features_eng).all()
+        ):
+            return self.compiled_model.predict_fraud_proba(features_eng)
+
+        features_scaled = self.scaler.transform(features_eng)
+        return self.model.predict_proba(features_scaled)[:, 1]
+
     def predict(self, features: np.ndarray) -> Tuple[bool, float, Dict[str, Any]]:
         """
         Make a prediction for a single transaction with additional metadata
@@ -295,19 +353,9 @@ class EnhancedFraudDetectionModel:
         if not self.is_loaded:
             raise RuntimeError("Model not loaded. Call load() or train() first.")
 
-        # Engineer features
-        features_eng = self._engineer_features(features)
-
-        # Scale features
-        features_scaled = self.scaler.transform(features_eng)
-
-        # Get prediction and probability
-        prediction = self.model.predict(features_scaled)[0]
-        probabilities = self.model.predict_proba(features_scaled)[0]
-
-        # Probability of fraud (class 1)
-        fraud_prob = float(probabilities[1])
-        is_fraud = bool(prediction == 1)
+        # Probability of fraud (class 1); the label is derived from it
+        fraud_prob = float(self._fraud_probabilities(features)[0])
+        is_fraud = fraud_prob > self.decision_threshold
 
         # Additional metadata
         metadata = {
@@ -322,7 +370,7 @@ class EnhancedFraudDetectionModel:
 
     def predict_batch(
         self, features_batch: np.ndarray
-    ) -> List[Tuple[bool, float, Dict[str, Any]]]:
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """
         Make predictions for multiple transactions
 
@@ -330,34 +378,15 @@ class EnhancedFraudDetectionModel:
             features_batch: numpy array of shape (n_samples, 30)
 
         Returns:
-            List of (is_fraud, fraud_probability, metadata) tuples
+            Tuple of (fraud_probabilities, is_fraud) arrays of shape (n_samples,)
         """
         if not self.is_loaded:
             raise RuntimeError("Model not loaded. Call load() or train() first.")
 
-        # Engineer features
-        features_eng = self._engineer_features(features_batch)
-
-        # Scale features
-        features_scaled = self.scaler.transform(features_eng)
+        probabilities = self._fraud_probabilities(features_batch)
+        labels = probabilities > self.decision_threshold
 
-        # Get predictions and probabilities
-        predictions = self.model.predict(features_scaled)
-        probabilities = self.model.predict_proba(features_scaled)
-
-        results = []
-        for pred, prob in zip(predictions, probabilities):
-            is_fraud = bool(pred == 1)
-            fraud_prob = float(prob[1])
-            metadata = {
-                "model_type": self.model_type.value,
-                "model_version": self.model_info.get("version", "1.0"),
-                "confidence_level": self.get_confidence_level(fraud_prob),
-                "risk_score": self.get_risk_score(fraud_prob),
-            }
-            results.append((is_fraud, fraud_prob, metadata))
-
-        return results
+        return probabilities, labels
 
     def get_feature_importance(self) -> Dict[str, float]:
         """Get feature importance scores for all features"""
@@ -1,14 +1,17 @@
 """ML Model wrapper for fraud detection"""
 
+import hashlib
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Optional, Tuple
 
 import joblib
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 
+from .compiled_trees import CompiledModel, compile_model
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,11 +26,22 @@ class FraudDetectionModel:
         "Amount",
     ]
 
+    # Default fraud probability cut-off (matches RandomForestClassifier.predict)
+    DEFAULT_DECISION_THRESHOLD = 0.5
+
+    # Above this many rows sklearn's Cython traversal beats the NumPy one
+    COMPILED_MAX_ROWS = 256
+
     def __init__(self):
         self.model: Optional[RandomForestClassifier] = None
         self.scaler: Optional[StandardScaler] = None
         self.is_loaded: bool = False
         self.model_info: Dict = {}
+        self.info_path: Optional[Path] = None
+        self.model_path: Optional[str] = None
+        self.scaler_path: Optional[str] = None
+        self.compiled_model: Optional[CompiledModel] = None
+        self.fingerprint: Optional[str] = None
 
     def load(self, model_path: str, scaler_path: str) -> bool:
         """Load the trained model and scaler from disk"""
@@ -45,12 +59,16 @@ class FraudDetectionModel:
 
             self.model = joblib.load(model_file)
             self.scaler = joblib.load(scaler_file)
+            self.compiled_model = None
             self.is_loaded = True
+            self.model_path = str(model_path)
+            self.scaler_path = str(scaler_path)
 
             # Load model info if available
-            info_path = model_file.parent / "model_info.pkl"
-            if info_path.exists():
-                self.model_info = joblib.load(info_path)
+            self.info_path = model_file.parent / "model_info.pkl"
+            if self.info_path.exists():
+                self.model_info = joblib.load(self.info_path)
+            self.fingerprint = self._fingerprint(model_file, scaler_file)
 
             logger.info("Model and scaler loaded successfully")
             return True
@@ -60,6 +78,71 @@ class FraudDetectionModel:
             self.is_loaded = False
             return False
 
+    def _fingerprint(self, model_file: Path, scaler_file: Path) -> str:
+        """Identifies the loaded artifacts: model version, file sizes and modification times"""
+        files = [(path.stat().st_size, path.stat().st_mtime_ns) for path in (model_file, scaler_file)]
+        payload = f"{self.model_info.get('version', '')}:{files}"
+        return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+    @property
+    def decision_threshold(self) -> float:
+        """Fraud probability above which a transaction is labelled fraud"""
+        return float(
+            self.model_info.get("decision_threshold", self.DEFAULT_DECISION_THRESHOLD)
+        )
+
+    def set_decision_threshold(self, threshold: float, persist: bool = False) -> None:
+        """
+        Change the decision threshold without retraining
+
+        Args:
+            threshold: Fraud probability cut-off in [0, 1]
+            persist: Also write it to model_info.pkl next to the model artifact
+        """
+        if not 0.0 <= threshold <= 1.0:
+            raise ValueError("Decision threshold must be between 0 and 1")
+
+        self.model_info["decision_threshold"] = float(threshold)
+
+        if persist:
+            if self.info_path is None:
+                raise RuntimeError("Model not loaded. Call load() first.")
+            joblib.dump(self.model_info, self.info_path)
+
+    @property
+    def inference_backend(self) -> str:
+        """Name of the active scoring backend"""
+        return "compiled" if self.compiled_model is not None else "sklearn"
+
+    def enable_compiled_backend(self) -> bool:
+        """Compile the loaded forest into flat node arrays for faster scoring"""
+        if not self.is_loaded:
+            raise RuntimeError("Model not loaded. Call load() first.")
+
+        try:
+            self.compiled_model = compile_model(self.model, self.scaler)
+        except ValueError as e:
+            logger.warning(f"Compiled inference backend unavailable: {e}")
+            return False
+
+        logger.info("Compiled inference backend enabled")
+        return True
+
+    def fraud_probabilities(self, features_batch: np.ndarray) -> np.ndarray:
+        """Probability of fraud (class 1) for raw, unscaled features"""
+        # Compiled trees win on small batches and assume finite inputs
+        if (
+            self.compiled_model is not None
+            and len(features_batch) <= self.COMPILED_MAX_ROWS
+            and np.isfinite(features_batch).all()
+        ):
+            return self.compiled_model.predict_fraud_proba(
+                np.asarray(features_batch, dtype=np.float64)
+            )
+
+        features_scaled = self.scaler.transform(features_batch)
+        return self.model.predict_proba(features_scaled)[:, 1]
+
     def predict(self, features: np.ndarray) -> Tuple[bool, float]:
         """
         Make a prediction for a single transaction
@@ -76,22 +159,15 @@ class FraudDetectionModel:
         # Reshape for single prediction
         features = features.reshape(1, -1)
 
-        # Scale features
-        features_scaled = self.scaler.transform(features)
-
-        # Get prediction and probability
-        prediction = self.model.predict(features_scaled)[0]
-        probabilities = self.model.predict_proba(features_scaled)[0]
-
-        # Probability of fraud (class 1)
-        fraud_prob = float(probabilities[1])
-        is_fraud = bool(prediction == 1)
+        # Single forest pass; the label is derived from the probability
+        fraud_prob = float(self.fraud_probabilities(features)[0])
+        is_fraud = fraud_prob > self.decision_threshold
 
         return is_fraud, fraud_prob
 
     def predict_batch(
         self, features_batch: np.ndarray
-    ) -> List[Tuple[bool, float]]:
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """
         Make predictions for multiple transactions
 
@@ -99,25 +175,16 @@ class FraudDetectionModel:
             features_batch: numpy array of shape (n_samples, 30)
 
         Returns:
-            List of (is_fraud, fraud_probability) tuples
+            Tuple of (fraud_probabilities, is_fraud) arrays of shape (n_samples,)
         """
         if not self.is_loaded:
             raise RuntimeError("Model not loaded. Call load() first.")
 
-        # Scale features
-        features_scaled = self.scaler.transform(features_batch)
-
-        # Get predictions and probabilities
-        predictions = self.model.predict(features_scaled)
-        probabilities = self.model.predict_proba(features_scaled)
+        # Single forest pass; labels are derived from the probabilities
+        probabilities = self.fraud_probabilities(features_batch)
+        labels = probabilities > self.decision_threshold
 
-        results = []
-        for pred, prob in zip(predictions, probabilities):
-            is_fraud = bool(pred == 1)
-            fraud_prob = float(prob[1])
-            results.append((is_fraud, fraud_prob))
-
-        return results
+        return probabilities, labels
 
     def get_feature_importance(self) -> Dict[str, float]:
         """Get feature importance scores"""
@@ -142,6 +209,18 @@ class FraudDetectionModel:
         """Convert probability to risk score (0-100)"""
         return int(probability * 100)
 
+    @staticmethod
+    def get_confidence_levels(probabilities: np.ndarray) -> np.ndarray:
+        """Vectorized get_confidence_level for an array of probabilities"""
+        return np.select(
+            [probabilities < 0.3, probabilities < 0.7], ["low", "medium"], "high"
+        )
+
+    @staticmethod
+    def get_risk_scores(probabilities: np.ndarray) -> np.ndarray:
+        """Vectorized get_risk_score for an array of probabilities"""
+        return (probabilities * 100).astype(int)
+
 
 # Global model instance
 fraud_model = FraudDetectionModel()
@@ -0,0 +1,171 @@
+"""
+Prediction Aggregation - SQL aggregates shared by analytics and rollups
+
+Counts, sums and averages over predictions are computed by the database
+and come back as a handful of rows, instead of hydrating every matching
+Prediction and counting in Python. The same additive counters are kept
+per hour in `prediction_rollups` (see rollups.py). Time bucketing is
+dialect-aware: `strftime` on SQLite, `date_trunc` on PostgreSQL.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from ..db.models import Prediction
+
+# Labels returned for each time-series period (strftime formats)
+PERIOD_FORMATS = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "week": "%Y-W%W",
+    "month": "%Y-%m",
+}
+
+# Risk distribution levels and their exclusive upper bounds
+RISK_LEVELS = (("low", 25), ("medium", 50), ("high", 75), ("critical", None))
+
+HIGH_RISK_THRESHOLD = 70
+
+FRAUD_COUNT = func.sum(case((Prediction.is_fraud == True, 1), else_=0))  # noqa: E712
+
+# Additive per-group counters, also the columns of PredictionRollup
+COUNTER_FIELDS = (
+    "total", "fraud_count", "high_risk_count",
+    "amount_sum", "fraud_amount_sum", "risk_score_sum", "prediction_time_ms_sum",
+    *(f"risk_{level}" for level, _ in RISK_LEVELS),
+)
+
+
+def _dialect(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def time_bucket(db: Session, period: str) -> ColumnElement:
+    """
+    Expression bucketing created_at by hour, day, week or month
+
+    On SQLite it yields the period label itself; on PostgreSQL it yields
+    the truncated timestamp, which `bucket_label` formats. Weeks follow
+    SQLite's %W: they start on Monday, and days before a year's first
+    Monday form its week 00, so PostgreSQL weeks are cut at January 1st.
+    """
+    period = period if period in PERIOD_FORMATS else "day"
+    if _dialect(db) == "postgresql":
+        if period == "week":
+            return func.greatest(
+                func.date_trunc("week", Prediction.created_at),
+                func.date_trunc("year", Prediction.created_at),
+            )
+        return func.date_trunc(period, Prediction.created_at)
+    return func.strftime(PERIOD_FORMATS[period], Prediction.created_at)
+
+
+def bucket_label(value, period: str) -> str:
+    """Format a `time_bucket` value as the period label"""
+    if isinstance(value, datetime):
+        return value.strftime(PERIOD_FORMATS.get(period, PERIOD_FORMATS["day"]))
+    return value
+
+
+def risk_level(risk_score: int) -> str:
+    """Risk distribution level of a score"""
+    for level, upper in RISK_LEVELS:
+        if upper is None or risk_score < upper:
+            return level
+
+
+def counter_columns() -> List[ColumnElement]:
+    """Aggregate expressions computing COUNTER_FIELDS over predictions"""
+    is_fraud = Prediction.is_fraud == True  # noqa: E712
+    risk_score = Prediction.risk_score
+
+    def count_if(condition):
+        return func.sum(case((condition, 1), else_=0))
+
+    risk_columns = []
+    lower = None
+    for level, upper in RISK_LEVELS:
+        bounds = [risk_score >= lower] if lower is not None else []
+        bounds += [risk_score < upper] if upper is not None else []
+        risk_columns.append(count_if(and_(*bounds)).label(f"risk_{level}"))
+        lower = upper
+
+    return [
+        func.count().label("total"),
+        FRAUD_COUNT.label("fraud_count"),
+        count_if(risk_score >= HIGH_RISK_THRESHOLD).label("high_risk_count"),
+        func.sum(Prediction.amount).label("amount_sum"),
+        func.sum(case((is_fraud, Prediction.amount), else_=0.0)).label("fraud_amount_sum"),
+        func.sum(risk_score).label("risk_score_sum"),
+        func.sum(Prediction.prediction_time_ms).label("prediction_time_ms_sum"),
+        *risk_columns,
+    ]
+
+
+def record_counters(record: Dict) -> Dict:
+    """COUNTER_FIELDS of a single predictions-table row"""
+    is_fraud = bool(record["is_fraud"])
+    risk_score = record["risk_score"]
+    counters = dict.fromkeys(COUNTER_FIELDS, 0)
+    counters.update(
+        total=1,
+        fraud_count=int(is_fraud),
+        high_risk_count=int(risk_score >= HIGH_RISK_THRESHOLD),
+        amount_sum=record["amount"],
+        fraud_amount_sum=record["amount"] if is_fraud else 0.0,
+        risk_score_sum=risk_score,
+        prediction_time_ms_sum=record["prediction_time_ms"],
+    )
+    counters[f"risk_{risk_level(risk_score)}"] = 1
+    return counters
+
+
+def summarize_counters(counters: Dict) -> Dict:
+    """
+    Totals, rates and averages from summed COUNTER_FIELDS
+
+    Averages are 0 when the counters are empty.
+    """
+    total = int(counters.get("total") or 0)
+    fraud_count = int(counters.get("fraud_count") or 0)
+    legitimate_count = total - fraud_count
+    amount_sum = float(counters.get("amount_sum") or 0)
+    fraud_amount_sum = float(counters.get("fraud_amount_sum") or 0)
+
+    def average(value, count):
+        return float(value or 0) / count if count else 0.0
+
+    return {
+        "total": total,
+        "fraud_count": fraud_count,
+        "legitimate_count": legitimate_count,
+        "fraud_rate": fraud_count / total if total else 0.0,
+        "total_amount": amount_sum,
+        "avg_amount": average(amount_sum, total),
+        "avg_fraud_amount": average(fraud_amount_sum, fraud_count),
+        "avg_legitimate_amount": average(amount_sum - fraud_amount_sum, legitimate_count),
+        "avg_risk_score": average(counters.get("risk_score_sum"), total),
+        "high_risk_count": int(counters.get("high_risk_count") or 0),
+        "avg_prediction_time_ms": average(counters.get("prediction_time_ms_sum"), total),
+        "risk_distribution": {
+            level: int(counters.get(f"risk_{level}") or 0) for level, _ in RISK_LEVELS
+        },
+    }
+
+
+def prediction_counters(db: Session, *criteria) -> Dict:
+    """Summed COUNTER_FIELDS over the matching predictions in one query"""
+    row = db.execute(select(*counter_columns()).where(*criteria)).one()
+    return dict(row._mapping)
+
+
+def prediction_aggregates(db: Session, *criteria) -> Dict:
+    """Totals and averages over the matching predictions in one query"""
+    return summarize_counters(prediction_counters(db, *criteria))
@@ -67,7 +67,7 @@ class AnomalyDetector:
             from app.db.models import Prediction
 
             # Get recent predictions
-            recent = db.query(Prediction).order_by(
+            recent = db.query(Prediction.amount).order_by(
                 Prediction.created_at.desc()
             ).limit(1000).all()
 
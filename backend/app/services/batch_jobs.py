@@ -0,0 +1,367 @@
+"""
+Background batch job subsystem
+
+Runs large CSV scoring jobs outside the request. Job state lives in the
+`batch_jobs` table and jobs are queued in-process, so no external broker
+is needed. Each job is read in chunks; the sklearn scoring of every chunk
+runs in a process pool so it never competes with the event loop, while
+database writes stay in the API process.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..db.models import BatchJob, BatchJobStatus
+from ..models.ml_model import fraud_model
+from .csv_stream import read_upload
+from .data_processor import DataProcessor
+from .fraud_detector import FraudDetectorService
+from .pagination import Page, keyset_page
+from .prediction_service import save_batch_predictions
+from .webhook_service import WebhookService
+from .websocket_service import notify_batch_complete
+
+logger = logging.getLogger(__name__)
+
+
+# ============== Worker process ==============
+
+def _init_worker(model_path: str, scaler_path: str, inference_backend: str) -> None:
+    """Load the model once per worker process"""
+    if not fraud_model.load(model_path, scaler_path):
+        raise RuntimeError(f"Worker could not load model from {model_path}")
+    if inference_backend == "compiled":
+        fraud_model.enable_compiled_backend()
+
+
+def _score_features(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Score one chunk in a worker; returns (probabilities, labels)"""
+    return fraud_model.predict_batch(features)
+
+
+# ============== Job manager ==============
+
+class BatchJobManager:
+    """
+    Queue, run and track background batch jobs.
+
+    Jobs are asyncio tasks on the API event loop, limited to
+    `max_concurrent` at a time. Chunk scoring is sent to a process pool of
+    `workers` processes (0 scores in a thread instead). Job files older than
+    `retention_hours` are swept at startup and after every job.
+    """
+
+    def __init__(
+        self, job_dir: str, workers: int = 2, max_concurrent: int = 2, retention_hours: float = 168.0
+    ):
+        self.job_dir = Path(job_dir)
+        self.workers = workers
+        self.max_concurrent = max_concurrent
+        self.retention_hours = retention_hours
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._active: Set[str] = set()  # ids of enqueued jobs, whose files are kept
+
+    # ---------- Submission ----------
+
+    def create_job(
+        self, db: Session, user_id: int, filename: str, upload: BinaryIO, max_bytes: int
+    ) -> BatchJob:
+        """
+        Spool an upload to the job directory and record a queued job
+
+        Raises:
+            ValueError: If the upload is empty or larger than max_bytes
+        """
+        job_id = str(uuid.uuid4())
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        source_path = self.job_dir / f"{job_id}.csv"
+
+        try:
+            line_count = self._spool(upload, source_path, max_bytes)
+        except Exception:
+            source_path.unlink(missing_ok=True)
+            raise
+
+        if line_count < 2:
+            source_path.unlink(missing_ok=True)
+            raise ValueError("CSV file has no rows")
+
+        job = BatchJob(
+            id=job_id,
+            user_id=user_id,
+            filename=filename,
+            status=BatchJobStatus.QUEUED,
+            total_rows=line_count - 1,  # minus the header
+            source_path=str(source_path),
+            result_path=str(self.job_dir / f"{job_id}_predictions.csv"),
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def _spool(upload: BinaryIO, path: Path, max_bytes: int) -> int:
+        """Copy an upload to disk and count its lines"""
+        lines = 0
+        last = b"\n"
+        with open(path, "wb") as out:
+            for block in read_upload(upload, max_bytes):
+                lines += block.count(b"\n")
+                last = block[-1:]
+                out.write(block)
+
+        # Count a final line without a trailing newline
+        return lines + (last != b"\n")
+
+    def enqueue(self, job_id: str, bind) -> None:
+        """Schedule a queued job on the running event loop"""
+        task = asyncio.get_running_loop().create_task(self._run_job(job_id, bind))
+        self._tasks.add(task)
+        self._active.add(job_id)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._active.discard(job_id))
+
+    # ---------- Queries ----------
+
+    @staticmethod
+    def get_job(db: Session, job_id: str, user_id: int) -> Optional[BatchJob]:
+        """Get a job owned by the user"""
+        return db.query(BatchJob).filter(
+            BatchJob.id == job_id,
+            BatchJob.user_id == user_id
+        ).first()
+
+    @staticmethod
+    def get_user_jobs(db: Session, user_id: int, limit: int = 20, cursor: Optional[str] = None) -> Page:
+        """Get a page of the user's jobs, most recent first, keyed on (created_at, id)"""
+        return keyset_page(
+            db,
+            select(BatchJob).where(BatchJob.user_id == user_id),
+            BatchJob.created_at,
+            BatchJob.id,
+            limit,
+            cursor=cursor,
+            scalars=True
+        )
+
+    @staticmethod
+    def job_to_dict(job: BatchJob) -> Dict:
+        """Serialize job state for the API"""
+        return {
+            "job_id": job.id,
+            "status": job.status.value,
+            "filename": job.filename,
+            "total_rows": job.total_rows,
+            "rows_processed": job.rows_processed or 0,
+            "fraud_count": job.fraud_count or 0,
+            "progress_percent": job.progress_percent,
+            "rows_per_second": job.rows_per_second,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+        }
+
+    # ---------- Execution ----------
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        """Create the scoring process pool on first use"""
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(fraud_model.model_path, fraud_model.scaler_path, settings.inference_backend),
+            )
+        return self._executor
+
+    async def _score(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score a chunk in the process pool, or in a thread without one"""
+        executor = self._get_executor()
+        if executor is None:
+            return await asyncio.to_thread(_score_features, features)
+        return await asyncio.get_running_loop().run_in_executor(executor, _score_features, features)
+
+    async def _run_job(self, job_id: str, bind) -> None:
+        """Run a job to completion, recording progress after every chunk"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async with self._semaphore:
+            db = Session(bind=bind)
+            try:
+                job = db.get(BatchJob, job_id)
+                if job is None or job.status != BatchJobStatus.QUEUED:
+                    return
+
+                job.status = BatchJobStatus.RUNNING
+                job.started_at = datetime.utcnow()
+                db.commit()
+
+                try:
+                    await self._process(db, job)
+                    job.status = BatchJobStatus.COMPLETED
+                    job.total_rows = job.rows_processed
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Batch job {job_id} failed after {job.rows_processed} rows: {e}")
+                    job.status = BatchJobStatus.FAILED
+                    job.error = str(e)[:1000]
+                    # A partial result can't be downloaded, so don't keep it
+                    Path(job.result_path).unlink(missing_ok=True)
+                finally:
+                    Path(job.source_path).unlink(missing_ok=True)
+
+                job.completed_at = datetime.utcnow()
+                db.commit()
+                await self._notify(db, job)
+            finally:
+                db.close()
+
+        await asyncio.to_thread(self.sweep)
+
+    async def _process(self, db: Session, job: BatchJob) -> None:
+        """Read, score and store the job's CSV chunk by chunk"""
+        reader = pd.read_csv(job.source_path, chunksize=settings.csv_stream_chunk_rows)
+        header = True
+
+        with open(job.result_path, "wb") as out:
+            while True:
+                chunk = await asyncio.to_thread(next, reader, None)
+                if chunk is None:
+                    break
+
+                chunk = DataProcessor.normalize_columns(chunk)
+                features = DataProcessor.dataframe_to_batch(chunk)
+
+                start_time = time.perf_counter()
+                probabilities, labels = await self._score(features)
+                processing_time_ms = (time.perf_counter() - start_time) * 1000
+
+                scores = FraudDetectorService.score_columns(probabilities, labels, processing_time_ms)
+                for column, values in scores.items():
+                    chunk[column] = values
+
+                await asyncio.to_thread(self._store_chunk, db, job, chunk, out, header)
+                header = False
+
+        if job.rows_processed == 0:
+            raise ValueError("CSV file has no rows")
+
+    @staticmethod
+    def _store_chunk(db: Session, job: BatchJob, chunk: pd.DataFrame, out: BinaryIO, header: bool) -> None:
+        """Save one chunk's predictions and progress, append its result CSV"""
+        save_batch_predictions(db, job.user_id, chunk, job.id)
+        out.write(chunk.to_csv(index=False, header=header).encode())
+
+        job.rows_processed = (job.rows_processed or 0) + len(chunk)
+        job.fraud_count = (job.fraud_count or 0) + int(chunk["is_fraud"].sum())
+        db.commit()
+
+    async def _notify(self, db: Session, job: BatchJob) -> None:
+        """Push job completion over WebSocket and to subscribed webhooks"""
+        stats = {
+            "total": job.rows_processed,
+            "fraud_count": job.fraud_count,
+            "legitimate_count": job.rows_processed - job.fraud_count,
+        }
+        try:
+            await notify_batch_complete(job.user_id, job.id, stats)
+            await WebhookService.trigger_webhooks_for_event(
+                db, job.user_id, "batch_complete",
+                {"batch_id": job.id, "status": job.status.value, "error": job.error, **stats}
+            )
+        except Exception as e:
+            logger.warning(f"Batch job {job.id} completion notification failed: {e}")
+
+    # ---------- Lifecycle ----------
+
+    def recover(self, db: Session) -> int:
+        """
+        Fail jobs left queued or running by a previous process
+
+        Partially stored jobs can't be resumed without duplicating rows, so
+        they are marked failed and can be resubmitted.
+        """
+        jobs = db.query(BatchJob).filter(
+            BatchJob.status.in_([BatchJobStatus.QUEUED, BatchJobStatus.RUNNING])
+        ).all()
+        for job in jobs:
+            job.status = BatchJobStatus.FAILED
+            job.error = "Interrupted by server restart"
+            job.completed_at = datetime.utcnow()
+            for path in (job.source_path, job.result_path):
+                if path:
+                    Path(path).unlink(missing_ok=True)
+        db.commit()
+        return len(jobs)
+
+    def sweep(self) -> int:
+        """
+        Delete job files older than the retention period
+
+        Files of jobs enqueued in this process are kept whatever their age.
+        Jobs whose result was swept report it as no longer available.
+        """
+        if not self.job_dir.is_dir():
+            return 0
+
+        cutoff = (datetime.now() - timedelta(hours=self.retention_hours)).timestamp()
+        active = set(self._active)
+        removed = 0
+        for path in self.job_dir.glob("*.csv"):
+            if path.name[:36] in active:
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            logger.info(f"Removed {removed} batch job files older than {self.retention_hours}h")
+        return removed
+
+    async def shutdown(self) -> None:
+        """Cancel running jobs and stop the worker processes"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._semaphore = None
+
+
+# Global batch job manager instance
+batch_job_manager = BatchJobManager(
+    job_dir=settings.batch_job_dir,
+    workers=settings.batch_job_workers,
+    max_concurrent=settings.batch_job_max_concurrent,
+    retention_hours=settings.batch_job_retention_hours,
+)
@@ -1,17 +1,46 @@
 """
-Cache Service - Redis caching for performance
+Cache Service - Two-tier caching for performance
+
+Reads go to a bounded in-process LRU/TTL tier first, then to Redis when
+it is enabled. Values read from Redis are kept locally, so repeated reads
+cost neither a network round trip nor a JSON decode. Without Redis the
+local tier is the whole cache.
+
+Every write and delete is published on a Redis pub/sub channel. Other
+processes evict their local copies when the message arrives. Local
+entries also live at most `cache_local_ttl` seconds, which bounds
+staleness if a message is lost.
+
+Keys can be registered under tags (e.g. user_tag(7), model_tag("1.2"))
+when they are set, and invalidate_tags() deletes everything registered
+under a tag in one call. Redis keeps each tag as a set of its keys.
+Bulk deletes use UNLINK, so Redis frees the memory off its main thread,
+and clear_pattern walks the keyspace with SCAN rather than KEYS.
+
+Cached values are shared between callers and must not be mutated.
 
 Author: Zhmuryk Andrii
 Copyright (c) 2024 - All Rights Reserved
 """
 
+import asyncio
+import fnmatch
+import hashlib
 import json
 import logging
-from typing import Any, Optional
-from datetime import timedelta
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
 from functools import wraps
 
+from pydantic import BaseModel
+
 from ..core.config import settings
+from ..core.responses import dumps
 
 logger = logging.getLogger(__name__)
 
@@ -21,25 +50,222 @@ try:
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
-    logger.warning("Redis not installed. Caching will be disabled.")
+    logger.warning("Redis not installed. Caching will be in-process only.")
 
+try:
+    from orjson import loads
+except ImportError:
+    loads = json.loads
 
-class CacheService:
-    """Redis cache service with fallback to no-op when Redis is unavailable"""
+# Pub/sub channel carrying keys and patterns to evict from local tiers
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Returned by LocalCache.get on a miss, since None can't tell
+MISSING = object()
+
+# Redis set holding the keys registered under a tag
+TAG_KEY_PREFIX = "tag:"
+
+# Keys per SCAN step, and keys per UNLINK when deleting in bulk
+SCAN_COUNT = 1000
+DELETE_BATCH_SIZE = 500
+
+# Distributed compute locks: expiry (also the longest wait for another
+# process's value) and how often waiters look for it
+LOCK_TIMEOUT_SECONDS = 10.0
+LOCK_POLL_SECONDS = 0.05
+
+# Deletes a lock only if it still holds our token
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def key_prefix(key: str) -> str:
+    """Namespace of a key: the part before the first colon"""
+    prefix, separator, _ = key.partition(":")
+    return prefix if separator else "none"
+
+
+class _Flight:
+    """One in-progress computation that concurrent callers wait on"""
 
     def __init__(self):
+        self._done = threading.Event()
+        self._value = None
+        self._error: Optional[BaseException] = None
+
+    def resolve(self, value: Any) -> None:
+        self._value = value
+        self._done.set()
+
+    def fail(self, error: BaseException) -> None:
+        self._error = error
+        self._done.set()
+
+    def wait(self) -> Any:
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class LocalCache:
+    """
+    In-process LRU cache with per-entry TTLs
+
+    Bounded by entry count and by encoded size. A prefix with a quota is
+    also capped at that many entries: once it is full, it evicts its own
+    least recently used entries instead of pushing out other namespaces.
+    Entries set with tags are indexed by tag for delete_tagged().
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, quotas: Optional[Dict[str, int]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.quotas = quotas or {}
+        # key -> (value, expires_at, size, tags), least recently used first
+        self._entries: "OrderedDict[str, Tuple[Any, float, int, Tuple[str, ...]]]" = OrderedDict()
+        self._by_prefix: Dict[str, "OrderedDict[str, None]"] = {}
+        self._by_tag: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions: Counter = Counter()  # by prefix
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str) -> Any:
+        """Value of a live entry, or MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                return MISSING
+            self._entries.move_to_end(key)
+            self._by_prefix[key_prefix(key)].move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: Any, size: int, ttl: float, tags: Iterable[str] = ()) -> None:
+        """Store a value of `size` encoded bytes for `ttl` seconds, evicting as needed"""
+        prefix = key_prefix(key)
+        quota = self.quotas.get(prefix)
+        if size > self.max_bytes or ttl <= 0 or quota == 0:
+            self.delete(key)
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            namespace = self._by_prefix.setdefault(prefix, OrderedDict())
+
+            while quota is not None and namespace and len(namespace) >= quota:
+                self._evict(next(iter(namespace)))
+            while self._entries and (
+                len(self._entries) >= self.max_entries or self._bytes + size > self.max_bytes
+            ):
+                self._evict(next(iter(self._entries)))
+
+            tags = tuple(tags)
+            self._entries[key] = (value, time.monotonic() + ttl, size, tags)
+            namespace[key] = None
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            self._bytes += size
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def delete_matching(self, pattern: str) -> int:
+        """Delete the keys matching a glob-style pattern"""
+        with self._lock:
+            keys = [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def delete_tagged(self, tags: Iterable[str]) -> int:
+        """Delete the keys set under any of the tags"""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._by_tag.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_prefix.clear()
+            self._by_tag.clear()
+            self._bytes = 0
+
+    def _evict(self, key: str) -> None:
+        self.evictions[key_prefix(key)] += 1
+        self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        _, _, size, tags = self._entries.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            tagged = self._by_tag[tag]
+            tagged.discard(key)
+            if not tagged:
+                del self._by_tag[tag]
+        prefix = key_prefix(key)
+        namespace = self._by_prefix[prefix]
+        del namespace[key]
+        if not namespace:
+            del self._by_prefix[prefix]
+
+
+class CacheService:
+    """Two-tier cache: in-process LRU in front of optional Redis"""
+
+    def __init__(
+        self,
+        max_entries: int = settings.cache_local_max_entries,
+        max_bytes: int = settings.cache_local_max_mb * 1024 * 1024,
+        local_ttl: float = settings.cache_local_ttl,
+        quotas: Optional[Dict[str, int]] = None,
+        redis_enabled: bool = settings.redis_enabled
+    ):
+        self.local = LocalCache(
+            max_entries, max_bytes, settings.cache_namespace_quotas_map if quotas is None else quotas
+        )
+        self.local_ttl = local_ttl
         self.client = None
-        self.enabled = False
-        self._connect()
+        self.enabled = False  # Redis tier connected
+        self.instance_id = uuid.uuid4().hex
+        self._pubsub = None
+        self._listener = None
+        self._counters: Counter = Counter()  # incr() without Redis
+        self._stats: Counter = Counter()  # (tier, prefix, result)
+        self._stats_lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}  # get_or_set computations in progress
+        self._flight_lock = threading.Lock()
+        self._async_flights: Dict[str, "asyncio.Future"] = {}
+        if redis_enabled:
+            self._connect()
 
     def _connect(self):
-        """Connect to Redis if available and enabled"""
+        """Connect to Redis if available and subscribe to invalidations"""
         if not REDIS_AVAILABLE:
-            logger.info("Redis not available - caching disabled")
-            return
-
-        if not settings.redis_enabled:
-            logger.info("Redis caching disabled in settings")
+            logger.info("Redis not available - in-process cache only")
             return
 
         try:
@@ -49,79 +275,441 @@ class CacheService:
             )
             # Test connection
             self.client.ping()
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_invalidate})
+            self._listener = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
             self.enabled = True
             logger.info(f"Connected to Redis at {settings.redis_url}")
         except Exception as e:
-            logger.warning(f"Failed to connect to Redis: {e}. Caching disabled.")
+            logger.warning(f"Failed to connect to Redis: {e}. In-process cache only.")
             self.client = None
             self.enabled = False
 
+    def close(self) -> None:
+        """Stop the invalidation listener"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+
+    def _record(self, tier: str, key: str, result: str) -> None:
+        with self._stats_lock:
+            self._stats[(tier, key_prefix(key), result)] += 1
+
+    # ---------- Invalidation ----------
+
+    def _publish(self, pipe, keys=(), pattern: Optional[str] = None, tags=()) -> None:
+        """Queue an invalidation message for other processes on a pipeline"""
+        pipe.publish(
+            INVALIDATION_CHANNEL,
+            json.dumps({"origin": self.instance_id, "keys": list(keys), "pattern": pattern, "tags": list(tags)})
+        )
+
+    def _on_invalidate(self, message: dict) -> None:
+        """Evict keys another process changed from the local tier"""
+        try:
+            payload = json.loads(message["data"])
+        except (TypeError, ValueError, KeyError):
+            logger.warning(f"Ignoring malformed cache invalidation: {message!r}")
+            return
+        if payload.get("origin") == self.instance_id:
+            return
+        for key in payload.get("keys") or ():
+            self.local.delete(key)
+        if payload.get("pattern"):
+            self.local.delete_matching(payload["pattern"])
+        if payload.get("tags"):
+            self.local.delete_tagged(payload["tags"])
+
+    # ---------- Operations ----------
+
     def get(self, key: str) -> Optional[Any]:
-        """Get a value from cache"""
+        """Get a value from the local tier, else from Redis"""
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._record("local", key, "hit")
+            return value
+        self._record("local", key, "miss")
+
         if not self.enabled:
             return None
 
         try:
-            value = self.client.get(key)
-            if value:
-                return json.loads(value)
-            return None
+            pipe = self.client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            raw, pttl = pipe.execute()
         except Exception as e:
             logger.error(f"Cache get error for key {key}: {e}")
             return None
 
-    def set(self, key: str, value: Any, ttl: int = 300) -> bool:
-        """Set a value in cache with TTL in seconds"""
-        if not self.enabled:
+        if raw is None:
+            self._record("redis", key, "miss")
+            return None
+        self._record("redis", key, "hit")
+
+        value = loads(raw)
+        ttl = self.local_ttl if pttl < 0 else min(self.local_ttl, pttl / 1000)
+        self.local.set(key, value, len(raw), ttl)
+        return value
+
+    def set(self, key: str, value: Any, ttl: int = 300, tags: Iterable[str] = ()) -> bool:
+        """Set a value in both tiers with TTL in seconds, registered under `tags`"""
+        try:
+            raw = dumps(value)
+        except TypeError as e:
+            logger.error(f"Cache set error for key {key}: {e}")
             return False
 
+        tags = tuple(tags)
+        if not self.enabled:
+            self.local.set(key, value, len(raw), ttl, tags)
+            return True
+
+        self.local.set(key, value, len(raw), min(ttl, self.local_ttl), tags)
         try:
-            self.client.setex(key, ttl, json.dumps(value))
+            pipe = self.client.pipeline(transaction=False)
+            pipe.setex(key, ttl, raw)
+            for tag in tags:
+                tag_key = f"{TAG_KEY_PREFIX}{tag}"
+                pipe.sadd(tag_key, key)
+                # A tag set outlives its keys: set an expiry on a new set,
+                # extend it when a key lives longer
+                pipe.expire(tag_key, ttl, nx=True)
+                pipe.expire(tag_key, ttl, gt=True)
+            self._publish(pipe, keys=[key])
+            pipe.execute()
             return True
         except Exception as e:
             logger.error(f"Cache set error for key {key}: {e}")
+            self.local.delete(key)
             return False
 
     def delete(self, key: str) -> bool:
-        """Delete a key from cache"""
+        """Delete a key from both tiers"""
+        self.local.delete(key)
         if not self.enabled:
-            return False
+            return True
 
         try:
-            self.client.delete(key)
+            pipe = self.client.pipeline(transaction=False)
+            pipe.delete(key)
+            self._publish(pipe, keys=[key])
+            pipe.execute()
             return True
         except Exception as e:
             logger.error(f"Cache delete error for key {key}: {e}")
             return False
 
     def clear_pattern(self, pattern: str) -> int:
-        """Delete all keys matching pattern"""
+        """
+        Delete all keys matching pattern
+
+        Redis is walked incrementally with SCAN and matches are unlinked in
+        batches, so no single command blocks the server for the whole
+        keyspace. Keys written during the walk may survive it.
+        """
+        deleted = self.local.delete_matching(pattern)
         if not self.enabled:
-            return 0
+            return deleted
 
         try:
-            keys = self.client.keys(pattern)
-            if keys:
-                return self.client.delete(*keys)
-            return 0
+            deleted = 0
+            batch = []
+            for key in self.client.scan_iter(match=pattern, count=SCAN_COUNT):
+                batch.append(key)
+                if len(batch) >= DELETE_BATCH_SIZE:
+                    deleted += self._unlink(batch)
+                    batch = []
+            deleted += self._unlink(batch)
+
+            pipe = self.client.pipeline(transaction=False)
+            self._publish(pipe, pattern=pattern)
+            pipe.execute()
+            return deleted
         except Exception as e:
             logger.error(f"Cache clear pattern error for {pattern}: {e}")
+            return deleted
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """
+        Delete every key registered under any of the tags
+
+        Each tag set is read and deleted in one MULTI, so a key registered
+        while invalidating is either deleted now or kept under a new set.
+        Returns the number of keys deleted.
+        """
+        deleted = self.local.delete_tagged(tags)
+        if not self.enabled or not tags:
+            return deleted
+
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            for tag in tags:
+                pipe.smembers(f"{TAG_KEY_PREFIX}{tag}")
+                pipe.unlink(f"{TAG_KEY_PREFIX}{tag}")
+            results = pipe.execute()
+            keys = sorted(set().union(*results[::2]))
+
+            deleted = 0
+            for start in range(0, len(keys), DELETE_BATCH_SIZE):
+                deleted += self._unlink(keys[start:start + DELETE_BATCH_SIZE])
+
+            pipe = self.client.pipeline(transaction=False)
+            self._publish(pipe, keys=keys, tags=tags)
+            pipe.execute()
+            return deleted
+        except Exception as e:
+            logger.error(f"Cache tag invalidation error for {tags}: {e}")
+            return deleted
+
+    def _unlink(self, keys: list) -> int:
+        """UNLINK a batch of keys from Redis"""
+        if not keys:
             return 0
+        return self.client.unlink(*keys)
+
+    # ---------- Computed values ----------
+    #
+    # get_or_set stores an envelope {"v": value, "e": stale-at epoch seconds,
+    # "d": seconds the value took to compute}. Keys it writes should only be
+    # read through get_or_set / get_or_set_async.
+
+    def _get_entry(self, key: str) -> Optional[dict]:
+        entry = self.get(key)
+        if isinstance(entry, dict) and entry.keys() == {"v", "e", "d"}:
+            return entry
+        return None
+
+    def _set_entry(self, key: str, value: Any, ttl: int, stale_ttl: int, delta: float, tags=()) -> None:
+        self.set(key, {"v": value, "e": time.time() + ttl, "d": delta}, ttl + stale_ttl, tags)
+
+    @staticmethod
+    def _is_fresh(entry: dict, beta: float) -> bool:
+        """
+        Probabilistic early expiration (XFetch)
+
+        A value reads as stale slightly before it expires, earlier the longer
+        it took to compute, so one caller usually refreshes it before the
+        rest see it expire.
+        """
+        gap = -entry["d"] * beta * math.log(1.0 - random.random())
+        return time.time() + gap < entry["e"]
+
+    def _serve(self, entry: dict, beta: float, stale_ttl: int) -> str:
+        """How to answer from a cached entry: "fresh", "stale" (refresh in background) or "expired" """
+        if self._is_fresh(entry, beta):
+            return "fresh"
+        if stale_ttl > 0 or time.time() < entry["e"]:
+            return "stale"
+        return "expired"
+
+    def _acquire_lock(self, key: str, timeout: float) -> Optional[str]:
+        """Token of the distributed compute lock of a key, or None if another process holds it"""
+        token = uuid.uuid4().hex
+        try:
+            if self.client.set(f"lock:{key}", token, nx=True, px=int(timeout * 1000)):
+                return token
+            return None
+        except Exception as e:
+            logger.error(f"Cache lock error for key {key}: {e}")
+            return token  # Compute without the lock rather than stall
 
-    def get_or_set(self, key: str, getter, ttl: int = 300) -> Any:
-        """Get from cache or compute and cache the value"""
-        cached = self.get(key)
-        if cached is not None:
-            return cached
+    def _release_lock(self, key: str, token: str) -> None:
+        try:
+            self.client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token)
+        except Exception as e:
+            logger.error(f"Cache unlock error for key {key}: {e}")
+
+    def get_or_set(
+        self,
+        key: str,
+        getter: Callable[[], Any],
+        ttl: int = 300,
+        stale_ttl: int = 0,
+        lock: bool = False,
+        beta: float = 1.0,
+        tags: Iterable[str] = ()
+    ) -> Any:
+        """
+        Get from cache or compute and cache the value
+
+        Concurrent misses in this process share one getter() call. With
+        lock=True and Redis enabled, a SET NX lock also keeps other
+        processes from computing the key at the same time; they wait for
+        the value instead. Within stale_ttl seconds after expiry, the old
+        value is returned while a single background refresh runs. beta
+        scales probabilistic early expiration (0 disables it). The value
+        is stored under `tags`.
+        """
+        entry = self._get_entry(key)
+        if entry is not None:
+            state = self._serve(entry, beta, stale_ttl)
+            if state != "expired":
+                if state == "stale":
+                    self._record("compute", key, "stale")
+                    self._refresh_in_background(key, getter, ttl, stale_ttl, lock, tags)
+                return entry["v"]
+
+        with self._flight_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self._record("compute", key, "coalesced")
+            value = flight.wait()
+            if value is MISSING:
+                # Joined a background refresh that left the key to another process
+                return self.get_or_set(key, getter, ttl, stale_ttl, lock, beta, tags)
+            return value
 
-        value = getter()
-        self.set(key, value, ttl)
+        try:
+            value = self._compute(key, getter, ttl, stale_ttl, lock, tags, wait=True)
+            flight.resolve(value)
+            return value
+        except BaseException as e:
+            flight.fail(e)
+            raise
+        finally:
+            with self._flight_lock:
+                self._flights.pop(key, None)
+
+    def _compute(self, key: str, getter, ttl: int, stale_ttl: int, lock: bool, tags, wait: bool) -> Any:
+        """
+        Run getter and store its value, under the distributed lock when asked
+
+        Without `wait`, returns MISSING instead of waiting when another
+        process holds the lock.
+        """
+        token = None
+        if lock and self.enabled:
+            deadline = time.monotonic() + LOCK_TIMEOUT_SECONDS
+            token = self._acquire_lock(key, LOCK_TIMEOUT_SECONDS)
+            while token is None:
+                if not wait:
+                    return MISSING
+                # Another process is computing; take its value when it lands
+                time.sleep(LOCK_POLL_SECONDS)
+                entry = self._get_entry(key)
+                if entry is not None and time.time() < entry["e"]:
+                    self._record("compute", key, "coalesced")
+                    return entry["v"]
+                if time.monotonic() >= deadline:
+                    break
+                token = self._acquire_lock(key, LOCK_TIMEOUT_SECONDS)
+
+        try:
+            start = time.perf_counter()
+            value = getter()
+            self._record("compute", key, "computed")
+            self._set_entry(key, value, ttl, stale_ttl, time.perf_counter() - start, tags)
+            return value
+        finally:
+            if token is not None:
+                self._release_lock(key, token)
+
+    def _refresh_in_background(self, key: str, getter, ttl: int, stale_ttl: int, lock: bool, tags) -> None:
+        """Recompute a stale key on a daemon thread unless a refresh is already running"""
+        with self._flight_lock:
+            if key in self._flights:
+                return
+            flight = self._flights[key] = _Flight()
+
+        def refresh():
+            try:
+                flight.resolve(self._compute(key, getter, ttl, stale_ttl, lock, tags, wait=False))
+            except Exception as e:
+                logger.error(f"Cache refresh error for key {key}: {e}")
+                flight.fail(e)
+            finally:
+                with self._flight_lock:
+                    self._flights.pop(key, None)
+
+        threading.Thread(target=refresh, name=f"cache-refresh-{key}", daemon=True).start()
+
+    async def get_or_set_async(
+        self,
+        key: str,
+        getter: Callable[[], Awaitable[Any]],
+        ttl: int = 300,
+        stale_ttl: int = 0,
+        lock: bool = False,
+        beta: float = 1.0,
+        tags: Iterable[str] = ()
+    ) -> Any:
+        """get_or_set for a coroutine function, coalescing misses on the event loop"""
+        entry = self._get_entry(key)
+        if entry is not None:
+            state = self._serve(entry, beta, stale_ttl)
+            if state != "expired":
+                if state == "stale" and key not in self._async_flights:
+                    self._record("compute", key, "stale")
+                    self._start_async_flight(key, self._compute_async(key, getter, ttl, stale_ttl, lock, tags, wait=False))
+                return entry["v"]
+
+        task = self._async_flights.get(key)
+        if task is None:
+            task = self._start_async_flight(key, self._compute_async(key, getter, ttl, stale_ttl, lock, tags, wait=True))
+        else:
+            self._record("compute", key, "coalesced")
+
+        value = await asyncio.shield(task)
+        if value is MISSING:
+            # Joined a background refresh that left the key to another process
+            return await self.get_or_set_async(key, getter, ttl, stale_ttl, lock, beta, tags)
         return value
 
+    def _start_async_flight(self, key: str, coroutine) -> "asyncio.Future":
+        task = asyncio.ensure_future(coroutine)
+        self._async_flights[key] = task
+
+        def finish(done: "asyncio.Future") -> None:
+            if self._async_flights.get(key) is done:
+                del self._async_flights[key]
+            # Retrieve the error so an unawaited refresh doesn't warn at exit
+            if not done.cancelled() and done.exception() is not None:
+                logger.error(f"Cache compute error for key {key}: {done.exception()}")
+
+        task.add_done_callback(finish)
+        return task
+
+    async def _compute_async(self, key: str, getter, ttl: int, stale_ttl: int, lock: bool, tags, wait: bool) -> Any:
+        token = None
+        if lock and self.enabled:
+            deadline = time.monotonic() + LOCK_TIMEOUT_SECONDS
+            token = self._acquire_lock(key, LOCK_TIMEOUT_SECONDS)
+            while token is None:
+                if not wait:
+                    return MISSING
+                await asyncio.sleep(LOCK_POLL_SECONDS)
+                entry = self._get_entry(key)
+                if entry is not None and time.time() < entry["e"]:
+                    self._record("compute", key, "coalesced")
+                    return entry["v"]
+                if time.monotonic() >= deadline:
+                    break
+                token = self._acquire_lock(key, LOCK_TIMEOUT_SECONDS)
+
+        try:
+            start = time.perf_counter()
+            value = await getter()
+            self._record("compute", key, "computed")
+            self._set_entry(key, value, ttl, stale_ttl, time.perf_counter() - start, tags)
+            return value
+        finally:
+            if token is not None:
+                self._release_lock(key, token)
+
     def incr(self, key: str, amount: int = 1) -> int:
-        """Increment a counter"""
+        """Increment a counter, shared through Redis or local to this process"""
         if not self.enabled:
-            return 0
+            with self._stats_lock:
+                self._counters[key] += amount
+                return self._counters[key]
 
         try:
             return self.client.incr(key, amount)
@@ -130,7 +718,34 @@ class CacheService:
             return 0
 
     def get_stats(self) -> dict:
-        """Get cache statistics"""
+        """
+        Get tier sizes and counts per tier and key prefix
+
+        Tiers "local" and "redis" count hits, misses and (local) evictions;
+        "compute" counts get_or_set values computed, coalesced onto another
+        caller's computation and served stale.
+        """
+        with self._stats_lock:
+            stats = Counter(self._stats)
+        for prefix, count in self.local.evictions.items():
+            stats[("local", prefix, "eviction")] = count
+
+        prefixes: Dict[str, Dict[str, Dict[str, int]]] = {}
+        for (tier, prefix, result), count in sorted(stats.items()):
+            prefixes.setdefault(prefix, {}).setdefault(tier, {})[result] = count
+
+        return {
+            "local": {
+                "entries": len(self.local),
+                "size_bytes": self.local.size_bytes,
+                "max_entries": self.local.max_entries,
+                "max_bytes": self.local.max_bytes,
+            },
+            "redis": self._redis_stats(),
+            "prefixes": prefixes,
+        }
+
+    def _redis_stats(self) -> dict:
         if not self.enabled:
             return {"enabled": False}
 
@@ -143,7 +758,8 @@ class CacheService:
                 "connected_clients": info.get("connected_clients"),
                 "total_keys": self.client.dbsize(),
                 "hits": info.get("keyspace_hits", 0),
-                "misses": info.get("keyspace_misses", 0)
+                "misses": info.get("keyspace_misses", 0),
+                "evicted_keys": info.get("evicted_keys", 0)
             }
         except Exception as e:
             return {"enabled": True, "connected": False, "error": str(e)}
@@ -153,42 +769,63 @@ class CacheService:
 cache = CacheService()
 
 
-def cached(ttl: int = 300, key_prefix: str = ""):
-    """Decorator to cache function results"""
+def _key_default(value: Any) -> Any:
+    """Stable stand-in for argument values json can't encode"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    return str(value)
+
+
+def cache_key_for(prefix: str, func: Callable, args: tuple, kwargs: dict) -> str:
+    """
+    Key of a call, identical in every process
+
+    Arguments are encoded as canonical JSON (sorted keys) and hashed, so
+    equal calls map to the same key across workers and restarts, unlike
+    hash(), which is randomized per process. Arguments json can't encode
+    are keyed by str(), which must be stable for them to cache.
+    """
+    payload = json.dumps([args, kwargs], sort_keys=True, separators=(",", ":"), default=_key_default)
+    digest = hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+    return f"{prefix}{func.__module__}.{func.__qualname__}:{digest}"
+
+
+def cached(
+    ttl: int = 300,
+    key_prefix: str = "",
+    stale_ttl: int = 0,
+    lock: bool = False,
+    tags: Optional[Callable[..., Iterable[str]]] = None
+):
+    """
+    Decorator to cache function results
+
+    Calls go through get_or_set(_async): concurrent misses share one call,
+    stale_ttl serves expired results while they refresh, and lock=True
+    also coalesces across processes through Redis. `tags` is called with
+    the function's arguments and returns the tags to store a result under,
+    e.g. tags=lambda user_id, **_: [user_tag(user_id)].
+    """
     def decorator(func):
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
-            # Generate cache key from function name and arguments
-            cache_key = f"{key_prefix}{func.__name__}:{hash(str(args) + str(kwargs))}"
-
-            # Try to get from cache
-            cached_value = cache.get(cache_key)
-            if cached_value is not None:
-                return cached_value
-
-            # Execute function
-            result = await func(*args, **kwargs)
-
-            # Cache the result
-            cache.set(cache_key, result, ttl)
-
-            return result
+            return await cache.get_or_set_async(
+                cache_key_for(key_prefix, func, args, kwargs),
+                lambda: func(*args, **kwargs),
+                ttl, stale_ttl=stale_ttl, lock=lock, tags=tags(*args, **kwargs) if tags else ()
+            )
 
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
-            cache_key = f"{key_prefix}{func.__name__}:{hash(str(args) + str(kwargs))}"
-
-            cached_value = cache.get(cache_key)
-            if cached_value is not None:
-                return cached_value
-
-            result = func(*args, **kwargs)
-            cache.set(cache_key, result, ttl)
-
-            return result
+            return cache.get_or_set(
+                cache_key_for(key_prefix, func, args, kwargs),
+                lambda: func(*args, **kwargs),
+                ttl, stale_ttl=stale_ttl, lock=lock, tags=tags(*args, **kwargs) if tags else ()
+            )
 
         # Return appropriate wrapper based on function type
-        import asyncio
         if asyncio.iscoroutinefunction(func):
             return async_wrapper
         return sync_wrapper
@@ -215,3 +852,14 @@ def model_cache_key(version: str) -> str:
 def stats_cache_key(stat_type: str) -> str:
     """Generate cache key for statistics"""
     return f"stats:{stat_type}"
+
+
+# Invalidation tags
+def user_tag(user_id: int) -> str:
+    """Tag of cached data derived from a user's predictions"""
+    return f"user:{user_id}"
+
+
+def model_tag(version: str) -> str:
+    """Tag of cached data derived from a model version"""
+    return f"model:{version}"
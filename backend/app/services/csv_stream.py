@@ -0,0 +1,146 @@
+"""
+Streaming chunked CSV scoring
+
+Parses an uploaded CSV in fixed-size chunks, scores each chunk, stores it
+in its own transaction and yields the result CSV chunk by chunk, so memory
+use is bounded by the chunk size instead of the file size.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import logging
+import tempfile
+from typing import BinaryIO, Callable, Iterator, Optional
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from .fraud_detector import FraudDetectorService
+from .prediction_service import save_batch_predictions
+
+logger = logging.getLogger(__name__)
+
+# Buffer size used when spooling an upload to disk
+SPOOL_COPY_BUFFER = 1024 * 1024
+
+
+def read_upload(upload: BinaryIO, max_bytes: int) -> Iterator[bytes]:
+    """
+    Read an upload in SPOOL_COPY_BUFFER blocks, enforcing a size limit
+
+    Raises:
+        ValueError: As soon as more than max_bytes have been read
+    """
+    size = 0
+    while True:
+        block = upload.read(SPOOL_COPY_BUFFER)
+        if not block:
+            return
+        size += len(block)
+        if size > max_bytes:
+            raise ValueError(f"File too large. Maximum size is {max_bytes // (1024*1024)}MB")
+        yield block
+
+
+def spool_upload(upload: BinaryIO, max_bytes: int) -> BinaryIO:
+    """
+    Copy an upload into a temporary file owned by the caller
+
+    Uploaded files are closed once the endpoint returns, before a streaming
+    response is sent, so the stream needs its own copy on disk.
+
+    Raises:
+        ValueError: If the upload is larger than max_bytes
+    """
+    spool = tempfile.TemporaryFile()
+    try:
+        for block in read_upload(upload, max_bytes):
+            spool.write(block)
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+    return spool
+
+
+class CsvScoringStream:
+    """
+    Score a CSV file chunk by chunk.
+
+    The first chunk is read and validated on construction, so header and
+    value errors in it surface before any response bytes are sent. Errors
+    in later chunks stop the stream; chunks already written stay committed
+    under the batch id.
+    """
+
+    def __init__(self, source: BinaryIO, chunk_rows: int):
+        """
+        Args:
+            source: Binary file object positioned at the CSV header
+            chunk_rows: Rows parsed, scored and stored per chunk
+
+        Raises:
+            ValueError: If the file has no rows or the first chunk is invalid
+            pd.errors.EmptyDataError / ParserError: If the CSV can't be parsed
+        """
+        self.source = source
+        self.chunk_rows = chunk_rows
+        self.rows_processed = 0
+        self.fraud_count = 0
+
+        self._reader = pd.read_csv(source, chunksize=chunk_rows)
+        first = next(self._reader, None)
+        if first is None or first.empty:
+            raise ValueError("CSV file has no rows")
+        self._first: Optional[pd.DataFrame] = FraudDetectorService.score_dataframe(first)
+
+    def chunks(self) -> Iterator[pd.DataFrame]:
+        """Yield scored chunks in file order"""
+        if self._first is not None:
+            first, self._first = self._first, None
+            yield first
+
+        for chunk in self._reader:
+            yield FraudDetectorService.score_dataframe(chunk)
+
+    def iter_csv(
+        self,
+        db: Session,
+        user_id: int,
+        batch_id: str,
+        on_complete: Optional[Callable[[Session, "CsvScoringStream"], None]] = None,
+    ) -> Iterator[bytes]:
+        """
+        Store each scored chunk and yield it as CSV bytes
+
+        Args:
+            db: Session owned by the stream; closed when the stream ends
+            user_id: Owner of the predictions
+            batch_id: Batch id saved with every row
+            on_complete: Called with (db, stream) after the last chunk
+
+        Yields:
+            Result CSV, header first, one piece per chunk
+        """
+        try:
+            header = True
+            for chunk in self.chunks():
+                # One transaction per chunk
+                save_batch_predictions(db, user_id, chunk, batch_id)
+                self.rows_processed += len(chunk)
+                self.fraud_count += int(chunk["is_fraud"].sum())
+
+                yield chunk.to_csv(index=False, header=header).encode()
+                header = False
+
+            if on_complete is not None:
+                on_complete(db, self)
+        except Exception as e:
+            logger.error(
+                f"CSV stream for batch {batch_id} stopped after {self.rows_processed} rows: {e}"
+            )
+            raise
+        finally:
+            db.close()
+            self.source.close()
@@ -3,6 +3,7 @@
 from typing import List
 
 import numpy as np
+import pandas as pd
 
 from ..models.schemas import TransactionInput
 
@@ -10,6 +11,9 @@ from ..models.schemas import TransactionInput
 class DataProcessor:
     """Process and transform transaction data for ML model"""
 
+    # Lower-case input columns in model feature order
+    FEATURE_COLUMNS = ["time"] + [f"v{i}" for i in range(1, 29)] + ["amount"]
+
     @staticmethod
     def transaction_to_array(transaction: TransactionInput) -> np.ndarray:
         """Convert a TransactionInput to numpy array for model prediction"""
@@ -53,6 +57,53 @@ class DataProcessor:
             DataProcessor.transaction_to_array(t) for t in transactions
         ])
 
+    @staticmethod
+    def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Lower-case column names and check all feature columns are present
+
+        Raises:
+            ValueError: If any feature column is missing
+        """
+        df.columns = df.columns.str.lower()
+        missing_cols = [col for col in DataProcessor.FEATURE_COLUMNS if col not in df.columns]
+        if missing_cols:
+            raise ValueError(f"Missing columns: {', '.join(missing_cols)}")
+        return df
+
+    @staticmethod
+    def dataframe_to_batch(df: pd.DataFrame) -> np.ndarray:
+        """
+        Take the feature matrix from a DataFrame with one column-ordered copy
+
+        Applies the same rules as TransactionInput to whole columns at once.
+
+        Args:
+            df: DataFrame with lower-case feature columns
+
+        Returns:
+            numpy array of shape (n_samples, 30)
+
+        Raises:
+            ValueError: If values are missing, non-numeric or out of range
+        """
+        try:
+            features = df[DataProcessor.FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError("All feature columns must be numeric")
+
+        invalid = ~np.isfinite(features).all(axis=1)
+        invalid |= (features[:, 0] < 0) | (features[:, -1] < 0)
+        if invalid.any():
+            # Report 1-based data row numbers; chunked reads keep a running index
+            rows = df.index[invalid][:10] + 1
+            raise ValueError(
+                f"Invalid values (missing, non-finite, or negative time/amount) "
+                f"in {int(invalid.sum())} rows, e.g. rows {', '.join(map(str, rows))}"
+            )
+
+        return features
+
     @staticmethod
     def generate_sample_transaction(is_fraud: bool = False) -> dict:
         """Generate a sample transaction for testing"""
@@ -194,6 +194,17 @@ class FeedbackService:
             )
             return None
 
+        # Decode every feature list with one json.loads call
+        try:
+            X = np.array(
+                json.loads("[" + ",".join(f.features_json for f in feedbacks) + "]"),
+                dtype=np.float64,
+            )
+            y = np.array([int(f.actual_fraud) for f in feedbacks])
+            return X, y
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Bulk feature decode failed, parsing rows one by one: {e}")
+
         # Extract features and labels
         X = []
         y = []
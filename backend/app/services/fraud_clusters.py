@@ -0,0 +1,480 @@
+"""
+Fraud Clusters - Incrementally maintained fraud rings
+
+Every fraud prediction is a member of an array-backed union-find (path
+compression plus union by rank). When it is indexed, it is scored
+against its candidate neighbours with the fraud graph's similarity rules
+and merged with those at CLUSTER_THRESHOLD or above. Cluster lookups
+then only resolve each member's root instead of scoring pairs.
+
+Candidate neighbours of prediction p are the same user's fraud
+predictions with a lower id, created within LINK_WINDOW of p, the
+LINK_CANDIDATES nearest in time (ties to the newest). Rows of one batch
+share a timestamp, so they are always each other's candidates. The edges
+are therefore a function of the predictions table alone: every worker
+indexing the same rows, in any chunking, ends up with the same clusters,
+and an offline rebuild reproduces them.
+
+New predictions are picked up by id watermark (`refresh`), covering
+every write path. Rows that commit after a later id was seen (PostgreSQL
+sequences don't commit in order) are caught by recounting the fraud
+predictions in the last REFRESH_LOOKBACK_IDS ids. A late row is linked to
+its candidates and to the newer rows it is now a candidate of; a newer
+row whose candidate list was already full keeps its earlier links, so
+only then can an offline rebuild differ.
+
+The union-find is checkpointed to a single .npz file that workers load
+on first use, every CHECKPOINT_ROWS additions or CHECKPOINT_SECONDS and
+at shutdown; rows added since are re-read from the table by the next
+refresh. Rebuild it from the predictions table with:
+
+    python -m app.services.fraud_clusters
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..db.models import Prediction
+from .fraud_graph import load_graph_nodes, score_pairs
+
+logger = logging.getLogger(__name__)
+
+# Similarity at which two fraud predictions belong to the same ring
+CLUSTER_THRESHOLD = 0.3
+
+# Candidate neighbours of each new fraud prediction
+LINK_WINDOW = timedelta(hours=24)
+LINK_CANDIDATES = 32
+
+# Ids read per refresh pass
+REFRESH_CHUNK_IDS = 100000
+
+# Ids below the highest indexed id rechecked for late commits on every refresh
+REFRESH_LOOKBACK_IDS = 100000
+
+# Additions, or seconds since the last checkpoint, that trigger the next one
+CHECKPOINT_ROWS = 1000
+CHECKPOINT_SECONDS = 300
+
+MEMBER_COLUMNS = [Prediction.id, Prediction.amount, Prediction.risk_score, Prediction.created_at]
+
+
+class FraudClusterStore:
+    """
+    Union-find over fraud prediction ids.
+
+    Members are stored in id order, so a prediction id maps to its
+    position with a binary search. `_first` holds, per root, the position
+    of the component's oldest member, whose id is the cluster id.
+    """
+
+    def __init__(self, checkpoint_path: str):
+        self.checkpoint_path = Path(checkpoint_path)
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._ids = array("q")
+        self._parent = array("q")
+        self._rank = array("b")
+        self._first = array("q")
+        self.max_id = 0
+
+        # Additions since the last checkpoint
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ============== Union-find ==============
+
+    def _find(self, position: int) -> int:
+        """Root of a member, compressing the path to it"""
+        parent = self._parent
+        root = position
+        while parent[root] != root:
+            root = parent[root]
+        while parent[position] != root:
+            parent[position], position = root, parent[position]
+        return root
+
+    def _union(self, a: int, b: int) -> bool:
+        """Merge the sets of two members; returns False if already merged"""
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a == root_b:
+            return False
+        if self._rank[root_a] < self._rank[root_b]:
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        if self._rank[root_a] == self._rank[root_b]:
+            self._rank[root_a] += 1
+        self._first[root_a] = min(self._first[root_a], self._first[root_b])
+        return True
+
+    def _positions(self, ids) -> np.ndarray:
+        """
+        Positions of prediction ids; -1 for ids that aren't members
+        (predictions marked fraud after they were indexed)
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        members = np.frombuffer(self._ids, dtype=np.int64)
+        if not len(members):
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(members, ids), len(members) - 1)
+        return np.where(members[positions] == ids, positions, -1)
+
+    def _add_members(self, ids: List[int]) -> None:
+        """
+        Add singleton members, keeping members in id order; caller holds the lock
+
+        Ids above every member are appended. Late ids are inserted, which
+        shifts the positions stored in `_parent` and `_first`.
+        """
+        ids = np.sort(np.asarray(ids, dtype=np.int64))
+        if not len(self._ids) or ids[0] > self._ids[-1]:
+            for member_id in ids.tolist():
+                position = len(self._ids)
+                self._ids.append(member_id)
+                self._parent.append(position)
+                self._rank.append(0)
+                self._first.append(position)
+            return
+
+        members = np.frombuffer(self._ids, dtype=np.int64)
+        total = len(members) + len(ids)
+        moved = np.arange(len(members)) + np.searchsorted(ids, members)
+        inserted = np.searchsorted(members, ids) + np.arange(len(ids))
+
+        new_ids = np.empty(total, dtype=np.int64)
+        new_parent = np.empty(total, dtype=np.int64)
+        new_rank = np.zeros(total, dtype=np.int8)
+        new_first = np.empty(total, dtype=np.int64)
+        new_ids[moved], new_ids[inserted] = members, ids
+        new_parent[moved] = moved[np.frombuffer(self._parent, dtype=np.int64)]
+        new_parent[inserted] = inserted
+        new_rank[moved] = np.frombuffer(self._rank, dtype=np.int8)
+        new_first[moved] = moved[np.frombuffer(self._first, dtype=np.int64)]
+        new_first[inserted] = inserted
+
+        self._ids = array("q", new_ids.tobytes())
+        self._parent = array("q", new_parent.tobytes())
+        self._rank = array("b", new_rank.tobytes())
+        self._first = array("q", new_first.tobytes())
+
+    def _roots(self, positions: np.ndarray) -> np.ndarray:
+        """Roots of many members at once, by pointer jumping"""
+        parent = np.frombuffer(self._parent, dtype=np.int64)
+        roots = parent[positions]
+        while True:
+            parents = parent[roots]
+            if np.array_equal(parents, roots):
+                return roots
+            roots = parents
+
+    # ============== Indexing ==============
+
+    def refresh(self, db: Session) -> int:
+        """
+        Index fraud predictions saved since the last refresh
+
+        Returns:
+            Number of predictions added
+        """
+        self.ensure_loaded()
+        checkpoint = False
+        with self._refresh_lock:
+            newest = db.execute(select(func.max(Prediction.id))).scalar() or 0
+            if newest < self.max_id:
+                # The table was restored or recreated: indexed ids are stale
+                logger.warning("Predictions table is behind the fraud cluster index; rebuilding")
+                with self._lock:
+                    self._reset()
+
+            added = self._index_late(db)
+            start = self.max_id
+            while start < newest:
+                end = min(start + REFRESH_CHUNK_IDS, newest)
+                added += self._index_rows(db, [Prediction.id > start, Prediction.id <= end], end)
+                start = end
+            with self._lock:
+                self.max_id = max(self.max_id, newest)
+                self._unsaved += added
+                checkpoint = self._unsaved > 0 and (
+                    self._unsaved >= CHECKPOINT_ROWS or time.monotonic() - self._saved_at >= CHECKPOINT_SECONDS
+                )
+
+        if added:
+            logger.debug(f"Fraud clusters: indexed {added} predictions, {len(self)} total")
+        if checkpoint:
+            self.save()
+        return added
+
+    def _index_late(self, db: Session) -> int:
+        """
+        Index fraud predictions at or below max_id committed after it was read
+
+        The lookback window's fraud predictions are counted on every
+        refresh and only read when there are more than indexed members.
+        """
+        low = max(self.max_id - REFRESH_LOOKBACK_IDS, 0)
+        if self.max_id <= low:
+            return 0
+        window = [Prediction.id > low, Prediction.id <= self.max_id]
+        visible = db.execute(
+            select(func.count()).select_from(Prediction).where(Prediction.is_fraud == True, *window)
+        ).scalar()
+        with self._lock:
+            indexed = len(self._ids) - int(np.searchsorted(np.frombuffer(self._ids, dtype=np.int64), low, "right"))
+        if visible <= indexed:
+            return 0
+
+        added = self._index_rows(db, window, self.max_id)
+        if added:
+            logger.info(f"Fraud clusters: {added} predictions committed late")
+        return added
+
+    def _index_rows(self, db: Session, criteria: List, end: int) -> int:
+        """Add the fraud predictions matching criteria that aren't members and link them"""
+        rows = db.execute(
+            select(Prediction.id, Prediction.user_id, Prediction.created_at)
+            .where(Prediction.is_fraud == True, *criteria)
+            .order_by(Prediction.id)
+        ).all()
+        if not rows:
+            return 0
+
+        with self._lock:
+            positions = self._positions([row.id for row in rows])
+            new_rows = [row for row, position in zip(rows, positions.tolist()) if position < 0]
+            if not new_rows:
+                return 0
+            self._add_members([row.id for row in new_rows])
+        new_ids = np.array([row.id for row in new_rows], dtype=np.int64)
+
+        by_user = defaultdict(list)
+        for row in new_rows:
+            by_user[row.user_id].append(row.created_at)
+
+        for user_id, created in by_user.items():
+            nodes = load_graph_nodes(
+                db,
+                [
+                    Prediction.user_id == user_id,
+                    Prediction.is_fraud == True,
+                    Prediction.id <= end,
+                    Prediction.created_at >= min(created) - LINK_WINDOW,
+                    Prediction.created_at <= max(created) + LINK_WINDOW,
+                ],
+                [Prediction.created_at, Prediction.id],
+            )
+            first, second = self._candidate_pairs(nodes, np.isin(nodes.ids, new_ids))
+            if not len(first):
+                continue
+
+            linked = score_pairs(nodes, first, second)["score"] >= CLUSTER_THRESHOLD
+            with self._lock:
+                positions_a = self._positions(nodes.ids[first[linked]])
+                positions_b = self._positions(nodes.ids[second[linked]])
+                for a, b in zip(positions_a.tolist(), positions_b.tolist()):
+                    if a >= 0 and b >= 0:
+                        self._union(a, b)
+
+        return len(new_rows)
+
+    @staticmethod
+    def _candidate_pairs(nodes, new: np.ndarray):
+        """
+        Pairs (node, candidate) of node positions with a new node on either side
+
+        Nodes are in (created_at, id) order and `new` flags the nodes being
+        added. Besides the new nodes, only nodes with a higher id than a
+        new one can have it as a candidate, so only those are visited.
+        """
+        window = LINK_WINDOW.total_seconds()
+        if not new.any():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        oldest_new = nodes.ids[new].min()
+
+        first, second = [], []
+        for p in np.flatnonzero(new | (nodes.ids > oldest_new)):
+            lo = np.searchsorted(nodes.seconds, nodes.seconds[p] - window, side="left")
+            hi = np.searchsorted(nodes.seconds, nodes.seconds[p] + window, side="right")
+            candidates = np.arange(lo, hi)
+            candidates = candidates[nodes.ids[candidates] < nodes.ids[p]]
+            if len(candidates) > LINK_CANDIDATES:
+                # Nearest in time, ties to the newest
+                order = np.lexsort((-nodes.ids[candidates], np.abs(nodes.seconds[candidates] - nodes.seconds[p])))
+                candidates = candidates[order[:LINK_CANDIDATES]]
+            if not new[p]:
+                candidates = candidates[new[candidates]]
+            first.append(np.full(len(candidates), p))
+            second.append(candidates)
+
+        if not first:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(first), np.concatenate(second)
+
+    # ============== Lookup ==============
+
+    def user_clusters(self, db: Session, user_id: int, start_date: datetime, min_size: int = 2) -> List[Dict]:
+        """
+        Fraud rings with members created since start_date
+
+        Members outside the window still connect a ring, but only members
+        inside it are listed and counted.
+
+        Returns:
+            Clusters with their member rows (id, amount, risk_score,
+            created_at), newest first; the cluster id is the id of the
+            ring's oldest member
+        """
+        self.refresh(db)
+        rows = db.execute(
+            select(*MEMBER_COLUMNS)
+            .where(
+                Prediction.user_id == user_id,
+                Prediction.is_fraud == True,
+                Prediction.created_at >= start_date,
+                Prediction.id <= self.max_id,
+            )
+            .order_by(Prediction.created_at.desc(), Prediction.id.desc())
+        ).all()
+        if not rows:
+            return []
+
+        ids = np.array([row.id for row in rows], dtype=np.int64)
+        with self._lock:
+            positions = self._positions(ids)
+            indexed = positions >= 0
+            roots = self._roots(positions[indexed])
+            cluster_ids = dict(zip(
+                ids[indexed].tolist(),
+                [self._ids[self._first[root]] for root in roots.tolist()],
+            ))
+
+        members = defaultdict(list)
+        for row in rows:
+            members[cluster_ids.get(row.id, row.id)].append(row)
+
+        return [
+            {"cluster_id": cluster_id, "members": rows, "size": len(rows)}
+            for cluster_id, rows in members.items()
+            if len(rows) >= min_size
+        ]
+
+    # ============== Persistence ==============
+
+    @property
+    def pending_checkpoint(self) -> bool:
+        """Whether predictions were added since the last checkpoint"""
+        return self._unsaved > 0
+
+    def save(self) -> None:
+        """Checkpoint the union-find atomically"""
+        with self._lock:
+            self._unsaved = 0
+            self._saved_at = time.monotonic()
+            arrays = {
+                "ids": np.array(self._ids, dtype=np.int64),
+                "parent": np.array(self._parent, dtype=np.int64),
+                "rank": np.array(self._rank, dtype=np.int8),
+                "first": np.array(self._first, dtype=np.int64),
+                "max_id": np.int64(self.max_id),
+            }
+
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_name(f"{self.checkpoint_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as tmp:
+            np.savez(tmp, **arrays)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def load(self) -> bool:
+        """
+        Load the checkpoint
+
+        Returns:
+            True if a checkpoint was loaded; False leaves an empty store
+            that refresh rebuilds from the database
+        """
+        with self._lock:
+            self._loaded = True
+            try:
+                with np.load(self.checkpoint_path) as checkpoint:
+                    arrays = {name: checkpoint[name] for name in ("ids", "parent", "rank", "first", "max_id")}
+            except (OSError, ValueError, KeyError) as e:
+                logger.info(f"No fraud cluster checkpoint loaded: {e}")
+                return False
+
+            self._reset()
+            self._ids.frombytes(arrays["ids"].astype(np.int64).tobytes())
+            self._parent.frombytes(arrays["parent"].astype(np.int64).tobytes())
+            self._rank.frombytes(arrays["rank"].astype(np.int8).tobytes())
+            self._first.frombytes(arrays["first"].astype(np.int64).tobytes())
+            self.max_id = int(arrays["max_id"])
+        logger.info(f"Fraud cluster checkpoint loaded: {len(self)} predictions")
+        return True
+
+    def ensure_loaded(self) -> None:
+        """Load the checkpoint on first use"""
+        with self._refresh_lock:
+            if not self._loaded:
+                self.load()
+
+    def rebuild(self, db: Session) -> int:
+        """Drop the index and rebuild it from the predictions table"""
+        with self._refresh_lock:
+            with self._lock:
+                self._reset()
+                self._loaded = True
+        return self.refresh(db)
+
+    def get_stats(self) -> Dict:
+        """Get the number of indexed predictions and clusters"""
+        with self._lock:
+            members = len(self._ids)
+            roots = int((np.frombuffer(self._parent, dtype=np.int64) == np.arange(members)).sum()) if members else 0
+            return {"predictions": members, "components": roots, "max_id": self.max_id}
+
+
+# Global fraud cluster store instance
+fraud_cluster_store = FraudClusterStore(settings.fraud_cluster_checkpoint)
+
+
+def main():
+    """Rebuild the fraud cluster checkpoint from the command line"""
+    from ..db.database import SessionLocal
+
+    argparse.ArgumentParser(description="Rebuild fraud clusters from the predictions table").parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    db = SessionLocal()
+    try:
+        count = fraud_cluster_store.rebuild(db)
+    finally:
+        db.close()
+    fraud_cluster_store.save()
+    print(f"Indexed {count} fraud predictions into {fraud_cluster_store.get_stats()['components']} clusters")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,10 @@
 
 import time
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
+import pandas as pd
 
 from ..models.ml_model import fraud_model, FraudDetectionModel
 from ..models.schemas import (
@@ -15,7 +16,11 @@ from ..models.schemas import (
     ModelInfo,
     StatsResponse,
 )
+from ..core.config import settings
+from ..core.executors import inference_executor
 from .data_processor import DataProcessor
+from .micro_batcher import micro_batcher
+from .prediction_memo import prediction_memo
 
 
 class FraudDetectorService:
@@ -31,16 +36,96 @@ class FraudDetectorService:
     }
 
     @classmethod
-    def predict_single(cls, transaction: TransactionInput) -> PredictionResponse:
-        """Make a fraud prediction for a single transaction"""
+    def predict_single(cls, transaction: TransactionInput, memoize: bool = True) -> PredictionResponse:
+        """
+        Make a fraud prediction for a single transaction
+
+        With prediction memoization on, a transaction scored before under
+        the same model reuses its probability unless memoize is False.
+        """
         start_time = time.perf_counter()
 
         # Convert transaction to numpy array
         features = DataProcessor.transaction_to_array(transaction)
 
+        key, memoized = cls._memo_lookup(features, memoize)
+        if memoized is not None:
+            return cls._build_response(memoized > fraud_model.decision_threshold, memoized, start_time)
+
         # Make prediction
         is_fraud, fraud_prob = fraud_model.predict(features)
+        if key is not None:
+            prediction_memo.set(key, fraud_prob)
+
+        return cls._build_response(is_fraud, fraud_prob, start_time)
+
+    @classmethod
+    async def predict_single_async(cls, transaction: TransactionInput, memoize: bool = True) -> PredictionResponse:
+        """
+        Make a fraud prediction for a single transaction through the micro-batcher
+
+        Concurrent requests are scored together in one vectorized model call.
+        Falls back to scoring on the inference executor when batching is disabled.
+        """
+        if not settings.inference_batching_enabled:
+            return await inference_executor.run(cls.predict_single, transaction, memoize)
+
+        start_time = time.perf_counter()
+
+        features = DataProcessor.transaction_to_array(transaction)
+
+        key = cls._memo_key(features, memoize)
+        memoized = None if key is None else await prediction_memo.get_async(key)
+        if memoized is not None:
+            return cls._build_response(memoized > fraud_model.decision_threshold, memoized, start_time)
 
+        is_fraud, fraud_prob = await micro_batcher.predict(features)
+        if key is not None:
+            await prediction_memo.set_async(key, fraud_prob)
+
+        return cls._build_response(is_fraud, fraud_prob, start_time)
+
+    @staticmethod
+    def _memo_key(features: np.ndarray, memoize: bool) -> Optional[str]:
+        """Memo key of a feature vector; None when not memoizing"""
+        if not prediction_memo.enabled:
+            return None
+        if not memoize:
+            prediction_memo.record_bypass()
+            return None
+        return prediction_memo.key(features)
+
+    @classmethod
+    def _memo_lookup(cls, features: np.ndarray, memoize: bool) -> Tuple[Optional[str], Optional[float]]:
+        """Memo key of a feature vector and its memoized probability; (None, None) when not memoizing"""
+        key = cls._memo_key(features, memoize)
+        return key, None if key is None else prediction_memo.get(key)
+
+    @staticmethod
+    def _predict_batch_memoized(features_batch: np.ndarray, memoize: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """fraud_model.predict_batch, scoring only the rows that aren't memoized"""
+        if not prediction_memo.enabled:
+            return fraud_model.predict_batch(features_batch)
+        if not memoize:
+            prediction_memo.record_bypass(len(features_batch))
+            return fraud_model.predict_batch(features_batch)
+
+        keys = prediction_memo.keys(features_batch)
+        memoized = prediction_memo.get_many(keys)
+        probabilities = np.array([np.nan if p is None else p for p in memoized], dtype=np.float64)
+        missing = np.flatnonzero(np.isnan(probabilities))
+        if len(missing):
+            scored, _ = fraud_model.predict_batch(features_batch[missing])
+            probabilities[missing] = scored
+            prediction_memo.set_many([keys[i] for i in missing], scored.tolist())
+
+        return probabilities, probabilities > fraud_model.decision_threshold
+
+    @classmethod
+    def _build_response(
+        cls, is_fraud: bool, fraud_prob: float, start_time: float
+    ) -> PredictionResponse:
+        """Build the prediction response and update statistics"""
         # Calculate metrics
         prediction_time_ms = (time.perf_counter() - start_time) * 1000
         confidence = FraudDetectionModel.get_confidence_level(
@@ -61,7 +146,7 @@ class FraudDetectorService:
 
     @classmethod
     def predict_batch(
-        cls, transactions: List[TransactionInput]
+        cls, transactions: List[TransactionInput], memoize: bool = True
     ) -> BatchPredictionResponse:
         """Make fraud predictions for multiple transactions"""
         start_time = time.perf_counter()
@@ -69,31 +154,29 @@ class FraudDetectorService:
         # Convert to batch array
         features_batch = DataProcessor.transactions_to_batch(transactions)
 
-        # Make predictions
-        predictions = fraud_model.predict_batch(features_batch)
+        # Make predictions (one vectorized pass over the rows not memoized)
+        probabilities, labels = cls._predict_batch_memoized(features_batch, memoize)
 
         # Process results
-        results = []
-        fraud_count = 0
-
-        for idx, (is_fraud, fraud_prob) in enumerate(predictions):
-            if is_fraud:
-                fraud_count += 1
-
-            results.append(
-                SingleBatchResult(
-                    index=idx,
-                    is_fraud=is_fraud,
-                    fraud_probability=round(fraud_prob, 4),
-                    risk_score=FraudDetectionModel.get_risk_score(fraud_prob),
-                )
+        rounded = np.round(probabilities, 4).tolist()
+        risk_scores = FraudDetectionModel.get_risk_scores(probabilities).tolist()
+        results = [
+            SingleBatchResult(
+                index=idx,
+                is_fraud=is_fraud,
+                fraud_probability=fraud_prob,
+                risk_score=risk_score,
             )
+            for idx, (is_fraud, fraud_prob, risk_score) in enumerate(
+                zip(labels.tolist(), rounded, risk_scores)
+            )
+        ]
+        fraud_count = int(labels.sum())
 
         processing_time_ms = (time.perf_counter() - start_time) * 1000
 
         # Update stats
-        for is_fraud, _ in predictions:
-            cls._update_stats(is_fraud, processing_time_ms / len(predictions))
+        cls._update_batch_stats(fraud_count, len(transactions), processing_time_ms)
 
         legitimate_count = len(transactions) - fraud_count
         fraud_rate = fraud_count / len(transactions) if transactions else 0
@@ -107,6 +190,66 @@ class FraudDetectorService:
             processing_time_ms=round(processing_time_ms, 2),
         )
 
+    @classmethod
+    def score_batch(cls, features_batch: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Score a feature matrix and derive every result column vectorized
+
+        Args:
+            features_batch: numpy array of shape (n_samples, 30)
+
+        Returns:
+            Dict of arrays: is_fraud, fraud_probability, confidence, risk_score
+        """
+        start_time = time.perf_counter()
+
+        probabilities, labels = fraud_model.predict_batch(features_batch)
+
+        processing_time_ms = (time.perf_counter() - start_time) * 1000
+        return cls.score_columns(probabilities, labels, processing_time_ms)
+
+    @classmethod
+    def score_columns(
+        cls, probabilities: np.ndarray, labels: np.ndarray, processing_time_ms: float
+    ) -> Dict[str, np.ndarray]:
+        """
+        Derive the result columns from model output scored elsewhere
+
+        Used when scoring runs outside this process (batch job workers).
+        Updates the batch statistics.
+        """
+        # Confidence is about the predicted class, as in predict_single
+        confidence = FraudDetectionModel.get_confidence_levels(
+            np.where(labels, probabilities, 1 - probabilities)
+        )
+
+        cls._update_batch_stats(int(labels.sum()), len(labels), processing_time_ms)
+
+        return {
+            "is_fraud": labels,
+            "fraud_probability": np.round(probabilities, 4),
+            "confidence": confidence,
+            "risk_score": FraudDetectionModel.get_risk_scores(probabilities),
+        }
+
+    @classmethod
+    def score_dataframe(cls, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Validate and score a DataFrame of uploaded transactions
+
+        Normalizes the column names, scores every row in one batch call and
+        appends the is_fraud, fraud_probability, confidence and risk_score
+        columns.
+
+        Raises:
+            ValueError: If columns are missing or values are invalid
+        """
+        df = DataProcessor.normalize_columns(df)
+        scores = cls.score_batch(DataProcessor.dataframe_to_batch(df))
+        for column, values in scores.items():
+            df[column] = values
+        return df
+
     @classmethod
     def get_model_info(cls) -> ModelInfo:
         """Get information about the loaded model"""
@@ -164,6 +307,16 @@ class FraudDetectorService:
         else:
             cls._stats["legitimate_detected"] += 1
 
+    @classmethod
+    def _update_batch_stats(
+        cls, fraud_count: int, total: int, response_time_ms: float
+    ) -> None:
+        """Update internal statistics for a whole batch at once"""
+        cls._stats["total_predictions"] += total
+        cls._stats["total_response_time_ms"] += response_time_ms
+        cls._stats["fraud_detected"] += fraud_count
+        cls._stats["legitimate_detected"] += total - fraud_count
+
     @classmethod
     def reset_stats(cls) -> None:
         """Reset statistics (for testing)"""
@@ -0,0 +1,239 @@
+"""
+Micro-batching inference engine
+
+Collects concurrent single-transaction predictions for a short window and
+scores them in one vectorized model call, then fans the results back out
+to the awaiting requests.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from ..core.executors import inference_executor
+from ..models.ml_model import fraud_model
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in rows) of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Queued by stop(): the worker scores everything queued before it, then exits
+_STOP = object()
+
+
+@dataclass
+class _PendingPrediction:
+    """A single queued prediction waiting for its batch"""
+    features: np.ndarray
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class MicroBatcher:
+    """
+    Async micro-batcher in front of the fraud model.
+
+    Requests are queued and a single worker task drains the queue, waiting
+    at most `max_wait_ms` for up to `max_batch_size` rows before scoring
+    them with one `predict_batch` call.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Optional[Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]] = None,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+    ):
+        self.predict_fn = predict_fn or fraud_model.predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.reset_stats()
+
+    def _ensure_started(self) -> None:
+        """Start the worker task on the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker = loop.create_task(self._run())
+
+    async def predict(self, features: np.ndarray) -> Tuple[bool, float]:
+        """
+        Queue a single transaction and wait for its batched prediction
+
+        Args:
+            features: numpy array of shape (30,) with transaction features
+
+        Returns:
+            Tuple of (is_fraud, fraud_probability)
+        """
+        self._ensure_started()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(
+            _PendingPrediction(features=features, future=future, enqueued_at=time.perf_counter())
+        )
+        return await future
+
+    async def stop(self) -> None:
+        """Score anything still queued and stop the worker task"""
+        if self._worker is None or self._worker.done():
+            return
+
+        if self._loop is not asyncio.get_running_loop():
+            # Worker belongs to a loop that is no longer running
+            self._worker = None
+            return
+
+        # The worker finishes the batch it holds and everything queued
+        # before the sentinel, so no waiting request is left unresolved
+        await self._queue.put(_STOP)
+        await self._worker
+        self._worker = None
+
+    async def _run(self) -> None:
+        """Worker loop: collect a batch, score it, repeat until stopped"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        batch: List[_PendingPrediction] = []
+        try:
+            while not (stopping and self._queue.empty()):
+                item = await self._queue.get()
+                if item is _STOP:
+                    stopping = True
+                    continue
+
+                batch = [item]
+                deadline = loop.time() + self.max_wait_ms / 1000
+                while len(batch) < self.max_batch_size and not stopping:
+                    stopping = self._drain_nowait(batch)
+                    if stopping or len(batch) >= self.max_batch_size:
+                        break
+
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                    else:
+                        batch.append(item)
+
+                await self._score_batch(batch)
+                batch = []
+        finally:
+            # Cancelled mid-batch (e.g. the loop is closing): fail the held
+            # requests rather than leave them waiting forever
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(RuntimeError("Micro-batcher stopped"))
+
+    def _drain_nowait(self, batch: List[_PendingPrediction]) -> bool:
+        """Move already-queued requests into the batch without waiting; True if the stop sentinel was reached"""
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is _STOP:
+                return True
+            batch.append(item)
+        return False
+
+    async def _score_batch(self, batch: List[_PendingPrediction]) -> None:
+        """Score a batch in one model call and resolve the waiting futures"""
+        # Skip requests whose callers have already gone away
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+
+        dispatched_at = time.perf_counter()
+        self._record_batch(batch, dispatched_at)
+
+        try:
+            features = np.vstack([item.features for item in batch])
+            probabilities, labels = await inference_executor.run(self.predict_fn, features)
+        except Exception as e:
+            logger.error(f"Micro-batch scoring failed for {len(batch)} rows: {e}")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        for item, is_fraud, fraud_prob in zip(batch, labels.tolist(), probabilities.tolist()):
+            if not item.future.done():
+                item.future.set_result((bool(is_fraud), float(fraud_prob)))
+
+    def _record_batch(self, batch: List[_PendingPrediction], dispatched_at: float) -> None:
+        """Update batch-size histogram and added-wait metrics"""
+        size = len(batch)
+        self._stats["batches"] += 1
+        self._stats["rows"] += size
+        self._stats["batch_size_sum"] += size
+
+        for bucket in BATCH_SIZE_BUCKETS:
+            if size <= bucket:
+                self._stats["batch_size_buckets"][bucket] += 1
+
+        for item in batch:
+            wait_ms = (dispatched_at - item.enqueued_at) * 1000
+            self._stats["wait_ms_sum"] += wait_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting to be batched"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get_stats(self) -> Dict:
+        """Get batching metrics for tuning latency against throughput"""
+        rows = self._stats["rows"]
+        batches = self._stats["batches"]
+        return {
+            "enabled": settings.inference_batching_enabled,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self.queue_depth,
+            "batches": batches,
+            "rows": rows,
+            "avg_batch_size": round(rows / batches, 2) if batches else 0.0,
+            "batch_size_buckets": dict(self._stats["batch_size_buckets"]),
+            "batch_size_sum": self._stats["batch_size_sum"],
+            "avg_wait_ms": round(self._stats["wait_ms_sum"] / rows, 3) if rows else 0.0,
+            "wait_ms_sum": round(self._stats["wait_ms_sum"], 3),
+            "max_wait_ms_observed": round(self._stats["wait_ms_max"], 3),
+        }
+
+    def reset_stats(self) -> None:
+        """Reset batching metrics (for testing)"""
+        self._stats = {
+            "batches": 0,
+            "rows": 0,
+            "batch_size_sum": 0,
+            "batch_size_buckets": {bucket: 0 for bucket in BATCH_SIZE_BUCKETS},
+            "wait_ms_sum": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+
+# Global micro-batcher instance
+micro_batcher = MicroBatcher(
+    max_batch_size=settings.inference_batch_max_size,
+    max_wait_ms=settings.inference_batch_max_wait_ms,
+)
@@ -0,0 +1,181 @@
+"""
+Keyset (cursor) pagination
+
+Listings page on (sort column, id) with a seek predicate instead of
+OFFSET, so a deep page reads the same handful of index entries as the
+first one. Cursors are opaque URL-safe tokens holding the boundary row's
+key, the sort they were issued for and the direction to read in.
+
+Sort columns must be non-null: rows with a NULL sort value never match
+the seek predicate.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, List, Optional
+
+from sqlalchemy import Select, and_, func, literal_column, or_, select, text
+from sqlalchemy.orm import Session
+
+CURSOR_VERSION = 1
+
+# Rows counted at most by an estimated total on databases without planner
+# estimates; the count is then a lower bound
+ESTIMATE_COUNT_CAP = 10_000
+
+
+class InvalidCursor(ValueError):
+    """Cursor that cannot be decoded or was issued for another sort"""
+
+
+@dataclass
+class Page:
+    """Rows of one page and the cursors of its neighbours"""
+    rows: List[Any]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+    def headers(self) -> dict:
+        """Cursors as response headers, for endpoints whose body is a plain list"""
+        headers = {}
+        if self.next_cursor:
+            headers["X-Next-Cursor"] = self.next_cursor
+        if self.prev_cursor:
+            headers["X-Prev-Cursor"] = self.prev_cursor
+        return headers
+
+
+def encode_cursor(sort: str, descending: bool, direction: str, key: tuple) -> str:
+    """Opaque cursor for the row with the given (sort value, id) key"""
+    value, row_id = key
+    payload = {
+        "v": CURSOR_VERSION,
+        "s": sort,
+        "o": "desc" if descending else "asc",
+        "d": direction,
+        "k": [value.isoformat() if isinstance(value, datetime) else value, row_id],
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_column, sort: str, descending: bool) -> tuple:
+    """
+    Direction and (sort value, id) key of a cursor
+
+    Raises InvalidCursor for malformed tokens and for cursors issued for a
+    different sort field or order.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value, row_id = payload["k"]
+        direction = payload["d"]
+        matches = (
+            payload["v"] == CURSOR_VERSION
+            and payload["s"] == sort
+            and payload["o"] == ("desc" if descending else "asc")
+            and direction in ("next", "prev")
+        )
+        if matches and value is not None and sort_column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+    if not matches:
+        raise InvalidCursor("Cursor does not match the requested sort")
+    return direction, (value, row_id)
+
+
+def _seek(sort_column, id_column, key: tuple, descending: bool):
+    """
+    Rows strictly after `key` in (sort, id) order
+
+    Written as sort <= v AND (sort < v OR id < i) rather than a row-value
+    comparison, so the leading range is an index seek on the sort column on
+    every backend.
+    """
+    value, row_id = key
+    if descending:
+        return and_(sort_column <= value, or_(sort_column < value, id_column < row_id))
+    return and_(sort_column >= value, or_(sort_column > value, id_column > row_id))
+
+
+def keyset_page(
+    db: Session,
+    statement: Select,
+    sort_column,
+    id_column,
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = True,
+    sort: Optional[str] = None,
+    scalars: bool = False
+) -> Page:
+    """
+    Run one page of `statement` ordered by (sort_column, id_column)
+
+    `statement` carries the filters but no ORDER BY, OFFSET or LIMIT. Its
+    rows must expose the sort and id values as attributes named after the
+    columns' keys (projected rows, or entities with scalars=True). Reads
+    limit + 1 rows to know whether another page follows.
+    """
+    sort = sort or sort_column.key
+    direction, key = "next", None
+    if cursor:
+        direction, key = decode_cursor(cursor, sort_column, sort, descending)
+
+    # Previous pages are read in reverse order from the boundary, then flipped
+    backward = direction == "prev"
+    reading_desc = descending != backward
+    if key is not None:
+        statement = statement.where(_seek(sort_column, id_column, key, reading_desc))
+    order = (sort_column.desc(), id_column.desc()) if reading_desc else (sort_column.asc(), id_column.asc())
+
+    result = db.execute(statement.order_by(*order).limit(limit + 1))
+    rows = result.scalars().all() if scalars else result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+
+    def cursor_at(row, to: str) -> str:
+        return encode_cursor(sort, descending, to, (getattr(row, sort_column.key), getattr(row, id_column.key)))
+
+    if not rows:
+        return Page(rows, None, None)
+    more_after = has_more if not backward else True
+    more_before = has_more if backward else key is not None
+    return Page(
+        rows,
+        cursor_at(rows[-1], "next") if more_after else None,
+        cursor_at(rows[0], "prev") if more_before else None,
+    )
+
+
+def estimated_count(db: Session, statement: Select) -> int:
+    """
+    Cheap row count of a filtered select
+
+    PostgreSQL answers from the planner's row estimate without reading the
+    rows. Elsewhere the count stops at ESTIMATE_COUNT_CAP rows.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        sql = statement.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+        plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    capped = (
+        statement.with_only_columns(literal_column("1"), maintain_column_froms=True)
+        .limit(ESTIMATE_COUNT_CAP)
+        .subquery()
+    )
+    return db.execute(select(func.count()).select_from(capped)).scalar()
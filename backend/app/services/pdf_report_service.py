@@ -14,9 +14,9 @@ from reportlab.graphics.charts.barcharts import VerticalBarChart
 from reportlab.graphics.charts.piecharts import Pie
 from reportlab.graphics.charts.lineplots import LinePlot
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-import matplotlib
-matplotlib.use('Agg')  # Non-GUI backend
-import matplotlib.pyplot as plt
+# Figures are built without pyplot: its global state isn't thread-safe and
+# reports render on the report executor's threads
+from matplotlib.figure import Figure
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
@@ -114,7 +114,8 @@ class PDFReportService:
     def _create_fraud_chart(self, fraud_data: Dict[str, int]) -> Optional[Image]:
         """Create fraud statistics pie chart"""
         try:
-            fig, ax = plt.subplots(figsize=(6, 4))
+            fig = Figure(figsize=(6, 4))
+            ax = fig.subplots()
 
             labels = list(fraud_data.keys())
             sizes = list(fraud_data.values())
@@ -126,8 +127,7 @@ class PDFReportService:
 
             # Save to buffer
             buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-            plt.close()
+            fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
             buf.seek(0)
 
             # Create ReportLab image
@@ -144,7 +144,8 @@ class PDFReportService:
             if not timeline_data:
                 return None
 
-            fig, ax = plt.subplots(figsize=(8, 4))
+            fig = Figure(figsize=(8, 4))
+            ax = fig.subplots()
 
             dates = [d['date'] for d in timeline_data]
             fraud_counts = [d['fraud_count'] for d in timeline_data]
@@ -159,12 +160,11 @@ class PDFReportService:
             ax.legend()
             ax.grid(True, alpha=0.3)
 
-            plt.xticks(rotation=45)
+            ax.tick_params(axis='x', labelrotation=45)
 
             # Save to buffer
             buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-            plt.close()
+            fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
             buf.seek(0)
 
             img = Image(buf, width=6*inch, height=3*inch)
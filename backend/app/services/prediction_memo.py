@@ -0,0 +1,204 @@
+"""
+Prediction memoization
+
+Retried requests, replays from upstream queues and the simulation and
+sample endpoints score byte-identical transactions over and over.
+PredictionMemo keeps the fraud probability of recently scored feature
+vectors, keyed by a hash of the vector rounded to
+`prediction_memo_decimals` places and the loaded model's fingerprint,
+so a repeat skips the forest.
+
+Only the probability is kept. The label, confidence and risk score are
+derived from it like those of a fresh score, so a changed decision
+threshold applies to memoized results too. Entries of the previous model
+are dropped as soon as a different model is loaded.
+
+Entries live in a bounded in-process LRU. With
+`prediction_memo_redis_enabled`, single predictions also share them
+through the Redis cache tier, tagged with the model version. Async
+callers use `get_async`/`set_async`, which make the Redis round trips
+in a worker thread so they never block the event loop.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..core.config import settings
+from ..models.ml_model import fraud_model
+from .cache_service import MISSING, LocalCache, cache, model_tag
+
+logger = logging.getLogger(__name__)
+
+# Key prefix of memoized probabilities in both tiers
+MEMO_KEY_PREFIX = "prediction"
+
+# Size charged per entry against the LRU's byte budget; entries are floats,
+# so the entry cap is the binding limit
+ENTRY_BYTES = 64
+
+
+class PredictionMemo:
+    """Bounded memo of fraud probabilities by quantized feature vector and model"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_entries: int = 100000,
+        ttl: float = 3600.0,
+        decimals: int = 6,
+        redis_enabled: bool = False,
+    ):
+        self.enabled = enabled
+        self.local = LocalCache(max_entries, max_entries * ENTRY_BYTES)
+        self.ttl = ttl
+        self.decimals = decimals
+        self.redis_enabled = redis_enabled
+        self._model_version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def shared(self) -> bool:
+        """Whether entries are also shared through Redis"""
+        return self.redis_enabled and cache.enabled
+
+    def keys(self, features_batch: np.ndarray) -> List[str]:
+        """
+        Memo key of each row of a feature matrix
+
+        Rows are rounded to `decimals` places (negative zero folded into
+        zero) and hashed with BLAKE2b, then prefixed by the model version.
+        """
+        version = self._sync_model()
+        quantized = np.round(np.asarray(features_batch, dtype=np.float64), self.decimals) + 0.0
+        quantized = quantized.reshape(len(quantized), -1)
+        return [
+            f"{MEMO_KEY_PREFIX}:{version}:{hashlib.blake2b(row.tobytes(), digest_size=16).hexdigest()}"
+            for row in quantized
+        ]
+
+    def key(self, features: np.ndarray) -> str:
+        """Memo key of a single feature vector"""
+        return self.keys(features.reshape(1, -1))[0]
+
+    def get(self, key: str) -> Optional[float]:
+        """Memoized probability of a key, from the local tier or Redis"""
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._record("local_hit")
+            return value
+        return self._shared_result(key, cache.get(key) if self.shared else None)
+
+    async def get_async(self, key: str) -> Optional[float]:
+        """`get` for the event loop: a local miss is looked up in Redis from a worker thread"""
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._record("local_hit")
+            return value
+        return self._shared_result(key, await asyncio.to_thread(cache.get, key) if self.shared else None)
+
+    def _shared_result(self, key: str, value: Optional[float]) -> Optional[float]:
+        """Count a local miss by its Redis result, keeping a Redis hit locally"""
+        if value is not None:
+            self._record("redis_hit")
+            self.local.set(key, value, ENTRY_BYTES, self.ttl)
+            return value
+
+        self._record("miss")
+        return None
+
+    def get_many(self, keys: List[str]) -> List[Optional[float]]:
+        """Memoized probabilities of a batch of keys, from the local tier only"""
+        values = [self.local.get(key) for key in keys]
+        hits = sum(value is not MISSING for value in values)
+        self._record("local_hit", hits)
+        self._record("miss", len(keys) - hits)
+        return [None if value is MISSING else value for value in values]
+
+    def set(self, key: str, probability: float) -> None:
+        """Memoize the probability of a key in both tiers"""
+        self.local.set(key, probability, ENTRY_BYTES, self.ttl)
+        if self.shared:
+            cache.set(key, probability, int(self.ttl), tags=[model_tag(self._model_version)])
+
+    async def set_async(self, key: str, probability: float) -> None:
+        """`set` for the event loop: the Redis write runs in a worker thread"""
+        self.local.set(key, probability, ENTRY_BYTES, self.ttl)
+        if self.shared:
+            await asyncio.to_thread(
+                cache.set, key, probability, int(self.ttl), tags=[model_tag(self._model_version)]
+            )
+
+    def set_many(self, keys: List[str], probabilities: List[float]) -> None:
+        """Memoize a batch of probabilities in the local tier"""
+        for key, probability in zip(keys, probabilities):
+            self.local.set(key, probability, ENTRY_BYTES, self.ttl)
+
+    def record_bypass(self, count: int = 1) -> None:
+        """Count predictions scored fresh because the caller opted out"""
+        self._record("bypass", count)
+
+    def _sync_model(self) -> str:
+        """Version of the loaded model, dropping entries of the previous one"""
+        version = fraud_model.fingerprint or "unloaded"
+        if version == self._model_version:
+            return version
+
+        with self._lock:
+            previous, self._model_version = self._model_version, version
+        if previous is not None and previous != version:
+            self.local.clear()
+            if self.shared:
+                # Keys carry the version, so the old entries are already
+                # unreachable; dropping them from Redis (a SCAN) can't hold
+                # up the lookup, which may be on the event loop
+                threading.Thread(
+                    target=cache.invalidate_tags, args=(model_tag(previous),),
+                    name="prediction-memo-invalidate", daemon=True,
+                ).start()
+            logger.info(f"Prediction memo cleared for model {version}")
+        return version
+
+    def _record(self, result: str, count: int = 1) -> None:
+        if count:
+            with self._lock:
+                self._stats[result] += count
+
+    def get_stats(self) -> Dict:
+        """Get lookup counts, hit rate and size"""
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats.get("local_hit", 0) + stats.get("redis_hit", 0)
+        lookups = hits + stats.get("miss", 0)
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.local),
+            "max_entries": self.local.max_entries,
+            "model_version": self._model_version,
+            "lookups": {result: stats.get(result, 0) for result in ("local_hit", "redis_hit", "miss", "bypass")},
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def reset_stats(self) -> None:
+        """Reset lookup counts (for testing)"""
+        with self._lock:
+            self._stats: Counter = Counter()
+
+
+# Global prediction memo instance
+prediction_memo = PredictionMemo(
+    enabled=settings.prediction_memo_enabled,
+    max_entries=settings.prediction_memo_max_entries,
+    ttl=settings.prediction_memo_ttl,
+    decimals=settings.prediction_memo_decimals,
+    redis_enabled=settings.prediction_memo_redis_enabled,
+)
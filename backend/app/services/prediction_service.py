@@ -6,88 +6,154 @@ Copyright (c) 2024 - All Rights Reserved
 """
 
 import json
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
+import numpy as np
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 
 from ..db.models import Prediction
 from ..models.schemas import TransactionInput, PredictionResponse
+from .pagination import Page, keyset_page
+from .rollups import apply_rollups, rollup_summary
 
+# Rows per executemany round trip for bulk inserts
+BULK_INSERT_CHUNK_SIZE = 5000
 
-def save_prediction(
-    db: Session,
+# Bound parameters per IN (...) query, below SQLite's variable limit
+IN_CLAUSE_CHUNK_SIZE = 900
+
+PCA_COLUMNS = [f"v{i}" for i in range(1, 29)]
+
+# Typed V1-V28 columns of the predictions table
+FEATURE_COLUMNS = [getattr(Prediction, col) for col in PCA_COLUMNS]
+
+# json.dumps layout of the features dict; %r matches json's float repr
+_FEATURES_JSON_TEMPLATE = "{" + ", ".join(f'"{col}": %r' for col in PCA_COLUMNS) + "}"
+
+# Scalar fields returned by prediction listings, in response order. Listings
+# select only these columns, never the large features_json / shap_values text
+HISTORY_FIELDS = (
+    "id", "time", "amount", "is_fraud", "fraud_probability", "confidence",
+    "risk_score", "prediction_time_ms", "created_at",
+)
+LISTING_FIELDS = HISTORY_FIELDS[:-1] + ("batch_id", "created_at")
+
+
+def prediction_record(
     user_id: int,
     transaction: TransactionInput,
     result: PredictionResponse
-) -> Prediction:
-    """Save a prediction to the database"""
-
+) -> dict:
+    """Build the predictions-table row for a single prediction"""
     # Convert PCA features to JSON
     features = {
         f"v{i}": getattr(transaction, f"v{i}")
         for i in range(1, 29)
     }
 
-    db_prediction = Prediction(
-        user_id=user_id,
-        time=transaction.time,
-        amount=transaction.amount,
-        features_json=json.dumps(features),
-        is_fraud=result.is_fraud,
-        fraud_probability=result.fraud_probability,
-        confidence=result.confidence,
-        risk_score=result.risk_score,
-        prediction_time_ms=result.prediction_time_ms
-    )
+    return {
+        "user_id": user_id,
+        "time": transaction.time,
+        "amount": transaction.amount,
+        "features_json": json.dumps(features),
+        **features,
+        "is_fraud": result.is_fraud,
+        "fraud_probability": result.fraud_probability,
+        "confidence": result.confidence,
+        "risk_score": result.risk_score,
+        "prediction_time_ms": result.prediction_time_ms,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def save_prediction(
+    db: Session,
+    user_id: int,
+    transaction: TransactionInput,
+    result: PredictionResponse
+) -> Prediction:
+    """Save a prediction to the database"""
+    record = prediction_record(user_id, transaction, result)
+    db_prediction = Prediction(**record)
 
     db.add(db_prediction)
+    apply_rollups(db, [record])
     db.commit()
     db.refresh(db_prediction)
 
     return db_prediction
 
 
+def bulk_insert_predictions(db: Session, records: List[dict]) -> int:
+    """Insert prediction rows and their rollups with Core executemany in one transaction"""
+    statement = insert(Prediction.__table__)
+    for start in range(0, len(records), BULK_INSERT_CHUNK_SIZE):
+        db.execute(statement, records[start:start + BULK_INSERT_CHUNK_SIZE])
+
+    apply_rollups(db, records)
+    db.commit()
+    return len(records)
+
+
+def prediction_columns(fields: Sequence[str]) -> List:
+    """Prediction columns for a projection of the given fields"""
+    return [getattr(Prediction, field) for field in fields]
+
+
+def serialize_prediction_rows(rows: Iterable[Sequence], fields: Sequence[str]) -> List[dict]:
+    """
+    JSON-ready dicts of projected prediction rows
+
+    Rows come from select(*prediction_columns(fields)); datetimes become
+    ISO strings. The result needs no further encoding, so routes can
+    return it in a JSONResponse and skip FastAPI's jsonable_encoder.
+    """
+    records = [dict(zip(fields, row)) for row in rows]
+    if "created_at" in fields:
+        for record in records:
+            if record["created_at"] is not None:
+                record["created_at"] = record["created_at"].isoformat()
+    return records
+
+
 def get_user_predictions(
     db: Session,
     user_id: int,
     limit: int = 50,
-    offset: int = 0
-) -> List[Prediction]:
-    """Get predictions for a specific user"""
-    return (
-        db.query(Prediction)
-        .filter(Prediction.user_id == user_id)
-        .order_by(Prediction.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
+    cursor: Optional[str] = None,
+    fields: Sequence[str] = HISTORY_FIELDS
+) -> Page:
+    """
+    Get a page of a user's predictions, newest first, as projected rows
+
+    Pages seek on (created_at, id) from `cursor`; raises InvalidCursor for
+    a token not issued by this listing.
+    """
+    columns = prediction_columns(fields)
+    # The keyset columns must be readable from every row
+    columns += [column for column in (Prediction.created_at, Prediction.id) if column.key not in fields]
+    return keyset_page(
+        db,
+        select(*columns).where(Prediction.user_id == user_id),
+        Prediction.created_at,
+        Prediction.id,
+        limit,
+        cursor=cursor
     )
 
 
 def get_user_prediction_stats(db: Session, user_id: int) -> dict:
     """Get prediction statistics for a user"""
-    predictions = db.query(Prediction).filter(Prediction.user_id == user_id).all()
-
-    if not predictions:
-        return {
-            "total_predictions": 0,
-            "fraud_detected": 0,
-            "legitimate_detected": 0,
-            "fraud_rate": 0.0,
-            "average_response_time_ms": 0.0
-        }
-
-    total = len(predictions)
-    fraud_count = sum(1 for p in predictions if p.is_fraud)
-    legitimate_count = total - fraud_count
-    avg_time = sum(p.prediction_time_ms for p in predictions) / total
+    stats = rollup_summary(db, user_id)
 
     return {
-        "total_predictions": total,
-        "fraud_detected": fraud_count,
-        "legitimate_detected": legitimate_count,
-        "fraud_rate": fraud_count / total if total > 0 else 0.0,
-        "average_response_time_ms": avg_time
+        "total_predictions": stats["total"],
+        "fraud_detected": stats["fraud_count"],
+        "legitimate_detected": stats["legitimate_count"],
+        "fraud_rate": stats["fraud_rate"],
+        "average_response_time_ms": stats["avg_prediction_time_ms"]
     }
 
 
@@ -96,41 +162,114 @@ def get_prediction_by_id(db: Session, prediction_id: int) -> Optional[Prediction
     return db.query(Prediction).filter(Prediction.id == prediction_id).first()
 
 
+def features_json_rows(features: np.ndarray) -> List[str]:
+    """
+    Serialize V1-V28 rows to the features_json format in one pass
+
+    Produces exactly what json.dumps({"v1": ..., "v28": ...}) would for
+    finite floats, without building a dict per row.
+    """
+    return [_FEATURES_JSON_TEMPLATE % row for row in map(tuple, features.tolist())]
+
+
 def save_batch_predictions(
     db: Session,
     user_id: int,
     df,
     batch_id: str
 ) -> int:
-    """Save batch predictions from a DataFrame to database"""
-    import pandas as pd
-
-    count = 0
-    for _, row in df.iterrows():
-        # Convert PCA features to JSON
-        features = {
-            f"v{i}": float(row[f'v{i}'])
-            for i in range(1, 29)
+    """
+    Bulk-insert batch predictions from a scored DataFrame
+
+    The DataFrame must hold the lower-case feature columns plus is_fraud,
+    fraud_probability, confidence and risk_score. Rows are written with
+    Core executemany in chunks inside a single transaction.
+    """
+    pca = df[PCA_COLUMNS].to_numpy(dtype=np.float64)
+    features_json = features_json_rows(pca)
+    created_at = datetime.utcnow()
+
+    columns = zip(
+        df["time"].astype(float).tolist(),
+        df["amount"].astype(float).tolist(),
+        features_json,
+        pca.tolist(),
+        df["is_fraud"].astype(bool).tolist(),
+        df["fraud_probability"].astype(float).tolist(),
+        df["confidence"].astype(str).tolist(),
+        df["risk_score"].astype(int).tolist(),
+    )
+    records = [
+        {
+            "user_id": user_id,
+            "time": time_,
+            "amount": amount,
+            "features_json": features,
+            **dict(zip(PCA_COLUMNS, pca_row)),
+            "is_fraud": is_fraud,
+            "fraud_probability": fraud_probability,
+            "confidence": confidence,
+            "risk_score": risk_score,
+            "prediction_time_ms": 0.0,  # Batch doesn't track individual timing
+            "created_at": created_at,
+            "batch_id": batch_id,
         }
+        for time_, amount, features, pca_row, is_fraud, fraud_probability, confidence, risk_score in columns
+    ]
+
+    return bulk_insert_predictions(db, records)
 
-        db_prediction = Prediction(
-            user_id=user_id,
-            time=float(row['time']),
-            amount=float(row['amount']),
-            features_json=json.dumps(features),
-            is_fraud=bool(row['is_fraud']),
-            fraud_probability=float(row['fraud_probability']),
-            confidence=str(row['confidence']),
-            risk_score=int(row['risk_score']),
-            prediction_time_ms=0.0,  # Batch doesn't track individual timing
-            batch_id=batch_id
+
+def get_features_json(db: Session, ids: Sequence[int]) -> Dict[int, str]:
+    """features_json of the given predictions, fetched IN_CLAUSE_CHUNK_SIZE ids at a time"""
+    features_json = {}
+    for start in range(0, len(ids), IN_CLAUSE_CHUNK_SIZE):
+        features_json.update(
+            db.query(Prediction.id, Prediction.features_json)
+            .filter(Prediction.id.in_(ids[start:start + IN_CLAUSE_CHUNK_SIZE]))
+            .all()
         )
+    return features_json
 
-        db.add(db_prediction)
-        count += 1
 
-    db.commit()
-    return count
+def get_feature_matrix(db: Session, *criteria) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load model features for the predictions matching a query in bulk
+
+    Reads the typed V1-V28 columns in one query; rows written before the
+    columns existed fall back to their features_json.
+
+    Args:
+        db: Database session
+        *criteria: SQLAlchemy filter expressions on Prediction
+
+    Returns:
+        Tuple of (ids of shape (n,), features of shape (n, 30)) ordered by
+        id, with columns in model order: time, v1..v28, amount
+    """
+    statement = (
+        select(Prediction.id, Prediction.time, *FEATURE_COLUMNS, Prediction.amount)
+        .where(*criteria)
+        .order_by(Prediction.id)
+    )
+    # Core execution on the session's connection skips ORM result processing
+    rows = db.connection().execute(statement).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 30), dtype=np.float64)
+
+    # Plain tuples convert ~10x faster than Row objects; NULLs become NaN
+    data = np.array([tuple(row) for row in rows], dtype=np.float64)
+    ids = data[:, 0].astype(np.int64)
+    features = data[:, 1:]
+
+    legacy = np.isnan(features[:, 1])
+    if legacy.any():
+        legacy_ids = ids[legacy].tolist()
+        features_json = get_features_json(db, legacy_ids)
+        decoded = json.loads("[" + ",".join(features_json[i] for i in legacy_ids) + "]")
+        features[legacy, 1:29] = [[row[col] for col in PCA_COLUMNS] for row in decoded]
+
+    return ids, features
 
 
 def get_batch_predictions(
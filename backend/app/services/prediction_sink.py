@@ -0,0 +1,252 @@
+"""
+Write-behind prediction sink
+
+Takes single-prediction rows off the request path: `/predict` enqueues the
+row and returns, and a background flusher bulk-inserts queued rows every
+`flush_interval_ms` or `max_batch_rows` rows, whichever comes first.
+
+The queue is bounded. When it is full, requests wait for the flusher to
+free space (backpressure) and get 503 if none frees up in time. The
+flusher writes on a thread of its own rather than `db_executor`, so a
+burst of request reads can't make it reject or drop rows.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.executors import ExecutorOverloaded
+from .prediction_service import bulk_insert_predictions
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionSink:
+    """
+    Async write-behind buffer in front of the predictions table.
+
+    Rows are written through the engine of the session that produced
+    them, one batch at a time on a dedicated writer thread. A flush that
+    fails with a database error is retried once; rows that fail again are
+    dropped and counted in `dropped_rows`. Those rows were already
+    acknowledged to the client with a 200, so a database outage loses
+    accepted predictions. Rows still queued when the process dies are
+    lost the same way.
+    """
+
+    def __init__(
+        self,
+        max_batch_rows: int = 500,
+        flush_interval_ms: float = 50.0,
+        max_queue_size: int = 10000,
+        put_timeout_ms: float = 1000.0,
+    ):
+        self.max_batch_rows = max_batch_rows
+        self.flush_interval_ms = flush_interval_ms
+        self.max_queue_size = max_queue_size
+        self.put_timeout_ms = put_timeout_ms
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._unwritten = 0
+
+        self.reset_stats()
+
+    def _ensure_started(self) -> None:
+        """Start the flusher task on the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._unwritten = 0
+        self._worker = loop.create_task(self._run())
+
+    async def submit(self, record: dict, bind: Engine) -> None:
+        """
+        Queue a prediction row for the next bulk insert
+
+        Args:
+            record: Column values for the predictions table
+            bind: Engine to write the row through
+
+        Raises:
+            ExecutorOverloaded: If the queue stays full for put_timeout_ms
+        """
+        self._ensure_started()
+
+        # Count the row before it can be picked up, so flush() waits for it
+        self._unwritten += 1
+        self._idle.clear()
+        try:
+            await asyncio.wait_for(
+                self._queue.put((bind, record)), self.put_timeout_ms / 1000
+            )
+        except asyncio.TimeoutError:
+            self._stats["rejected"] += 1
+            self._settle(1)
+            raise ExecutorOverloaded("prediction sink")
+
+    async def flush(self) -> None:
+        """Write everything queued so far, including a batch in flight"""
+        if self._worker is None or self._loop is not asyncio.get_running_loop():
+            return
+
+        while not self._queue.empty():
+            await self._flush_batch(self._drain_nowait([]))
+        await self._idle.wait()
+
+    async def stop(self) -> None:
+        """Flush queued rows and stop the flusher task"""
+        if self._worker is None or self._worker.done():
+            return
+
+        if self._loop is not asyncio.get_running_loop():
+            # Flusher belongs to a loop that is no longer running
+            self._worker = None
+            return
+
+        await self.flush()
+
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+
+    async def _run(self) -> None:
+        """Flusher loop: collect rows until the batch is full or the interval ends"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval_ms / 1000
+
+            while len(batch) < self.max_batch_rows:
+                self._drain_nowait(batch)
+                if len(batch) >= self.max_batch_rows:
+                    break
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._flush_batch(batch)
+
+    def _drain_nowait(self, batch: List[Tuple[Engine, dict]]) -> List[Tuple[Engine, dict]]:
+        """Move already-queued rows into the batch without waiting"""
+        while len(batch) < self.max_batch_rows and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush_batch(self, batch: List[Tuple[Engine, dict]]) -> None:
+        """Bulk-insert a batch, grouped by engine"""
+        by_bind: Dict[Engine, List[dict]] = defaultdict(list)
+        for bind, record in batch:
+            by_bind[bind].append(record)
+
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prediction-sink")
+        loop = asyncio.get_running_loop()
+
+        start_time = time.perf_counter()
+        for bind, records in by_bind.items():
+            for attempt in (1, 2):
+                try:
+                    await loop.run_in_executor(self._writer, self._write, bind, records)
+                    self._stats["rows_written"] += len(records)
+                    break
+                except Exception as e:
+                    if attempt == 2:
+                        self._stats["dropped_rows"] += len(records)
+                        logger.error(f"Dropped {len(records)} predictions after failed flush: {e}")
+                    else:
+                        logger.warning(f"Prediction flush failed, retrying: {e}")
+                        await asyncio.sleep(self.flush_interval_ms / 1000)
+
+        flush_ms = (time.perf_counter() - start_time) * 1000
+        self._stats["flushes"] += 1
+        self._stats["flush_ms_sum"] += flush_ms
+        self._stats["flush_ms_max"] = max(self._stats["flush_ms_max"], flush_ms)
+
+        self._settle(len(batch))
+
+    def _settle(self, count: int) -> None:
+        """Stop counting rows that were written, dropped or never queued"""
+        self._unwritten -= count
+        if self._unwritten <= 0:
+            self._idle.set()
+
+    @staticmethod
+    def _write(bind: Engine, records: List[dict]) -> None:
+        """Insert rows in one transaction (runs on the writer thread)"""
+        db = Session(bind=bind)
+        try:
+            bulk_insert_predictions(db, records)
+        finally:
+            db.close()
+
+    @property
+    def queue_size(self) -> int:
+        """Rows waiting to be flushed"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get_stats(self) -> Dict:
+        """Get queue and flush metrics"""
+        flushes = self._stats["flushes"]
+        return {
+            "enabled": settings.prediction_write_behind_enabled,
+            "queue_size": self.queue_size,
+            "max_queue_size": self.max_queue_size,
+            "flushes": flushes,
+            "rows_written": self._stats["rows_written"],
+            "dropped_rows": self._stats["dropped_rows"],
+            "rejected": self._stats["rejected"],
+            "avg_flush_ms": round(self._stats["flush_ms_sum"] / flushes, 3) if flushes else 0.0,
+            "flush_ms_sum": round(self._stats["flush_ms_sum"], 3),
+            "max_flush_ms": round(self._stats["flush_ms_max"], 3),
+        }
+
+    def reset_stats(self) -> None:
+        """Reset sink metrics (for testing)"""
+        self._stats = {
+            "flushes": 0,
+            "rows_written": 0,
+            "dropped_rows": 0,
+            "rejected": 0,
+            "flush_ms_sum": 0.0,
+            "flush_ms_max": 0.0,
+        }
+
+
+# Global prediction sink instance
+prediction_sink = PredictionSink(
+    max_batch_rows=settings.prediction_sink_max_batch_rows,
+    flush_interval_ms=settings.prediction_sink_flush_interval_ms,
+    max_queue_size=settings.prediction_sink_max_queue_size,
+    put_timeout_ms=settings.prediction_sink_put_timeout_ms,
+)
@@ -0,0 +1,234 @@
+"""
+Report Cache - Rendered PDF reports cached on local disk
+
+Reports are rendered on the bounded report executor, never on the event
+loop, and the finished PDF is stored under a content address: the hash
+of (user, report type, parameters, data watermark). The watermark is the
+number of predictions in the report's window plus the newest created_at,
+so a report is only rendered again once predictions land in (or age out
+of) its window. Until then every download streams the cached file.
+
+Cached files are evicted least recently used first once the directory
+grows past `report_cache_max_mb`. Concurrent requests for the same
+report share a single render.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.executors import report_executor
+from ..db.models import Prediction
+
+logger = logging.getLogger(__name__)
+
+# Size of the pieces a cached report is sent in
+REPORT_SEND_BUFFER = 64 * 1024
+
+REPORT_SUFFIX = ".pdf"
+
+
+def data_watermark(db: Session, *criteria) -> Tuple[int, Optional[str]]:
+    """
+    Version of the predictions a report reads
+
+    Returns:
+        (count, newest created_at) of the matching predictions; both
+        come from the (user_id, created_at) index without reading rows
+    """
+    count, newest = db.execute(
+        select(func.count(), func.max(Prediction.created_at)).where(*criteria)
+    ).one()
+    return count, newest.isoformat() if newest is not None else None
+
+
+def iter_file(file: BinaryIO) -> Iterator[bytes]:
+    """Yield a file in pieces and close it"""
+    try:
+        while True:
+            data = file.read(REPORT_SEND_BUFFER)
+            if not data:
+                break
+            yield data
+    finally:
+        file.close()
+
+
+class ReportCache:
+    """
+    Content-addressed disk cache of rendered reports with LRU eviction.
+
+    Access time is the file's mtime, refreshed on every hit, so the LRU
+    order survives restarts without an index.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "renders": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(user_id: int, report_type: str, params: Dict, watermark) -> str:
+        """Content address of a report"""
+        payload = json.dumps(
+            {"user_id": user_id, "type": report_type, "params": params, "watermark": watermark},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{REPORT_SUFFIX}"
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """
+        Open a cached report and mark it recently used
+
+        The open handle stays readable even if the file is evicted while
+        it is being sent.
+        """
+        path = self._path(key)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return file
+
+    def put(self, key: str, content: bytes) -> None:
+        """Store a report atomically, then evict down to max_bytes"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(content)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove least recently used reports until the cache fits max_bytes
+
+        The most recent report is always kept, even if it alone is larger.
+
+        Returns:
+            Number of reports removed
+        """
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(REPORT_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            entries.sort()
+            removed = 0
+            for _, size, path in entries[:-1]:
+                if total <= self.max_bytes:
+                    break
+                Path(path).unlink(missing_ok=True)
+                total -= size
+                removed += 1
+
+            self._stats["evictions"] += removed
+        if removed:
+            logger.info(f"Evicted {removed} cached reports")
+        return removed
+
+    def _render_and_store(self, key: str, render: Callable[[], bytes]) -> bytes:
+        """Render a report and cache it; runs on the report executor"""
+        content = render()
+        self.put(key, content)
+        with self._lock:
+            self._stats["renders"] += 1
+        return content
+
+    async def get_or_render(self, key: str, render: Callable[[], bytes]) -> BinaryIO:
+        """
+        Open the cached report, rendering it first if it isn't cached
+
+        Args:
+            key: Content address from make_key
+            render: Blocking callable returning the PDF bytes; it must use
+                its own database session
+
+        Returns:
+            Binary file object positioned at the start of the report
+
+        Raises:
+            ExecutorOverloaded: If the report executor's queue is full
+        """
+        cached = self.open(key)
+        if cached is not None:
+            with self._lock:
+                self._stats["hits"] += 1
+            return cached
+
+        with self._lock:
+            self._stats["misses"] += 1
+
+        # Requests for a report that is already rendering wait for that render
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(report_executor.run(self._render_and_store, key, render))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # A cancelled request must not cancel the render other requests wait on
+        content = await asyncio.shield(future)
+
+        cached = self.open(key)
+        return cached if cached is not None else io.BytesIO(content)
+
+    def clear(self) -> None:
+        """Remove every cached report"""
+        if self.cache_dir.exists():
+            for path in self.cache_dir.glob(f"*{REPORT_SUFFIX}"):
+                path.unlink(missing_ok=True)
+
+    def get_stats(self) -> Dict:
+        """Get hit, miss, render and eviction counts and the cache size"""
+        entries = 0
+        size_bytes = 0
+        if self.cache_dir.exists():
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(REPORT_SUFFIX):
+                    try:
+                        size_bytes += entry.stat().st_size
+                    except FileNotFoundError:
+                        continue
+                    entries += 1
+
+        with self._lock:
+            return {**self._stats, "entries": entries, "size_bytes": size_bytes}
+
+
+# Global report cache instance
+report_cache = ReportCache(settings.report_cache_dir, settings.report_cache_max_mb * 1024 * 1024)
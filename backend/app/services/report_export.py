@@ -0,0 +1,231 @@
+"""
+Report Exports - Constant-memory CSV and Excel exports of predictions
+
+Only the exported columns are selected, and rows are fetched through a
+server-side cursor `export_chunk_rows` at a time (`yield_per`), so an
+export never holds more than one chunk of rows in memory.
+
+CSV is encoded and yielded chunk by chunk: the first bytes are sent as
+soon as the first chunk is read. Excel uses XlsxWriter's constant_memory
+mode, which flushes each row to a temporary file as it is written; the
+finished workbook is spooled on disk and sent in pieces. An .xlsx file is
+a zip archive that can only be sent once complete, but memory stays flat
+for any size.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import csv
+import io
+import logging
+import tempfile
+from datetime import datetime
+from typing import Iterator, List, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..db.models import Prediction
+from .aggregation import prediction_aggregates
+
+logger = logging.getLogger(__name__)
+
+# Size of the pieces a spooled workbook is sent in
+EXCEL_SEND_BUFFER = 1024 * 1024
+
+CSV_COLUMNS = [
+    ("date", Prediction.created_at),
+    ("amount", Prediction.amount),
+    ("is_fraud", Prediction.is_fraud),
+    ("fraud_probability", Prediction.fraud_probability),
+    ("risk_score", Prediction.risk_score),
+    ("confidence", Prediction.confidence),
+    ("prediction_time_ms", Prediction.prediction_time_ms),
+]
+
+EXCEL_HEADERS = ["Date", "Amount", "Is Fraud", "Fraud Probability", "Risk Score", "Confidence"]
+EXCEL_WIDTHS = {"A": 20, "B": 12, "C": 10, "D": 18, "E": 12, "F": 12}
+
+
+def iter_prediction_chunks(
+    db: Session,
+    columns: Sequence,
+    criteria: Sequence,
+    order_by: Sequence,
+    chunk_rows: int
+) -> Iterator[List]:
+    """
+    Yield matching prediction rows in lists of up to chunk_rows
+
+    `yield_per` streams results from a server-side cursor on PostgreSQL
+    and fetches lazily on SQLite, so the full result is never buffered.
+    """
+    statement = (
+        select(*columns)
+        .where(*criteria)
+        .order_by(*order_by)
+        .execution_options(yield_per=chunk_rows)
+    )
+    yield from db.execute(statement).partitions()
+
+
+def iter_csv_export(
+    db: Session,
+    criteria: Sequence,
+    order_by: Sequence,
+    chunk_rows: int
+) -> Iterator[bytes]:
+    """
+    Yield a CSV export of the matching predictions, header first
+
+    Args:
+        db: Session owned by the export; closed when the stream ends
+        criteria: Filter on Prediction columns
+        order_by: Row order
+        chunk_rows: Rows fetched and encoded per yielded piece
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    try:
+        writer.writerow([name for name, _ in CSV_COLUMNS])
+        yield flush()
+
+        columns = [column for _, column in CSV_COLUMNS]
+        for rows in iter_prediction_chunks(db, columns, criteria, order_by, chunk_rows):
+            writer.writerows(
+                (created_at.isoformat() if created_at else None, *values)
+                for created_at, *values in rows
+            )
+            yield flush()
+    except Exception as e:
+        logger.error(f"CSV export stopped: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def excel_export(
+    db: Session,
+    criteria: Sequence,
+    order_by: Sequence,
+    title: str,
+    username: str,
+    chunk_rows: int
+) -> Iterator[bytes]:
+    """
+    Excel export of the matching predictions with summary and data sheets
+
+    The summary is aggregated in SQL over the same criteria as the data
+    sheet. Nothing is queried until the returned iterator is consumed.
+
+    Args:
+        db: Session owned by the export; closed when the stream ends
+        criteria: Filter on Prediction columns
+        order_by: Row order of the data sheet
+        title: Title shown on the summary sheet
+        username: User shown on the summary sheet
+        chunk_rows: Rows fetched per round trip
+
+    Raises:
+        ImportError: If xlsxwriter is not installed
+    """
+    import xlsxwriter
+
+    def write_summary(wb, summary: dict) -> None:
+        ws = wb.add_worksheet("Summary")
+        ws.set_column("A:A", 25)
+        ws.set_column("B:B", 20)
+
+        total = summary["total"]
+        risk = summary["risk_distribution"]
+        header_format = wb.add_format({
+            "bg_color": "#2563EB", "font_color": "#FFFFFF", "bold": True, "border": 1, "align": "center"
+        })
+        cell_format = wb.add_format({"border": 1})
+        bold_format = wb.add_format({"border": 1, "bold": True})
+
+        ws.merge_range("A1:D1", title, wb.add_format({"font_size": 18, "bold": True, "font_color": "#2563EB"}))
+        ws.write("A3", f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}")
+        ws.write("A4", f"User: {username}")
+        ws.write("A5", f"Total Predictions: {total}")
+        ws.write_row("A7", ["Metric", "Value"], header_format)
+
+        summary_data = [
+            ["Total Predictions", total],
+            ["Fraud Detected", summary["fraud_count"]],
+            ["Legitimate", summary["legitimate_count"]],
+            ["Fraud Rate", f"{summary['fraud_rate'] * 100:.2f}%" if total > 0 else "0%"],
+            ["Average Amount", f"${summary['avg_amount']:.2f}"],
+            ["", ""],
+            ["Risk Distribution", ""],
+            ["Low (0-24)", risk["low"]],
+            ["Medium (25-49)", risk["medium"]],
+            ["High (50-74)", risk["high"]],
+            ["Critical (75-100)", risk["critical"]],
+        ]
+        for row_idx, row_data in enumerate(summary_data, 7):
+            bold = row_data[0] in ("Risk Distribution", "")
+            ws.write_row(row_idx, 0, row_data, bold_format if bold else cell_format)
+
+    def write_data(wb) -> None:
+        ws = wb.add_worksheet("Predictions Data")
+        for column, width in EXCEL_WIDTHS.items():
+            ws.set_column(f"{column}:{column}", width)
+        ws.freeze_panes(1, 0)
+
+        ws.write_row(0, 0, EXCEL_HEADERS, wb.add_format({
+            "bg_color": "#374151", "font_color": "#FFFFFF", "bold": True, "align": "center"
+        }))
+
+        # Highlight fraud rows
+        fraud_format = wb.add_format({"bg_color": "#FEE2E2"})
+        columns = [
+            Prediction.created_at, Prediction.amount, Prediction.is_fraud,
+            Prediction.fraud_probability, Prediction.risk_score, Prediction.confidence,
+        ]
+        row_idx = 1
+        for rows in iter_prediction_chunks(db, columns, criteria, order_by, chunk_rows):
+            for created_at, amount, is_fraud, probability, risk_score, confidence in rows:
+                ws.write_row(row_idx, 0, [
+                    created_at.isoformat()[:19] if created_at else "",
+                    amount or 0,
+                    "Yes" if is_fraud else "No",
+                    f"{(probability or 0) * 100:.2f}%",
+                    risk_score or 0,
+                    confidence or "",
+                ], fraud_format if is_fraud else None)
+                row_idx += 1
+
+    def generate() -> Iterator[bytes]:
+        spool = tempfile.TemporaryFile()
+        try:
+            # constant_memory flushes each finished row to a temporary file
+            wb = xlsxwriter.Workbook(spool, {"constant_memory": True})
+            summary = prediction_aggregates(db, *criteria)
+            if summary["total"]:
+                write_summary(wb, summary)
+            write_data(wb)
+            wb.close()
+
+            spool.seek(0)
+            while True:
+                data = spool.read(EXCEL_SEND_BUFFER)
+                if not data:
+                    break
+                yield data
+        except Exception as e:
+            logger.error(f"Excel export stopped: {e}")
+            raise
+        finally:
+            spool.close()
+            db.close()
+
+    return generate()
@@ -0,0 +1,347 @@
+"""
+Prediction Rollups - Hourly per-user aggregates for dashboards
+
+Every prediction write also adds its counters to the user's hour bucket
+in `prediction_rollups`, in the same transaction. Dashboards then read
+one row per hour instead of one row per prediction. Bucket updates are
+atomic upserts (`INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x`),
+so concurrent writers never lose increments. Dialects without ON
+CONFLICT fall back to an UPDATE and an INSERT for buckets it missed.
+
+Time ranges that don't start or end on an hour boundary are answered
+exactly: whole hours come from the rollups and the partial hours at the
+edges from the predictions table.
+
+Rebuild rollups from the predictions table with:
+
+    python -m app.services.rollups [--user-id ID]
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..db.models import Prediction, PredictionRollup
+from .aggregation import (
+    COUNTER_FIELDS, PERIOD_FORMATS, counter_columns, prediction_counters,
+    record_counters, summarize_counters, time_bucket
+)
+
+logger = logging.getLogger(__name__)
+
+# Rollup rows per executemany round trip
+UPSERT_CHUNK_SIZE = 1000
+
+ROLLUP_COUNTERS = [getattr(PredictionRollup, field) for field in COUNTER_FIELDS]
+
+
+def hour_floor(value: datetime) -> datetime:
+    """Start of the hour containing value"""
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+# ============== Writes ==============
+
+def rollup_deltas(records: Iterable[Dict]) -> List[Dict]:
+    """
+    Sum prediction rows into per-user hour buckets
+
+    Returns:
+        Rollup rows sorted by (user_id, bucket_start)
+    """
+    buckets: Dict[tuple, Dict] = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    for record in records:
+        bucket = buckets[(record["user_id"], hour_floor(record["created_at"]))]
+        for field, value in record_counters(record).items():
+            bucket[field] += value
+
+    return [
+        {"user_id": user_id, "bucket_start": bucket_start, **counters}
+        for (user_id, bucket_start), counters in sorted(buckets.items())
+    ]
+
+
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _upsert_statement(dialect_name: str):
+    """INSERT ... ON CONFLICT that adds to an existing bucket's counters"""
+    statement = UPSERT_INSERTS[dialect_name](PredictionRollup.__table__)
+    table = PredictionRollup.__table__
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.bucket_start],
+        set_={field: table.c[field] + statement.excluded[field] for field in COUNTER_FIELDS},
+    )
+
+
+def apply_rollups(db: Session, records: List[Dict]) -> int:
+    """
+    Add prediction rows to their rollup buckets in the current transaction
+
+    Call before committing the insert of the same rows. Buckets are
+    upserted in (user_id, bucket_start) order, so concurrent writers lock
+    them in the same order and can't deadlock each other.
+
+    Returns:
+        Number of buckets touched
+    """
+    deltas = rollup_deltas(records)
+    if not deltas:
+        return 0
+
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name not in UPSERT_INSERTS:
+        _update_then_insert(db, deltas)
+        return len(deltas)
+
+    statement = _upsert_statement(dialect_name)
+    for start in range(0, len(deltas), UPSERT_CHUNK_SIZE):
+        db.execute(statement, deltas[start:start + UPSERT_CHUNK_SIZE])
+    return len(deltas)
+
+
+def _update_then_insert(db: Session, deltas: List[Dict]) -> None:
+    """
+    Upsert buckets on dialects without ON CONFLICT
+
+    The UPDATE adds atomically to existing buckets; missing ones are then
+    inserted. Two writers creating the same bucket at once make one of
+    them fail on the primary key instead of losing its increment.
+    """
+    table = PredictionRollup.__table__
+    for delta in deltas:
+        result = db.execute(
+            update(table)
+            .where(and_(table.c.user_id == delta["user_id"], table.c.bucket_start == delta["bucket_start"]))
+            .values({field: table.c[field] + delta[field] for field in COUNTER_FIELDS})
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table), delta)
+
+
+# ============== Reads ==============
+
+def _edge_bucket(db: Session, user_id: int, start: datetime, end: datetime, include_end: bool) -> Optional[Dict]:
+    """Counters of a partial hour, from the predictions table"""
+    counters = prediction_counters(
+        db,
+        Prediction.user_id == user_id,
+        Prediction.created_at >= start,
+        Prediction.created_at <= end if include_end else Prediction.created_at < end,
+    )
+    if not counters["total"]:
+        return None
+    return {"bucket_start": hour_floor(start), **{field: counters[field] or 0 for field in COUNTER_FIELDS}}
+
+
+def _split_range(start: Optional[datetime], end: Optional[datetime]):
+    """
+    Split [start, end] into a whole-hour range and partial edges
+
+    Returns:
+        (hours, edges): rollups cover the bucket range `hours`, a
+        (first, stop) pair with None for unbounded, or no hours at all if
+        `hours` is None; each edge is a (start, end, include_end) range to
+        read from predictions
+    """
+    first = None
+    if start is not None:
+        first = hour_floor(start)
+        if first < start:
+            first += timedelta(hours=1)
+
+    stop = hour_floor(end) if end is not None else None
+
+    if first is not None and stop is not None and first >= stop:
+        # Less than one whole hour: read it all from predictions
+        return None, [(start, end, True)]
+
+    edges = []
+    if start is not None and start < first:
+        edges.append((start, first, False))
+    if end is not None:
+        edges.append((stop, end, True))
+    return (first, stop), edges
+
+
+def _rollup_criteria(user_id: int, hours: Tuple[Optional[datetime], Optional[datetime]]) -> list:
+    """Filter for rollup buckets with first <= bucket_start < stop"""
+    first, stop = hours
+    criteria = [PredictionRollup.user_id == user_id]
+    if first is not None:
+        criteria.append(PredictionRollup.bucket_start >= first)
+    if stop is not None:
+        criteria.append(PredictionRollup.bucket_start < stop)
+    return criteria
+
+
+def hourly_buckets(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[Dict]:
+    """
+    Per-hour counters of a user's predictions with start <= created_at <= end
+
+    Returns:
+        Dicts of bucket_start plus COUNTER_FIELDS, ordered by bucket_start;
+        hours without predictions are omitted
+    """
+    hours, edges = _split_range(start, end)
+
+    buckets = []
+    if hours is not None:
+        # Core execution: no ORM row processing for up to 24 rows per day
+        result = db.connection().execute(
+            select(PredictionRollup.bucket_start, *ROLLUP_COUNTERS)
+            .where(*_rollup_criteria(user_id, hours))
+            .order_by(PredictionRollup.bucket_start)
+        )
+        keys = list(result.keys())
+        buckets = [dict(zip(keys, row)) for row in result.all()]
+
+    for edge_start, edge_end, include_end in edges:
+        bucket = _edge_bucket(db, user_id, edge_start, edge_end, include_end)
+        if bucket is not None:
+            buckets.append(bucket)
+
+    buckets.sort(key=lambda bucket: bucket["bucket_start"])
+    return buckets
+
+
+def rollup_summary(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict:
+    """
+    Totals and averages of a user's predictions with start <= created_at <= end
+
+    Same result as `prediction_aggregates` over the range, summed in the
+    database over hour buckets.
+    """
+    hours, edges = _split_range(start, end)
+
+    totals = dict.fromkeys(COUNTER_FIELDS, 0)
+    if hours is not None:
+        row = db.execute(
+            select(*(func.sum(column).label(column.key) for column in ROLLUP_COUNTERS))
+            .where(*_rollup_criteria(user_id, hours))
+        ).one()
+        totals = {field: value or 0 for field, value in row._mapping.items()}
+
+    for edge_start, edge_end, include_end in edges:
+        bucket = _edge_bucket(db, user_id, edge_start, edge_end, include_end)
+        if bucket is not None:
+            for field in COUNTER_FIELDS:
+                totals[field] += bucket[field]
+
+    return summarize_counters(totals)
+
+
+# ============== Rebuild ==============
+
+def _bucket_datetime(value) -> datetime:
+    """Hour bucket from time_bucket: a datetime (PostgreSQL) or label (SQLite)"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, PERIOD_FORMATS["hour"])
+
+
+def rebuild_rollups(engine: Engine, user_id: Optional[int] = None) -> int:
+    """
+    Recompute rollups from the predictions table
+
+    Runs in one transaction. On PostgreSQL the rollup table is locked
+    against writers first, so predictions committed during the rebuild
+    are either counted by it or added after it, never both.
+
+    Args:
+        engine: Database engine
+        user_id: Rebuild one user's rollups only (default: all users)
+
+    Returns:
+        Number of rollup rows written
+    """
+    with Session(bind=engine) as db:
+        if engine.dialect.name == "postgresql":
+            db.execute(text(f"LOCK TABLE {PredictionRollup.__tablename__} IN EXCLUSIVE MODE"))
+
+        cleared = delete(PredictionRollup)
+        criteria = []
+        if user_id is not None:
+            cleared = cleared.where(PredictionRollup.user_id == user_id)
+            criteria.append(Prediction.user_id == user_id)
+        db.execute(cleared)
+
+        bucket = time_bucket(db, "hour").label("bucket")
+        rows = db.execute(
+            select(Prediction.user_id, bucket, *counter_columns())
+            .where(*criteria)
+            .group_by(Prediction.user_id, bucket)
+        )
+
+        statement = insert(PredictionRollup.__table__)
+        written = 0
+        batch = []
+        for row in rows:
+            mapping = row._mapping
+            batch.append({
+                "user_id": row.user_id,
+                "bucket_start": _bucket_datetime(row.bucket),
+                **{field: mapping[field] or 0 for field in COUNTER_FIELDS},
+            })
+            if len(batch) >= UPSERT_CHUNK_SIZE:
+                db.execute(statement, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            db.execute(statement, batch)
+            written += len(batch)
+
+        db.commit()
+
+    logger.info(f"Rebuilt {written} prediction rollup buckets")
+    return written
+
+
+def backfill_rollups_if_empty(engine: Engine) -> int:
+    """Build rollups once for databases that had predictions before rollups existed"""
+    with engine.connect() as conn:
+        has_rollups = conn.execute(select(PredictionRollup.user_id).limit(1)).first() is not None
+        has_predictions = conn.execute(select(Prediction.id).limit(1)).first() is not None
+
+    if has_rollups or not has_predictions:
+        return 0
+    logger.info("Prediction rollups are empty - building them from existing predictions")
+    return rebuild_rollups(engine)
+
+
+def main():
+    """Rebuild prediction rollups from the command line"""
+    from ..db.database import engine
+
+    parser = argparse.ArgumentParser(description="Rebuild hourly prediction rollups")
+    parser.add_argument("--user-id", type=int, default=None, help="Rebuild one user only")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    count = rebuild_rollups(engine, user_id=args.user_id)
+    print(f"Rebuilt {count} rollup buckets")
+
+
+if __name__ == "__main__":
+    main()
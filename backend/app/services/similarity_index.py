@@ -0,0 +1,504 @@
+"""
+Similarity Index - Approximate nearest neighbours over transaction vectors
+
+An inverted-file (IVF) index on NumPy. Each prediction is a vector of
+V1-V28 plus the standardized log amount. A k-means coarse quantizer
+splits the vectors into about sqrt(n) lists; a query scans only the
+`nprobe` lists whose centroids are closest to it instead of every
+stored vector.
+
+- Vectors are kept sorted by list, so a probed list is one contiguous
+  slice. New vectors are appended to an unsorted tail that every query
+  scans in full; the tail is merged into the lists once it grows past
+  TAIL_MERGE_ROWS, and the quantizer is retrained once the index has
+  grown RETRAIN_GROWTH times past the size it was trained on. Merges
+  build new arrays outside the lock, so searches never wait on k-means.
+- `refresh` appends every prediction with an id above the highest
+  indexed id, so rows saved by any path (single predictions, CSV
+  uploads, batch job processes) are picked up incrementally. Rows that
+  commit after a later id was seen (PostgreSQL sequences don't commit
+  in order) are caught by recounting the last REFRESH_LOOKBACK_IDS ids.
+- `save` writes the arrays as .npy files into a new generation directory
+  and then points meta.json at it, so concurrent writers never mix
+  files; `load` memory-maps them, so a restart doesn't read the whole
+  index into memory up front.
+
+Below TRAIN_MIN_ROWS vectors the index is a flat (exact) scan.
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..db.models import Prediction
+from .prediction_service import get_feature_matrix
+
+logger = logging.getLogger(__name__)
+
+# V1-V28 plus the standardized log amount
+VECTOR_DIM = 29
+
+# log1p(amount) mean and standard deviation of the credit card training data
+AMOUNT_LOG_MEAN = 3.15
+AMOUNT_LOG_STD = 1.66
+
+TRAIN_MIN_ROWS = 4096
+TRAIN_SAMPLE_ROWS = 65536
+KMEANS_ITERATIONS = 10
+RETRAIN_GROWTH = 4
+TAIL_MERGE_ROWS = 50000
+
+# Ids read per refresh query
+REFRESH_CHUNK_IDS = 100000
+
+# Ids below the highest indexed id rechecked for late commits on every
+# refresh; covers a CSV chunk committing behind a later single prediction
+REFRESH_LOOKBACK_IDS = 100000
+
+# Age after which generation directories meta.json doesn't point to are
+# removed; younger ones may still be written or loaded by another worker
+GENERATION_GRACE_SECONDS = 300
+
+# Vectors per distance block, bounding temporary memory
+DISTANCE_CHUNK_ROWS = 65536
+
+ARRAY_FILES = ("vectors", "ids", "user_ids", "offsets", "centroids", "recent_ids")
+
+
+def transaction_vectors(features: np.ndarray) -> np.ndarray:
+    """
+    Index vectors from model feature rows
+
+    Args:
+        features: Rows in model order (time, v1..v28, amount), as returned
+            by get_feature_matrix
+
+    Returns:
+        float32 array of shape (n, VECTOR_DIM)
+    """
+    vectors = np.empty((len(features), VECTOR_DIM), dtype=np.float32)
+    vectors[:, :28] = features[:, 1:29]
+    vectors[:, 28] = (np.log1p(np.maximum(features[:, 29], 0)) - AMOUNT_LOG_MEAN) / AMOUNT_LOG_STD
+    return np.nan_to_num(vectors)
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, count: int = 1) -> np.ndarray:
+    """Positions of the `count` closest centroids of each vector"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    nearest = np.empty((len(vectors), count), dtype=np.int32)
+    for start in range(0, len(vectors), DISTANCE_CHUNK_ROWS):
+        block = vectors[start:start + DISTANCE_CHUNK_ROWS]
+        # ||x - c||^2 without the ||x||^2 term, which doesn't change the order
+        distances = centroid_norms - 2 * block @ centroids.T
+        if count == 1:
+            nearest[start:start + len(block), 0] = distances.argmin(axis=1)
+        else:
+            closest = np.argpartition(distances, count - 1, axis=1)[:, :count]
+            order = np.take_along_axis(distances, closest, axis=1).argsort(axis=1)
+            nearest[start:start + len(block)] = np.take_along_axis(closest, order, axis=1)
+    return nearest
+
+
+def train_centroids(vectors: np.ndarray, n_lists: int, seed: int = 0) -> np.ndarray:
+    """k-means (Lloyd) centroids of a sample of the vectors"""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > TRAIN_SAMPLE_ROWS:
+        sample = vectors[rng.choice(len(vectors), TRAIN_SAMPLE_ROWS, replace=False)]
+    sample = np.asarray(sample, dtype=np.float32)
+
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = _nearest_centroids(sample, centroids)[:, 0]
+        counts = np.bincount(assignment, minlength=n_lists)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Reseed empty lists with random sample vectors
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centroids
+
+
+class SimilarityIndex:
+    """
+    IVF index of prediction vectors, scoped to their users at query time.
+
+    Arrays are replaced, never mutated in place, so a query works on the
+    snapshot it took while refresh and merge build new arrays. `_lock`
+    only guards swapping references; `_merge_lock` serializes merges.
+    """
+
+    def __init__(self, index_dir: str, nprobe: int = 8):
+        self.index_dir = Path(index_dir)
+        self.nprobe = nprobe
+
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._epoch = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        # Vectors sorted by list; list i is rows offsets[i]:offsets[i + 1]
+        self._vectors = np.empty((0, VECTOR_DIM), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._user_ids = np.empty(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._centroids = np.empty((0, VECTOR_DIM), dtype=np.float32)
+        self._trained_rows = 0
+
+        # Unsorted rows appended since the last merge
+        self._tail: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._tail_rows = 0
+        self.max_id = 0
+
+        # Indexed ids within REFRESH_LOOKBACK_IDS of max_id, all above _recent_low
+        self._recent: Set[int] = set()
+        self._recent_low = 0
+        # Bumped on every reset, so a merge started before it is discarded
+        self._epoch += 1
+
+    def __len__(self) -> int:
+        return len(self._ids) + self._tail_rows
+
+    @property
+    def trained(self) -> bool:
+        return len(self._centroids) > 0
+
+    # ============== Building ==============
+
+    def add(self, ids: np.ndarray, user_ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Append vectors of ids that aren't indexed yet"""
+        if not len(ids):
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            self._tail.append((
+                np.asarray(vectors, dtype=np.float32),
+                ids,
+                np.asarray(user_ids, dtype=np.int64),
+            ))
+            self._tail_rows += len(ids)
+            self.max_id = max(self.max_id, int(ids.max()))
+            self._recent.update(ids[ids > self.max_id - REFRESH_LOOKBACK_IDS].tolist())
+            self._prune_recent()
+
+            retrain = len(self) >= TRAIN_MIN_ROWS and len(self) >= RETRAIN_GROWTH * max(self._trained_rows, 1)
+            merge = retrain or self._tail_rows > TAIL_MERGE_ROWS
+
+        if merge:
+            self._merge(retrain)
+
+    def _prune_recent(self) -> None:
+        """Forget recent ids that fell out of the lookback window; caller holds the lock"""
+        low = self.max_id - REFRESH_LOOKBACK_IDS
+        if low > self._recent_low:
+            self._recent = {i for i in self._recent if i > low}
+            self._recent_low = low
+
+    def _merge(self, retrain: bool) -> None:
+        """
+        Sort the tail into the lists, retraining the quantizer if asked
+
+        The new arrays are built from a snapshot without holding the lock;
+        it is only taken to swap them in, keeping rows appended meanwhile
+        in the tail.
+        """
+        with self._merge_lock:
+            with self._lock:
+                epoch = self._epoch
+                tail = list(self._tail)
+                sorted_rows = len(self._ids)
+                base = (self._vectors, self._ids, self._user_ids)
+                offsets, centroids = self._offsets, self._centroids
+            if not tail and not retrain:
+                return
+
+            vectors = np.concatenate([base[0], *(t[0] for t in tail)])
+            ids = np.concatenate([base[1], *(t[1] for t in tail)])
+            user_ids = np.concatenate([base[2], *(t[2] for t in tail)])
+            trained_rows = None
+
+            if len(ids) < TRAIN_MIN_ROWS:
+                # Too few vectors to train on: one flat list
+                offsets = np.array([0, len(ids)], dtype=np.int64)
+            else:
+                if retrain or not len(centroids):
+                    n_lists = max(1, int(math.sqrt(len(ids))))
+                    centroids = train_centroids(vectors, n_lists)
+                    lists = _nearest_centroids(vectors, centroids)[:, 0]
+                    trained_rows = len(ids)
+                    logger.info(f"Similarity index trained: {len(ids)} vectors in {n_lists} lists")
+                else:
+                    # Sorted rows keep their lists; only the tail is assigned
+                    lists = np.concatenate([
+                        np.repeat(np.arange(len(centroids), dtype=np.int32), np.diff(offsets)),
+                        _nearest_centroids(vectors[sorted_rows:], centroids)[:, 0],
+                    ])
+                order = np.argsort(lists, kind="stable")
+                offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+                np.cumsum(np.bincount(lists, minlength=len(centroids)), out=offsets[1:])
+                vectors, ids, user_ids = vectors[order], ids[order], user_ids[order]
+
+            with self._lock:
+                if self._epoch != epoch:
+                    # Cleared or reloaded while merging
+                    return
+                self._vectors, self._ids, self._user_ids = vectors, ids, user_ids
+                self._offsets, self._centroids = offsets, centroids
+                if trained_rows is not None:
+                    self._trained_rows = trained_rows
+                self._tail = self._tail[len(tail):]
+                self._tail_rows = sum(len(t[1]) for t in self._tail)
+
+    def refresh(self, db: Session) -> int:
+        """
+        Index predictions saved since the last refresh
+
+        Returns:
+            Number of vectors added
+        """
+        self.ensure_loaded()
+        with self._refresh_lock:
+            return self._refresh(db)
+
+    def _refresh(self, db: Session) -> int:
+        newest = db.execute(select(func.max(Prediction.id))).scalar() or 0
+        added = self._index_late(db)
+        start = self.max_id
+        while start < newest:
+            end = start + REFRESH_CHUNK_IDS
+            added += self._index_rows(db, [Prediction.id > start, Prediction.id <= end])
+            start = end
+        with self._lock:
+            self.max_id = max(self.max_id, newest)
+            self._prune_recent()
+        if added:
+            logger.debug(f"Similarity index: added {added} vectors, {len(self)} total")
+        return added
+
+    def _index_late(self, db: Session) -> int:
+        """
+        Index rows at or below max_id that were committed after it was read
+
+        The lookback window is counted on every refresh; its ids are only
+        read when the count shows rows that aren't indexed.
+        """
+        with self._lock:
+            self._prune_recent()
+            low = max(self._recent_low, 0)
+            window = [Prediction.id > low, Prediction.id <= self.max_id]
+            indexed = len(self._recent)
+        if self.max_id <= low:
+            return 0
+        visible = db.execute(select(func.count()).select_from(Prediction).where(*window)).scalar()
+        if visible <= indexed:
+            return 0
+
+        late = sorted(set(db.execute(select(Prediction.id).where(*window)).scalars()) - self._recent)
+        if not late:
+            return 0
+        logger.info(f"Similarity index: {len(late)} predictions committed late")
+        return self._index_rows(db, [Prediction.id >= late[0], Prediction.id <= late[-1]], set(late))
+
+    def _index_rows(self, db: Session, criteria: List, keep: Optional[Set[int]] = None) -> int:
+        """Add the predictions matching criteria, only those in keep if given"""
+        ids, features = get_feature_matrix(db, *criteria)
+        if keep is not None:
+            wanted = np.fromiter((i in keep for i in ids.tolist()), dtype=bool, count=len(ids))
+            ids, features = ids[wanted], features[wanted]
+        if not len(ids):
+            return 0
+
+        users = dict(db.execute(select(Prediction.id, Prediction.user_id).where(*criteria)).all())
+        user_ids = np.fromiter((users[i] for i in ids.tolist()), dtype=np.int64, count=len(ids))
+        self.add(ids, user_ids, transaction_vectors(features))
+        return len(ids)
+
+    # ============== Search ==============
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int = 10,
+        user_id: Optional[int] = None,
+        exclude_id: Optional[int] = None,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Approximate k nearest neighbours of a vector
+
+        Args:
+            vector: Query vector from transaction_vectors
+            k: Neighbours to return
+            user_id: Only return this user's predictions
+            exclude_id: Prediction id to leave out (the query itself)
+            nprobe: Lists to scan (default self.nprobe); the number of
+                lists scans every vector
+
+        Returns:
+            (prediction id, euclidean distance) pairs, closest first
+        """
+        with self._lock:
+            vectors, ids, user_ids = self._vectors, self._ids, self._user_ids
+            offsets, centroids, tail = self._offsets, self._centroids, list(self._tail)
+
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, VECTOR_DIM)
+        if len(centroids):
+            probes = _nearest_centroids(vector, centroids, min(nprobe or self.nprobe, len(centroids)))[0]
+            rows = np.concatenate([np.arange(offsets[p], offsets[p + 1]) for p in probes])
+        else:
+            rows = np.arange(len(ids))
+
+        segments = [(vectors[rows], ids[rows], user_ids[rows]), *tail]
+        candidates = np.concatenate([segment[0] for segment in segments])
+        candidate_ids = np.concatenate([segment[1] for segment in segments])
+        keep = np.ones(len(candidate_ids), dtype=bool)
+        if user_id is not None:
+            keep &= np.concatenate([segment[2] for segment in segments]) == user_id
+        if exclude_id is not None:
+            keep &= candidate_ids != exclude_id
+        candidates, candidate_ids = candidates[keep], candidate_ids[keep]
+
+        distances = ((candidates - vector) ** 2).sum(axis=1)
+        if len(distances) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [(int(candidate_ids[i]), float(np.sqrt(distances[i]))) for i in top]
+
+    def exact_search(self, vector: np.ndarray, k: int = 10, **kwargs) -> List[Tuple[int, float]]:
+        """Exact k nearest neighbours (every list scanned)"""
+        return self.search(vector, k, nprobe=max(len(self._centroids), 1), **kwargs)
+
+    # ============== Persistence ==============
+
+    def save(self) -> None:
+        """
+        Merge the tail and write the index as a new generation
+
+        Arrays go to a directory of their own, then meta.json is replaced
+        to point at it, so a reader sees either the old or the new index.
+        """
+        self._merge(retrain=False)
+        with self._lock:
+            arrays = {
+                "vectors": self._vectors, "ids": self._ids, "user_ids": self._user_ids,
+                "offsets": self._offsets, "centroids": self._centroids,
+                "recent_ids": np.array(sorted(self._recent), dtype=np.int64),
+            }
+            meta = {"rows": len(self._ids), "max_id": self.max_id, "trained_rows": self._trained_rows}
+
+        generation = f"gen-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        generation_dir = self.index_dir / generation
+        generation_dir.mkdir(parents=True)
+        for name, array in arrays.items():
+            np.save(generation_dir / f"{name}.npy", array)
+        meta["generation"] = generation
+        meta["shapes"] = {name: list(array.shape) for name, array in arrays.items()}
+
+        tmp_path = self.index_dir / f"meta.json.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, self.index_dir / "meta.json")
+        logger.info(f"Similarity index saved: {meta['rows']} vectors in {generation}")
+        self._remove_old_generations(generation)
+
+    def _remove_old_generations(self, keep: str) -> None:
+        """Delete generation directories that are neither current nor recent"""
+        try:
+            current = json.loads((self.index_dir / "meta.json").read_text()).get("generation")
+        except (OSError, ValueError):
+            return
+        cutoff = time.time() - GENERATION_GRACE_SECONDS
+        for path in self.index_dir.glob("gen-*"):
+            try:
+                if path.name not in (keep, current) and path.stat().st_mtime < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+    def load(self) -> bool:
+        """
+        Memory-map the generation meta.json points to
+
+        Returns:
+            True if an index was loaded; False leaves an empty index that
+            refresh rebuilds from the database
+        """
+        with self._lock:
+            self._loaded = True
+            try:
+                meta = json.loads((self.index_dir / "meta.json").read_text())
+                generation_dir = self.index_dir / meta["generation"]
+                arrays = {
+                    name: np.load(generation_dir / f"{name}.npy", mmap_mode="r")
+                    for name in ARRAY_FILES
+                }
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.info(f"No saved similarity index loaded: {e}")
+                return False
+
+            shapes = {name: list(array.shape) for name, array in arrays.items()}
+            if shapes != meta.get("shapes") or not (
+                len(arrays["ids"]) == len(arrays["vectors"]) == meta["rows"] == arrays["offsets"][-1]
+            ):
+                logger.warning(f"Saved similarity index {meta['generation']} is inconsistent; rebuilding")
+                return False
+
+            self._reset()
+            self._vectors, self._ids, self._user_ids = arrays["vectors"], arrays["ids"], arrays["user_ids"]
+            self._offsets, self._centroids = arrays["offsets"], arrays["centroids"]
+            self._trained_rows = meta["trained_rows"]
+            self.max_id = meta["max_id"]
+            self._recent = set(arrays["recent_ids"].tolist())
+            self._prune_recent()
+        logger.info(f"Similarity index loaded: {meta['rows']} vectors from {meta['generation']}")
+        return True
+
+    def ensure_loaded(self) -> None:
+        """Load the saved index on first use"""
+        with self._refresh_lock:
+            if not self._loaded:
+                self.load()
+
+    def clear(self) -> None:
+        """Drop every indexed vector (the saved files are kept)"""
+        with self._lock:
+            self._reset()
+            self._loaded = True
+
+    def get_stats(self) -> Dict:
+        """Get the index size and shape"""
+        with self._lock:
+            return {
+                "vectors": len(self),
+                "lists": len(self._centroids),
+                "unsorted_tail": self._tail_rows,
+                "nprobe": self.nprobe,
+                "max_id": self.max_id,
+            }
+
+
+# Global similarity index instance
+similarity_index = SimilarityIndex(settings.similarity_index_dir, settings.similarity_index_nprobe)
@@ -0,0 +1,135 @@
+"""
+Benchmark the fraud network graph builder
+
+Builds the similarity graph of synthetic fraud predictions (a week of
+activity, some in batches) with the vectorized builder, and with the
+previous one-call-per-pair loop (a reference copy of its scorer) for the smaller sizes.
+Reports build time, candidate pairs, edges and clusters.
+
+Usage:
+    python benchmarks/bench_fraud_graph.py [--sizes 200,1000,2000,5000,20000] [--pairwise-max 1000]
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.models import Prediction  # noqa: E402
+from app.services.fraud_graph import GraphNodes, KEY_FEATURES, build_similarity_graph  # noqa: E402
+
+Row = namedtuple("Row", "id amount created_at risk_score is_fraud fraud_probability confidence batch_id")
+NOW = datetime(2024, 12, 31)
+THRESHOLD = 0.25
+
+
+def make_predictions(n: int, seed: int = 42) -> list:
+    """Fraud predictions spread over a week; one in ten belongs to one of n/50 batches"""
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 7 * 86400, n)
+    amounts = np.round(rng.exponential(120, n), 2)
+    risks = rng.integers(50, 100, n)
+    features = rng.normal(0, 1.5, (n, 28))
+    batches = rng.integers(0, max(n // 50, 1), n)
+
+    predictions = []
+    for i in range(n):
+        batch_id = f"batch-{batches[i]:06d}" if i % 10 == 0 else None
+        # Batch rows are written together
+        created_at = NOW - timedelta(seconds=int(batches[i] * 600 if batch_id else seconds[i]))
+        values = {f"v{k + 1}": float(features[i, k]) for k in range(28)}
+        predictions.append(Prediction(
+            id=i + 1, amount=float(amounts[i]), created_at=created_at, risk_score=int(risks[i]),
+            is_fraud=True, fraud_probability=0.9, confidence="High", batch_id=batch_id,
+            features_json=json.dumps(values), **values,
+        ))
+    return predictions
+
+
+def to_nodes(predictions: list) -> GraphNodes:
+    """GraphNodes as load_graph_nodes would build them"""
+    rows = [Row(*(getattr(p, name) for name in Row._fields)) for p in predictions]
+    features = np.array([[getattr(p, name) for name in KEY_FEATURES] for p in predictions], dtype=np.float64)
+    return GraphNodes(rows, features)
+
+
+def pairwise_score(pred1: Prediction, pred2: Prediction) -> float:
+    """Reference copy of the previous one-pair similarity score"""
+    score = 0.0
+    if pred1.amount > 0 and pred2.amount > 0:
+        amount_diff = abs(pred1.amount - pred2.amount) / max(pred1.amount, pred2.amount)
+        if amount_diff < 0.1:
+            score += (1 - amount_diff) * 0.3
+
+    time_diff = abs((pred1.created_at - pred2.created_at).total_seconds())
+    if time_diff < 3600:
+        score += (1 - time_diff / 3600) * 0.25
+
+    risk_diff = abs(pred1.risk_score - pred2.risk_score) / 100
+    if pred1.risk_score and pred2.risk_score and risk_diff < 0.15:
+        score += (1 - risk_diff) * 0.2
+
+    if pred1.batch_id and pred1.batch_id == pred2.batch_id:
+        score += 0.5
+
+    f1, f2 = pred1.pca_features(), pred2.pca_features()
+    diffs = [abs(f1[name] - f2[name]) for name in KEY_FEATURES]
+    close = [1 - diff for diff in diffs if diff < 1.0]
+    if close and sum(close) / len(close) > 0.5:
+        score += sum(close) / len(close) * 0.25
+
+    return min(score, 1.0)
+
+
+def pairwise_edges(predictions: list) -> int:
+    """Edge count of the previous one-call-per-pair loop"""
+    edges = 0
+    for i, pred1 in enumerate(predictions):
+        for pred2 in predictions[i + 1:]:
+            if pairwise_score(pred1, pred2) >= THRESHOLD:
+                edges += 1
+    return edges
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="200,1000,2000,5000,20000")
+    parser.add_argument("--pairwise-max", type=int, default=1000, help="largest size run with the pairwise loop")
+    args = parser.parse_args()
+
+    print("\n" + "=" * 88)
+    print("FRAUD GRAPH BENCHMARK")
+    print("=" * 88)
+    print(f"{'nodes':<8} {'pairwise (s)':<14} {'vectorized (s)':<16} {'mode':<8} "
+          f"{'candidates':<12} {'edges':<10} {'clusters':<9}")
+    print("-" * 88)
+    for n in (int(size) for size in args.sizes.split(",")):
+        predictions = make_predictions(n)
+
+        pairwise = "-"
+        if n <= args.pairwise_max:
+            start = time.perf_counter()
+            expected = pairwise_edges(predictions)
+            pairwise = f"{time.perf_counter() - start:.2f}"
+
+        nodes = to_nodes(predictions)
+        start = time.perf_counter()
+        graph = build_similarity_graph(nodes, THRESHOLD)
+        clusters = graph.clusters()
+        elapsed = time.perf_counter() - start
+        if n <= args.pairwise_max and graph.exact:
+            assert graph.edge_count == expected
+
+        print(f"{n:<8} {pairwise:<14} {elapsed:<16.3f} {'exact' if graph.exact else 'blocked':<8} "
+              f"{graph.candidates:<12,} {graph.edge_count:<10,} {len(clusters):<9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark the compiled tree-ensemble backend against the sklearn path
+
+Scores single rows up to 1k-row batches with both backends and checks
+that their outputs are identical. Uses the
+trained model in backend/models/ when present, otherwise a synthetic
+forest with the same hyper-parameters as ml/train.py.
+
+Usage:
+    python benchmarks/bench_inference_backend.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.models.ml_model import FraudDetectionModel  # noqa: E402
+
+
+def build_model(models_dir: Path) -> FraudDetectionModel:
+    """Load the trained model, or fit a synthetic one of the same shape"""
+    model = FraudDetectionModel()
+    if model.load(str(models_dir / "fraud_detector.pkl"), str(models_dir / "scaler.pkl")):
+        print("Using trained model from models/")
+        return model
+
+    print("Trained model not found - fitting a synthetic forest (ml/train.py parameters)")
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(20000, 30))
+    X[:, 0] = rng.uniform(0, 172792, len(X))
+    X[:, -1] = rng.exponential(90, len(X))
+    y = ((X[:, 14] < -1.5) & (X[:, 4] > 0.5) | (rng.random(len(X)) < 0.002)).astype(int)
+
+    model.scaler = StandardScaler().fit(X)
+    model.model = RandomForestClassifier(
+        n_estimators=100,
+        max_depth=20,
+        min_samples_split=5,
+        min_samples_leaf=2,
+        random_state=42,
+        n_jobs=1,
+        class_weight="balanced",
+    ).fit(model.scaler.transform(X), y)
+    model.is_loaded = True
+    return model
+
+
+def time_call(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    base_dir = Path(__file__).parent.parent
+    model = build_model(base_dir / "models")
+
+    rng = np.random.default_rng(7)
+    batch = rng.normal(size=(1000, 30))
+    batch[:, 0] = rng.uniform(0, 172792, len(batch))
+    batch[:, -1] = rng.exponential(90, len(batch))
+
+    start = time.perf_counter()
+    model.enable_compiled_backend()
+    compile_ms = (time.perf_counter() - start) * 1000
+    compiled = model.compiled_model
+
+    print("\n" + "=" * 60)
+    print("INFERENCE BACKEND BENCHMARK")
+    print("=" * 60)
+    print(f"Trees: {compiled.trees.n_trees}, nodes: {compiled.trees.n_nodes:,}, "
+          f"max depth: {compiled.trees.max_depth}")
+    print(f"Compile time: {compile_ms:.1f} ms")
+    print(f"Batches above {model.COMPILED_MAX_ROWS} rows are routed to sklearn")
+    print(f"\n{'Rows':<8} {'sklearn (ms)':<14} {'compiled (ms)':<15} {'speedup':<9} {'identical':<10}")
+    print("-" * 58)
+
+    for n_rows in (1, 64, 256, 1000):
+        rows = batch[:n_rows]
+        repeat = 200 if n_rows == 1 else 20
+
+        sklearn_ms = time_call(
+            lambda: model.model.predict_proba(model.scaler.transform(rows)), repeat
+        )
+        compiled_ms = time_call(lambda: compiled.predict_fraud_proba(rows), repeat)
+        identical = np.array_equal(
+            model.model.predict_proba(model.scaler.transform(rows))[:, 1],
+            compiled.predict_fraud_proba(rows),
+        )
+        print(f"{n_rows:<8} {sklearn_ms:<14.3f} {compiled_ms:<15.3f} "
+              f"{sklearn_ms / compiled_ms:<9.1f} {str(identical):<10}")
+
+
+if __name__ == "__main__":
+    main()
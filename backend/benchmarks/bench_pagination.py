@@ -0,0 +1,168 @@
+"""
+Benchmark OFFSET vs keyset pagination of prediction history
+
+Fills a predictions table for one user, then reads a history page at
+increasing depths both ways:
+
+- offset: ORDER BY created_at DESC OFFSET n LIMIT page, plus the COUNT(*)
+  the filter endpoint used to run for every page
+- keyset: get_user_predictions with the cursor of the row at depth n
+
+Reports per-page latency (best of --repeat) and the SQLite query plan of
+a keyset page.
+
+Usage:
+    python benchmarks/bench_pagination.py [--rows 1000000] [--page 100] [--depths 0,1000,100000,900000] [--url sqlite:///...]
+
+The database at --url is dropped and recreated; point it at a scratch
+database when benchmarking PostgreSQL.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.database import Base  # noqa: E402
+from app.db.models import Prediction, User  # noqa: E402
+from app.services.pagination import encode_cursor  # noqa: E402
+from app.services.prediction_service import HISTORY_FIELDS, get_user_predictions, prediction_columns  # noqa: E402
+
+INSERT_CHUNK_ROWS = 50_000
+NOW = datetime(2024, 12, 31)
+
+
+def build_table(engine, n_rows: int) -> None:
+    """Create the schema and fill it with one user's predictions, some sharing a timestamp"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"id": 1, "username": "user1", "email": "user1@example.com", "hashed_password": "x"}
+        ])
+
+    rng = np.random.default_rng(42)
+    statement = insert(Prediction.__table__)
+    for offset in range(0, n_rows, INSERT_CHUNK_ROWS):
+        size = min(INSERT_CHUNK_ROWS, n_rows - offset)
+        amounts = rng.exponential(90, size).tolist()
+        probabilities = rng.beta(0.3, 8, size).tolist()
+        records = [
+            {
+                "user_id": 1, "time": 0.0, "amount": amounts[i], "features_json": "{}",
+                "is_fraud": probabilities[i] >= 0.5, "fraud_probability": probabilities[i],
+                "confidence": "High", "risk_score": int(probabilities[i] * 100), "prediction_time_ms": 1.0,
+                # Batches write several rows per second
+                "created_at": NOW - timedelta(seconds=(offset + i) // 4),
+            }
+            for i in range(size)
+        ]
+        with engine.begin() as conn:
+            conn.execute(statement, records)
+        print(f"\r  inserted {offset + size:,} rows", end="", flush=True)
+    print()
+
+
+def offset_page(db: Session, depth: int, limit: int) -> list:
+    """Page at `depth` with OFFSET, and the per-page COUNT"""
+    criteria = [Prediction.user_id == 1]
+    db.execute(select(func.count()).select_from(Prediction).where(*criteria)).scalar()
+    return db.execute(
+        select(*prediction_columns(HISTORY_FIELDS))
+        .where(*criteria)
+        .order_by(Prediction.created_at.desc(), Prediction.id.desc())
+        .offset(depth)
+        .limit(limit)
+    ).all()
+
+
+def cursor_at(db: Session, depth: int):
+    """Cursor a client holds after reading `depth` rows"""
+    if depth == 0:
+        return None
+    row = db.execute(
+        select(Prediction.created_at, Prediction.id)
+        .where(Prediction.user_id == 1)
+        .order_by(Prediction.created_at.desc(), Prediction.id.desc())
+        .offset(depth - 1)
+        .limit(1)
+    ).one()
+    return encode_cursor("created_at", True, "next", (row.created_at, row.id))
+
+
+def keyset_plan(engine, db: Session, limit: int, cursor: str) -> list:
+    """EXPLAIN QUERY PLAN lines of the SQL a keyset page runs"""
+    statements = []
+
+    def capture(conn, cursor_, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        get_user_predictions(db, 1, limit, cursor)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    statement, parameters = statements[-1]
+    return [row[-1] for row in db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+
+def best_ms(run, repeat: int) -> float:
+    """Best latency of `repeat` runs"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--depths", default="0,1000,100000,900000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", default=None, help="database URL (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{Path(tempfile.gettempdir()) / 'bench_pagination.db'}"
+    engine = create_engine(url)
+
+    print("\n" + "=" * 60)
+    print("PAGINATION BENCHMARK")
+    print("=" * 60)
+    print(f"Database: {engine.dialect.name}, rows: {args.rows:,}, page: {args.page}")
+    build_table(engine, args.rows)
+
+    print(f"\n{'depth':<12} {'offset+count (ms)':<19} {'keyset (ms)':<13} {'speedup':<8}")
+    print("-" * 60)
+    with Session(bind=engine) as db:
+        for depth in (int(value) for value in args.depths.split(",")):
+            if depth >= args.rows:
+                continue
+            cursor = cursor_at(db, depth)
+            expected = [row.id for row in offset_page(db, depth, args.page)]
+            assert [row.id for row in get_user_predictions(db, 1, args.page, cursor).rows] == expected
+
+            offset_ms = best_ms(lambda: offset_page(db, depth, args.page), args.repeat)
+            keyset_ms = best_ms(lambda: get_user_predictions(db, 1, args.page, cursor), args.repeat)
+            print(f"{depth:<12,} {offset_ms:<19.2f} {keyset_ms:<13.2f} {offset_ms / keyset_ms:.1f}x")
+
+        if engine.dialect.name == "sqlite":
+            print("\nKeyset page plan:")
+            for line in keyset_plan(engine, db, args.page, cursor_at(db, args.rows // 2)):
+                print(f"  {line}")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
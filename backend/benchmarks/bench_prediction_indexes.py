@@ -0,0 +1,163 @@
+"""
+Benchmark per-user time-range queries with and without composite indexes
+
+Fills a synthetic predictions table (10M rows over 1,000 users and one
+year by default), times the query shapes used by the analytics, report
+and forecast routes on the bare table, then creates the composite
+indexes through the migration and times them again.
+
+Usage:
+    python benchmarks/bench_prediction_indexes.py [--rows 10000000] [--url sqlite:///...]
+
+The database at --url is dropped and recreated; point it at a scratch
+database when benchmarking PostgreSQL.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine, func, insert, select, text
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.database import Base  # noqa: E402
+from app.db.migrations import add_prediction_indexes  # noqa: E402
+from app.db.models import Prediction, User  # noqa: E402
+
+INSERT_CHUNK_ROWS = 100_000
+NOW = datetime(2024, 12, 31)
+
+
+def build_table(engine, n_rows: int, n_users: int) -> None:
+    """Create the schema without the composite indexes and fill it"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for index in Prediction.__table__.indexes:
+            if index.name.startswith("ix_predictions_user_id_"):
+                index.drop(conn)
+
+        conn.execute(insert(User.__table__), [
+            {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "hashed_password": "x"}
+            for i in range(1, n_users + 1)
+        ])
+
+    rng = np.random.default_rng(42)
+    statement = insert(Prediction.__table__)
+    start = time.perf_counter()
+    for offset in range(0, n_rows, INSERT_CHUNK_ROWS):
+        size = min(INSERT_CHUNK_ROWS, n_rows - offset)
+        user_ids = rng.integers(1, n_users + 1, size)
+        seconds = rng.integers(0, 365 * 86400, size)
+        probabilities = rng.beta(0.3, 8, size)
+        amounts = rng.exponential(90, size)
+        records = [
+            {
+                "user_id": int(user_ids[i]),
+                "time": float(seconds[i] % 172800),
+                "amount": float(amounts[i]),
+                "features_json": "{}",
+                "is_fraud": bool(probabilities[i] >= 0.5),
+                "fraud_probability": float(probabilities[i]),
+                "confidence": "High",
+                "risk_score": int(probabilities[i] * 100),
+                "prediction_time_ms": 1.0,
+                "created_at": NOW - timedelta(seconds=int(seconds[i])),
+            }
+            for i in range(size)
+        ]
+        with engine.begin() as conn:
+            conn.execute(statement, records)
+        print(f"\r  inserted {offset + size:,} rows ({time.perf_counter() - start:.0f} s)", end="", flush=True)
+    print()
+
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM ANALYZE predictions"))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+
+
+def hot_queries(user_id: int) -> dict:
+    """Query shapes of the analytics, report and forecast routes"""
+    month_ago = NOW - timedelta(days=30)
+    quarter_ago = NOW - timedelta(days=90)
+    return {
+        "time series (30d)": select(Prediction).where(
+            Prediction.user_id == user_id, Prediction.created_at >= month_ago
+        ).order_by(Prediction.created_at),
+        "forecast history (90d)": select(Prediction).where(
+            Prediction.user_id == user_id, Prediction.created_at >= quarter_ago
+        ),
+        "fraud only (30d)": select(Prediction).where(
+            Prediction.user_id == user_id,
+            Prediction.created_at >= month_ago,
+            Prediction.is_fraud == True,  # noqa: E712
+        ).order_by(Prediction.created_at.desc()),
+        "high risk (30d)": select(Prediction).where(
+            Prediction.user_id == user_id,
+            Prediction.created_at >= month_ago,
+            Prediction.risk_score >= 70,
+        ).order_by(Prediction.risk_score.desc()),
+        "compare week": select(func.count(Prediction.id)).where(
+            Prediction.user_id == user_id,
+            Prediction.created_at >= NOW - timedelta(days=7),
+            Prediction.created_at <= NOW,
+        ),
+    }
+
+
+def time_query(engine, statement, repeat: int) -> float:
+    """Median wall time of fetching all rows, in milliseconds"""
+    timings = []
+    with engine.connect() as conn:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(statement).all()
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", default=None, help="database URL (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{Path(tempfile.gettempdir()) / 'bench_prediction_indexes.db'}"
+    engine = create_engine(url)
+
+    print("\n" + "=" * 72)
+    print("PREDICTION INDEX BENCHMARK")
+    print("=" * 72)
+    print(f"Database: {engine.dialect.name}, rows: {args.rows:,}, users: {args.users:,}")
+    build_table(engine, args.rows, args.users)
+
+    queries = hot_queries(user_id=1)
+    before = {name: time_query(engine, statement, args.repeat) for name, statement in queries.items()}
+
+    start = time.perf_counter()
+    created = add_prediction_indexes(engine)
+    build_s = time.perf_counter() - start
+    print(f"Created {', '.join(created)} in {build_s:.1f} s")
+
+    after = {name: time_query(engine, statement, args.repeat) for name, statement in queries.items()}
+
+    print(f"\n{'Query':<24} {'no index (ms)':<15} {'indexed (ms)':<14} {'speedup':<8}")
+    print("-" * 64)
+    for name in queries:
+        print(f"{name:<24} {before[name]:<15.1f} {after[name]:<14.2f} {before[name] / after[name]:<8.0f}")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark the in-memory rate limiter: deque scans vs sliding-window counters
+
+Runs the same request streams through two limiters:
+
+- deques: the previous InMemoryRateLimiter, two timestamp deques per
+  identifier and a scan of the minute deque for the burst check
+- counters: InMemoryRateLimiter, a fixed-size slot of bucket counts per
+  identifier and timing-wheel expiry
+
+Scenarios:
+
+- distinct: --keys identifiers, two requests each (create, then update),
+  reporting time per request, then memory per identifier (tracemalloc)
+- hot: --hot-requests requests spread over 100 identifiers under high
+  limits, where the deque scan grows with the limit
+
+Usage:
+    python benchmarks/bench_rate_limiter.py [--keys 1000000] [--baseline-keys 100000] [--hot-requests 200000]
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.middleware.rate_limiter import InMemoryRateLimiter  # noqa: E402
+
+
+class DequeRateLimiter:
+    """The limiter as it was: timestamp deques per identifier"""
+
+    def __init__(self, requests_per_minute: int = 60, requests_per_hour: int = 1000, burst_size: int = 10):
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_hour = requests_per_hour
+        self.burst_size = burst_size
+        self.minute_windows = defaultdict(lambda: deque(maxlen=requests_per_minute * 2))
+        self.hour_windows = defaultdict(lambda: deque(maxlen=requests_per_hour * 2))
+
+    def is_allowed(self, identifier: str) -> tuple:
+        current_time = time.time()
+        minute_window = self.minute_windows[identifier]
+        hour_window = self.hour_windows[identifier]
+        while minute_window and minute_window[0] < current_time - 60:
+            minute_window.popleft()
+        while hour_window and hour_window[0] < current_time - 3600:
+            hour_window.popleft()
+        minute_count = len(minute_window)
+        hour_count = len(hour_window)
+
+        if sum(1 for t in minute_window if current_time - t < 1) >= self.burst_size:
+            return False, {"limit": self.burst_size, "remaining": 0, "reset": int(current_time + 1)}
+        if minute_count >= self.requests_per_minute:
+            return False, {"limit": self.requests_per_minute, "remaining": 0, "reset": int(minute_window[0] + 60)}
+        if hour_count >= self.requests_per_hour:
+            return False, {"limit": self.requests_per_hour, "remaining": 0, "reset": int(hour_window[0] + 3600)}
+
+        minute_window.append(current_time)
+        hour_window.append(current_time)
+        return True, {
+            "limit_minute": self.requests_per_minute,
+            "remaining_minute": self.requests_per_minute - minute_count - 1,
+            "limit_hour": self.requests_per_hour,
+            "remaining_hour": self.requests_per_hour - hour_count - 1,
+            "reset_minute": int(current_time + 60),
+            "reset_hour": int(current_time + 3600)
+        }
+
+
+def distinct_keys(limiter_class, n_keys: int) -> dict:
+    """Two requests for each of n_keys identifiers, then the state size under tracemalloc"""
+    identifiers = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(n_keys)]
+    limiter = limiter_class()
+
+    start = time.perf_counter()
+    for identifier in identifiers:
+        limiter.is_allowed(identifier)
+    create_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for identifier in identifiers:
+        limiter.is_allowed(identifier)
+    update_s = time.perf_counter() - start
+    del limiter
+
+    tracemalloc.start()
+    limiter = limiter_class()
+    for identifier in identifiers:
+        limiter.is_allowed(identifier)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "create_us": create_s / n_keys * 1e6,
+        "update_us": update_s / n_keys * 1e6,
+        "bytes_per_key": peak / n_keys,
+    }
+
+
+def hot_keys(limiter_class, n_requests: int, per_minute: int) -> float:
+    """Microseconds per request over 100 identifiers with high limits"""
+    limiter = limiter_class(
+        requests_per_minute=per_minute, requests_per_hour=per_minute * 60, burst_size=per_minute // 10
+    )
+    identifiers = [f"192.168.0.{i}" for i in range(100)]
+    start = time.perf_counter()
+    for i in range(n_requests):
+        limiter.is_allowed(identifiers[i % 100])
+    return (time.perf_counter() - start) / n_requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--keys", type=int, default=1_000_000)
+    parser.add_argument("--baseline-keys", type=int, default=100_000,
+                        help="identifiers for the deque limiter (about 1.5 KB each)")
+    parser.add_argument("--hot-requests", type=int, default=200_000)
+    parser.add_argument("--per-minute", default="60,1000,10000")
+    args = parser.parse_args()
+
+    print("\n" + "=" * 72)
+    print("RATE LIMITER BENCHMARK")
+    print("=" * 72)
+
+    print("\nDistinct identifiers (2 requests each)")
+    print(f"{'limiter':<10} {'keys':<11} {'create (us)':<13} {'update (us)':<13} {'bytes/key':<10}")
+    print("-" * 72)
+    for name, limiter_class, n_keys in (
+        ("deques", DequeRateLimiter, args.baseline_keys),
+        ("counters", InMemoryRateLimiter, args.baseline_keys),
+        ("counters", InMemoryRateLimiter, args.keys),
+    ):
+        result = distinct_keys(limiter_class, n_keys)
+        print(f"{name:<10} {n_keys:<11,} {result['create_us']:<13.2f} {result['update_us']:<13.2f} "
+              f"{result['bytes_per_key']:<10.0f}")
+
+    print(f"\nHot identifiers ({args.hot_requests:,} requests over 100 identifiers)")
+    print(f"{'per minute':<12} {'deques (us)':<13} {'counters (us)':<15} {'speedup':<8}")
+    print("-" * 72)
+    for per_minute in (int(value) for value in args.per_minute.split(",")):
+        deques_us = hot_keys(DequeRateLimiter, args.hot_requests, per_minute)
+        counters_us = hot_keys(InMemoryRateLimiter, args.hot_requests, per_minute)
+        print(f"{per_minute:<12,} {deques_us:<13.2f} {counters_us:<15.2f} {deques_us / counters_us:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark prediction listings: full ORM entities vs column projections
+
+Fills a predictions table with realistic rows (V1-V28 columns, the
+features_json copy and stored SHAP values), then serves history pages
+both ways:
+
+- entities: db.query(Prediction) hydrates every column, and the dicts
+  go through FastAPI's jsonable_encoder before json.dumps
+- projection: select() of the returned columns, serialize_prediction_rows
+  and a JSONResponse
+
+Reports time (best of --repeat) and peak Python memory (tracemalloc) per
+page size.
+
+Usage:
+    python benchmarks/bench_read_paths.py [--rows 100000] [--pages 1000,10000,100000] [--url sqlite:///...]
+
+The database at --url is dropped and recreated; point it at a scratch
+database when benchmarking PostgreSQL.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.database import Base  # noqa: E402
+from app.db.models import Prediction, User  # noqa: E402
+from app.services.prediction_service import (  # noqa: E402
+    HISTORY_FIELDS,
+    PCA_COLUMNS,
+    get_user_predictions,
+    serialize_prediction_rows,
+)
+
+INSERT_CHUNK_ROWS = 20_000
+NOW = datetime(2024, 12, 31)
+
+
+def build_table(engine, n_rows: int) -> None:
+    """Create the schema and fill it with one user's predictions"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"id": 1, "username": "user1", "email": "user1@example.com", "hashed_password": "x"}
+        ])
+
+    rng = np.random.default_rng(42)
+    statement = insert(Prediction.__table__)
+    for offset in range(0, n_rows, INSERT_CHUNK_ROWS):
+        size = min(INSERT_CHUNK_ROWS, n_rows - offset)
+        features = rng.normal(0, 1.5, (size, 28))
+        shap = rng.normal(0, 0.2, (size, 30))
+        probabilities = rng.beta(0.3, 8, size)
+        records = []
+        for i in range(size):
+            values = dict(zip(PCA_COLUMNS, features[i].tolist()))
+            records.append({
+                "user_id": 1, "time": float(i), "amount": float(rng.exponential(90)),
+                "features_json": json.dumps(values), **values,
+                "shap_values": json.dumps({f"f{k}": v for k, v in enumerate(shap[i].tolist())}),
+                "is_fraud": bool(probabilities[i] >= 0.5), "fraud_probability": float(probabilities[i]),
+                "confidence": "High", "risk_score": int(probabilities[i] * 100), "prediction_time_ms": 1.0,
+                "created_at": NOW - timedelta(seconds=offset + i),
+            })
+        with engine.begin() as conn:
+            conn.execute(statement, records)
+        print(f"\r  inserted {offset + size:,} rows", end="", flush=True)
+    print()
+
+
+def entities_page(engine, limit: int) -> bytes:
+    """History page as served before: full entities and jsonable_encoder"""
+    with Session(bind=engine) as db:
+        predictions = (
+            db.query(Prediction)
+            .filter(Prediction.user_id == 1)
+            .order_by(Prediction.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+        content = [
+            {
+                "id": p.id,
+                "time": p.time,
+                "amount": p.amount,
+                "is_fraud": p.is_fraud,
+                "fraud_probability": p.fraud_probability,
+                "confidence": p.confidence,
+                "risk_score": p.risk_score,
+                "prediction_time_ms": p.prediction_time_ms,
+                "created_at": p.created_at.isoformat()
+            }
+            for p in predictions
+        ]
+        return JSONResponse(jsonable_encoder(content)).body
+
+
+def projection_page(engine, limit: int) -> bytes:
+    """History page from a column projection and the shared serializer"""
+    with Session(bind=engine) as db:
+        page = get_user_predictions(db, 1, limit=limit)
+        return JSONResponse(serialize_prediction_rows(page.rows, HISTORY_FIELDS)).body
+
+
+def measure(serve, repeat: int) -> dict:
+    """Best time over `repeat` untraced runs, then one run under tracemalloc"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = serve()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    serve()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": min(times) * 1000, "peak_mb": peak / 1024 / 1024, "body": body}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--pages", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--url", default=None, help="database URL (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{Path(tempfile.gettempdir()) / 'bench_read_paths.db'}"
+    engine = create_engine(url)
+
+    print("\n" + "=" * 76)
+    print("READ PATH BENCHMARK")
+    print("=" * 76)
+    print(f"Database: {engine.dialect.name}, rows: {args.rows:,}")
+    build_table(engine, args.rows)
+
+    print(f"\n{'page rows':<11} {'entities (ms)':<15} {'projection (ms)':<17} "
+          f"{'peak MB before':<16} {'peak MB after':<14}")
+    print("-" * 76)
+    for limit in (int(page) for page in args.pages.split(",")):
+        before = measure(lambda: entities_page(engine, limit), args.repeat)
+        after = measure(lambda: projection_page(engine, limit), args.repeat)
+        assert json.loads(before["body"]) == json.loads(after["body"])
+        print(f"{limit:<11,} {before['ms']:<15.1f} {after['ms']:<17.1f} "
+              f"{before['peak_mb']:<16.1f} {after['peak_mb']:<14.1f}")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
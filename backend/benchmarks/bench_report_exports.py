@@ -0,0 +1,142 @@
+"""
+Benchmark streaming CSV and Excel exports
+
+Fills a synthetic predictions table for one user, then runs the CSV and
+Excel exports over growing row counts and reports time to first byte,
+total time and peak Python memory (tracemalloc). Peak memory should stay
+flat as the row count grows.
+
+Usage:
+    python benchmarks/bench_report_exports.py [--rows 1000000] [--chunk-rows 5000] [--url sqlite:///...]
+
+The database at --url is dropped and recreated; point it at a scratch
+database when benchmarking PostgreSQL.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.database import Base  # noqa: E402
+from app.db.models import Prediction, User  # noqa: E402
+from app.services.report_export import excel_export, iter_csv_export  # noqa: E402
+
+INSERT_CHUNK_ROWS = 100_000
+NOW = datetime(2024, 12, 31)
+
+
+def build_table(engine, n_rows: int) -> None:
+    """Create the schema and fill it with one user's predictions over a year"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"id": 1, "username": "user1", "email": "user1@example.com", "hashed_password": "x"}
+        ])
+
+    rng = np.random.default_rng(42)
+    statement = insert(Prediction.__table__)
+    for offset in range(0, n_rows, INSERT_CHUNK_ROWS):
+        size = min(INSERT_CHUNK_ROWS, n_rows - offset)
+        seconds = rng.integers(0, 365 * 86400, size)
+        probabilities = rng.beta(0.3, 8, size)
+        amounts = rng.exponential(90, size)
+        records = [
+            {
+                "user_id": 1,
+                "time": float(seconds[i] % 172800),
+                "amount": float(amounts[i]),
+                "features_json": "{}",
+                "is_fraud": bool(probabilities[i] >= 0.5),
+                "fraud_probability": float(probabilities[i]),
+                "confidence": "High",
+                "risk_score": int(probabilities[i] * 100),
+                "prediction_time_ms": 1.0,
+                "created_at": NOW - timedelta(seconds=int(seconds[i])),
+            }
+            for i in range(size)
+        ]
+        with engine.begin() as conn:
+            conn.execute(statement, records)
+        print(f"\r  inserted {offset + size:,} rows", end="", flush=True)
+    print()
+
+
+def measure(make_stream) -> dict:
+    """
+    Consume an export stream twice: once timed, once under tracemalloc
+
+    Tracing slows allocation-heavy code several times over, so timings
+    come from the untraced run.
+    """
+    start = time.perf_counter()
+    first_byte_ms = None
+    size = 0
+    for chunk in make_stream():
+        if first_byte_ms is None:
+            first_byte_ms = (time.perf_counter() - start) * 1000
+        size += len(chunk)
+    total_s = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in make_stream():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ttfb_ms": first_byte_ms, "total_s": total_s, "peak_mb": peak / 1024 / 1024, "size_mb": size / 1024 / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-rows", type=int, default=5000)
+    parser.add_argument("--url", default=None, help="database URL (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{Path(tempfile.gettempdir()) / 'bench_report_exports.db'}"
+    engine = create_engine(url)
+
+    print("\n" + "=" * 72)
+    print("REPORT EXPORT BENCHMARK")
+    print("=" * 72)
+    print(f"Database: {engine.dialect.name}, rows: {args.rows:,}, chunk rows: {args.chunk_rows:,}")
+    build_table(engine, args.rows)
+
+    # Growing windows of the same year of data
+    windows = (30, 90, 365)
+    print(f"\n{'Export':<8} {'days':<6} {'TTFB (ms)':<11} {'total (s)':<11} {'peak (MB)':<11} {'size (MB)':<10}")
+    print("-" * 60)
+    for name in ("csv", "excel"):
+        for days in windows:
+            criteria = [Prediction.user_id == 1, Prediction.created_at >= NOW - timedelta(days=days)]
+            order_by = [Prediction.created_at.desc()]
+            if name == "csv":
+                def make_stream():
+                    return iter_csv_export(Session(bind=engine), criteria, order_by, chunk_rows=args.chunk_rows)
+            else:
+                def make_stream():
+                    return excel_export(
+                        Session(bind=engine), criteria, order_by,
+                        title="Benchmark", username="user1", chunk_rows=args.chunk_rows
+                    )
+            result = measure(make_stream)
+            print(
+                f"{name:<8} {days:<6} {result['ttfb_ms']:<11.1f} {result['total_s']:<11.2f} "
+                f"{result['peak_mb']:<11.1f} {result['size_mb']:<10.1f}"
+            )
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
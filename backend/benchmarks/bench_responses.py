@@ -0,0 +1,170 @@
+"""
+Benchmark JSON encoding of the largest API responses
+
+Builds the real payloads of five large endpoints and encodes each two ways:
+
+- default: FastAPI's path for the route's response_model (re-validation,
+  serialization to JSON-compatible objects, JSONResponse/json.dumps)
+- fast: FastJSONResponse, as the routes now return it (orjson when
+  installed, pydantic's serializer for models)
+
+Endpoints: /predict/batch (1000 results), /fraud-network/graph,
+/simulation/start (500 transactions), /predict/history?limit=1000 and
+/analytics/heatmap.
+
+Usage:
+    python benchmarks/bench_responses.py [--graph-nodes 2000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.api.routes import analytics, fraud_network, simulation  # noqa: E402
+from app.core.responses import ORJSON_AVAILABLE, FastJSONResponse  # noqa: E402
+from app.db.database import Base  # noqa: E402
+from app.db.models import User  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.schemas import BatchPredictionResponse, SingleBatchResult, UserResponse  # noqa: E402
+from app.services.prediction_service import (  # noqa: E402
+    HISTORY_FIELDS,
+    PCA_COLUMNS,
+    bulk_insert_predictions,
+    get_user_predictions,
+    serialize_prediction_rows,
+)
+
+
+def response_field(path: str, method: str):
+    """Response model field FastAPI validates the route's output against"""
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path == path and method in route.methods:
+            return route.response_field
+    raise LookupError(path)
+
+
+def make_database(n_rows: int) -> Session:
+    """In-memory database with a week of one user's predictions, mostly fraud"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = Session(bind=engine)
+    db.add(User(id=1, username="user1", email="user1@example.com", hashed_password="x"))
+    db.commit()
+
+    rng = np.random.default_rng(42)
+    now = datetime.utcnow()
+    features = rng.normal(0, 1.5, (n_rows, 28))
+    records = []
+    for i in range(n_rows):
+        values = dict(zip(PCA_COLUMNS, features[i].tolist()))
+        records.append({
+            "user_id": 1, "time": float(i), "amount": float(rng.exponential(120)),
+            "features_json": json.dumps(values), **values,
+            "is_fraud": i % 5 != 0, "fraud_probability": 0.9, "confidence": "High",
+            "risk_score": int(rng.integers(50, 100)), "prediction_time_ms": 1.0,
+            "batch_id": f"batch-{i % 40:04d}" if i % 10 == 0 else None,
+            "created_at": now - timedelta(seconds=int(rng.integers(0, 6 * 86400))),
+        })
+    bulk_insert_predictions(db, records)
+    return db
+
+
+def build_payloads(db: Session, graph_nodes: int) -> list:
+    """(name, route path, method, content) of each benchmarked response"""
+    user = UserResponse(id="1", username="user1", email="user1@example.com", created_at=datetime.utcnow())
+    rng = np.random.default_rng(7)
+    probabilities = rng.beta(0.3, 8, 1000)
+    batch = BatchPredictionResponse(
+        total_transactions=1000, fraud_count=int((probabilities >= 0.5).sum()),
+        legitimate_count=int((probabilities < 0.5).sum()), fraud_rate=float((probabilities >= 0.5).mean()),
+        results=[
+            SingleBatchResult(index=i, is_fraud=bool(p >= 0.5), fraud_probability=float(p), risk_score=int(p * 100))
+            for i, p in enumerate(probabilities)
+        ],
+        processing_time_ms=12.5,
+    )
+
+    async def route_content(coroutine):
+        return json.loads((await coroutine).body)
+
+    graph = asyncio.run(route_content(fraud_network.get_fraud_network_graph(
+        days=7, min_risk=30, include_legitimate=False, similarity_threshold=0.25,
+        max_nodes=graph_nodes, max_edges=20000, current_user=user, db=db
+    )))
+    heatmap = asyncio.run(route_content(analytics.get_heatmap_data(days=30, current_user=user, db=db)))
+
+    scenario_id = next(iter(simulation.FRAUD_SCENARIOS))
+    asyncio.run(simulation.start_simulation(simulation.SimulationConfig(scenario_id=scenario_id, num_transactions=500)))
+    simulation_result = list(simulation.active_simulations.values())[-1]
+
+    history = serialize_prediction_rows(get_user_predictions(db, 1, limit=1000).rows, HISTORY_FIELDS)
+
+    return [
+        ("/predict/batch", "/api/v1/predict/batch", "POST", batch),
+        ("/fraud-network/graph", "/api/v1/fraud-network/graph", "GET", graph),
+        ("/simulation/start", "/api/v1/simulation/start", "POST", simulation_result),
+        ("/predict/history", "/api/v1/predict/history", "GET", history),
+        ("/analytics/heatmap", "/api/v1/analytics/heatmap", "GET", heatmap),
+    ]
+
+
+def best_ms(run, repeat: int) -> float:
+    """Best latency of `repeat` runs"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--graph-nodes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print("\n" + "=" * 78)
+    print("RESPONSE ENCODING BENCHMARK")
+    print("=" * 78)
+    print(f"Encoder: {'orjson' if ORJSON_AVAILABLE else 'json (orjson not installed)'}")
+    db = make_database(args.graph_nodes)
+    payloads = build_payloads(db, args.graph_nodes)
+
+    print(f"\n{'endpoint':<22} {'size (KB)':<11} {'default (ms)':<14} {'fast (ms)':<11} {'speedup':<8}")
+    print("-" * 78)
+    loop = asyncio.new_event_loop()
+    for name, path, method, content in payloads:
+        field = response_field(path, method)
+
+        def default():
+            encoded = loop.run_until_complete(serialize_response(field=field, response_content=content))
+            return JSONResponse(encoded).body
+
+        def fast():
+            return FastJSONResponse(content).body
+
+        assert json.loads(default()) == json.loads(fast())
+        default_ms = best_ms(default, args.repeat)
+        fast_ms = best_ms(fast, args.repeat)
+        print(f"{name:<22} {len(fast()) / 1024:<11.1f} {default_ms:<14.2f} {fast_ms:<11.2f} "
+              f"{default_ms / fast_ms:.1f}x")
+    loop.close()
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark the similarity index against exact search
+
+Indexes synthetic transaction vectors (clustered like fraud patterns,
+plus noise), then runs the same queries through exact search and the IVF
+index at several nprobe values. Reports recall@k against the exact
+neighbours and per-query latency.
+
+Usage:
+    python benchmarks/bench_similarity_index.py [--rows 1000000] [--queries 200] [--k 10] [--nprobe 1,4,8,16,32]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.similarity_index import SimilarityIndex, VECTOR_DIM  # noqa: E402
+
+ADD_CHUNK_ROWS = 100_000
+
+
+def make_vectors(n: int, seed: int = 42) -> np.ndarray:
+    """Vectors around 500 pattern centres with unit noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 3, (500, VECTOR_DIM))
+    return (centers[rng.integers(0, len(centers), n)] + rng.normal(0, 1, (n, VECTOR_DIM))).astype(np.float32)
+
+
+def run_queries(search, queries: np.ndarray, k: int):
+    """Neighbour id sets and latencies (ms) of each query"""
+    results, latencies = [], []
+    for i, vector in enumerate(queries):
+        start = time.perf_counter()
+        neighbours = search(vector, k, exclude_id=-1)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append({neighbour_id for neighbour_id, _ in neighbours})
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", default="1,4,8,16,32")
+    args = parser.parse_args()
+
+    print("\n" + "=" * 72)
+    print("SIMILARITY INDEX BENCHMARK")
+    print("=" * 72)
+    vectors = make_vectors(args.rows)
+    queries = make_vectors(args.queries, seed=7)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = SimilarityIndex(index_dir)
+        start = time.perf_counter()
+        for offset in range(0, args.rows, ADD_CHUNK_ROWS):
+            ids = np.arange(offset + 1, min(offset + ADD_CHUNK_ROWS, args.rows) + 1)
+            index.add(ids, np.zeros(len(ids), dtype=np.int64), vectors[offset:offset + len(ids)])
+        build_s = time.perf_counter() - start
+        stats = index.get_stats()
+        print(f"Vectors: {stats['vectors']:,}, lists: {stats['lists']:,}, "
+              f"unsorted tail: {stats['unsorted_tail']:,}, build: {build_s:.1f}s")
+
+        start = time.perf_counter()
+        index.save()
+        save_s = time.perf_counter() - start
+        loaded = SimilarityIndex(index_dir)
+        start = time.perf_counter()
+        loaded.load()
+        print(f"Save: {save_s:.2f}s, memory-mapped load: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        exact, exact_ms = run_queries(loaded.exact_search, queries, args.k)
+        print(f"\n{'search':<14} {'recall@' + str(args.k):<11} {'p50 (ms)':<10} {'p99 (ms)':<10} {'speedup':<8}")
+        print("-" * 56)
+        print(f"{'exact':<14} {1.0:<11.3f} {np.median(exact_ms):<10.2f} {np.percentile(exact_ms, 99):<10.2f} {'1.0x':<8}")
+        for nprobe in (int(value) for value in args.nprobe.split(",")):
+            def search(vector, k, exclude_id):
+                return loaded.search(vector, k, exclude_id=exclude_id, nprobe=nprobe)
+
+            results, latencies = run_queries(search, queries, args.k)
+            recall = np.mean([len(found & truth) / len(truth) for found, truth in zip(results, exact)])
+            speedup = np.median(exact_ms) / np.median(latencies)
+            print(f"{'nprobe=' + str(nprobe):<14} {recall:<11.3f} {np.median(latencies):<10.2f} "
+                  f"{np.percentile(latencies, 99):<10.2f} {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -170,6 +170,8 @@ def save_model(model, scaler, metrics: dict, models_dir: str):
         "training_samples": 284807,
         "fraud_samples": 492,
         "last_trained": datetime.now(),
+        # Fraud probability cut-off used at inference; tune without retraining
+        "decision_threshold": 0.5,
         **metrics,
     }
     info_path = models_path / "model_info.pkl"
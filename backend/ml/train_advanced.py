@@ -275,6 +275,7 @@ def save_model(model, scaler, metrics: dict, shap_importance: dict, models_dir:
         "training_date": datetime.now().isoformat(),
         "training_samples": 284807,
         "fraud_samples": 492,
+        "decision_threshold": 0.5,
         "metrics": metrics,
         "shap_feature_importance": shap_importance,
     }
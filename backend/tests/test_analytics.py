@@ -0,0 +1,227 @@
+"""
+Analytics Tests
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import os
+
+import pytest
+
+
+class TestAnalyticsAggregation:
+    """Test that SQL-side aggregates match counting the rows in Python"""
+
+    @pytest.fixture
+    def predictions(self, db_session, test_user):
+        from datetime import datetime, timedelta
+        from app.db.models import Prediction
+        from app.services.prediction_service import bulk_insert_predictions
+
+        now = datetime.utcnow().replace(minute=30)
+        records = [
+            {
+                "user_id": test_user.id, "time": 0.0, "amount": float(10 * (i + 1)), "features_json": "{}",
+                "is_fraud": i % 3 == 0, "fraud_probability": 0.5, "confidence": "High",
+                "risk_score": i * 10, "prediction_time_ms": float(i),
+                "created_at": now - timedelta(days=i % 4, hours=i),
+            }
+            for i in range(10)
+        ]
+        bulk_insert_predictions(db_session, records)
+        return db_session.query(Prediction).all()
+
+    def test_time_series(self, client, auth_headers, predictions):
+        """Test daily buckets, labels and fraud counts"""
+        from collections import Counter
+
+        data = client.get("/api/v1/analytics/time-series?period=day&days=30", headers=auth_headers).json()
+
+        totals = Counter(p.created_at.strftime("%Y-%m-%d") for p in predictions)
+        frauds = Counter(p.created_at.strftime("%Y-%m-%d") for p in predictions if p.is_fraud)
+        assert [item["date"] for item in data] == sorted(totals)
+        for item in data:
+            assert item["total"] == totals[item["date"]]
+            assert item["fraud"] == frauds[item["date"]]
+            assert item["legitimate"] == item["total"] - item["fraud"]
+
+    def test_heatmap(self, client, auth_headers, predictions):
+        """Test weekday/hour cells start on Monday"""
+        data = client.get("/api/v1/analytics/heatmap?days=30", headers=auth_headers).json()["data"]
+
+        cells = {(cell["day"], cell["hour"]): cell for cell in data if cell["total"]}
+        expected = {}
+        for p in predictions:
+            key = (p.created_at.weekday(), p.created_at.hour)
+            expected[key] = expected.get(key, 0) + 1
+        assert {key: cell["total"] for key, cell in cells.items()} == expected
+
+    def test_summary_and_stats(self, client, auth_headers, predictions):
+        """Test averages, risk distribution and the per-user stats"""
+        summary = client.get("/api/v1/analytics/summary?days=30", headers=auth_headers).json()
+
+        fraud = [p for p in predictions if p.is_fraud]
+        assert summary["total_predictions"] == 10
+        assert summary["fraud_count"] == len(fraud)
+        assert summary["avg_amount"] == 55.0
+        assert summary["avg_fraud_amount"] == round(sum(p.amount for p in fraud) / len(fraud), 2)
+        assert summary["risk_distribution"] == {"low": 3, "medium": 2, "high": 3, "critical": 2}
+
+        stats = client.get("/api/v1/predict/stats", headers=auth_headers).json()
+        assert stats["total_predictions"] == 10
+        assert stats["fraud_detected"] == len(fraud)
+        assert stats["average_response_time_ms"] == 4.5
+
+    @pytest.mark.skipif(not os.environ.get("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL not set")
+    def test_postgres_week_labels_match_sqlite(self):
+        """Test week buckets get the same labels on both dialects across a year boundary"""
+        from datetime import datetime, timedelta
+        from sqlalchemy import create_engine, func, insert, select
+        from sqlalchemy.orm import Session
+        from app.db.database import Base
+        from app.db.models import Prediction, User
+        from app.services.aggregation import bucket_label, time_bucket
+
+        days = [datetime(2020, 12, 27, 12) + timedelta(days=i) for i in range(10)]
+        labels = {}
+        for url in (os.environ["TEST_POSTGRES_URL"], "sqlite:///:memory:"):
+            engine = create_engine(url)
+            Base.metadata.create_all(bind=engine)
+            try:
+                with Session(engine) as db:
+                    user = User(username="weeks", email="weeks@example.com", hashed_password="x")
+                    db.add(user)
+                    db.flush()
+                    db.execute(insert(Prediction.__table__), [
+                        {
+                            "user_id": user.id, "time": 0.0, "amount": 1.0, "features_json": "{}",
+                            "is_fraud": False, "fraud_probability": 0.1, "confidence": "High",
+                            "risk_score": 10, "prediction_time_ms": 1.0, "created_at": day,
+                        }
+                        for day in days
+                    ])
+                    bucket = time_bucket(db, "week").label("bucket")
+                    rows = db.execute(select(bucket, func.count()).group_by(bucket)).all()
+                    labels[engine.dialect.name] = sorted((bucket_label(b, "week"), n) for b, n in rows)
+                    db.rollback()
+            finally:
+                Base.metadata.drop_all(bind=engine)
+                engine.dispose()
+
+        assert labels["sqlite"] == [("2020-W51", 1), ("2020-W52", 4), ("2021-W00", 3), ("2021-W01", 2)]
+        assert labels["postgresql"] == labels["sqlite"]
+
+
+class TestRollups:
+    """Test incrementally maintained hourly rollups"""
+
+    @staticmethod
+    def _record(user_id, created_at, i=0):
+        return {
+            "user_id": user_id, "time": 0.0, "amount": 10.0 + i, "features_json": "{}",
+            "is_fraud": i % 2 == 0, "fraud_probability": 0.5, "confidence": "High",
+            "risk_score": (i * 17) % 100, "prediction_time_ms": 1.0, "created_at": created_at,
+        }
+
+    def test_rebuild_matches_incremental(self, db_session, test_user):
+        """Test rollups written with predictions equal a rebuild from scratch"""
+        from datetime import datetime, timedelta
+        from app.services.prediction_service import bulk_insert_predictions
+        from app.services.rollups import hourly_buckets, rebuild_rollups
+
+        start = datetime(2024, 3, 1, 10, 5)
+        for chunk in range(3):
+            bulk_insert_predictions(db_session, [
+                self._record(test_user.id, start + timedelta(minutes=23 * i), i) for i in range(chunk, 40, 3)
+            ])
+
+        incremental = hourly_buckets(db_session, test_user.id)
+        assert sum(bucket["total"] for bucket in incremental) == 40
+
+        assert rebuild_rollups(db_session.get_bind()) == len(incremental)
+        db_session.expire_all()
+        assert hourly_buckets(db_session, test_user.id) == incremental
+
+    def test_dialect_without_on_conflict(self, db_session, test_user, monkeypatch):
+        """Test rollups are updated then inserted where ON CONFLICT isn't available"""
+        from datetime import datetime, timedelta
+        from app.services import rollups
+        from app.services.prediction_service import bulk_insert_predictions
+
+        monkeypatch.setattr(rollups, "UPSERT_INSERTS", {})
+        start = datetime(2024, 3, 1, 10, 5)
+        for chunk in range(2):
+            bulk_insert_predictions(db_session, [
+                self._record(test_user.id, start + timedelta(minutes=31 * i), i) for i in range(chunk, 20, 2)
+            ])
+
+        buckets = rollups.hourly_buckets(db_session, test_user.id)
+        assert sum(bucket["total"] for bucket in buckets) == 20
+
+        rollups.rebuild_rollups(db_session.get_bind())
+        db_session.expire_all()
+        assert rollups.hourly_buckets(db_session, test_user.id) == buckets
+
+    def test_partial_hours_read_from_predictions(self, db_session, test_user):
+        """Test ranges that don't start or end on the hour are exact"""
+        from datetime import datetime
+        from app.services.prediction_service import bulk_insert_predictions
+        from app.services.rollups import hourly_buckets, rollup_summary
+
+        bulk_insert_predictions(db_session, [
+            self._record(test_user.id, datetime(2024, 3, 1, 10, 10), 0),
+            self._record(test_user.id, datetime(2024, 3, 1, 10, 50), 1),
+            self._record(test_user.id, datetime(2024, 3, 1, 12, 0), 2),
+        ])
+
+        buckets = hourly_buckets(db_session, test_user.id, start=datetime(2024, 3, 1, 10, 30))
+        assert [(b["bucket_start"].hour, b["total"]) for b in buckets] == [(10, 1), (12, 1)]
+
+        assert rollup_summary(db_session, test_user.id, end=datetime(2024, 3, 1, 10, 30))["total"] == 1
+        assert rollup_summary(
+            db_session, test_user.id, start=datetime(2024, 3, 1, 10, 20), end=datetime(2024, 3, 1, 10, 40)
+        )["total"] == 0
+        assert rollup_summary(db_session, test_user.id, end=datetime(2024, 3, 1, 12, 0))["total"] == 3
+
+    def test_concurrent_writers(self, tmp_path):
+        """Test increments from parallel transactions are not lost"""
+        from concurrent.futures import ThreadPoolExecutor
+        from datetime import datetime
+        from sqlalchemy import create_engine, func, select
+        from sqlalchemy.orm import Session
+        from app.db.database import Base
+        from app.db.models import PredictionRollup
+        from app.services.prediction_service import bulk_insert_predictions
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'rollups.db'}", connect_args={"timeout": 30})
+        Base.metadata.create_all(bind=engine)
+        created_at = datetime(2024, 3, 1, 10, 15)
+
+        def write(worker):
+            for i in range(25):
+                with Session(bind=engine) as db:
+                    bulk_insert_predictions(db, [self._record(worker, created_at, i), self._record(1, created_at, i)])
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(write, range(1, 5)))
+
+        with engine.connect() as conn:
+            totals = dict(conn.execute(
+                select(PredictionRollup.user_id, func.sum(PredictionRollup.total)).group_by(PredictionRollup.user_id)
+            ).all())
+        assert totals == {1: 125, 2: 25, 3: 25, 4: 25}
+
+    def test_backfill_existing_predictions(self, db_session, test_user):
+        """Test rollups are built once for predictions written before they existed"""
+        from datetime import datetime
+        from app.db.models import Prediction
+        from app.services.rollups import backfill_rollups_if_empty, rollup_summary
+
+        db_session.add(Prediction(**self._record(test_user.id, datetime(2024, 3, 1, 10, 15))))
+        db_session.commit()
+        assert rollup_summary(db_session, test_user.id)["total"] == 0
+
+        assert backfill_rollups_if_empty(db_session.get_bind()) == 1
+        assert backfill_rollups_if_empty(db_session.get_bind()) == 0
+        assert rollup_summary(db_session, test_user.id)["total"] == 1
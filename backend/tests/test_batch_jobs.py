@@ -0,0 +1,149 @@
+"""
+Batch Job Tests
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import pytest
+
+
+class TestBatchJobs:
+    """Test background batch job endpoints"""
+
+    @pytest.fixture(autouse=True)
+    def job_manager(self, tmp_path, monkeypatch):
+        """Score jobs in a thread and keep job files in a temp directory"""
+        from pathlib import Path
+        from app.services.batch_jobs import batch_job_manager
+        monkeypatch.setattr(batch_job_manager, "job_dir", Path(tmp_path))
+        monkeypatch.setattr(batch_job_manager, "workers", 0)
+        return batch_job_manager
+
+    @staticmethod
+    def _wait(client, auth_headers, job_id, timeout=10.0):
+        import time
+        deadline = time.monotonic() + timeout
+        while True:
+            job = client.get(f"/api/v1/jobs/{job_id}", headers=auth_headers).json()
+            if job["status"] in ("completed", "failed") or time.monotonic() > deadline:
+                return job
+            time.sleep(0.05)
+
+    def test_submit_and_poll_job(self, client, auth_headers, sample_transaction, monkeypatch):
+        """Test a job runs in chunks and reports progress and results"""
+        from app.core.config import settings
+        from tests.test_prediction import TestCsvUpload
+        monkeypatch.setattr(settings, "csv_stream_chunk_rows", 4)
+
+        response = client.post(
+            "/api/v1/jobs",
+            files={"file": TestCsvUpload._csv([sample_transaction] * 10)},
+            headers=auth_headers
+        )
+        assert response.status_code in [202, 503]
+
+        if response.status_code == 202:
+            submitted = response.json()
+            assert submitted["status"] == "queued"
+            assert submitted["total_rows"] == 10
+
+            job = self._wait(client, auth_headers, submitted["job_id"])
+            assert job["status"] == "completed"
+            assert job["rows_processed"] == 10
+            assert job["progress_percent"] == 100.0
+            assert job["rows_per_second"] >= 0
+
+            result = client.get(f"/api/v1/jobs/{job['job_id']}/result", headers=auth_headers)
+            assert result.status_code == 200
+            assert len(result.text.strip().splitlines()) == 11
+
+            history = client.get("/api/v1/predict/history", headers=auth_headers).json()
+            assert len(history) == 10
+
+    def test_job_with_invalid_rows_fails(self, client, auth_headers, sample_transaction, job_manager):
+        """Test validation errors are recorded on the job and its files removed"""
+        from tests.test_prediction import TestCsvUpload
+
+        bad = dict(sample_transaction, amount=-1.0)
+        response = client.post(
+            "/api/v1/jobs",
+            files={"file": TestCsvUpload._csv([sample_transaction, bad])},
+            headers=auth_headers
+        )
+        assert response.status_code in [202, 503]
+
+        if response.status_code == 202:
+            job = self._wait(client, auth_headers, response.json()["job_id"])
+            assert job["status"] == "failed"
+            assert "rows 2" in job["error"]
+
+            result = client.get(f"/api/v1/jobs/{job['job_id']}/result", headers=auth_headers)
+            assert result.status_code == 409
+            assert list(job_manager.job_dir.iterdir()) == []
+
+    def test_sweep_removes_old_job_files(self, job_manager):
+        """Test job files past retention are deleted unless their job is enqueued"""
+        import os
+        import time
+        import uuid
+
+        old_time = time.time() - (job_manager.retention_hours + 1) * 3600
+        stale, active, recent = (str(uuid.uuid4()) for _ in range(3))
+        for job_id in (stale, active, recent):
+            for name in (f"{job_id}.csv", f"{job_id}_predictions.csv"):
+                (job_manager.job_dir / name).write_text("time,amount\n")
+                if job_id != recent:
+                    os.utime(job_manager.job_dir / name, (old_time, old_time))
+
+        job_manager._active.add(active)
+        try:
+            assert job_manager.sweep() == 2
+        finally:
+            job_manager._active.discard(active)
+
+        remaining = sorted(path.name[:36] for path in job_manager.job_dir.iterdir())
+        assert remaining == sorted([active, active, recent, recent])
+
+    def test_get_unknown_job(self, client, auth_headers):
+        """Test polling a job that doesn't exist"""
+        response = client.get("/api/v1/jobs/does-not-exist", headers=auth_headers)
+        assert response.status_code == 404
+
+    def test_process_pool_scoring(self, tmp_path, monkeypatch):
+        """Test chunks scored in a worker process match in-process scoring"""
+        import asyncio
+        import joblib
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.preprocessing import StandardScaler
+        from app.models.ml_model import FraudDetectionModel, fraud_model
+        from app.services.batch_jobs import BatchJobManager
+
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(400, 30))
+        model = FraudDetectionModel()
+        model.scaler = StandardScaler().fit(X)
+        model.model = RandomForestClassifier(n_estimators=10, random_state=0).fit(
+            model.scaler.transform(X), X[:, 1] > 0.5
+        )
+        model.is_loaded = True
+
+        joblib.dump(model.model, tmp_path / "model.pkl")
+        joblib.dump(model.scaler, tmp_path / "scaler.pkl")
+        monkeypatch.setattr(fraud_model, "model_path", str(tmp_path / "model.pkl"))
+        monkeypatch.setattr(fraud_model, "scaler_path", str(tmp_path / "scaler.pkl"))
+
+        features = np.random.default_rng(3).normal(size=(50, 30))
+        manager = BatchJobManager(str(tmp_path), workers=1)
+
+        async def score():
+            try:
+                return await manager._score(features)
+            finally:
+                await manager.shutdown()
+
+        probabilities, labels = asyncio.run(score())
+        expected_probabilities, expected_labels = model.predict_batch(features)
+        np.testing.assert_array_equal(probabilities, expected_probabilities)
+        np.testing.assert_array_equal(labels, expected_labels)
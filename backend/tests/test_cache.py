@@ -0,0 +1,301 @@
+"""
+Cache Service Tests
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+
+class TestCacheService:
+    """Test the two-tier cache: in-process LRU/TTL tier in front of Redis"""
+
+    class FakeRedis:
+        """Redis commands the cache uses, with pub/sub delivered to subscribed caches"""
+
+        def __init__(self):
+            self.data = {}
+            self.subscribers = []
+            self.commands = 0
+
+        def pipeline(self, transaction=False):
+            redis, calls = self, []
+
+            class Pipeline:
+                def __getattr__(self, name):
+                    return lambda *args, **kwargs: calls.append((name, args, kwargs))
+
+                def execute(self):
+                    redis.commands += 1
+                    return [getattr(redis, name)(*args, **kwargs) for name, args, kwargs in calls]
+            return Pipeline()
+
+        def get(self, key):
+            return self.data.get(key)
+
+        def pttl(self, key):
+            return 60_000 if key in self.data else -2
+
+        def setex(self, key, ttl, value):
+            self.data[key] = value.decode() if isinstance(value, bytes) else value
+
+        def set(self, key, value, nx=False, px=None):
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+        def eval(self, script, numkeys, key, token):
+            return int(self.data.get(key) == token and self.data.pop(key) is not None)
+
+        def unlink(self, *keys):
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+        delete = unlink
+
+        def scan_iter(self, match, count):
+            import fnmatch
+            return iter([key for key in list(self.data) if fnmatch.fnmatchcase(key, match)])
+
+        def sadd(self, key, *members):
+            self.data.setdefault(key, set()).update(members)
+
+        def smembers(self, key):
+            return set(self.data.get(key, set()))
+
+        def expire(self, key, ttl, nx=False, gt=False):
+            return key in self.data
+
+        def publish(self, channel, message):
+            for service in self.subscribers:
+                service._on_invalidate({"channel": channel, "data": message})
+            return len(self.subscribers)
+
+    def _service(self, redis=None, **kwargs):
+        from app.services.cache_service import CacheService
+
+        service = CacheService(
+            max_entries=kwargs.pop("max_entries", 100), max_bytes=1024 * 1024,
+            local_ttl=kwargs.pop("local_ttl", 30), redis_enabled=False, **kwargs
+        )
+        if redis is not None:
+            service.client, service.enabled = redis, True
+            redis.subscribers.append(service)
+        return service
+
+    def test_local_tier_lru_ttl_and_quotas(self):
+        """Test entry caps, per-prefix quotas, TTL expiry and per-prefix counters without Redis"""
+        import time
+
+        service = self._service(max_entries=3, quotas={"user": 2})
+        for key in ("user:1", "user:2", "user:3"):
+            service.set(key, {"key": key})
+        # The user quota evicts its own oldest entry
+        assert service.get("user:1") is None
+        assert service.get("user:2") == {"key": "user:2"}
+
+        service.set("stats:a", [1, 2])
+        service.set("stats:b", [3])
+        # The global cap evicts the least recently used entry (user:3; user:2 was just read)
+        assert service.get("user:3") is None
+        assert service.get("user:2") == {"key": "user:2"}
+
+        service.set("model:v1", "short", ttl=0.05)
+        time.sleep(0.1)
+        assert service.get("model:v1") is None
+        assert service.incr("counter:x") == 1 and service.incr("counter:x", 2) == 3
+
+        prefixes = service.get_stats()["prefixes"]
+        assert prefixes["user"]["local"] == {"eviction": 2, "hit": 2, "miss": 2}
+        assert "redis" not in prefixes["user"]
+
+    def test_redis_tier_and_invalidation(self):
+        """Test local copies of Redis values and cross-process invalidation"""
+        redis = self.FakeRedis()
+        first, second = self._service(redis), self._service(redis)
+
+        first.set("user:1:stats", {"total": 5}, ttl=300)
+        assert second.get("user:1:stats") == {"total": 5}
+        commands = redis.commands
+        # Served from the second process's local tier without a round trip
+        assert second.get("user:1:stats") == {"total": 5}
+        assert redis.commands == commands
+
+        first.set("user:1:stats", {"total": 6}, ttl=300)
+        assert second.get("user:1:stats") == {"total": 6}
+
+        first.delete("user:1:stats")
+        assert second.get("user:1:stats") is None
+
+        first.set("user:2:a", 1)
+        second.get("user:2:a")
+        assert first.clear_pattern("user:2:*") == 1
+        assert second.get("user:2:a") is None
+
+        prefixes = second.get_stats()["prefixes"]
+        assert prefixes["user"]["redis"]["hit"] == 3
+        assert prefixes["user"]["local"]["hit"] == 1
+
+    def test_get_or_set_coalesces_misses(self):
+        """Test concurrent misses share one getter call, in threads and on the event loop"""
+        import asyncio
+        import threading
+        import time
+        from app.services.cache_service import cache_key_for
+
+        service = self._service()
+        calls = []
+
+        def getter():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"total": 42}
+
+        results = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            results.append(service.get_or_set("stats:global", getter, ttl=60))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert results == [{"total": 42}] * 8
+
+        async def async_getter():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return [1, 2]
+
+        async def main():
+            return await asyncio.gather(*(
+                service.get_or_set_async("stats:async", async_getter, ttl=60) for _ in range(10)
+            ))
+
+        assert asyncio.run(main()) == [[1, 2]] * 10
+        assert len(calls) == 2
+        assert service.get_stats()["prefixes"]["stats"]["compute"]["computed"] == 2
+
+        def report(user_id, days=30):
+            return None
+
+        key = cache_key_for("report:", report, (1,), {"days": 7})
+        assert key == cache_key_for("report:", report, (1,), {"days": 7})
+        assert key.startswith("report:") and key != cache_key_for("report:", report, (1,), {"days": 30})
+
+    def test_stale_while_revalidate(self):
+        """Test an expired value is served while a single background refresh runs"""
+        import time
+
+        service = self._service()
+        service.set("stats:daily", {"v": "old", "e": time.time() - 1, "d": 0.01}, ttl=60)
+        calls = []
+
+        def getter():
+            calls.append(1)
+            time.sleep(0.1)
+            return "new"
+
+        assert service.get_or_set("stats:daily", getter, ttl=60, stale_ttl=60) == "old"
+        assert service.get_or_set("stats:daily", getter, ttl=60, stale_ttl=60) == "old"
+        deadline = time.time() + 5
+        while service._flights and time.time() < deadline:
+            time.sleep(0.01)
+        assert service.get_or_set("stats:daily", getter, ttl=60, stale_ttl=60) == "new"
+        assert len(calls) == 1
+
+        # Without a stale window, an expired value is recomputed in the caller
+        service.set("stats:hourly", {"v": "old", "e": time.time() - 1, "d": 0.01}, ttl=60)
+        assert service.get_or_set("stats:hourly", lambda: "new", ttl=60) == "new"
+
+    def test_get_or_set_distributed_lock(self):
+        """Test a process waits for the value of another process holding the compute lock"""
+        import threading
+        import time
+
+        redis = self.FakeRedis()
+        first, second = self._service(redis), self._service(redis)
+        calls = []
+
+        def getter():
+            calls.append(1)
+            return "mine"
+
+        redis.data["lock:report:7"] = "first-token"
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            second.get_or_set("report:7", getter, ttl=300, lock=True)
+        ))
+        thread.start()
+        time.sleep(0.2)
+        first._set_entry("report:7", "theirs", 300, 0, 0.01)
+        thread.join(timeout=5)
+        assert results == ["theirs"]
+        assert calls == []
+
+        # The lock is released by its holder once the value is stored
+        assert second.get_or_set("report:8", getter, ttl=300, lock=True) == "mine"
+        assert "lock:report:8" not in redis.data
+
+    def test_tag_invalidation(self):
+        """Test keys set under tags are deleted together, in both tiers and across processes"""
+        from app.services.cache_service import model_tag, user_tag
+
+        service = self._service()
+        service.set("user:1:summary", 1, tags=[user_tag(1)])
+        service.set("user:1:heatmap", 2, tags=[user_tag(1), model_tag("1.0")])
+        service.set("user:2:summary", 3, tags=[user_tag(2)])
+        assert service.invalidate_tags(user_tag(1)) == 2
+        assert service.get("user:1:heatmap") is None
+        assert service.get("user:2:summary") == 3
+
+        redis = self.FakeRedis()
+        first, second = self._service(redis), self._service(redis)
+        first.set("user:1:summary", 1, tags=[user_tag(1)])
+        first.get_or_set("user:1:graph", lambda: [1], tags=[user_tag(1), model_tag("1.0")])
+        first.set("user:2:summary", 3, tags=[user_tag(2)])
+        assert second.get("user:1:summary") == 1
+
+        assert second.invalidate_tags(user_tag(1), "unused") == 2
+        assert "tag:user:1" not in redis.data
+        assert "user:1:graph" not in redis.data
+        # The first process evicted its local copies on the published keys
+        assert first.get("user:1:summary") is None
+        assert first.get("user:2:summary") == 3
+
+    def test_clear_pattern_scans(self, monkeypatch):
+        """Test pattern deletes walk Redis with SCAN in UNLINK batches"""
+        from app.services import cache_service
+
+        redis = self.FakeRedis()
+        service = self._service(redis)
+        for i in range(7):
+            service.set(f"user:{i}:stats", i)
+        service.set("model:1", "keep")
+        unlinked = []
+        unlink = redis.unlink
+        redis.unlink = lambda *keys: unlinked.append(len(keys)) or unlink(*keys)
+        monkeypatch.setattr(cache_service, "DELETE_BATCH_SIZE", 3)
+        assert service.clear_pattern("user:*") == 7
+        assert unlinked == [3, 3, 1]
+        assert list(redis.data) == ["model:1"]
+
+    def test_metrics_expose_cache_counters(self, client, monkeypatch):
+        """Test /metrics reports per-tier, per-prefix cache counters"""
+        from app.api.routes import health
+
+        service = self._service(max_entries=1)
+        service.set("user:1", 1)
+        service.get("user:1")
+        service.set("stats:a", 2)
+        service.get_or_set("report:1", lambda: 3)
+        monkeypatch.setattr(health, "cache", service)
+
+        metrics = client.get("/api/v1/metrics").json()
+        assert 'fraud_detection_cache_requests_total{tier="local",prefix="user",result="hit"} 1' in metrics
+        assert 'fraud_detection_cache_evictions_total{tier="local",prefix="user"} 1' in metrics
+        assert 'fraud_detection_cache_computations_total{prefix="report",result="computed"} 1' in metrics
+        assert "fraud_detection_cache_local_entries 1" in metrics
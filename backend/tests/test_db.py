@@ -0,0 +1,187 @@
+"""
+Database Tests
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import os
+
+import pytest
+
+
+class TestFeatureColumns:
+    """Test typed feature storage, bulk access and the backfill migration"""
+
+    @staticmethod
+    def _legacy_row(db_session, test_user, features):
+        import json
+        from app.db.models import Prediction
+        prediction = Prediction(
+            user_id=test_user.id, time=5.0, amount=42.0,
+            features_json=json.dumps({f"v{i}": features[i - 1] for i in range(1, 29)}),
+            is_fraud=False, fraud_probability=0.1, confidence="High",
+            risk_score=10, prediction_time_ms=1.0,
+        )
+        db_session.add(prediction)
+        db_session.commit()
+        return prediction
+
+    def test_batch_rows_use_typed_columns(self, db_session, test_user):
+        """Test that bulk-saved rows round-trip through get_feature_matrix"""
+        import numpy as np
+        import pandas as pd
+        from app.services.data_processor import DataProcessor
+        from app.services.prediction_service import get_feature_matrix, save_batch_predictions
+        from app.db.models import Prediction
+
+        X = np.random.default_rng(1).normal(size=(5, 30))
+        df = pd.DataFrame(X, columns=DataProcessor.FEATURE_COLUMNS)
+        df["is_fraud"] = False
+        df["fraud_probability"] = 0.1
+        df["confidence"] = "High"
+        df["risk_score"] = 10
+        save_batch_predictions(db_session, test_user.id, df, "batch-1")
+
+        ids, features = get_feature_matrix(db_session, Prediction.batch_id == "batch-1")
+        assert len(ids) == 5
+        np.testing.assert_array_equal(features, X)
+        assert db_session.query(Prediction).first().pca_features()["v28"] == X[0, 28]
+
+    def test_legacy_rows_fall_back_and_backfill(self, db_session, test_user):
+        """Test JSON-only rows are decoded, then migrated into the columns"""
+        import numpy as np
+        from app.db.migrations import backfill_prediction_features
+        from app.db.models import Prediction
+        from app.services.prediction_service import get_feature_matrix
+
+        pca = np.linspace(-1, 1, 28)
+        prediction = self._legacy_row(db_session, test_user, pca.tolist())
+        assert prediction.v1 is None
+
+        _, features = get_feature_matrix(db_session, Prediction.user_id == test_user.id)
+        np.testing.assert_array_equal(features[0], np.r_[5.0, pca, 42.0])
+
+        assert backfill_prediction_features(db_session.get_bind(), batch_size=1) == 1
+        db_session.expire_all()
+        assert db_session.get(Prediction, prediction.id).v28 == pca[-1]
+        assert backfill_prediction_features(db_session.get_bind()) == 0
+
+    def test_columns_added_to_existing_table(self):
+        """Test the schema upgrade adds V1-V28 to an old predictions table"""
+        from sqlalchemy import create_engine, inspect, text
+        from app.db.migrations import add_prediction_feature_columns
+
+        engine = create_engine("sqlite:///:memory:")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE predictions (id INTEGER PRIMARY KEY, features_json TEXT NOT NULL)"
+            ))
+
+        assert len(add_prediction_feature_columns(engine)) == 28
+        assert add_prediction_feature_columns(engine) == []
+        columns = {c["name"] for c in inspect(engine).get_columns("predictions")}
+        assert {"v1", "v28"} <= columns
+
+
+class TestQueryPlans:
+    """Test that per-user time-range queries are served by the composite indexes"""
+
+    HOT_ROUTES = [
+        "/api/v1/analytics/time-series?days=30",
+        "/api/v1/analytics/summary?days=30",
+        (
+            "/api/v1/analytics/compare-periods?period1_start=2024-01-01T00:00:00"
+            "&period1_end=2024-01-08T00:00:00&period2_start=2024-01-08T00:00:00"
+            "&period2_end=2024-01-15T00:00:00"
+        ),
+        "/api/v1/analytics/heatmap?days=30",
+        "/api/v1/reports/export/excel/fraud-only?days=30",
+        "/api/v1/reports/export/excel/high-risk?days=30",
+        "/api/v1/reports/export/csv?days=30",
+        "/api/v1/forecast?hours=24",
+        "/api/v1/predict/history?limit=100",
+        "/api/v1/analytics/predictions/filter?min_risk=50",
+    ]
+
+    @pytest.fixture
+    def hot_queries(self, client, auth_headers, db_session):
+        """SELECTs on predictions issued by the analytics, report and forecast routes"""
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        statements = []
+
+        def capture(state):
+            table_names = {t.name for t in state.statement.get_final_froms()} if state.is_select else set()
+            if "predictions" in table_names:
+                statements.append(state.statement)
+
+        # Exports stream from their own sessions, so listen on every session
+        event.listen(Session, "do_orm_execute", capture)
+        try:
+            for route in self.HOT_ROUTES:
+                client.get(route, headers=auth_headers)
+        finally:
+            event.remove(Session, "do_orm_execute", capture)
+
+        assert statements
+        return statements
+
+    @staticmethod
+    def _explain(conn, statement, prefix):
+        from sqlalchemy import text
+        sql = statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+        return "\n".join(str(row[-1]) for row in conn.execute(text(f"{prefix} {sql}")))
+
+    def test_sqlite_uses_index_search(self, hot_queries, db_session):
+        """Test every hot query is an index search, never a full table scan"""
+        conn = db_session.connection()
+        for statement in hot_queries:
+            plan = self._explain(conn, statement, "EXPLAIN QUERY PLAN")
+            assert "INDEX ix_predictions_user_id_" in plan, plan
+            assert "SCAN predictions" not in plan, plan
+
+    def test_fraud_only_uses_is_fraud_index(self, hot_queries, db_session):
+        """Test fraud-only queries seek on (user_id, is_fraud, created_at)"""
+        conn = db_session.connection()
+        plans = [self._explain(conn, statement, "EXPLAIN QUERY PLAN") for statement in hot_queries]
+        assert any("ix_predictions_user_id_is_fraud_created_at" in plan for plan in plans)
+
+    def test_indexes_added_to_existing_table(self):
+        """Test the schema upgrade creates missing indexes once"""
+        from sqlalchemy import create_engine, inspect, text
+        from app.db.database import Base
+        from app.db.migrations import add_prediction_indexes
+
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_predictions_user_id_created_at_is_fraud"))
+
+        assert add_prediction_indexes(engine) == ["ix_predictions_user_id_created_at_is_fraud"]
+        assert add_prediction_indexes(engine) == []
+        names = {index["name"] for index in inspect(engine).get_indexes("predictions")}
+        assert "ix_predictions_user_id_created_at_is_fraud" in names
+
+    @pytest.mark.skipif(not os.environ.get("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL not set")
+    def test_postgres_uses_index_scan(self, hot_queries):
+        """Test the same queries use index scans on PostgreSQL"""
+        from sqlalchemy import create_engine, text
+        from app.db.database import Base
+        from app.db.migrations import upgrade_schema
+
+        engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+        Base.metadata.create_all(bind=engine)
+        upgrade_schema(engine)
+        try:
+            with engine.connect() as conn:
+                # An empty table is cheapest to scan sequentially; check the index is usable
+                conn.execute(text("SET enable_seqscan = off"))
+                for statement in hot_queries:
+                    plan = self._explain(conn, statement, "EXPLAIN")
+                    assert "ix_predictions_user_id_" in plan, plan
+                    assert "Seq Scan on predictions" not in plan, plan
+        finally:
+            Base.metadata.drop_all(bind=engine)
+            engine.dispose()
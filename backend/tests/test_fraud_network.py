@@ -0,0 +1,494 @@
+"""
+Fraud Network Tests
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import pytest
+
+
+class TestFraudGraph:
+    """Test the vectorized fraud network graph"""
+
+    @staticmethod
+    def _add_predictions(db_session, user_id, n, seed=7):
+        """Fraud predictions in a few batches, close in time, some without typed V columns"""
+        import json
+        from datetime import datetime, timedelta
+        import numpy as np
+        from app.services.prediction_service import bulk_insert_predictions
+
+        rng = np.random.default_rng(seed)
+        now = datetime.utcnow()
+        records = []
+        for i in range(n):
+            features = {f"v{k}": float(rng.normal(0, 0.6)) for k in range(1, 29)}
+            record = {
+                "user_id": user_id, "time": 0.0, "amount": float(rng.choice([0.0, 100.0, 104.0, 250.0, 900.0])),
+                "features_json": json.dumps(features), "is_fraud": True, "fraud_probability": 0.8,
+                "confidence": "High", "risk_score": int(rng.integers(35, 100)), "prediction_time_ms": 1.0,
+                "batch_id": f"batch-{i % 4}" if i % 3 == 0 else None,
+                "created_at": now - timedelta(seconds=int(rng.integers(0, 6 * 3600))),
+            }
+            if i % 5:
+                record.update(features)
+            records.append(record)
+        bulk_insert_predictions(db_session, records)
+
+    @staticmethod
+    def _pairwise_similarity(pred1, pred2):
+        """Reference one-pair similarity, as the graph was scored before vectorization"""
+        connections = []
+        total_score = 0
+
+        if pred1.amount > 0 and pred2.amount > 0:
+            amount_diff = abs(pred1.amount - pred2.amount) / max(pred1.amount, pred2.amount)
+            if amount_diff < 0.1:
+                connections.append({
+                    "type": "similar_amount",
+                    "strength": 1 - amount_diff,
+                    "detail": f"${pred1.amount:.2f} ↔ ${pred2.amount:.2f}"
+                })
+                total_score += (1 - amount_diff) * 0.3
+
+        if pred1.created_at and pred2.created_at:
+            time_diff = abs((pred1.created_at - pred2.created_at).total_seconds())
+            if time_diff < 3600:
+                time_strength = 1 - (time_diff / 3600)
+                connections.append({
+                    "type": "time_proximity",
+                    "strength": time_strength,
+                    "detail": f"{int(time_diff / 60)} min apart"
+                })
+                total_score += time_strength * 0.25
+
+        if pred1.risk_score and pred2.risk_score:
+            risk_diff = abs(pred1.risk_score - pred2.risk_score) / 100
+            if risk_diff < 0.15:
+                connections.append({
+                    "type": "similar_risk",
+                    "strength": 1 - risk_diff,
+                    "detail": f"Risk: {pred1.risk_score} ↔ {pred2.risk_score}"
+                })
+                total_score += (1 - risk_diff) * 0.2
+
+        if pred1.batch_id and pred2.batch_id and pred1.batch_id == pred2.batch_id:
+            connections.append({"type": "same_batch", "strength": 1.0, "detail": f"Batch: {pred1.batch_id[:8]}"})
+            total_score += 0.5
+
+        if pred1.features_json and pred2.features_json:
+            f1, f2 = pred1.pca_features(), pred2.pca_features()
+            feature_similarity, count = 0, 0
+            for feat in ("v1", "v2", "v3", "v14", "v17"):
+                if feat in f1 and feat in f2:
+                    diff = abs(f1[feat] - f2[feat])
+                    if diff < 1.0:
+                        feature_similarity += 1 - diff
+                        count += 1
+            if count > 0 and feature_similarity / count > 0.5:
+                avg_similarity = feature_similarity / count
+                connections.append({
+                    "type": "feature_pattern",
+                    "strength": avg_similarity,
+                    "detail": f"Pattern match: {avg_similarity:.1%}"
+                })
+                total_score += avg_similarity * 0.25
+
+        return {"score": min(total_score, 1.0), "connections": connections}
+
+    def test_legacy_features_read_in_chunks(self, db_session, test_user, monkeypatch):
+        """Test legacy feature lookups are split across IN queries"""
+        import numpy as np
+        from app.db.models import Prediction
+        from app.services import prediction_service
+        from app.services.fraud_graph import load_graph_nodes
+
+        self._add_predictions(db_session, test_user.id, 30)
+        criteria, order = [Prediction.user_id == test_user.id], [Prediction.id]
+        expected = load_graph_nodes(db_session, criteria, order).features
+
+        monkeypatch.setattr(prediction_service, "IN_CLAUSE_CHUNK_SIZE", 2)
+        nodes = load_graph_nodes(db_session, criteria, order)
+        assert not np.isnan(nodes.features).any()
+        np.testing.assert_array_equal(nodes.features, expected)
+
+    def test_matches_pairwise_similarity(self, db_session, test_user):
+        """Test vectorized edges, scores, connections and clusters match pairwise scoring"""
+        from app.db.models import Prediction
+        from app.services.fraud_graph import build_similarity_graph, load_graph_nodes
+
+        self._add_predictions(db_session, test_user.id, 60)
+        order = [Prediction.created_at.desc(), Prediction.id]
+        graph = build_similarity_graph(
+            load_graph_nodes(db_session, [Prediction.user_id == test_user.id], order), threshold=0.25
+        )
+        predictions = db_session.query(Prediction).filter(Prediction.user_id == test_user.id).order_by(*order).all()
+
+        expected = {}
+        for i, pred1 in enumerate(predictions):
+            for pred2 in predictions[i + 1:]:
+                similarity = self._pairwise_similarity(pred1, pred2)
+                if similarity["score"] >= 0.25:
+                    expected[(pred1.id, pred2.id)] = similarity
+
+        ids = graph.nodes.ids
+        assert graph.exact
+        assert graph.edge_count == len(expected) > 0
+        for edge in range(graph.edge_count):
+            similarity = expected[(ids[graph.source[edge]], ids[graph.target[edge]])]
+            assert graph.edges["score"][edge] == pytest.approx(similarity["score"])
+            connections = graph.connections(edge)
+            assert [c["detail"] for c in connections] == [c["detail"] for c in similarity["connections"]]
+            assert [c["strength"] for c in connections] == pytest.approx(
+                [c["strength"] for c in similarity["connections"]]
+            )
+
+        # Clusters are the connected components of the edges
+        members = {frozenset(cluster["members"]) for cluster in graph.clusters()}
+        for source, target in expected:
+            assert any(source in cluster and target in cluster for cluster in members)
+        assert sum(len(cluster) for cluster in members) == len({node for pair in expected for node in pair})
+
+    def test_large_graph_uses_sorted_neighbourhood(self, db_session, test_user, monkeypatch):
+        """Test beyond the exact pair limit the graph finds the same clusters without scoring every pair"""
+        from app.db.models import Prediction
+        from app.services import fraud_graph
+
+        self._add_predictions(db_session, test_user.id, 400, seed=11)
+        nodes = fraud_graph.load_graph_nodes(db_session, [Prediction.user_id == test_user.id], [Prediction.id])
+        exact = fraud_graph.build_similarity_graph(nodes, threshold=0.6)
+
+        monkeypatch.setattr(fraud_graph, "EXACT_PAIR_LIMIT", 1000)
+        approximate = fraud_graph.build_similarity_graph(nodes, threshold=0.6)
+
+        assert not approximate.exact
+        assert approximate.candidates < len(nodes) * (len(nodes) - 1) // 2
+        exact_edges = set(zip(exact.source.tolist(), exact.target.tolist()))
+        approximate_edges = set(zip(approximate.source.tolist(), approximate.target.tolist()))
+        assert approximate_edges <= exact_edges
+
+        # Windows don't enumerate every pair of a dense group (a batch), but they connect it
+        assert (
+            {frozenset(cluster["members"]) for cluster in approximate.clusters()}
+            == {frozenset(cluster["members"]) for cluster in exact.clusters()}
+        )
+
+    def test_graph_endpoint(self, client, auth_headers, db_session, test_user, tmp_path, monkeypatch):
+        """Test the graph endpoint returns the strongest edges and counts all of them"""
+        from app.api.routes import fraud_network
+        from app.services.fraud_clusters import FraudClusterStore
+
+        monkeypatch.setattr(fraud_network, "fraud_cluster_store", FraudClusterStore(str(tmp_path / "clusters.npz")))
+        self._add_predictions(db_session, test_user.id, 40)
+
+        response = client.get(
+            "/api/v1/fraud-network/graph?min_risk=0&similarity_threshold=0.3&max_edges=10", headers=auth_headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        stats = data["statistics"]
+        assert stats["total_nodes"] == len(data["nodes"]) == 40
+        assert stats["edges_returned"] == len(data["edges"]) == 10
+        assert stats["total_edges"] > 10
+        assert min(edge["weight"] for edge in data["edges"]) >= 0.3
+        node_ids = {node["id"] for node in data["nodes"]}
+        assert all(edge["source"] in node_ids and edge["target"] in node_ids for edge in data["edges"])
+        assert stats["clusters_found"] == len(data["clusters"]) > 0
+
+        response = client.get("/api/v1/fraud-network/clusters", headers=auth_headers)
+        assert response.status_code == 200
+        clusters = response.json()["clusters"]
+        assert clusters and all(len(cluster["members"]) == cluster["size"] for cluster in clusters)
+
+    def test_node_details_endpoint(self, client, auth_headers, db_session, test_user):
+        """Test node details list the related predictions scoring above 0.2, strongest first"""
+        from datetime import timedelta
+        from app.db.models import Prediction
+
+        self._add_predictions(db_session, test_user.id, 30)
+        predictions = db_session.query(Prediction).filter(Prediction.user_id == test_user.id).order_by(Prediction.id).all()
+        node = predictions[0]
+
+        expected = {}
+        for rel in predictions[1:]:
+            if abs(rel.created_at - node.created_at) <= timedelta(hours=24):
+                similarity = self._pairwise_similarity(node, rel)
+                if similarity["score"] > 0.2:
+                    expected[rel.id] = similarity
+
+        response = client.get(f"/api/v1/fraud-network/node/{node.id}", headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["node"]["id"] == node.id
+        assert data["total_connections"] == len(expected) > 0
+        scores = [connection["similarity_score"] for connection in data["connections"]]
+        assert scores == sorted(scores, reverse=True)
+        for connection in data["connections"]:
+            similarity = expected[connection["node_id"]]
+            assert connection["similarity_score"] == pytest.approx(similarity["score"])
+            assert connection["connection_types"] == [
+                {**c, "strength": pytest.approx(c["strength"])} for c in similarity["connections"]
+            ]
+
+        assert client.get("/api/v1/fraud-network/node/999999", headers=auth_headers).status_code == 404
+
+
+class TestFraudClusters:
+    """Test incrementally maintained fraud rings"""
+
+    @staticmethod
+    def _rings(store, db_session, user_id):
+        from datetime import datetime, timedelta
+        clusters = store.user_clusters(db_session, user_id, datetime.utcnow() - timedelta(days=7))
+        return {cluster["cluster_id"]: {row.id for row in cluster["members"]} for cluster in clusters}
+
+    def test_incremental_matches_rebuild(self, db_session, test_user, tmp_path):
+        """Test rings indexed in rounds equal a rebuild and follow the similarity rules"""
+        from app.db.models import Prediction
+        from app.services.fraud_clusters import CLUSTER_THRESHOLD, FraudClusterStore
+        from app.services.fraud_graph import build_similarity_graph, load_graph_nodes
+
+        store = FraudClusterStore(str(tmp_path / "incremental.npz"))
+        for seed in range(3):
+            TestFraudGraph._add_predictions(db_session, test_user.id, 40, seed=seed)
+            assert store.refresh(db_session) == 40
+        incremental = self._rings(store, db_session, test_user.id)
+
+        rebuilt = FraudClusterStore(str(tmp_path / "rebuilt.npz"))
+        assert rebuilt.rebuild(db_session) == 120
+        assert self._rings(rebuilt, db_session, test_user.id) == incremental
+
+        # The nearest candidates connect the same rings as scoring every pair
+        nodes = load_graph_nodes(db_session, [Prediction.user_id == test_user.id], [Prediction.id])
+        expected = {
+            cluster["cluster_id"]: set(cluster["members"])
+            for cluster in build_similarity_graph(nodes, CLUSTER_THRESHOLD).clusters()
+        }
+        assert incremental == expected
+
+    def test_checkpoint_and_lookup(self, db_session, test_user, tmp_path):
+        """Test a checkpoint restores the rings and later predictions extend them"""
+        from app.services.fraud_clusters import FraudClusterStore
+
+        path = str(tmp_path / "clusters.npz")
+        store = FraudClusterStore(path)
+        TestFraudGraph._add_predictions(db_session, test_user.id, 30)
+        before = self._rings(store, db_session, test_user.id)
+        assert before
+        store.save()
+
+        restored = FraudClusterStore(path)
+        assert restored.load() and restored.max_id == store.max_id
+        assert self._rings(restored, db_session, test_user.id) == before
+
+        TestFraudGraph._add_predictions(db_session, test_user.id, 30, seed=8)
+        after = self._rings(restored, db_session, test_user.id)
+        assert sum(len(members) for members in after.values()) > sum(len(members) for members in before.values())
+        assert self._rings(FraudClusterStore(path), db_session, test_user.id) == after
+
+    def test_checkpoint_every_n_additions(self, db_session, test_user, tmp_path, monkeypatch):
+        """Test lookups only rewrite the checkpoint once enough predictions were added"""
+        from app.services import fraud_clusters
+        from app.services.fraud_clusters import FraudClusterStore
+
+        monkeypatch.setattr(fraud_clusters, "CHECKPOINT_ROWS", 50)
+        path = tmp_path / "clusters.npz"
+        store = FraudClusterStore(str(path))
+
+        TestFraudGraph._add_predictions(db_session, test_user.id, 30)
+        self._rings(store, db_session, test_user.id)
+        assert not path.exists() and store.pending_checkpoint
+
+        TestFraudGraph._add_predictions(db_session, test_user.id, 30, seed=8)
+        self._rings(store, db_session, test_user.id)
+        assert path.exists() and not store.pending_checkpoint
+        assert FraudClusterStore(str(path)).load()
+
+    def test_late_commits_match_rebuild(self, db_session, test_user, tmp_path):
+        """Test a prediction committed below the highest indexed id links both ways, like a rebuild"""
+        from datetime import datetime, timedelta
+        from app.services.fraud_clusters import FraudClusterStore
+        from app.services.prediction_service import bulk_insert_predictions
+
+        now = datetime.utcnow()
+
+        def record(row_id, hours, amount, feature, batch_id=None):
+            return {
+                "id": row_id, "user_id": test_user.id, "time": 0.0, "amount": amount, "features_json": "{}",
+                **{f"v{k}": feature for k in range(1, 29)}, "is_fraud": True, "fraud_probability": 0.9,
+                "confidence": "High", "risk_score": 0, "prediction_time_ms": 1.0, "batch_id": batch_id,
+                "created_at": now - timedelta(hours=hours),
+            }
+
+        # 10 shares a batch with 1 and the amount of 20; 1 and 20 have nothing in common
+        store = FraudClusterStore(str(tmp_path / "incremental.npz"))
+        bulk_insert_predictions(db_session, [record(1, 6, 100.0, 0.0, "x"), record(20, 2, 500.0, -5.0)])
+        assert store.refresh(db_session) == 2 and store.max_id == 20
+
+        # Id 10 was drawn before 20 but committed after it was indexed
+        bulk_insert_predictions(db_session, [record(10, 4, 500.0, 5.0, "x")])
+        assert store.refresh(db_session) == 1
+        assert store.refresh(db_session) == 0
+        assert list(store._ids) == [1, 10, 20]
+
+        rebuilt = FraudClusterStore(str(tmp_path / "rebuilt.npz"))
+        assert rebuilt.rebuild(db_session) == 3
+        assert self._rings(store, db_session, test_user.id) == {1: {1, 10, 20}}
+        assert self._rings(rebuilt, db_session, test_user.id) == {1: {1, 10, 20}}
+
+
+class TestSimilarityIndex:
+    """Test the approximate nearest-neighbour index"""
+
+    def test_search_recall_and_persistence(self, tmp_path):
+        """Test IVF search finds most exact neighbours and survives a save and memory-mapped load"""
+        import numpy as np
+        from app.services.similarity_index import SimilarityIndex, VECTOR_DIM
+
+        rng = np.random.default_rng(3)
+        centers = rng.normal(0, 4, (40, VECTOR_DIM))
+        vectors = (centers[rng.integers(0, 40, 8000)] + rng.normal(0, 1, (8000, VECTOR_DIM))).astype(np.float32)
+        ids = np.arange(1, 8001)
+        user_ids = ids % 2
+
+        index = SimilarityIndex(str(tmp_path), nprobe=8)
+        for start in range(0, 8000, 1000):
+            index.add(ids[start:start + 1000], user_ids[start:start + 1000], vectors[start:start + 1000])
+        assert index.trained and len(index) == 8000
+
+        found = total = 0
+        for query in range(0, 8000, 400):
+            exact = {i for i, _ in index.exact_search(vectors[query], k=10, exclude_id=query + 1)}
+            approximate = index.search(vectors[query], k=10, user_id=None, exclude_id=query + 1)
+            found += len(exact & {i for i, _ in approximate})
+            total += len(exact)
+        assert found / total >= 0.8
+
+        neighbours = index.search(vectors[0], k=5, user_id=1, exclude_id=1)
+        assert len(neighbours) == 5 and all(i % 2 == 1 and i != 1 for i, _ in neighbours)
+        assert [d for _, d in neighbours] == sorted(d for _, d in neighbours)
+
+        index.save()
+        loaded = SimilarityIndex(str(tmp_path), nprobe=8)
+        assert loaded.load()
+        assert isinstance(loaded._vectors, np.memmap)
+        assert loaded.search(vectors[7], k=10) == index.search(vectors[7], k=10)
+
+        # Appending after a memory-mapped load
+        loaded.add(np.array([9000]), np.array([1]), vectors[7:8])
+        assert loaded.search(vectors[7], k=2, user_id=1)[0][1] == 0.0
+
+    def test_save_switches_generations(self, tmp_path, monkeypatch):
+        """Test saves from several writers never mix and a mismatched generation isn't loaded"""
+        import json
+        import numpy as np
+        from app.services import similarity_index as module
+        from app.services.similarity_index import SimilarityIndex, VECTOR_DIM
+
+        monkeypatch.setattr(module, "GENERATION_GRACE_SECONDS", 0)
+        rng = np.random.default_rng(5)
+        writers = []
+        for n in (50, 80):
+            index = SimilarityIndex(str(tmp_path))
+            index.add(np.arange(1, n + 1), np.zeros(n), rng.normal(size=(n, VECTOR_DIM)))
+            writers.append(index)
+        writers[0].save()
+        writers[1].save()
+
+        meta = json.loads((tmp_path / "meta.json").read_text())
+        assert [path.name for path in tmp_path.glob("gen-*")] == [meta["generation"]]
+        loaded = SimilarityIndex(str(tmp_path))
+        assert loaded.load() and len(loaded) == 80
+
+        np.save(tmp_path / meta["generation"] / "ids.npy", np.arange(50))
+        assert not SimilarityIndex(str(tmp_path)).load()
+
+    def test_search_runs_during_retrain(self, tmp_path, monkeypatch):
+        """Test a search isn't blocked while the quantizer is retrained"""
+        import threading
+        import numpy as np
+        from app.services import similarity_index as module
+        from app.services.similarity_index import SimilarityIndex, TRAIN_MIN_ROWS, VECTOR_DIM
+
+        training, release = threading.Event(), threading.Event()
+        train_centroids = module.train_centroids
+
+        def slow_train(*args, **kwargs):
+            training.set()
+            release.wait(5)
+            return train_centroids(*args, **kwargs)
+
+        monkeypatch.setattr(module, "train_centroids", slow_train)
+        vectors = np.random.default_rng(1).normal(size=(TRAIN_MIN_ROWS, VECTOR_DIM)).astype(np.float32)
+        index = SimilarityIndex(str(tmp_path))
+        index.add(np.arange(1, 101), np.zeros(100), vectors[:100])
+
+        adding = threading.Thread(target=index.add, args=(
+            np.arange(101, TRAIN_MIN_ROWS + 1), np.zeros(TRAIN_MIN_ROWS - 100), vectors[100:]
+        ))
+        adding.start()
+        try:
+            assert training.wait(5)
+            assert index.search(vectors[0], k=1)[0] == (1, 0.0)
+            assert not index.trained
+        finally:
+            release.set()
+            adding.join()
+        assert index.trained and len(index) == TRAIN_MIN_ROWS
+
+    def test_refresh_picks_up_late_commits(self, db_session, test_user, tmp_path):
+        """Test rows committed below the highest indexed id are indexed on the next refresh"""
+        from datetime import datetime
+        from app.services.prediction_service import bulk_insert_predictions
+        from app.services.similarity_index import SimilarityIndex
+        from tests.test_analytics import TestRollups
+
+        def records(ids):
+            return [
+                {**TestRollups._record(test_user.id, datetime(2024, 3, 1, 10), i), "id": i, "v1": float(i)}
+                for i in ids
+            ]
+
+        index = SimilarityIndex(str(tmp_path))
+        bulk_insert_predictions(db_session, records([*range(1, 11), 20]))
+        assert index.refresh(db_session) == 11 and index.max_id == 20
+        assert index.refresh(db_session) == 0
+
+        # Ids 11-15 were drawn before 20 but committed after it was indexed
+        bulk_insert_predictions(db_session, records(range(11, 16)))
+        assert index.refresh(db_session) == 5
+        assert len(index) == 16 and index.max_id == 20
+        assert index.refresh(db_session) == 0
+
+    def test_similar_endpoint(self, client, auth_headers, db_session, test_user, tmp_path, monkeypatch):
+        """Test the endpoint returns the user's nearest transactions, including ones saved since the last query"""
+        import json
+        from datetime import datetime
+        from app.api.routes import fraud_network
+        from app.db.models import Prediction
+        from app.services.prediction_service import bulk_insert_predictions
+        from app.services.similarity_index import SimilarityIndex
+
+        monkeypatch.setattr(fraud_network, "similarity_index", SimilarityIndex(str(tmp_path)))
+        TestFraudGraph._add_predictions(db_session, test_user.id, 30)
+        target = db_session.query(Prediction).filter(Prediction.user_id == test_user.id).first()
+
+        response = client.get(f"/api/v1/fraud-network/similar/{target.id}?k=5", headers=auth_headers)
+        assert response.status_code == 200
+        neighbours = response.json()["neighbours"]
+        assert len(neighbours) == 5
+        assert target.id not in [n["node_id"] for n in neighbours]
+        assert [n["distance"] for n in neighbours] == sorted(n["distance"] for n in neighbours)
+
+        # A copy of the transaction saved afterwards is its nearest neighbour
+        features = target.pca_features()
+        bulk_insert_predictions(db_session, [{
+            "user_id": test_user.id, "time": 0.0, "amount": target.amount, "features_json": json.dumps(features),
+            **features, "is_fraud": True, "fraud_probability": 0.9, "confidence": "High", "risk_score": 90,
+            "prediction_time_ms": 1.0, "created_at": datetime.utcnow(),
+        }])
+        response = client.get(f"/api/v1/fraud-network/similar/{target.id}?k=5", headers=auth_headers)
+        assert response.json()["neighbours"][0]["distance"] == 0
+
+        assert client.get("/api/v1/fraud-network/similar/999999", headers=auth_headers).status_code == 404
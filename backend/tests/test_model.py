@@ -85,3 +85,297 @@ class TestDataProcessor:
         assert sample["time"] >= 0
         assert sample["amount"] >= 0
         assert all(f"v{i}" in sample for i in range(1, 29))
+
+
+class TestMicroBatcher:
+    """Tests for the micro-batching inference engine"""
+
+    @staticmethod
+    def _fake_predict(calls):
+        def predict_batch(features):
+            calls.append(len(features))
+            probabilities = features[:, -1] / 1000
+            return probabilities, probabilities > 0.1
+        return predict_batch
+
+    def test_concurrent_requests_share_one_batch(self):
+        """Test that concurrent predictions are scored in one call"""
+        import asyncio
+        from app.services.micro_batcher import MicroBatcher
+
+        calls = []
+        batcher = MicroBatcher(self._fake_predict(calls), max_batch_size=64, max_wait_ms=20)
+
+        async def run():
+            rows = [np.full(30, float(i * 10)) for i in range(20)]
+            results = await asyncio.gather(*(batcher.predict(r) for r in rows))
+            await batcher.stop()
+            return results
+
+        results = asyncio.run(run())
+
+        assert calls == [20]
+        assert results[0] == (False, 0.0)
+        assert results[15] == (True, 0.15)
+        stats = batcher.get_stats()
+        assert stats["batches"] == 1
+        assert stats["rows"] == 20
+        assert stats["batch_size_buckets"][32] == 1
+        assert stats["batch_size_buckets"][16] == 0
+
+    def test_batch_size_is_capped(self):
+        """Test that batches never exceed max_batch_size"""
+        import asyncio
+        from app.services.micro_batcher import MicroBatcher
+
+        calls = []
+        batcher = MicroBatcher(self._fake_predict(calls), max_batch_size=8, max_wait_ms=20)
+
+        async def run():
+            await asyncio.gather(*(batcher.predict(np.zeros(30)) for _ in range(20)))
+            await batcher.stop()
+
+        asyncio.run(run())
+
+        assert max(calls) <= 8
+        assert sum(calls) == 20
+
+    def test_scoring_error_propagates(self):
+        """Test that a model failure is raised to every waiting request"""
+        import asyncio
+        from app.services.micro_batcher import MicroBatcher
+
+        def failing_predict(features):
+            raise RuntimeError("Model not loaded. Call load() first.")
+
+        batcher = MicroBatcher(failing_predict, max_wait_ms=1)
+
+        async def run():
+            with pytest.raises(RuntimeError):
+                await batcher.predict(np.zeros(30))
+            await batcher.stop()
+
+        asyncio.run(run())
+
+    def test_stop_resolves_in_flight_batch(self):
+        """Test that stopping mid-batch finishes the held and queued requests"""
+        import asyncio
+        import time
+        from app.services.micro_batcher import MicroBatcher
+
+        calls = []
+        fake_predict = self._fake_predict(calls)
+
+        def slow_predict(features):
+            time.sleep(0.1)
+            return fake_predict(features)
+
+        batcher = MicroBatcher(slow_predict, max_batch_size=4, max_wait_ms=1)
+
+        async def run():
+            tasks = [asyncio.ensure_future(batcher.predict(np.zeros(30))) for _ in range(10)]
+            # Let the worker take its first batch to the executor
+            await asyncio.sleep(0.02)
+            await asyncio.wait_for(batcher.stop(), 5)
+            return await asyncio.wait_for(asyncio.gather(*tasks), 1)
+
+        results = asyncio.run(run())
+
+        assert results == [(False, 0.0)] * 10
+        assert sum(calls) == 10
+
+
+class TestBoundedExecutor:
+    """Tests for the bounded executors used by async routes"""
+
+    def test_runs_off_the_event_loop(self):
+        """Test that work runs on a pool thread and returns its result"""
+        import asyncio
+        import threading
+        from app.core.executors import BoundedExecutor
+
+        executor = BoundedExecutor("test", max_workers=2, max_pending=4)
+
+        async def run():
+            return await executor.run(lambda x: (x * 2, threading.current_thread().name), 21)
+
+        value, thread_name = asyncio.run(run())
+        executor.shutdown()
+
+        assert value == 42
+        assert thread_name.startswith("test-executor")
+        assert executor.get_stats()["completed"] == 1
+
+    def test_rejects_when_full(self):
+        """Test that work beyond max_pending is rejected with 503"""
+        import asyncio
+        import threading
+        from app.core.executors import BoundedExecutor, ExecutorOverloaded
+
+        executor = BoundedExecutor("test", max_workers=1, max_pending=2)
+        release = threading.Event()
+
+        async def run():
+            tasks = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+            await asyncio.sleep(0.05)
+
+            stats = executor.get_stats()
+            with pytest.raises(ExecutorOverloaded) as exc_info:
+                await executor.run(release.wait)
+
+            release.set()
+            await asyncio.gather(*tasks)
+            return stats, exc_info.value
+
+        stats, error = asyncio.run(run())
+        executor.shutdown()
+
+        assert stats["running"] == 1
+        assert stats["queued"] == 1
+        assert error.status_code == 503
+        assert error.headers["Retry-After"] == "1"
+        assert executor.get_stats()["rejected"] == 1
+        assert executor.get_stats()["pending"] == 0
+
+
+class TestSinglePassScoring:
+    """Tests for threshold-based single-pass scoring"""
+
+    @staticmethod
+    def _trained_model():
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.preprocessing import StandardScaler
+
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(400, 30))
+        y = (X[:, 1] + X[:, -1] > 1).astype(int)
+
+        model = FraudDetectionModel()
+        model.scaler = StandardScaler().fit(X)
+        model.model = RandomForestClassifier(n_estimators=10, random_state=0).fit(
+            model.scaler.transform(X), y
+        )
+        model.is_loaded = True
+        return model, X
+
+    def test_default_threshold_matches_predict(self):
+        """Test that labels match the estimator's own predict at 0.5"""
+        model, X = self._trained_model()
+
+        probabilities, labels = model.predict_batch(X)
+
+        expected = model.model.predict(model.scaler.transform(X)) == 1
+        assert isinstance(probabilities, np.ndarray)
+        assert labels.dtype == bool
+        assert np.array_equal(labels, expected)
+
+    def test_single_matches_batch(self):
+        """Test that single and batch scoring agree"""
+        model, X = self._trained_model()
+
+        probabilities, labels = model.predict_batch(X[:5])
+        for row, prob, label in zip(X[:5], probabilities, labels):
+            assert model.predict(row) == (bool(label), float(prob))
+
+    def test_custom_threshold(self):
+        """Test that the decision threshold changes labels, not probabilities"""
+        model, X = self._trained_model()
+        probabilities, _ = model.predict_batch(X)
+
+        model.set_decision_threshold(0.9)
+        strict_probs, strict_labels = model.predict_batch(X)
+
+        assert np.array_equal(probabilities, strict_probs)
+        assert np.array_equal(strict_labels, probabilities > 0.9)
+
+    def test_invalid_threshold(self):
+        """Test that out-of-range thresholds are rejected"""
+        model = FraudDetectionModel()
+        with pytest.raises(ValueError):
+            model.set_decision_threshold(1.5)
+
+
+class TestCompiledTrees:
+    """Parity tests for the compiled tree-ensemble backend"""
+
+    @staticmethod
+    def _data():
+        from sklearn.preprocessing import StandardScaler
+
+        rng = np.random.default_rng(1)
+        X = rng.normal(size=(600, 30)) * rng.uniform(0.1, 100, 30)
+        y = ((X[:, 1] + X[:, 5] / 10 + rng.normal(size=600) * 3) > 0).astype(int)
+        scaler = StandardScaler().fit(X)
+        X_test = rng.normal(size=(500, 30)) * rng.uniform(0.1, 100, 30)
+        return X, y, scaler, X_test
+
+    def test_random_forest_parity(self):
+        """Test compiled forest output is bit-for-bit equal to predict_proba"""
+        from sklearn.ensemble import RandomForestClassifier
+        from app.models.compiled_trees import compile_model
+
+        X, y, scaler, X_test = self._data()
+        forest = RandomForestClassifier(n_estimators=20, random_state=0)
+        forest.fit(scaler.transform(X), y)
+        compiled = compile_model(forest, scaler)
+
+        for data in (X, X_test):
+            expected = forest.predict_proba(scaler.transform(data))[:, 1]
+            assert np.array_equal(compiled.predict_fraud_proba(data), expected)
+
+    def test_parity_on_split_boundaries(self):
+        """Test values exactly on folded thresholds take the sklearn branch"""
+        from sklearn.ensemble import RandomForestClassifier
+        from app.models.compiled_trees import compile_model
+
+        X, y, scaler, _ = self._data()
+        forest = RandomForestClassifier(n_estimators=5, random_state=0)
+        forest.fit(scaler.transform(X), y)
+        compiled = compile_model(forest, scaler)
+
+        trees = compiled.trees
+        splits = trees.left != np.arange(trees.n_nodes)
+        rows = []
+        for value, feature in zip(trees.threshold[splits], trees.feature[splits]):
+            for v in (value, np.nextafter(value, np.inf), np.nextafter(value, -np.inf)):
+                row = X[len(rows) % len(X)].copy()
+                row[feature] = v
+                rows.append(row)
+        boundary = np.array(rows)
+
+        expected = forest.predict_proba(scaler.transform(boundary))[:, 1]
+        assert np.array_equal(compiled.predict_fraud_proba(boundary), expected)
+
+    def test_gradient_boosting_parity(self):
+        """Test compiled gradient boosting matches predict_proba"""
+        from sklearn.ensemble import GradientBoostingClassifier
+        from app.models.compiled_trees import compile_model
+
+        X, y, scaler, X_test = self._data()
+        gb = GradientBoostingClassifier(n_estimators=20, random_state=0)
+        gb.fit(scaler.transform(X), y)
+        compiled = compile_model(gb, scaler)
+
+        expected = gb.predict_proba(scaler.transform(X_test))[:, 1]
+        assert np.array_equal(compiled.predict_fraud_proba(X_test), expected)
+
+    def test_model_uses_compiled_backend(self):
+        """Test FraudDetectionModel scores identically on both backends"""
+        model, X = TestSinglePassScoring._trained_model()
+        X = X[:model.COMPILED_MAX_ROWS]
+        probabilities, labels = model.predict_batch(X)
+
+        assert model.enable_compiled_backend()
+        assert model.inference_backend == "compiled"
+
+        compiled_probs, compiled_labels = model.predict_batch(X)
+        assert np.array_equal(compiled_probs, probabilities)
+        assert np.array_equal(compiled_labels, labels)
+
+    def test_unsupported_model(self):
+        """Test that non-tree models are rejected"""
+        from sklearn.linear_model import LogisticRegression
+        from app.models.compiled_trees import compile_model
+
+        with pytest.raises(ValueError):
+            compile_model(LogisticRegression())
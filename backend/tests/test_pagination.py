@@ -0,0 +1,152 @@
+"""
+Pagination Tests
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+
+class TestReadProjections:
+    """Test read paths select only the columns they return"""
+
+    def test_listings_skip_large_text_columns(self, client, auth_headers, db_session, test_user):
+        """Test listings, reports and explanations never read features_json or shap_values"""
+        from sqlalchemy import event
+        from app.db.models import Prediction
+        from tests.test_fraud_network import TestFraudGraph
+
+        TestFraudGraph._add_predictions(db_session, test_user.id, 5)
+        db_session.query(Prediction).update({Prediction.shap_values: '{"v14": -0.5}'})
+        db_session.commit()
+        prediction_id = db_session.query(Prediction.id).first().id
+
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT") and "predictions" in statement:
+                statements.append(statement)
+
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            history = client.get("/api/v1/predict/history?limit=3", headers=auth_headers)
+            filtered = client.get("/api/v1/analytics/predictions/filter?limit=2&sort_by=amount&total=exact", headers=auth_headers)
+            quick = client.get(f"/api/v1/explain/quick/{prediction_id}", headers=auth_headers)
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+
+        assert history.status_code == filtered.status_code == quick.status_code == 200
+        assert statements
+        assert not [s for s in statements if "features_json" in s or "shap_values" in s]
+
+        rows = history.json()
+        assert len(rows) == 3
+        assert list(rows[0]) == [
+            "id", "time", "amount", "is_fraud", "fraud_probability", "confidence",
+            "risk_score", "prediction_time_ms", "created_at",
+        ]
+        data = filtered.json()
+        assert data["total"] == 5 and len(data["predictions"]) == 2
+        assert "batch_id" in data["predictions"][0]
+        assert data["predictions"][0]["amount"] >= data["predictions"][1]["amount"]
+
+
+class TestKeysetPagination:
+    """Test cursor pagination of history, filtered listings and batch jobs"""
+
+    @staticmethod
+    def _walk(client, auth_headers, url, cursor_of, rows_of):
+        """Rows of every page reached by following next cursors"""
+        pages, cursor = [], None
+        while True:
+            response = client.get(url + (f"&cursor={cursor}" if cursor else ""), headers=auth_headers)
+            assert response.status_code == 200
+            pages.append(response)
+            cursor = cursor_of(response, "next")
+            if not cursor:
+                return pages, [row for page in pages for row in rows_of(page)]
+
+    def test_history_pages_in_both_directions(self, client, auth_headers, db_session, test_user):
+        """Test history pages cover every row once, ties included, and prev returns the previous page"""
+        from datetime import datetime
+        from app.db.models import Prediction
+        from tests.test_fraud_network import TestFraudGraph
+
+        TestFraudGraph._add_predictions(db_session, test_user.id, 23)
+        # Identical timestamps across a page boundary are ordered by id
+        db_session.query(Prediction).filter(Prediction.id <= 8).update({Prediction.created_at: datetime(2024, 1, 1)})
+        db_session.commit()
+        expected = [
+            row.id for row in db_session.query(Prediction.id)
+            .order_by(Prediction.created_at.desc(), Prediction.id.desc())
+        ]
+
+        pages, rows = self._walk(
+            client, auth_headers, "/api/v1/predict/history?limit=5&include_total=true",
+            lambda response, to: response.headers.get(f"x-{to}-cursor"), lambda response: response.json()
+        )
+        assert [row["id"] for row in rows] == expected
+        assert [len(page.json()) for page in pages] == [5, 5, 5, 5, 3]
+        assert pages[0].headers["x-total-count"] == "23"
+        assert "x-prev-cursor" not in pages[0].headers
+
+        previous = client.get(
+            f"/api/v1/predict/history?limit=5&cursor={pages[-1].headers['x-prev-cursor']}", headers=auth_headers
+        )
+        assert previous.json() == pages[-2].json()
+        assert previous.headers["x-next-cursor"] and previous.headers["x-prev-cursor"]
+
+        invalid = client.get("/api/v1/predict/history?cursor=not-a-cursor", headers=auth_headers)
+        assert invalid.status_code == 400
+
+    def test_filter_pages_on_sort_field(self, client, auth_headers, db_session, test_user):
+        """Test filtered listings page on (sort field, id) and count only when asked"""
+        from app.db.models import Prediction
+        from tests.test_fraud_network import TestFraudGraph
+
+        TestFraudGraph._add_predictions(db_session, test_user.id, 30)
+        url = "/api/v1/analytics/predictions/filter?limit=4&sort_by=amount&sort_order=asc&min_risk=40"
+        expected = [
+            row.id for row in db_session.query(Prediction.id)
+            .filter(Prediction.risk_score >= 40)
+            .order_by(Prediction.amount, Prediction.id)
+        ]
+
+        pages, rows = self._walk(
+            client, auth_headers, url,
+            lambda response, to: response.json()[f"{to}_cursor"], lambda response: response.json()["predictions"]
+        )
+        assert [row["id"] for row in rows] == expected
+        assert "total" not in pages[0].json()
+
+        counted = client.get(url + "&total=exact", headers=auth_headers).json()
+        estimated = client.get(url + "&total=estimate", headers=auth_headers).json()
+        assert counted["total"] == estimated["total"] == len(expected)
+        assert estimated["total_estimated"] is True
+
+        # A cursor only pages the sort it was issued for
+        cursor = pages[0].json()["next_cursor"]
+        other_sort = client.get(
+            f"/api/v1/analytics/predictions/filter?sort_by=risk_score&cursor={cursor}", headers=auth_headers
+        )
+        assert other_sort.status_code == 400
+
+    def test_batch_jobs_listing(self, client, auth_headers, db_session, test_user):
+        """Test the batch job listing pages with cursor headers"""
+        from datetime import datetime, timedelta
+        from app.db.models import BatchJob
+
+        now = datetime.utcnow()
+        for i in range(5):
+            db_session.add(BatchJob(
+                id=f"job-{i}", user_id=test_user.id, source_path="/tmp/none.csv",
+                created_at=now - timedelta(minutes=i // 2)
+            ))
+        db_session.commit()
+
+        first = client.get("/api/v1/jobs?limit=3", headers=auth_headers)
+        second = client.get(f"/api/v1/jobs?limit=3&cursor={first.headers['x-next-cursor']}", headers=auth_headers)
+        assert [job["job_id"] for job in first.json() + second.json()] == [
+            "job-1", "job-0", "job-3", "job-2", "job-4"
+        ]
+        assert "x-next-cursor" not in second.headers
@@ -100,3 +100,389 @@ class TestBatchPrediction:
             assert "fraud_count" in data
             assert "legitimate_count" in data
             assert "results" in data
+
+
+class TestPredictionSink:
+    """Test write-behind persistence of single predictions"""
+
+    @staticmethod
+    def _engine():
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import StaticPool
+        from app.db.database import Base
+
+        engine = create_engine(
+            "sqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        Base.metadata.create_all(bind=engine)
+        return engine
+
+    @staticmethod
+    def _record(i):
+        from datetime import datetime
+        return {
+            "user_id": 1, "time": float(i), "amount": 10.0, "features_json": "{}",
+            "is_fraud": False, "fraud_probability": 0.1, "confidence": "High",
+            "risk_score": 10, "prediction_time_ms": 1.0, "created_at": datetime.utcnow(),
+        }
+
+    def test_rows_are_bulk_inserted(self):
+        """Test that concurrent submissions are written in few bulk inserts"""
+        import asyncio
+        from sqlalchemy import func, select
+        from app.db.models import Prediction
+        from app.services.prediction_sink import PredictionSink
+
+        engine = self._engine()
+        sink = PredictionSink(max_batch_rows=100, flush_interval_ms=20)
+
+        async def run():
+            await asyncio.gather(*(sink.submit(self._record(i), engine) for i in range(50)))
+            await sink.flush()
+            await sink.stop()
+
+        asyncio.run(run())
+
+        with engine.connect() as conn:
+            assert conn.execute(select(func.count()).select_from(Prediction)).scalar() == 50
+        stats = sink.get_stats()
+        assert stats["rows_written"] == 50
+        assert stats["flushes"] <= 2
+        assert stats["queue_size"] == 0
+
+    def test_full_queue_applies_backpressure(self, monkeypatch):
+        """Test that submissions wait for space and are rejected with 503 on timeout"""
+        import asyncio
+        import threading
+        from app.core.executors import ExecutorOverloaded
+        from app.services.prediction_sink import PredictionSink
+
+        release = threading.Event()
+        written = []
+
+        def slow_write(bind, records):
+            release.wait()
+            written.extend(records)
+
+        monkeypatch.setattr(PredictionSink, "_write", staticmethod(slow_write))
+        sink = PredictionSink(max_batch_rows=1, flush_interval_ms=1, max_queue_size=1, put_timeout_ms=50)
+
+        async def run():
+            await sink.submit(self._record(0), None)  # taken by the flusher, blocked in write
+            await asyncio.sleep(0.02)
+            await sink.submit(self._record(1), None)  # fills the queue
+            with pytest.raises(ExecutorOverloaded):
+                await sink.submit(self._record(2), None)
+            release.set()
+            await sink.stop()
+
+        asyncio.run(run())
+
+        assert len(written) == 2
+        assert sink.get_stats()["rejected"] == 1
+
+    def test_busy_db_executor_drops_nothing(self, monkeypatch):
+        """Test that a full request DB pool doesn't make the flusher drop rows"""
+        import asyncio
+        from sqlalchemy import func, select
+        from app.core.executors import db_executor
+        from app.db.models import Prediction
+        from app.services.prediction_sink import PredictionSink
+
+        # Every db_executor slot is taken by request reads
+        monkeypatch.setattr(db_executor, "max_pending", 0)
+        engine = self._engine()
+        sink = PredictionSink(max_batch_rows=10, flush_interval_ms=5)
+
+        async def run():
+            await asyncio.gather(*(sink.submit(self._record(i), engine) for i in range(30)))
+            await sink.flush()
+            await sink.stop()
+
+        asyncio.run(run())
+
+        with engine.connect() as conn:
+            assert conn.execute(select(func.count()).select_from(Prediction)).scalar() == 30
+        stats = sink.get_stats()
+        assert stats["dropped_rows"] == 0
+        assert stats["rows_written"] == 30
+
+    def test_prediction_visible_in_history(self, client, auth_headers, sample_transaction):
+        """Test that a buffered prediction shows up in the user's history"""
+        response = client.post("/api/v1/predict", json=sample_transaction, headers=auth_headers)
+        assert response.status_code in [200, 503]
+
+        if response.status_code == 200:
+            history = client.get("/api/v1/predict/history", headers=auth_headers).json()
+            assert len(history) == 1
+
+
+class TestPredictionMemo:
+    """Test memoized scoring of repeated feature vectors"""
+
+    @pytest.fixture
+    def memo(self, client, monkeypatch):
+        from app.models.ml_model import fraud_model
+        from app.services import fraud_detector
+        from app.services.prediction_memo import PredictionMemo
+
+        if not fraud_model.is_loaded:
+            pytest.skip("Model not loaded")
+        memo = PredictionMemo(enabled=True, max_entries=100)
+        monkeypatch.setattr(fraud_detector, "prediction_memo", memo)
+        return memo
+
+    @staticmethod
+    def _count_scored_rows(monkeypatch):
+        from app.models.ml_model import fraud_model
+
+        scored = []
+        predict_batch = fraud_model.predict_batch
+        monkeypatch.setattr(
+            fraud_model, "predict_batch", lambda features: scored.append(len(features)) or predict_batch(features)
+        )
+        return scored
+
+    def test_repeated_transactions_reuse_scores(self, memo, monkeypatch, sample_transaction):
+        """Test repeats skip the model, give the same result and are dropped on model change"""
+        from app.models.ml_model import fraud_model
+        from app.models.schemas import TransactionInput
+        from app.services.fraud_detector import FraudDetectorService
+
+        scored = self._count_scored_rows(monkeypatch)
+        transaction = TransactionInput(**sample_transaction)
+        # Differs below the quantization step only
+        nearly = TransactionInput(**{**sample_transaction, "v1": sample_transaction["v1"] + 1e-9})
+        other = TransactionInput(**{**sample_transaction, "amount": 9999.0})
+
+        first = FraudDetectorService.predict_batch([transaction, other])
+        second = FraudDetectorService.predict_batch([nearly, other, transaction])
+        assert scored == [2]
+        assert [r.fraud_probability for r in second.results] == [
+            first.results[0].fraud_probability, first.results[1].fraud_probability, first.results[0].fraud_probability
+        ]
+
+        monkeypatch.setattr(fraud_model, "predict", lambda features: pytest.fail("memoized score expected"))
+        single = FraudDetectorService.predict_single(transaction)
+        assert single.fraud_probability == first.results[0].fraud_probability
+
+        FraudDetectorService.predict_batch([transaction], memoize=False)
+        assert scored == [2, 1]
+        assert memo.get_stats()["lookups"] == {"local_hit": 4, "redis_hit": 0, "miss": 2, "bypass": 1}
+
+        monkeypatch.setattr(fraud_model, "fingerprint", "retrained")
+        FraudDetectorService.predict_batch([transaction])
+        assert scored == [2, 1, 1]
+        assert len(memo.local) == 1
+
+    def test_api_key_opt_out_and_metrics(self, client, auth_headers, memo, monkeypatch, sample_transaction):
+        """Test API keys with memoize_predictions=false always score fresh"""
+        from app.api.routes import health
+
+        monkeypatch.setattr(health, "prediction_memo", memo)
+        created = client.post(
+            "/api/v1/api-keys", json={"name": "fresh", "memoize_predictions": False}, headers=auth_headers
+        ).json()
+        headers = {**auth_headers, "X-API-Key": created["key"]}
+
+        for _ in range(2):
+            assert client.post("/api/v1/predict", json=sample_transaction, headers=headers).status_code == 200
+        assert memo.get_stats()["lookups"]["bypass"] == 2
+
+        updated = client.patch(
+            f"/api/v1/api-keys/{created['id']}", json={"memoize_predictions": True}, headers=auth_headers
+        )
+        assert updated.json()["memoize_predictions"] is True
+        for _ in range(2):
+            assert client.post("/api/v1/predict", json=sample_transaction, headers=headers).status_code == 200
+        assert memo.get_stats()["lookups"]["local_hit"] == 1
+
+        metrics = client.get("/api/v1/metrics").json()
+        assert 'fraud_detection_prediction_memo_lookups_total{result="bypass"} 2' in metrics
+        assert "fraud_detection_prediction_memo_entries 1" in metrics
+
+    def test_async_redis_calls_leave_event_loop(self, memo, monkeypatch, sample_transaction):
+        """Test async predictions make the shared memo's Redis calls, model-change invalidation included, off the loop"""
+        import asyncio
+        import threading
+        from app.core.config import settings
+        from app.models.ml_model import fraud_model
+        from app.models.schemas import TransactionInput
+        from app.services import prediction_memo as memo_module
+        from app.services.fraud_detector import FraudDetectorService
+
+        class LoopCheckingCache:
+            enabled = True
+
+            def __init__(self):
+                self.data = {}
+                self.calls = []
+
+            def _record(self, command):
+                try:
+                    asyncio.get_running_loop()
+                    self.calls.append((command, "loop"))
+                except RuntimeError:
+                    self.calls.append((command, "thread"))
+
+            def get(self, key):
+                self._record("get")
+                return self.data.get(key)
+
+            def set(self, key, value, ttl=300, tags=()):
+                self._record("set")
+                self.data[key] = value
+                return True
+
+            def invalidate_tags(self, *tags):
+                self._record("invalidate_tags")
+                self.data.clear()
+                return 0
+
+        shared = LoopCheckingCache()
+        monkeypatch.setattr(memo_module, "cache", shared)
+        monkeypatch.setattr(settings, "inference_batching_enabled", True)
+        memo.redis_enabled = True
+        transaction = TransactionInput(**sample_transaction)
+
+        async def run():
+            first = await FraudDetectorService.predict_single_async(transaction)
+            memo.local.clear()
+            second = await FraudDetectorService.predict_single_async(transaction)
+            monkeypatch.setattr(fraud_model, "fingerprint", "retrained")
+            await FraudDetectorService.predict_single_async(transaction)
+            return first, second
+
+        first, second = asyncio.run(run())
+        for thread in threading.enumerate():
+            if thread.name == "prediction-memo-invalidate":
+                thread.join()
+
+        assert second.fraud_probability == first.fraud_probability
+        assert memo.get_stats()["lookups"]["redis_hit"] == 1
+        assert {command for command, _ in shared.calls} == {"get", "set", "invalidate_tags"}
+        assert all(where == "thread" for _, where in shared.calls)
+
+
+class TestOverload:
+    """Test load shedding when executors are full"""
+
+    def test_batch_rejected_when_inference_queue_full(self, client, auth_headers, sample_transaction, monkeypatch):
+        """Test that a full inference executor returns 503 instead of queueing"""
+        from app.core.executors import inference_executor
+        monkeypatch.setattr(inference_executor, "max_pending", 0)
+
+        response = client.post(
+            "/api/v1/predict/batch",
+            json={"transactions": [sample_transaction]},
+            headers=auth_headers
+        )
+        assert response.status_code == 503
+        if "queue full" in response.json()["detail"]:
+            assert response.headers["Retry-After"] == "1"
+
+
+class TestCsvUpload:
+    """Test CSV upload endpoint"""
+
+    @staticmethod
+    def _csv(rows, columns=None):
+        import pandas as pd
+        df = pd.DataFrame(rows)
+        if columns is not None:
+            df = df[columns]
+        return ("transactions.csv", df.to_csv(index=False).encode(), "text/csv")
+
+    def test_upload_csv_success(self, client, auth_headers, sample_transaction):
+        """Test scoring and saving a CSV batch"""
+        # Column names are matched case-insensitively
+        rows = [{k.upper(): v for k, v in sample_transaction.items()}] * 10
+        response = client.post(
+            "/api/v1/predict/upload-csv",
+            files={"file": self._csv(rows)},
+            headers=auth_headers
+        )
+        assert response.status_code in [200, 503]
+
+        if response.status_code == 200:
+            assert response.headers["X-Total-Rows"] == "10"
+            lines = response.text.strip().splitlines()
+            assert len(lines) == 11
+            assert lines[0].endswith("is_fraud,fraud_probability,confidence,risk_score")
+
+            history = client.get("/api/v1/predict/history", headers=auth_headers).json()
+            assert len(history) == 10
+
+    def test_upload_csv_missing_columns(self, client, auth_headers, sample_transaction):
+        """Test that missing feature columns are rejected"""
+        response = client.post(
+            "/api/v1/predict/upload-csv",
+            files={"file": self._csv([sample_transaction], columns=["time", "amount", "v1"])},
+            headers=auth_headers
+        )
+        assert response.status_code in [400, 503]
+
+        if response.status_code == 400:
+            assert "Missing columns" in response.json()["detail"]
+
+    def test_upload_csv_negative_amount(self, client, auth_headers, sample_transaction):
+        """Test that out-of-range values are rejected with row numbers"""
+        bad = dict(sample_transaction, amount=-5.0)
+        response = client.post(
+            "/api/v1/predict/upload-csv",
+            files={"file": self._csv([sample_transaction, bad])},
+            headers=auth_headers
+        )
+        assert response.status_code in [400, 503]
+
+        if response.status_code == 400:
+            assert "rows 2" in response.json()["detail"]
+
+    def test_upload_csv_stream_in_chunks(self, client, auth_headers, sample_transaction, monkeypatch):
+        """Test streamed scoring writes one header and saves every chunk"""
+        from app.core.config import settings
+        monkeypatch.setattr(settings, "csv_stream_chunk_rows", 4)
+
+        response = client.post(
+            "/api/v1/predict/upload-csv/stream",
+            files={"file": self._csv([sample_transaction] * 10)},
+            headers=auth_headers
+        )
+        assert response.status_code in [200, 503]
+
+        if response.status_code == 200:
+            assert "X-Batch-ID" in response.headers
+            lines = response.text.strip().splitlines()
+            assert len(lines) == 11
+            assert sum(line.startswith("time,") for line in lines) == 1
+
+            history = client.get("/api/v1/predict/history", headers=auth_headers).json()
+            assert len(history) == 10
+
+    def test_upload_csv_stream_rejects_invalid_first_chunk(self, client, auth_headers, sample_transaction):
+        """Test that errors in the first chunk are reported before streaming"""
+        bad = dict(sample_transaction, time=-1.0)
+        response = client.post(
+            "/api/v1/predict/upload-csv/stream",
+            files={"file": self._csv([sample_transaction, sample_transaction, bad])},
+            headers=auth_headers
+        )
+        assert response.status_code in [400, 503]
+
+        if response.status_code == 400:
+            assert "rows 3" in response.json()["detail"]
+
+    def test_spool_upload_stops_at_size_limit(self):
+        """Test that an oversized upload is rejected without reading all of it"""
+        import io
+        from app.services.csv_stream import SPOOL_COPY_BUFFER, spool_upload
+
+        upload = io.BytesIO(b"x" * SPOOL_COPY_BUFFER * 10)
+        with pytest.raises(ValueError, match="too large"):
+            spool_upload(upload, SPOOL_COPY_BUFFER)
+        assert upload.tell() == SPOOL_COPY_BUFFER * 2
+
+        with spool_upload(io.BytesIO(b"a,b\n1,2\n"), SPOOL_COPY_BUFFER) as spool:
+            assert spool.read() == b"a,b\n1,2\n"
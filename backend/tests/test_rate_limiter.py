@@ -0,0 +1,65 @@
+"""
+Rate Limiter Tests
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+
+class TestRateLimiter:
+    """Test the sliding-window counter rate limiter"""
+
+    @staticmethod
+    def _clock(monkeypatch, start):
+        from app.middleware import rate_limiter
+
+        now = [start]
+        monkeypatch.setattr(rate_limiter.time, "time", lambda: now[0])
+        return now
+
+    def test_sliding_window_limits(self, monkeypatch):
+        """Test burst and minute limits, the previous bucket's weight and reset times"""
+        from app.middleware.rate_limiter import InMemoryRateLimiter
+
+        now = self._clock(monkeypatch, 1000.0)
+        limiter = InMemoryRateLimiter(requests_per_minute=60, requests_per_hour=1000, burst_size=10)
+        assert all(limiter.is_allowed("a")[0] for _ in range(10))
+        allowed, info = limiter.is_allowed("a")
+        assert not allowed and info["reason"] == "burst_limit_exceeded" and info["reset"] == 1001
+        # Other identifiers are independent
+        assert limiter.is_allowed("b")[0]
+
+        # Half a second into the next bucket, the previous one counts for half
+        now[0] = 1001.5
+        assert [limiter.is_allowed("a")[0] for _ in range(6)] == [True] * 5 + [False]
+
+        limiter = InMemoryRateLimiter(requests_per_minute=20, requests_per_hour=1000, burst_size=100)
+        now[0] = 6030.0
+        results = [limiter.is_allowed("a") for _ in range(21)]
+        assert results[19][1]["remaining_minute"] == 0
+        allowed, info = results[20]
+        assert not allowed and info["reason"] == "minute_limit_exceeded" and info["reset"] == 6060
+        now[0] = 6060.5
+        assert limiter.is_allowed("a")[0]
+        assert not limiter.is_allowed("a")[0]
+
+    def test_idle_identifiers_expire_incrementally(self, monkeypatch):
+        """Test idle identifiers are dropped a few per request, active ones kept"""
+        from app.middleware.rate_limiter import EXPIRE_PER_CALL, InMemoryRateLimiter
+
+        now = self._clock(monkeypatch, 50_000.0)
+        limiter = InMemoryRateLimiter()
+        for i in range(100):
+            limiter.is_allowed(f"10.0.0.{i}")
+        now[0] += 3600
+        limiter.is_allowed("10.0.0.0")
+        assert len(limiter) == 100
+
+        # The others were last seen a state lifetime (plus a wheel tick) ago
+        now[0] += limiter.state_ttl - 3600 + limiter.tick_seconds
+        limiter.is_allowed("10.0.1.1")
+        assert limiter.expired <= EXPIRE_PER_CALL
+        for _ in range(100):
+            limiter.is_allowed("10.0.1.1")
+        assert set(limiter.slots) == {"10.0.0.0", "10.0.1.1"}
+        assert limiter.expired == 99
@@ -0,0 +1,170 @@
+"""
+Report Tests
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+import pytest
+
+
+class TestReportExports:
+    """Test streaming CSV and Excel exports"""
+
+    @pytest.fixture
+    def predictions(self, db_session, test_user):
+        from datetime import datetime, timedelta
+        from app.services.prediction_service import bulk_insert_predictions
+
+        now = datetime.utcnow()
+        records = [
+            {
+                "user_id": test_user.id, "time": 0.0, "amount": float(i), "features_json": "{}",
+                "is_fraud": i % 4 == 0, "fraud_probability": i / 10, "confidence": "High",
+                "risk_score": i * 10, "prediction_time_ms": 1.5,
+                "created_at": now - timedelta(hours=i),
+            }
+            for i in range(10)
+        ]
+        bulk_insert_predictions(db_session, records)
+        return records
+
+    def test_csv_streams_in_chunks(self, db_session, predictions):
+        """Test the CSV is yielded one chunk per cursor fetch, newest first"""
+        import io
+        import pandas as pd
+        from sqlalchemy.orm import Session
+        from app.db.models import Prediction
+        from app.services.report_export import iter_csv_export
+
+        chunks = list(iter_csv_export(
+            Session(bind=db_session.get_bind()),
+            criteria=[Prediction.user_id == predictions[0]["user_id"]],
+            order_by=[Prediction.created_at.desc()],
+            chunk_rows=4,
+        ))
+        assert len(chunks) == 4  # header + 4 + 4 + 2 rows
+
+        df = pd.read_csv(io.BytesIO(b"".join(chunks)))
+        assert list(df.columns) == [
+            "date", "amount", "is_fraud", "fraud_probability", "risk_score", "confidence", "prediction_time_ms"
+        ]
+        assert df["amount"].tolist() == [float(i) for i in range(10)]
+        assert df["is_fraud"].tolist() == [i % 4 == 0 for i in range(10)]
+
+    def test_csv_endpoint(self, client, auth_headers, predictions, monkeypatch):
+        """Test the CSV download"""
+        from app.core.config import settings
+        monkeypatch.setattr(settings, "export_chunk_rows", 3)
+
+        response = client.get("/api/v1/reports/export/csv?days=30", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.strip().split("\n")
+        assert lines[0].startswith("date,amount,is_fraud")
+        assert len(lines) == 11
+
+    def test_excel_endpoint(self, client, auth_headers, predictions, monkeypatch):
+        """Test the write-only workbook has the summary and every data row"""
+        import io
+        from openpyxl import load_workbook
+        from app.core.config import settings
+        monkeypatch.setattr(settings, "export_chunk_rows", 3)
+
+        response = client.get("/api/v1/reports/export/excel/high-risk?days=30&threshold=50", headers=auth_headers)
+        assert response.status_code == 200
+
+        wb = load_workbook(io.BytesIO(response.content))
+        assert wb.sheetnames == ["Summary", "Predictions Data"]
+
+        summary = {row[0]: row[1] for row in wb["Summary"].iter_rows(min_row=8, values_only=True)}
+        assert summary["Total Predictions"] == 5
+        assert summary["Fraud Detected"] == 1
+        assert summary["Critical (75-100)"] == 2
+
+        rows = list(wb["Predictions Data"].iter_rows(min_row=2, values_only=True))
+        assert [row[4] for row in rows] == [90, 80, 70, 60, 50]
+        assert [row[2] for row in rows] == ["No", "Yes", "No", "No", "No"]
+        assert wb["Predictions Data"].freeze_panes == "A2"
+
+
+class TestReportCache:
+    """Test background PDF rendering and the disk report cache"""
+
+    @pytest.fixture
+    def cache(self, tmp_path, monkeypatch):
+        from app.services.report_cache import report_cache
+        monkeypatch.setattr(report_cache, "cache_dir", tmp_path)
+        return report_cache
+
+    @staticmethod
+    def _add_prediction(db_session, user_id, risk_score=10):
+        from datetime import datetime
+        from app.services.prediction_service import bulk_insert_predictions
+        bulk_insert_predictions(db_session, [{
+            "user_id": user_id, "time": 0.0, "amount": 25.0, "features_json": "{}",
+            "is_fraud": False, "fraud_probability": 0.1, "confidence": "High",
+            "risk_score": risk_score, "prediction_time_ms": 1.0, "created_at": datetime.utcnow(),
+        }])
+
+    def test_report_reused_until_new_predictions(self, client, auth_headers, db_session, test_user, cache):
+        """Test a report renders once and again only after new predictions land"""
+        self._add_prediction(db_session, test_user.id)
+        renders = cache.get_stats()["renders"]
+
+        first = client.get("/api/v1/reports/fraud-summary?days=7", headers=auth_headers)
+        second = client.get("/api/v1/reports/fraud-summary?days=7", headers=auth_headers)
+        assert first.status_code == second.status_code == 200
+        assert first.headers["content-type"] == "application/pdf"
+        assert first.content.startswith(b"%PDF")
+        assert second.content == first.content
+        assert cache.get_stats()["renders"] == renders + 1
+
+        # Other parameters are a different report
+        client.get("/api/v1/reports/fraud-summary?days=30", headers=auth_headers)
+        assert cache.get_stats()["renders"] == renders + 2
+
+        self._add_prediction(db_session, test_user.id)
+        third = client.get("/api/v1/reports/fraud-summary?days=7", headers=auth_headers)
+        assert third.status_code == 200
+        assert cache.get_stats()["renders"] == renders + 3
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        """Test eviction removes the least recently used reports past the size cap"""
+        import os
+        from app.services.report_cache import ReportCache
+
+        cache = ReportCache(str(tmp_path), max_bytes=250)
+        cache.put("a", b"a" * 100)
+        cache.put("b", b"b" * 100)
+        os.utime(tmp_path / "a.pdf", (1000, 1000))
+        os.utime(tmp_path / "b.pdf", (2000, 2000))
+
+        # Reading "a" makes "b" the least recently used
+        cache.open("a").close()
+        cache.put("c", b"c" * 100)
+
+        assert cache.open("b") is None
+        assert cache.open("a").read() == b"a" * 100
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_concurrent_requests_share_render(self, tmp_path):
+        """Test requests for a report that is rendering wait for that render"""
+        import asyncio
+        import time
+        from app.services.report_cache import ReportCache
+
+        cache = ReportCache(str(tmp_path), max_bytes=1024 * 1024)
+        calls = []
+
+        def render():
+            calls.append(1)
+            time.sleep(0.1)
+            return b"%PDF-report"
+
+        async def download_all():
+            files = await asyncio.gather(*(cache.get_or_render("key", render) for _ in range(5)))
+            return [file.read() for file in files]
+
+        assert asyncio.run(download_all()) == [b"%PDF-report"] * 5
+        assert len(calls) == 1
@@ -0,0 +1,40 @@
+"""
+Response Encoding Tests
+
+Author: Zhmuryk Andrii
+Copyright (c) 2024 - All Rights Reserved
+"""
+
+
+class TestResponseEncoding:
+    """Test the default JSON response class with and without orjson"""
+
+    def test_orjson_and_fallback_agree(self, monkeypatch):
+        """Test models, NumPy values, datetimes, enums and int keys encode the same both ways"""
+        import json
+        from datetime import datetime
+        import numpy as np
+        from app.core import responses
+        from app.db.models import BatchJobStatus
+        from app.models.schemas import SingleBatchResult
+
+        content = {
+            "result": SingleBatchResult(index=1, is_fraud=True, fraud_probability=0.9, risk_score=90),
+            "scores": np.array([0.25, 0.5]),
+            "count": np.int64(3),
+            "created_at": datetime(2024, 1, 2, 3, 4, 5),
+            "status": BatchJobStatus.RUNNING,
+            "by_hour": {7: 2},
+        }
+        expected = {
+            "result": {"index": 1, "is_fraud": True, "fraud_probability": 0.9, "risk_score": 90},
+            "scores": [0.25, 0.5],
+            "count": 3,
+            "created_at": "2024-01-02T03:04:05",
+            "status": "running",
+            "by_hour": {"7": 2},
+        }
+        assert json.loads(responses.FastJSONResponse(content).body) == expected
+
+        monkeypatch.setattr(responses, "ORJSON_AVAILABLE", False)
+        assert json.loads(responses.FastJSONResponse(content).body) == expected
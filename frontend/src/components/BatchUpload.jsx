@@ -43,7 +43,7 @@ export default function BatchUpload() {
       setError(t('batch.selectCsvFile'));
       return;
     }
-    if (selectedFile.size > 10 * 1024 * 1024) {
+    if (selectedFile.size > 100 * 1024 * 1024) {
       setError(t('batch.fileTooLarge'));
       return;
     }